@@ -0,0 +1,143 @@
+"""
+Catalog 向量查詢擴充性 benchmark（top-k ANN vs 全 catalog 查詢）。
+
+以合成 SKU 向量（預設 1k / 10k / 100k 筆，512 維，依品牌成群以模擬外觀相近的瓶子）
+建立與 drink_catalog 相同設定的 Chroma collection，查詢向量為某個 SKU 加上雜訊
+（模擬 crop 的 CLIP 向量），回報：
+
+- recall@k : HNSW top-k 與 NumPy 暴力搜尋 top-k 的交集比例
+- hit@k    : 產生查詢的 SKU 是否在 top-k 內（service 需另外取向量的機率 = 1 - hit@k）
+- 延遲     : top-k 查詢與 n_results=整個 catalog（MATCH_TOP_K=0）的 p50 / p95
+
+用法：
+    python -m benchmarks.ann_bench
+    python -m benchmarks.ann_bench --sizes 1000,10000 --k 1,5,10 --m 32 --ef-construction 200 --ef-search 50,100,200
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+from chromadb.api.client import SharedSystemClient
+
+from benchmarks.common import git_commit, summarize, write_report
+
+
+def synthetic_catalog(size: int, dim: int, spread: float, rng: np.random.Generator) -> np.ndarray:
+    """每 50 個 SKU 共用一個品牌中心；spread 越小，同品牌 SKU 越相近、ANN 越難分辨"""
+    centers = rng.normal(size=(max(size // 50, 1), dim))
+    vectors = centers[rng.integers(0, len(centers), size)] + spread * rng.normal(size=(size, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def exact_top_k(queries: np.ndarray, catalog: np.ndarray, k: int) -> np.ndarray:
+    sims = queries @ catalog.T
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(top, np.argsort(-np.take_along_axis(sims, top, axis=1), axis=1), axis=1)
+
+
+def build_collection(client, catalog: np.ndarray, m: int, ef_construction: int):
+    collection = client.create_collection(
+        name="ann_bench",
+        metadata={"hnsw:space": "cosine"},
+        configuration={"hnsw": {"space": "cosine", "max_neighbors": m, "ef_construction": ef_construction}},
+    )
+    batch = client.get_max_batch_size()
+    for start in range(0, len(catalog), batch):
+        chunk = catalog[start:start + batch]
+        collection.add(ids=[str(i) for i in range(start, start + len(chunk))], embeddings=chunk)
+    return collection
+
+
+def timed_query(collection, query: np.ndarray, n_results: int):
+    t0 = time.perf_counter()
+    result = collection.query(query_embeddings=[query.tolist()], n_results=n_results, include=["distances"])
+    return (time.perf_counter() - t0) * 1000, [int(i) for i in result["ids"][0]]
+
+
+def bench_size(size: int, args, rng: np.random.Generator) -> dict:
+    catalog = synthetic_catalog(size, args.dim, args.spread, rng)
+    sources = rng.integers(0, size, args.queries)
+    queries = catalog[sources] + args.noise * rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    max_k = max(args.k)
+    truth = exact_top_k(queries, catalog, max_k)
+
+    path = tempfile.mkdtemp(prefix="ann_bench_")
+    try:
+        client = chromadb.PersistentClient(path=path)
+        started = time.perf_counter()
+        collection = build_collection(client, catalog, args.m, args.ef_construction)
+        build_s = time.perf_counter() - started
+
+        row = {"catalog_size": size, "build_s": round(build_s, 2), "ef_search": {}}
+        for ef_search in args.ef_search:
+            collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+            # 已載入的 index 不會套用新的 ef_search，需重開 client（與 service.open_catalog 相同）
+            SharedSystemClient.clear_system_cache()
+            collection = chromadb.PersistentClient(path=path).get_collection("ann_bench")
+            stats = {}
+            for k in args.k:
+                latencies, recall, hits = [], [], 0
+                for query, source, expected in zip(queries, sources, truth):
+                    ms, ids = timed_query(collection, query, k)
+                    latencies.append(ms)
+                    recall.append(len(set(ids) & set(expected[:k].tolist())) / k)
+                    hits += int(source) in ids
+                stats[f"top_{k}"] = {
+                    "latency": summarize(latencies),
+                    "recall": round(float(np.mean(recall)), 4),
+                    "hit_rate": round(hits / len(queries), 4),
+                }
+            row["ef_search"][ef_search] = stats
+
+        if size <= args.full_max:
+            latencies = [timed_query(collection, query, size)[0] for query in queries[: args.full_queries]]
+            row["full_catalog"] = {"latency": summarize(latencies)}
+        return row
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="top-k ANN 查詢 recall / 延遲 benchmark")
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--spread", type=float, default=0.15, help="同品牌 SKU 相對品牌中心的離散程度")
+    parser.add_argument("--noise", type=float, default=0.04, help="查詢向量相對 SKU 的雜訊標準差（每維）")
+    parser.add_argument("--k", default="1,5,10")
+    parser.add_argument("--m", type=int, default=16, help="HNSW M（max_neighbors）")
+    parser.add_argument("--ef-construction", type=int, default=100)
+    parser.add_argument("--ef-search", default="10,50,100")
+    parser.add_argument("--full-max", type=int, default=10000, help="catalog 不超過此大小時才量測全 catalog 查詢")
+    parser.add_argument("--full-queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+    args.k = [int(v) for v in args.k.split(",")]
+    args.ef_search = [int(v) for v in args.ef_search.split(",")]
+
+    rng = np.random.default_rng(args.seed)
+    rows = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        row = bench_size(size, args, rng)
+        print(f"▶ {size:>7} SKU  建立 {row['build_s']}s")
+        for ef_search, stats in row["ef_search"].items():
+            for name, s in stats.items():
+                print(f"    ef_search={ef_search:<4} {name:<6} recall={s['recall']:.3f} hit={s['hit_rate']:.3f} "
+                      f"p50={s['latency']['p50_ms']}ms p95={s['latency']['p95_ms']}ms")
+        if "full_catalog" in row:
+            full = row["full_catalog"]["latency"]
+            print(f"    全 catalog 查詢 p50={full['p50_ms']}ms p95={full['p95_ms']}ms")
+        rows.append(row)
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    write_report({"config": config, "results": rows}, args.output or f"bench_results/ann-{git_commit()}.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+/db/search 延遲 benchmark。
+
+以合成 catalog（預設 100 / 1000 / 10000 筆，512 維影像向量，品牌 × 口味 × 顏色組合的 metadata）量測：
+
+- hit   : 查詢句向量已在 LRU 快取中（重複輸入、刪字回到先前的字串），只有矩陣乘法 + rapidfuzz
+- miss  : 需要編碼查詢句；預設以固定延遲的替身模擬，--clip 時載入 clip-ViT-B-32 實測文字編碼
+- batch : 一次 --batch 個查詢（皆命中快取）
+
+用法：
+    python -m benchmarks.catalog_search_bench
+    python -m benchmarks.catalog_search_bench --sizes 1000 --clip
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from benchmarks.common import git_commit, summarize, write_report
+from utils.catalog_search import CatalogSearchIndex, QueryEmbeddingCache
+
+BRANDS = ["茶裏王", "原萃", "御茶園", "光泉", "統一", "麥香", "波蜜", "悅氏", "黑松", "愛之味"]
+FLAVORS = ["日式無糖綠茶", "台式綠茶", "白毫烏龍", "紅茶", "奶茶", "果菜汁", "鮮乳", "礦泉水", "沙士", "麥茶",
+           "檸檬紅茶", "蜂蜜綠茶", "冬瓜茶", "四季春", "鐵觀音"]
+COLORS = ["綠色", "褐色", "橘色", "紅色", "黃色", "白色", "藍色", "黑色"]
+QUERIES = ["橘色飲料", "無糖綠茶", "茶裏王", "紅茶", "奶茶", "藍色瓶子", "蜂蜜", "烏龍", "綠", "原萃"]
+
+
+def synthetic_catalog(size: int, dim: int, rng: random.Random):
+    ids, metadatas = [], []
+    for i in range(size):
+        meta = {"brand": rng.choice(BRANDS), "flavor": rng.choice(FLAVORS), "color": rng.choice(COLORS)}
+        ids.append(f"{meta['brand']}{meta['flavor']}-{i}")
+        metadatas.append(meta)
+    embeddings = np.random.default_rng(rng.randrange(1 << 30)).normal(size=(size, dim)).astype(np.float32)
+    return ids, metadatas, embeddings
+
+
+def time_calls(fn, repeat: int) -> dict:
+    latencies = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        fn(i)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return summarize(latencies)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="/db/search 延遲 benchmark")
+    parser.add_argument("--sizes", default="100,1000,10000")
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--encode-ms", type=float, default=8.0, help="替身文字編碼延遲（未指定 --clip 時）")
+    parser.add_argument("--clip", action="store_true", help="載入 clip-ViT-B-32 實測文字編碼")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    if args.clip:
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer("clip-ViT-B-32")
+        encode_text = lambda texts: model.encode(list(texts), batch_size=64)
+    else:
+        vector_rng = np.random.default_rng(args.seed)
+
+        def encode_text(texts):
+            time.sleep(args.encode_ms / 1000)
+            return vector_rng.normal(size=(len(texts), args.dim)).astype(np.float32)
+
+    rows = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        rng = random.Random(args.seed)
+        ids, metadatas, embeddings = synthetic_catalog(size, args.dim, rng)
+        started = time.perf_counter()
+        index = CatalogSearchIndex(ids, metadatas, embeddings)
+        build_ms = (time.perf_counter() - started) * 1000
+        cache = QueryEmbeddingCache(encode_text)
+        cache.get(QUERIES)
+
+        def search(queries):
+            return index.search(queries, cache.get(queries), args.k)
+
+        row = {
+            "size": size,
+            "build_ms": round(build_ms, 2),
+            "hit": time_calls(lambda i: search([QUERIES[i % len(QUERIES)]]), args.repeat),
+            # 每次都是新的字串（逐字輸入）
+            "miss": time_calls(lambda i: search([f"{QUERIES[i % len(QUERIES)]}{i}"]),
+                               max(args.repeat // 4, 10)),
+            "batch": time_calls(lambda i: search([QUERIES[(i + j) % len(QUERIES)] for j in range(args.batch)]),
+                                args.repeat),
+        }
+        print(f"▶ catalog {size:>6} 筆（建索引 {row['build_ms']}ms）  "
+              f"hit p50={row['hit']['p50_ms']}ms p95={row['hit']['p95_ms']}ms  "
+              f"miss p50={row['miss']['p50_ms']}ms  batch×{args.batch} p50={row['batch']['p50_ms']}ms")
+        rows.append(row)
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    write_report({"config": config, "results": rows}, args.output or f"bench_results/catalog-search-{git_commit()}.json")
+
+
+if __name__ == "__main__":
+    main()
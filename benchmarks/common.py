@@ -0,0 +1,73 @@
+"""benchmark 共用工具：統計、報告輸出、跨 commit 比較"""
+
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+
+def summarize(samples_ms) -> dict:
+    """回傳 count / mean / p50 / p95 / p99 / max（單位 ms）"""
+    arr = np.asarray(list(samples_ms), dtype=np.float64)
+    if arr.size == 0:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {
+        "count": int(arr.size),
+        "mean_ms": round(float(arr.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(float(arr.max()), 3),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def write_report(report: dict, path: str) -> str:
+    report = {"commit": git_commit(), "timestamp": datetime.now().isoformat(), **report}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📄 報告已寫入 {path}")
+    return path
+
+
+def compare_reports(old_path: str, new_path: str, section: str = "stages"):
+    """印出兩份報告中同名 stage 的 p50/p95 變化"""
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"比較 {old.get('commit')} -> {new.get('commit')}")
+    for name, stats in new.get(section, {}).items():
+        before = old.get(section, {}).get(name)
+        if not before or "p50_ms" not in before or "p50_ms" not in stats:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            delta = stats[key] - before[key]
+            pct = delta / before[key] * 100 if before[key] else 0.0
+            print(f"  {name:<28} {key}: {before[key]:>9.2f} -> {stats[key]:>9.2f} ({pct:+.1f}%)")
+
+
+def list_images(directory: str, recursive: bool = False) -> list:
+    root = REPO_ROOT / directory
+    pattern = "**/*" if recursive else "*"
+    return sorted(
+        str(p) for p in root.glob(pattern) if p.suffix.lower() in (".jpg", ".jpeg", ".png")
+    )
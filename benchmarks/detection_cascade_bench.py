@@ -0,0 +1,130 @@
+"""
+偵測 cascade benchmark：比較單一路徑（yolo11m @ 640）與 coarse → fine cascade。
+
+以單一路徑的結果作為參考答案，量測 cascade 的：
+
+- 每張圖平均 / p50 / p95 偵測延遲（單張送入，與 /inventory_base64 相同）
+- recall    : 參考 box 中能以 IoU ≥ --match-iou 對上 cascade box 的比例
+- extra     : cascade 多出、對不上參考 box 的數量
+- full_rate : 退回整張圖 fine pass 的比例；regions : 平均每張圖的 fine 區域數
+
+用法：
+    python -m benchmarks.detection_cascade_bench
+    python -m benchmarks.detection_cascade_bench --coarse-model yolo11n.pt --coarse-imgsz 480 --repeat 5
+"""
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+os.environ.setdefault("TRACE_EXPORTER", "none")
+os.environ.setdefault("DEBUG_SAVE", "0")
+
+import numpy as np
+
+from benchmarks.common import git_commit, list_images, summarize, write_report
+from utils.detection_cascade import DetectionCascade, box_iou
+
+
+def match_counts(reference: np.ndarray, predicted: np.ndarray, iou: float):
+    """貪婪一對一配對，回傳 (配對數, 多出的 predicted 數)"""
+    unmatched = list(range(len(predicted)))
+    matched = 0
+    for box in reference:
+        if not unmatched:
+            break
+        ious = box_iou(box, predicted[unmatched])
+        best = int(ious.argmax())
+        if ious[best] >= iou:
+            matched += 1
+            del unmatched[best]
+    return matched, len(unmatched)
+
+
+def time_detector(detect, images: list, repeat: int):
+    """回傳 (每張圖最後一次的結果, 延遲 ms 列表)"""
+    latencies, results = [], []
+    for _ in range(repeat):
+        results = []
+        for image in images:
+            started = time.perf_counter()
+            results.append(detect(image))
+            latencies.append((time.perf_counter() - started) * 1000)
+    return results, latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="偵測 cascade benchmark")
+    parser.add_argument("--images-dir", default="images")
+    parser.add_argument("--coarse-model", default="", help="coarse pass 模型；預設沿用 yolo11m")
+    parser.add_argument("--coarse-imgsz", type=int, default=320)
+    parser.add_argument("--fine-imgsz", type=int, default=640)
+    parser.add_argument("--low-conf", type=float, default=0.25)
+    parser.add_argument("--small-px", type=int, default=24)
+    parser.add_argument("--match-iou", type=float, default=0.5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    from ultralytics import YOLO
+
+    import service
+
+    service.yolo_model = YOLO("yolo11m.pt")
+    coarse_model = YOLO(args.coarse_model) if args.coarse_model else service.yolo_model
+    cascade = DetectionCascade(
+        lambda images, imgsz, conf: service.run_yolo(service.yolo_model, images, conf, imgsz),
+        lambda images, imgsz, conf: service.run_yolo(coarse_model, images, conf, imgsz),
+        conf=service.CONF_THRESHOLD, low_conf=args.low_conf, coarse_imgsz=args.coarse_imgsz,
+        fine_imgsz=args.fine_imgsz, small_px=args.small_px,
+    )
+
+    paths = list_images(args.images_dir)
+    images = [service.decode_image(Path(path).read_bytes()) for path in paths]
+    single = lambda image: service.run_yolo(service.yolo_model, [image], service.CONF_THRESHOLD)[0]
+    stats = {}
+    cascaded = lambda image: cascade.detect([image], stats)[0]
+    for _ in range(args.warmup):
+        for image in images:
+            single(image)
+            cascaded(image)
+
+    reference, single_ms = time_detector(single, images, args.repeat)
+    stats.clear()
+    predicted, cascade_ms = time_detector(cascaded, images, args.repeat)
+
+    per_image = []
+    matched = extra = total = 0
+    for path, ref, pred in zip(paths, reference, predicted):
+        hit, more = match_counts(ref, pred, args.match_iou)
+        matched, extra, total = matched + hit, extra + more, total + len(ref)
+        per_image.append({"image": Path(path).name, "reference": len(ref), "cascade": len(pred),
+                          "matched": hit, "extra": more})
+        flag = "" if hit == len(ref) and not more else "  ⚠️"
+        print(f"  {Path(path).name:<16} 參考 {len(ref):>3}  cascade {len(pred):>3}  配對 {hit:>3}{flag}")
+
+    single_stats, cascade_stats = summarize(single_ms), summarize(cascade_ms)
+    summary = {
+        "single": single_stats,
+        "cascade": cascade_stats,
+        "speedup": round(single_stats["mean_ms"] / cascade_stats["mean_ms"], 2),
+        "recall": round(matched / total, 4) if total else 1.0,
+        "extra": extra,
+        "full_rate": round(stats["full"] / stats["images"], 4),
+        "regions_per_image": round(stats["regions"] / stats["images"], 2),
+    }
+    print(f"▶ 單一路徑 mean={single_stats['mean_ms']}ms p95={single_stats['p95_ms']}ms")
+    print(f"▶ cascade  mean={cascade_stats['mean_ms']}ms p95={cascade_stats['p95_ms']}ms  "
+          f"（{summary['speedup']}x，recall={summary['recall']}，多出 {extra} 個，"
+          f"整張圖 fine pass {summary['full_rate']:.0%}，平均 {summary['regions_per_image']} 個區域）")
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    config["images"] = len(paths)
+    write_report({"config": config, "summary": summary, "per_image": per_image},
+                 args.output or f"bench_results/detection-cascade-{git_commit()}.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+catalog 模糊搜尋擴充性 benchmark。
+
+以合成的 brand+flavor catalog（預設 1k / 10k / 100k 筆）比較：
+- full_scan : 原本的做法，對整個 catalog 跑 extractOne(partial_ratio)
+- index     : utils/fuzzy_index.FuzzyIndex（n-gram 篩選 + 形近字正規化）
+
+查詢字串由 catalog 項目加上 OCR 雜訊產生：前後夾雜標籤文字、部分字元換成形近字。
+回報每次查詢延遲、索引建立時間與 top-1 正確率。
+
+用法：
+    python -m benchmarks.fuzzy_index_bench
+    python -m benchmarks.fuzzy_index_bench --sizes 1000,100000 --queries 500
+"""
+
+import argparse
+import random
+import time
+
+from rapidfuzz import fuzz
+from rapidfuzz import process as fuzz_process
+
+from benchmarks.common import git_commit, summarize, write_report
+from utils.fuzzy_index import GLYPH_CONFUSIONS, FuzzyIndex
+
+BRAND_WORDS = ["茶裏王", "原萃", "御茶園", "每朝健康", "油切", "濃韻", "冷山", "純喫茶", "光泉", "統一", "麥香", "黑松"]
+FLAVOR_WORDS = ["綠茶", "烏龍", "紅茶", "青茶", "鐵觀音", "檸檬", "無糖", "微糖", "四季春", "金萱", "奶茶", "蜜香",
+                "白毫", "熟藏", "雙纖", "日式", "台式", "特上", "麥茶", "花茶", "普洱", "抹茶", "拿鐵", "烘焙"]
+LABEL_NOISE = ["保存期限", "內容量600ml", "營養標示", "未稅", "每100毫升", "熱量", "新包裝", "NT$25"]
+# 反向對照：正確字 → 可能被誤讀成的字
+_CONFUSABLE = {}
+for wrong, right in GLYPH_CONFUSIONS.items():
+    _CONFUSABLE.setdefault(right, []).append(wrong)
+
+
+def synthetic_catalog(size: int, seed: int = 0) -> list:
+    """品牌 × 口味組合再加上隨機字尾，保證 id 唯一"""
+    rng = random.Random(seed)
+    pool = [chr(0x4E00 + i) for i in rng.sample(range(20000), 2000)]
+    names = set()
+    while len(names) < size:
+        flavor = "".join(rng.sample(FLAVOR_WORDS, rng.randint(1, 2)))
+        suffix = "".join(rng.choices(pool, k=rng.randint(1, 3)))
+        names.add(f"{rng.choice(BRAND_WORDS)}{flavor}{suffix}")
+    return sorted(names)
+
+
+def noisy_query(name: str, rng: random.Random) -> str:
+    chars = [rng.choice(_CONFUSABLE[ch]) if ch in _CONFUSABLE and rng.random() < 0.5 else ch for ch in name]
+    return f"{rng.choice(LABEL_NOISE)} {''.join(chars)} {rng.choice(LABEL_NOISE)}"
+
+
+def bench_size(size: int, n_queries: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    catalog = synthetic_catalog(size, seed)
+    targets = [rng.choice(catalog) for _ in range(n_queries)]
+    queries = [noisy_query(t, rng) for t in targets]
+
+    started = time.perf_counter()
+    index = FuzzyIndex(catalog, catalog)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    results = {}
+    for mode in ("full_scan", "index"):
+        latencies = []
+        correct = 0
+        for target, query in zip(targets, queries):
+            t0 = time.perf_counter()
+            if mode == "full_scan":
+                found = fuzz_process.extractOne(query, catalog, scorer=fuzz.partial_ratio, score_cutoff=50)
+                matched = found[0] if found else None
+            else:
+                matched = index.search(query, score_cutoff=50)[0]
+            latencies.append((time.perf_counter() - t0) * 1000)
+            correct += matched == target
+        results[mode] = {"latency": summarize(latencies), "accuracy": round(correct / n_queries, 4)}
+    return {"catalog_size": size, "index_build_ms": round(build_ms, 1), **results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="catalog 模糊搜尋擴充性 benchmark")
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    rows = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        row = bench_size(size, args.queries, args.seed)
+        print(f"▶ {size:>7} 筆  建索引 {row['index_build_ms']}ms")
+        for mode in ("full_scan", "index"):
+            stats = row[mode]
+            print(f"    {mode:<10} p50={stats['latency']['p50_ms']}ms p95={stats['latency']['p95_ms']}ms "
+                  f"accuracy={stats['accuracy']:.2%}")
+        rows.append(row)
+
+    write_report({"queries": args.queries, "results": rows},
+                 args.output or f"bench_results/fuzzy-index-{git_commit()}.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+服務端點並發壓測。
+
+啟動本地 OCR / LLM 替身（benchmarks/stub_server.py）與真正的 FastAPI 服務（uvicorn），
+以 closed-loop 方式在多個並發等級下混合送出請求：
+- inventory : POST /inventory_base64
+- date      : POST /glm_ocr_inference_base64
+- list      : GET  /db/list
+
+每個並發等級回報各端點延遲 p50/p95/p99、錯誤率、429 比例與吞吐量，以及 OCR 排程器
+（GET /ocr/scheduler）各優先等級的排隊等待，最後取所有等級中最高的成功吞吐量作為飽和吞吐量。
+
+用法：
+    python -m benchmarks.load_test --concurrency 1,4,8,16 --duration 30 --mix inventory=3,date=5,list=2
+    python -m benchmarks.load_test --target http://store-server:8888   # 壓測既有服務，不啟動替身
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.common import REPO_ROOT, git_commit, list_images, summarize, write_report
+from utils.model_ipc import private_dir
+
+ENDPOINTS = {
+    "inventory": ("POST", "/inventory_base64"),
+    "date": ("POST", "/glm_ocr_inference_base64"),
+    "list": ("GET", "/db/list"),
+}
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise ValueError(f"未知的請求類型: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def _spawn(cmd: list, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(cmd, cwd=REPO_ROOT, env={**os.environ, **env},
+                            stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+
+
+def _wait_ready(url: str, timeout: float = 300.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"等待 {url} 啟動逾時")
+
+
+async def _worker(client, mix, payloads, stop_at, records, rng):
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    while time.monotonic() < stop_at:
+        kind = rng.choices(names, weights)[0]
+        method, path = ENDPOINTS[kind]
+        start = time.perf_counter()
+        try:
+            if method == "GET":
+                response = await client.get(path)
+            else:
+                response = await client.post(path, json={"image_base64": rng.choice(payloads[kind])})
+            status = response.status_code
+        except httpx.HTTPError:
+            status = 0  # 連線錯誤 / 逾時
+        records.append((kind, status, (time.perf_counter() - start) * 1000))
+
+
+async def run_level(base_url, concurrency, duration, mix, payloads, timeout, seed) -> dict:
+    records = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        stop_at = time.monotonic() + duration
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            _worker(client, mix, payloads, stop_at, records, random.Random(seed + i))
+            for i in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+        result = summarize_records(records, elapsed, concurrency)
+        # 排程器統計為服務啟動以來最近的等待分布，多 worker 時只取到其中一個 process
+        try:
+            response = await client.get("/ocr/scheduler")
+            if response.status_code == 200:
+                result["ocr_scheduler"] = response.json()["scheduler"]
+        except httpx.HTTPError:
+            pass
+    return result
+
+
+def summarize_records(records: list, elapsed: float, concurrency: int) -> dict:
+    by_kind = defaultdict(list)
+    for record in records:
+        by_kind[record[0]].append(record)
+
+    def stats(rows):
+        ok = [ms for _, status, ms in rows if 200 <= status < 300]
+        throttled = sum(1 for _, status, _ in rows if status == 429)
+        errors = sum(1 for _, status, _ in rows if not 200 <= status < 300 and status != 429)
+        return {
+            "requests": len(rows),
+            "latency": summarize(ok),
+            "error_rate": round(errors / len(rows), 4) if rows else 0.0,
+            "throttled_rate": round(throttled / len(rows), 4) if rows else 0.0,
+            "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        }
+
+    return {
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "overall": stats(records),
+        "endpoints": {kind: stats(rows) for kind, rows in sorted(by_kind.items())},
+    }
+
+
+def load_payloads(images_dir: str) -> dict:
+    paths = list_images(images_dir)
+    encoded = []
+    for path in paths:
+        with open(path, "rb") as f:
+            encoded.append(base64.b64encode(f.read()).decode("utf-8"))
+    if not encoded:
+        raise RuntimeError(f"{images_dir} 內沒有圖片")
+    return {"inventory": encoded, "date": encoded, "list": []}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="服務端點並發壓測")
+    parser.add_argument("--target", default=None, help="既有服務 URL；未指定則自行啟動服務與替身")
+    parser.add_argument("--port", type=int, default=8890)
+    parser.add_argument("--stub-port", type=int, default=11500)
+    parser.add_argument("--concurrency", default="1,2,4,8,16")
+    parser.add_argument("--duration", type=float, default=20.0, help="每個並發等級的秒數")
+    parser.add_argument("--mix", default="inventory=3,date=5,list=2")
+    parser.add_argument("--images-dir", default="images")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--ocr-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0)
+    parser.add_argument("--ocr-parallel", type=int, default=4)
+    parser.add_argument("--llm-parallel", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker 數")
+    parser.add_argument("--model-server", action="store_true",
+                        help="啟動共用 model server（model_server.py），worker 不各自載入模型")
+    parser.add_argument("--result-cache", action="store_true",
+                        help="保留服務的 /inventory_base64 結果快取；預設關閉，否則重複送出的 images/ "
+                             "幾乎全部命中快取，量到的是快取而不是 pipeline（--target 時不影響既有服務）")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    payloads = load_payloads(args.images_dir)
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    processes = []
+    base_url = args.target
+    try:
+        if base_url is None:
+            stub_url = f"http://127.0.0.1:{args.stub_port}"
+            processes.append(_spawn([
+                sys.executable, "-m", "benchmarks.stub_server", "--port", str(args.stub_port),
+                "--ocr-latency-ms", str(args.ocr_latency_ms),
+                "--llm-latency-ms", str(args.llm_latency_ms),
+                "--ocr-parallel", str(args.ocr_parallel),
+                "--llm-parallel", str(args.llm_parallel),
+            ], {}))
+            _wait_ready(f"{stub_url}/health")
+
+            service_env = {
+                "OLLAMA_HOST": stub_url,
+                "LLAMA_SERVER_URL": f"{stub_url}/v1",
+                "LLAMA_SERVER_AUTOSTART": "0",
+                "TRACE_EXPORTER": "none",
+                "DEBUG_SAVE": "0",
+                # OCR 排程器的全域並發與替身的平行處理數一致
+                "OCR_OLLAMA_GLM_MAX_CONCURRENCY": str(args.ocr_parallel),
+            }
+            if not args.result_cache:
+                service_env["RESULT_CACHE_SIZE"] = "0"
+            if args.model_server:
+                address = os.path.join(private_dir(), f"model_server_{args.port}.sock")
+                processes.append(_spawn([sys.executable, "model_server.py"],
+                                        {**service_env, "MODEL_SERVER_ADDRESS": address}))
+                service_env["MODEL_SERVER_ADDRESS"] = address
+            processes.append(_spawn([
+                sys.executable, "-m", "uvicorn", "service:app",
+                "--port", str(args.port), "--workers", str(args.workers),
+            ], service_env))
+            base_url = f"http://127.0.0.1:{args.port}"
+            _wait_ready(f"{base_url}/")
+
+        results = []
+        for level in levels:
+            print(f"▶ 並發 {level}，持續 {args.duration}s ...")
+            result = asyncio.run(run_level(base_url, level, args.duration, mix, payloads,
+                                           args.timeout, seed=level * 1000))
+            overall = result["overall"]
+            print(f"  {overall['throughput_rps']} req/s, p95={overall['latency'].get('p95_ms')}ms, "
+                  f"error={overall['error_rate']:.2%}, 429={overall['throttled_rate']:.2%}")
+            for kind, stats in result["endpoints"].items():
+                print(f"    {kind:<10} p50={stats['latency'].get('p50_ms')}ms "
+                      f"p99={stats['latency'].get('p99_ms')}ms rps={stats['throughput_rps']}")
+            for name, stats in result.get("ocr_scheduler", {}).get("classes", {}).items():
+                if stats["wait_ms"]:
+                    print(f"    OCR {name:<9} 排隊 p50={stats['wait_ms']['p50']}ms p95={stats['wait_ms']['p95']}ms "
+                          f"({stats['granted']} 次)")
+            results.append(result)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait(timeout=30)
+
+    best = max(results, key=lambda r: r["overall"]["throughput_rps"])
+    saturation = best["overall"]["throughput_rps"]
+    # 第一個達到飽和吞吐量 90% 的並發等級，再往上加並發只會拉長延遲
+    knee = next(r["concurrency"] for r in results if r["overall"]["throughput_rps"] >= 0.9 * saturation)
+    print(f"飽和吞吐量: {saturation} req/s（並發 {best['concurrency']}），建議並發上限約 {knee}")
+
+    report = {
+        "config": {**{k: v for k, v in vars(args).items() if k != "output"}, "mix": mix},
+        "levels": results,
+        "saturation": {"throughput_rps": saturation, "concurrency": best["concurrency"], "knee_concurrency": knee},
+    }
+    write_report(report, args.output or f"bench_results/load-{git_commit()}.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+OCR backend 延遲與吞吐量比較。
+
+對 images/ 的每張圖，以不同並發數呼叫各 backend（backend 本身的並發上限仍然生效），
+回報延遲 p50/p95/p99、吞吐量與錯誤數。
+預設先以各 backend 的 input_spec 縮放 / 編碼（與 service 相同），--raw 則直接送原檔，
+可比較輸入尺寸對延遲的影響。
+
+用法：
+    python -m benchmarks.ocr_backends_bench --backends ollama_glm,llama_vision,paddle --concurrency 1,4
+    python -m benchmarks.ocr_backends_bench --backends stub   # 不需任何 backend，驗證流程用
+    python -m benchmarks.ocr_backends_bench --backends ollama_glm --raw
+"""
+
+import argparse
+import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from benchmarks.common import git_commit, list_images, summarize, write_report
+from benchmarks.stubs import StubOCRBackend
+from utils.ocr_backends import create_ocr_backend
+
+
+def run_backend(backend, payloads: list, concurrency: int, repeat: int) -> dict:
+    latencies = []
+    errors = 0
+
+    def call(payload):
+        start = time.perf_counter()
+        backend.recognize(payload)
+        return (time.perf_counter() - start) * 1000
+
+    jobs = payloads * repeat
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(call, payload) for payload in jobs]
+        for future in futures:
+            try:
+                latencies.append(future.result())
+            except Exception as e:
+                errors += 1
+                print(f"  [{backend.name}] 失敗: {e}")
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "latency": summarize(latencies),
+        "errors": errors,
+        "throughput_per_s": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OCR backend 比較")
+    parser.add_argument("--backends", default="ollama_glm")
+    parser.add_argument("--images-dir", default="images")
+    parser.add_argument("--concurrency", default="1,2,4")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--raw", action="store_true", help="直接送原始檔案，不經 OCR 輸入準備")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    raw_files = [Path(path).read_bytes() for path in list_images(args.images_dir)]
+
+    results = {}
+    for name in args.backends.split(","):
+        backend = StubOCRBackend() if name == "stub" else create_ocr_backend(name)
+        print(f"▶ {name}: {backend.describe()}")
+        if args.raw:
+            payloads = [base64.b64encode(data).decode("utf-8") for data in raw_files]
+        else:
+            payloads = [backend.prepare_input(cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR))
+                        for data in raw_files]
+        payload_kb = sum(len(p) if args.raw else len(p.b64) for p in payloads) / max(len(payloads), 1) / 1024
+        print(f"  平均 payload {payload_kb:.1f} KB（base64）")
+        for payload in payloads[: args.warmup]:
+            backend.recognize(payload)  # 模型載入 / 連線建立不計入
+        runs = []
+        for level in (int(c) for c in args.concurrency.split(",")):
+            run = run_backend(backend, payloads, level, args.repeat)
+            print(f"  並發 {level}: p50={run['latency'].get('p50_ms')}ms "
+                  f"p95={run['latency'].get('p95_ms')}ms {run['throughput_per_s']} img/s errors={run['errors']}")
+            runs.append(run)
+        results[name] = {"config": backend.describe(), "avg_payload_kb": round(payload_kb, 1), "runs": runs}
+
+    write_report({"images": len(raw_files), "raw": args.raw, "backends": results},
+                 args.output or f"bench_results/ocr-backends-{git_commit()}.json")
+
+
+if __name__ == "__main__":
+    main()
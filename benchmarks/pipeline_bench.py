@@ -0,0 +1,152 @@
+"""
+離線端到端 pipeline benchmark。
+
+在同一個 process 內載入 YOLO / CLIP / ChromaDB，OCR 與 LLM 換成可設定延遲的替身，
+不需網路、不啟動 llama-server，也可在沒有 GPU 的機器上執行。
+
+- images/   : 跑完整 /inventory_base64 流程
+- my_crops/ : 針對已標註的 crop 只跑 match_bottle（替身 OCR 回傳資料夾名稱）
+
+各 stage 耗時取自 OpenTelemetry span（見 utils/tracing.py），輸出 p50/p95/p99 與吞吐量。
+
+用法：
+    python -m benchmarks.pipeline_bench --ocr-latency-ms 300 --llm-latency-ms 800
+    python -m benchmarks.pipeline_bench --compare bench_results/pipeline-abc1234.json
+"""
+
+import argparse
+import base64
+import os
+import time
+from collections import defaultdict
+from pathlib import Path
+
+os.environ.setdefault("TRACE_EXPORTER", "none")
+os.environ.setdefault("DEBUG_SAVE", "0")
+
+from benchmarks.common import compare_reports, git_commit, list_images, summarize, write_report
+from benchmarks.stubs import StubLLMClient, StubOCRBackend
+
+from opentelemetry import trace
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+
+def collect_stage_stats(exporter: InMemorySpanExporter) -> dict:
+    durations = defaultdict(list)
+    for span in exporter.get_finished_spans():
+        durations[span.name].append((span.end_time - span.start_time) / 1e6)
+    exporter.clear()
+    return {name: summarize(values) for name, values in sorted(durations.items())}
+
+
+def bench_images(service, image_paths, repeat: int, warmup: int) -> dict:
+    payloads = []
+    for path in image_paths:
+        with open(path, "rb") as f:
+            payloads.append(base64.b64encode(f.read()).decode("utf-8"))
+
+    for b64 in payloads[:warmup]:
+        service.run_inventory(service.Base64ImageRequest(image_base64=b64))
+
+    wall = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for b64 in payloads:
+            t0 = time.perf_counter()
+            service.run_inventory(service.Base64ImageRequest(image_base64=b64))
+            wall.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(wall),
+        "wall": summarize(wall),
+        "images_per_s": round(len(wall) / elapsed, 3) if elapsed else 0.0,
+    }
+
+
+def bench_crops(service, crop_paths, ocr: StubOCRBackend, repeat: int) -> dict:
+    crops = [(Path(p).parent.name, service.decode_image(Path(p).read_bytes())) for p in crop_paths]
+    correct = 0
+    total = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for i, (label, image) in enumerate(crops):
+            ocr.texts = [label]
+            matched, _ = service.match_bottle(image, service.encode_image(image), None, i)
+            correct += matched == label
+            total += 1
+    elapsed = time.perf_counter() - start
+    return {
+        "crops": total,
+        "accuracy": round(correct / total, 4) if total else None,
+        "crops_per_s": round(total / elapsed, 3) if elapsed else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="離線端到端 pipeline benchmark")
+    parser.add_argument("--images-dir", default="images")
+    parser.add_argument("--crops-dir", default="my_crops")
+    parser.add_argument("--ocr-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0)
+    parser.add_argument("--sigma", type=float, default=0.25, help="替身延遲的 lognormal sigma")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None, help="與先前的報告比較")
+    args = parser.parse_args(argv)
+
+    import service
+
+    exporter = InMemorySpanExporter()
+    trace.get_tracer_provider().add_span_processor(SimpleSpanProcessor(exporter))
+
+    service.load_models()
+    ocr = StubOCRBackend(latency_ms=args.ocr_latency_ms, sigma=args.sigma)
+    service.ocr_backend = ocr
+    service.client = StubLLMClient(latency_ms=args.llm_latency_ms, sigma=args.sigma)
+    # 每輪重送同樣的圖片，關閉結果快取才量得到整條流程
+    service.result_cache = None
+
+    image_paths = list_images(args.images_dir)
+    crop_paths = list_images(args.crops_dir, recursive=True)
+
+    # 替身 OCR 對整張貨架圖輪流回傳 catalog 名稱，讓 fuzzy / 驗證路徑都會被走到
+    ocr.texts = service.collection.get()["ids"] or [""]
+    images_result = bench_images(service, image_paths, args.repeat, args.warmup)
+    image_stages = collect_stage_stats(exporter)
+
+    crops_result = bench_crops(service, crop_paths, ocr, args.repeat)
+    crop_stages = collect_stage_stats(exporter)
+
+    report = {
+        "config": {
+            "ocr_latency_ms": args.ocr_latency_ms,
+            "llm_latency_ms": args.llm_latency_ms,
+            "sigma": args.sigma,
+            "repeat": args.repeat,
+            "images": len(image_paths),
+            "crops": len(crop_paths),
+        },
+        "images": images_result,
+        "stages": image_stages,
+        "crops": crops_result,
+        "crop_stages": crop_stages,
+    }
+
+    for title, stages in (("images/", image_stages), ("my_crops/", crop_stages)):
+        print(f"===== {title} =====")
+        for name, stats in stages.items():
+            print(f"  {name:<28} n={stats['count']:<5} p50={stats['p50_ms']:>9.2f}ms "
+                  f"p95={stats['p95_ms']:>9.2f}ms p99={stats['p99_ms']:>9.2f}ms")
+    print(f"吞吐量: {images_result['images_per_s']} images/s, {crops_result['crops_per_s']} crops/s")
+
+    output = args.output or f"bench_results/pipeline-{git_commit()}.json"
+    write_report(report, output)
+    if args.compare:
+        compare_reports(args.compare, output)
+        compare_reports(args.compare, output, section="crop_stages")
+
+
+if __name__ == "__main__":
+    main()
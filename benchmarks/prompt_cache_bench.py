@@ -0,0 +1,184 @@
+"""
+盤點回答 prompt 快取的 time-to-first-token benchmark。
+
+比較兩種 prompt 排列，各自開 / 關 cache_prompt，依序送出掃描清單與問題皆不同的請求（串流），量測
+TTFT（收到第一個內容 token）與總延遲，並記錄 llama-server 回報的 cache_n（命中 KV cache 的 tokens）：
+
+- legacy : 舊版 SYSTEM_PROMPT_TEMPLATE，掃描清單在 system prompt 開頭，其後的規則與範例每次都要重新 prefill
+- prefix : utils/answer_prompt.py，固定的 system prompt 在前，掃描清單與問題在最後
+
+預設啟動 benchmarks/stub_server.py 的 prompt 快取模擬（--prefill-ms-per-token / --decode-ms-per-token），
+數字只反映 prefill 的 token 數差異；--target 指向真正的 llama-server 時量測實際延遲。
+
+用法：
+    python -m benchmarks.prompt_cache_bench --requests 30
+    python -m benchmarks.prompt_cache_bench --target http://127.0.0.1:8881   # 實際 llama-server
+"""
+
+import argparse
+import json
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import REPO_ROOT, git_commit, summarize, write_report
+from utils.answer_prompt import build_messages, format_scan_list
+
+# 改版前的 prompt（掃描清單在規則與範例之前），僅供比較
+LEGACY_SYSTEM_PROMPT_TEMPLATE = """你是一位專業的超商貨架分析員。請根據以下掃描結果清單回答用戶問題。
+
+【掃描結果清單】
+{scan_list}
+
+【回答規則與範例】
+1. 若用戶詢問「統計商品」或類似整體盤點的問題，嚴格遵守以下格式：
+   根據掃描結果清單，以下是各商品的數量統計：
+   [商品名稱] 有 [數量] 瓶
+   (以此類推，每行一個，不使用列點符號或顏色前綴)
+
+2. 若用戶詢問「有幾瓶 [特定商品]」，嚴格遵守以下格式：
+   [特定商品] 有 [數量] 瓶
+   (如果該商品完全不存在，請回：沒有找到您指定的商品)
+
+3. 輸出禁止包含額外的解釋或結尾客套話。
+4. 忽略顏色前綴（例如「灰色茶裏王」僅回答「茶裏王」），以掃描清單中的商品名稱為主。
+5. 必須使用繁體中文。
+6. 用戶輸入可能來自語音轉文字（STT），若遇到諧音詞，請自動對應到清單中最接近的商品
+
+【範例】
+用戶：統計商品
+回答：
+根據掃描結果清單，以下是各商品的數量統計：
+原萃台灣青茶 有 1 瓶
+茶裏王半熟金萱 有 1 瓶
+茶裏王白毫烏龍 有 1 瓶
+無加糖LP33機能優酪乳 有 2 瓶
+
+用戶：有幾瓶茶裏王白毫烏龍？
+回答：茶裏王白毫烏龍 有 1 瓶
+"""
+
+PRODUCTS = ["茶裏王白毫烏龍", "茶裏王半熟金萱", "原萃台灣青茶", "原萃日式綠茶", "御茶園特上紅茶", "光泉鮮乳",
+            "無加糖LP33機能優酪乳", "麥香奶茶", "波蜜果菜汁", "悅氏礦泉水", "黑松沙士", "愛之味番茄汁"]
+QUESTIONS = ["統計商品", "有幾瓶茶裏王白毫烏龍？", "有幾瓶原萃？", "光泉鮮乳有幾瓶", "麥香奶茶還剩多少"]
+
+
+def legacy_messages(scan_list: str, question: str) -> list:
+    return [
+        {"role": "system", "content": LEGACY_SYSTEM_PROMPT_TEMPLATE.format(scan_list=scan_list)},
+        {"role": "user", "content": [{"type": "text", "text": question}]},
+    ]
+
+
+LAYOUTS = {"legacy": legacy_messages, "prefix": build_messages}
+
+
+def make_requests(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(count):
+        names = rng.sample(PRODUCTS, rng.randint(2, 8))
+        requests.append((format_scan_list({name: rng.randint(1, 6) for name in names}), rng.choice(QUESTIONS)))
+    return requests
+
+
+def stream_completion(client: httpx.Client, url: str, model: str, messages: list, cache_prompt: bool) -> dict:
+    """送出串流請求，回傳 TTFT / 總延遲（ms）與最後一個 chunk 的 timings"""
+    body = {"model": model, "messages": messages, "temperature": 0, "stream": True, "cache_prompt": cache_prompt}
+    started = time.perf_counter()
+    ttft_ms, timings = None, {}
+    with client.stream("POST", url, json=body) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line.startswith("data: ") or line == "data: [DONE]":
+                continue
+            chunk = json.loads(line[len("data: "):])
+            delta = chunk["choices"][0]["delta"] if chunk.get("choices") else {}
+            if ttft_ms is None and delta.get("content"):
+                ttft_ms = (time.perf_counter() - started) * 1000
+            timings = chunk.get("timings") or timings
+    return {"ttft_ms": ttft_ms, "total_ms": (time.perf_counter() - started) * 1000, "timings": timings}
+
+
+def run_config(client, url, model, layout: str, cache_prompt: bool, requests: list) -> dict:
+    build = LAYOUTS[layout]
+    # 第一個請求只用來填滿 slot 的快取，不計入
+    stream_completion(client, url, model, build(*requests[0]), cache_prompt)
+    ttft, total, cached, prompt_n = [], [], [], []
+    for scan_list, question in requests[1:]:
+        result = stream_completion(client, url, model, build(scan_list, question), cache_prompt)
+        ttft.append(result["ttft_ms"])
+        total.append(result["total_ms"])
+        cached.append(result["timings"].get("cache_n", 0))
+        prompt_n.append(result["timings"].get("prompt_n", 0))
+    print(f"  {layout:<7} cache_prompt={str(cache_prompt):<5} TTFT p50={summarize(ttft)['p50_ms']:>8.1f}ms "
+          f"cache_n 平均={sum(cached) / len(cached):>6.1f} prefill 平均={sum(prompt_n) / len(prompt_n):>6.1f} tokens")
+    return {
+        "layout": layout,
+        "cache_prompt": cache_prompt,
+        "ttft": summarize(ttft),
+        "total": summarize(total),
+        "mean_cached_tokens": round(sum(cached) / len(cached), 1),
+        "mean_prefill_tokens": round(sum(prompt_n) / len(prompt_n), 1),
+    }
+
+
+def _wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} 未在 {timeout}s 內就緒")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="盤點回答 prompt 快取 TTFT benchmark")
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--target", default=None, help="llama-server 位址（不啟動替身）")
+    parser.add_argument("--model", default="ministral_3_3b")
+    parser.add_argument("--stub-port", type=int, default=11510)
+    parser.add_argument("--prefill-ms-per-token", type=float, default=2.0, help="替身的 prefill 速度")
+    parser.add_argument("--decode-ms-per-token", type=float, default=20.0, help="替身的 decode 速度")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    stub = None
+    base_url = args.target
+    if base_url is None:
+        base_url = f"http://127.0.0.1:{args.stub_port}"
+        stub = subprocess.Popen([
+            sys.executable, "-m", "benchmarks.stub_server", "--port", str(args.stub_port), "--llm-parallel", "1",
+            "--llm-prefill-ms-per-token", str(args.prefill_ms_per_token),
+            "--llm-decode-ms-per-token", str(args.decode_ms_per_token),
+        ], cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    try:
+        _wait_ready(f"{base_url}/health")
+        requests = make_requests(args.requests + 1, args.seed)
+        results = []
+        with httpx.Client(timeout=120.0) as client:
+            for layout in LAYOUTS:
+                for cache_prompt in (False, True):
+                    results.append(run_config(client, f"{base_url}/v1/chat/completions", args.model, layout,
+                                              cache_prompt, requests))
+    finally:
+        if stub is not None:
+            stub.terminate()
+            stub.wait()
+
+    report = {
+        "config": {**vars(args), "backend": "llama-server" if args.target else "stub"},
+        "results": results,
+    }
+    write_report(report, args.output or f"bench_results/prompt-cache-{git_commit()}.json")
+
+
+if __name__ == "__main__":
+    main()
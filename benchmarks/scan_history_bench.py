@@ -0,0 +1,113 @@
+"""
+掃描歷史查詢 benchmark。
+
+以合成掃描資料（預設 10 萬 / 100 萬次掃描、30 天、50 家店、300 個 SKU，每次掃描約 4 個 SKU）
+依時間順序寫入 utils/scan_history.ScanHistory：每 --flush-rows 次掃描 flush 一次，並與 service 相同，
+當天分區達 compact_files 個檔案即合併。分別在「只有當天合併」與「過日合併成單一檔案」後量測：
+
+- store_sku_daily : 單一店、單一 SKU、一個月內的每日數量（分區裁剪 + SKU 條件）
+- sku_totals      : 一週內所有店依 SKU 加總
+- store_scans     : 整個期間各店的掃描次數、未知率與延遲分布
+
+用法：
+    python -m benchmarks.scan_history_bench
+    python -m benchmarks.scan_history_bench --scans 1000000 --repeat 10
+"""
+
+import argparse
+import random
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from benchmarks.common import git_commit, summarize, write_report
+from utils.scan_history import ScanHistory
+
+
+def populate(history: ScanHistory, start_day: date, scans: int, args):
+    rng = random.Random(args.seed)
+    store_ids = [f"S{i:03d}" for i in range(args.stores)]
+    sku_names = [f"SKU{i:04d}" for i in range(args.skus)] + ["未知商品"]
+    start = datetime.combine(start_day, datetime.min.time())
+    offsets = sorted(rng.randrange(args.days * 86400) for _ in range(scans))
+    for i, offset in enumerate(offsets, 1):
+        ts = start + timedelta(seconds=offset)
+        counts = {sku: rng.randint(1, 6) for sku in rng.sample(sku_names, rng.randint(1, 7))}
+        history.record(rng.choice(store_ids), counts, rng.uniform(300, 3000), "inventory",
+                       unknown=counts.get("未知商品", 0), ts=ts)
+        if i % args.flush_rows == 0 or i == scans:
+            history.flush()
+            history.compact(ts.date(), history.compact_files)
+
+
+def time_queries(history: ScanHistory, start_day: date, days: int, repeat: int) -> dict:
+    end = start_day + timedelta(days=days - 1)
+    queries = {
+        "store_sku_daily": lambda: history.query_counts(start_day, end, stores=["S001"], skus=["SKU0001"],
+                                                        group_by=("sku",), interval="1d"),
+        "sku_totals": lambda: history.query_counts(start_day, start_day + timedelta(days=6), group_by=("sku",)),
+        "store_scans": lambda: history.query_scans(group_by=("store",)),
+    }
+    results = {}
+    for name, query in queries.items():
+        query()
+        latencies = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            query()
+            latencies.append((time.perf_counter() - t0) * 1000)
+        results[name] = summarize(latencies)
+    return results
+
+
+def bench_size(scans: int, args) -> dict:
+    path = tempfile.mkdtemp(prefix="scan_history_bench_")
+    try:
+        # 合成資料落在今天以前，compact() 會將其視為已結束的分區
+        start_day = date.today() - timedelta(days=args.days)
+        history = ScanHistory(path, flush_rows=scans + 1, compact_files=args.compact_files)
+        started = time.perf_counter()
+        populate(history, start_day, scans, args)
+        row = {"scans": scans, "write_s": round(time.perf_counter() - started, 2),
+               "files_before": sum(1 for _ in history.root.rglob("*.parquet"))}
+        row["before_compact"] = time_queries(history, start_day, args.days, args.repeat)
+        started = time.perf_counter()
+        history.compact()
+        row["compact_s"] = round(time.perf_counter() - started, 2)
+        row["files_after"] = sum(1 for _ in history.root.rglob("*.parquet"))
+        row["after_compact"] = time_queries(history, start_day, args.days, args.repeat)
+        return row
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="掃描歷史查詢 benchmark")
+    parser.add_argument("--scans", default="100000,1000000")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--stores", type=int, default=50)
+    parser.add_argument("--skus", type=int, default=300)
+    parser.add_argument("--flush-rows", type=int, default=1000, help="每幾次掃描 flush 一次")
+    parser.add_argument("--compact-files", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    rows = []
+    for scans in (int(s) for s in args.scans.split(",")):
+        row = bench_size(scans, args)
+        print(f"▶ {scans:>8} 次掃描  寫入 {row['write_s']}s  檔案 {row['files_before']} → {row['files_after']}"
+              f"（合併 {row['compact_s']}s）")
+        for phase in ("before_compact", "after_compact"):
+            for name, stats in row[phase].items():
+                print(f"    {phase:<14} {name:<16} p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms")
+        rows.append(row)
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    write_report({"config": config, "results": rows}, args.output or f"bench_results/scan-history-{git_commit()}.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+服務啟動 benchmark：比較 SERVICE_PROFILE=date 與 full 的匯入時間、啟動時間與記憶體。
+
+每次量測都在全新的子 process 中執行（模組快取不會影響結果），量測：
+
+- import_s  : import service 所需時間
+- startup_s : lifespan 啟動（full 會載入 YOLO / CLIP、開啟 ChromaDB）所需時間
+- first_ms  : 啟動後第一個 GET / 的延遲
+- max_rss_mb: 子 process 的最大 RSS
+- heavy     : 已載入的重量級模組（torch、chromadb、openai 等）
+
+full profile 需要完整的模型與套件環境；無法啟動時記錄錯誤訊息並繼續。
+llama-server 一律不自動啟動（LLAMA_SERVER_AUTOSTART=0），只量測本 process 的成本。
+
+用法：
+    python -m benchmarks.startup_bench
+    python -m benchmarks.startup_bench --profiles date --repeat 10
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.common import REPO_ROOT, git_commit, summarize, write_report
+
+HEAVY_MODULES = ("torch", "ultralytics", "sentence_transformers", "chromadb", "openai", "polars",
+                 "cv2", "numpy", "PIL", "rapidfuzz")
+
+_CHILD = """
+import json, resource, sys, time
+t0 = time.perf_counter()
+import service
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(service.app) as client:
+    t2 = time.perf_counter()
+    response = client.get("/")
+    t3 = time.perf_counter()
+    assert response.status_code == 200, response.text
+heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+print("@@" + json.dumps({
+    "import_s": t1 - t0, "startup_s": t2 - t1, "first_ms": (t3 - t2) * 1000,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "heavy": heavy,
+}))
+"""
+
+
+def run_once(profile: str, timeout: float) -> dict:
+    env = {**os.environ, "SERVICE_PROFILE": profile, "TRACE_EXPORTER": "none", "DEBUG_SAVE": "0",
+           "LLAMA_SERVER_AUTOSTART": "0"}
+    code = f"HEAVY_MODULES = {HEAVY_MODULES!r}\n{_CHILD}"
+    proc = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, env=env, capture_output=True,
+                          text=True, timeout=timeout)
+    for line in proc.stdout.splitlines():
+        if line.startswith("@@"):
+            return json.loads(line[2:])
+    lines = (proc.stderr or proc.stdout).strip().splitlines()
+    raise RuntimeError(lines[-1] if lines else f"exit code {proc.returncode}")
+
+
+def bench_profile(profile: str, repeat: int, timeout: float) -> dict:
+    runs = []
+    for _ in range(repeat):
+        try:
+            runs.append(run_once(profile, timeout))
+        except (RuntimeError, subprocess.TimeoutExpired) as e:
+            return {"profile": profile, "error": str(e), "runs": len(runs)}
+    return {
+        "profile": profile,
+        "import": summarize(r["import_s"] * 1000 for r in runs),
+        "startup": summarize(r["startup_s"] * 1000 for r in runs),
+        "first_request": summarize(r["first_ms"] for r in runs),
+        "max_rss_mb": round(max(r["max_rss_mb"] for r in runs), 1),
+        "heavy_modules": runs[-1]["heavy"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="服務啟動 benchmark")
+    parser.add_argument("--profiles", default="date,full")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=300.0, help="單次子 process 逾時（秒）")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    rows = []
+    for profile in args.profiles.split(","):
+        row = bench_profile(profile, args.repeat, args.timeout)
+        if "error" in row:
+            print(f"▶ {profile:<5} 無法啟動: {row['error']}")
+        else:
+            print(f"▶ {profile:<5} import p50={row['import']['p50_ms']}ms  "
+                  f"startup p50={row['startup']['p50_ms']}ms  "
+                  f"first GET / p50={row['first_request']['p50_ms']}ms  "
+                  f"max RSS={row['max_rss_mb']}MB  heavy={row['heavy_modules'] or '-'}")
+        rows.append(row)
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    write_report({"config": config, "results": rows}, args.output or f"bench_results/startup-{git_commit()}.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+本地 OCR / LLM 替身 HTTP server。
+
+同一個 process 同時提供：
+- Ollama     POST /api/chat               （glm-ocr 替身）
+- llama.cpp  POST /v1/chat/completions    （llama-server 替身）
+
+延遲以 lognormal 分布模擬，並以 --ocr-parallel / --llm-parallel 限制同時處理數，
+模擬 OLLAMA_NUM_PARALLEL 與 llama-server slot 數的上限。
+
+故障注入（測試 hedged request 與斷路器）：
+- --ocr-error-rate / --llm-error-rate : 回傳 500 的比例
+- --ocr-hang-rate / --llm-hang-rate   : 佔住 slot 卡住 --hang-s 秒的比例（模擬 Ollama 無回應）
+- --slow-rate / --slow-factor          : 延遲乘上 slow-factor 的比例（長尾）
+- POST /faults {"ocr": {"error_rate": 1.0, "hang_next": 2}, ...} 可在執行中調整，
+  hang_next / fail_next 讓接下來的 N 個請求卡住 / 失敗；GET /faults 查看目前設定
+
+prompt 快取模擬（--llm-prefill-ms-per-token > 0 時取代 --llm-latency-ms）：
+- token 數以 chat template 展開後的字元數近似
+- 每個 slot 保留上一次的 prompt，請求分配到與 prompt 共同前綴最長的閒置 slot；
+  cache_prompt 為真（llama-server 預設）時只 prefill 共同前綴之後的部分
+- 回覆依 --llm-decode-ms-per-token 逐 token 產生，"stream": true 時以 SSE 逐 token 送出（量測 TTFT）
+- 回應附上 llama-server 格式的 timings（prompt_n / cache_n / prompt_ms / predicted_ms）
+- --llm-ramble-tokens 讓回答後繼續產生多餘內容（不實作 grammar），max_tokens 會截斷回答；
+  GET /stats 查看實際產生的 token 數（串流被 client 中途關閉後即停止）
+
+用法：
+    python -m benchmarks.stub_server --port 11500 --ocr-latency-ms 300 --llm-latency-ms 800
+    OLLAMA_HOST=http://127.0.0.1:11500 LLAMA_SERVER_URL=http://127.0.0.1:11500/v1 \\
+        LLAMA_SERVER_AUTOSTART=0 uvicorn service:app --port 8888
+    python -m benchmarks.stub_server --llm-prefill-ms-per-token 2 --llm-decode-ms-per-token 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from functools import partial
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from benchmarks.stubs import message_text, scan_list_answer
+
+
+@dataclass
+class Faults:
+    error_rate: float = 0.0
+    hang_rate: float = 0.0
+    # 接下來的 N 個請求必定卡住 / 失敗（優先於比例）
+    hang_next: int = 0
+    fail_next: int = 0
+
+
+@dataclass
+class StubConfig:
+    ocr_latency_ms: float = 300.0
+    llm_latency_ms: float = 800.0
+    sigma: float = 0.25
+    ocr_parallel: int = 4
+    llm_parallel: int = 1
+    ocr_text: str = "茶裏王白毫烏龍"
+    ocr_faults: Faults = field(default_factory=Faults)
+    llm_faults: Faults = field(default_factory=Faults)
+    slow_rate: float = 0.0
+    slow_factor: float = 10.0
+    hang_s: float = 300.0
+    # > 0 時以 token 數模擬 prefill / decode 時間與 prompt 快取
+    llm_prefill_ms_per_token: float = 0.0
+    llm_decode_ms_per_token: float = 20.0
+    # 回答後多產生的 token 數（模擬停不下來的模型；請求的 max_tokens 仍會截斷）
+    llm_ramble_tokens: int = 0
+
+
+RAMBLE_TEXT = "以上是本次掃描的統計結果，如果還有其他問題，歡迎隨時詢問。"
+
+
+def _render_prompt(messages: list) -> str:
+    """簡化的 chat template：各 message 依序展開"""
+    return "".join(f"<|{m.get('role')}|>\n{message_text(m)}\n" for m in messages) + "<|assistant|>\n"
+
+
+def _common_prefix(a: str, b: str) -> int:
+    return len(os.path.commonprefix([a, b]))
+
+
+def create_app(config: StubConfig) -> FastAPI:
+    app = FastAPI(title="OCR/LLM stub")
+    rng = random.Random(0)
+    ocr_slots = asyncio.Semaphore(config.ocr_parallel)
+    llm_slots = asyncio.Semaphore(config.llm_parallel)
+
+    stats = {"requests": 0, "decoded_tokens": 0}
+    # 各 llama-server slot 目前 KV cache 中的 prompt
+    llm_cache = [""] * config.llm_parallel
+    llm_idle = set(range(config.llm_parallel))
+
+    def _pick_fault(faults: Faults):
+        if faults.hang_next > 0:
+            faults.hang_next -= 1
+            return "hang"
+        if faults.fail_next > 0:
+            faults.fail_next -= 1
+            return "error"
+        roll = rng.random()
+        return ("hang" if roll < faults.hang_rate else
+                "error" if roll < faults.hang_rate + faults.error_rate else None)
+
+    async def _simulate(latency_ms: float, slots: asyncio.Semaphore, faults: Faults):
+        fault = _pick_fault(faults)
+        if fault is None and rng.random() < config.slow_rate:
+            latency_ms *= config.slow_factor
+        async with slots:
+            if fault == "hang":
+                await asyncio.sleep(config.hang_s)
+            else:
+                await asyncio.sleep(latency_ms * rng.lognormvariate(0, config.sigma) / 1000)
+        if fault == "error":
+            raise HTTPException(status_code=500, detail="injected fault")
+
+    @app.post("/api/chat")
+    async def ollama_chat(request: Request):
+        body = await request.json()
+        start = time.perf_counter_ns()
+        await _simulate(config.ocr_latency_ms, ocr_slots, config.ocr_faults)
+        return {
+            "model": body.get("model", "glm-ocr:q8_0"),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "message": {"role": "assistant", "content": config.ocr_text},
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": time.perf_counter_ns() - start,
+        }
+
+    async def _prefill(prompt: str, cache_prompt: bool):
+        """取得與 prompt 共同前綴最長的閒置 slot 並模擬 prefill，回傳 (slot, timings)"""
+        fault = _pick_fault(config.llm_faults)
+        await llm_slots.acquire()
+        slot = max(llm_idle, key=lambda i: _common_prefix(llm_cache[i], prompt))
+        llm_idle.remove(slot)
+        try:
+            if fault == "hang":
+                await asyncio.sleep(config.hang_s)
+            elif fault == "error":
+                raise HTTPException(status_code=500, detail="injected fault")
+            cache_n = _common_prefix(llm_cache[slot], prompt) if cache_prompt else 0
+            prompt_ms = (len(prompt) - cache_n) * config.llm_prefill_ms_per_token
+            await asyncio.sleep(prompt_ms / 1000)
+            llm_cache[slot] = prompt
+        except BaseException:
+            _release_slot(slot)
+            raise
+        return slot, {"cache_n": cache_n, "prompt_n": len(prompt) - cache_n, "prompt_ms": round(prompt_ms, 3)}
+
+    def _release_slot(slot: int):
+        llm_idle.add(slot)
+        llm_slots.release()
+
+    def _completion_body(body: dict, content: str, finish_reason: str, timings: dict) -> dict:
+        return {
+            "id": f"chatcmpl-stub-{rng.randrange(1 << 30)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": finish_reason,
+            }],
+            "usage": {"prompt_tokens": timings.get("prompt_n", 0) + timings.get("cache_n", 0),
+                      "completion_tokens": timings.get("predicted_n", 0),
+                      "total_tokens": timings.get("prompt_n", 0) + timings.get("cache_n", 0)
+                      + timings.get("predicted_n", 0)},
+            "timings": timings,
+        }
+
+    def _stream(body: dict, content: str, finish_reason: str, timings: dict, decode_ms: float, release=None):
+        """逐 token 以 SSE 送出；client 中途斷線時停止產生（與 llama-server 相同）"""
+        chunk_id = f"chatcmpl-stub-{rng.randrange(1 << 30)}"
+
+        def chunk(delta: dict, finish_reason=None, **extra) -> str:
+            data = {"id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}], **extra}
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        async def events():
+            try:
+                for i, token in enumerate(content):
+                    await asyncio.sleep(decode_ms / 1000)
+                    stats["decoded_tokens"] += 1
+                    yield chunk({"role": "assistant", "content": token} if i == 0 else {"content": token})
+                yield chunk({}, finish_reason, timings=timings)
+                yield "data: [DONE]\n\n"
+            finally:
+                if release is not None:
+                    release()
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    def _generate(messages: list, max_tokens) -> tuple:
+        """回答內容（token 數以字元數近似）：--llm-ramble-tokens 模擬回答後仍繼續產生的模型；超過 max_tokens 時截斷"""
+        content = scan_list_answer(messages)
+        if config.llm_ramble_tokens > 0:
+            content += ("\n" + RAMBLE_TEXT * (config.llm_ramble_tokens // len(RAMBLE_TEXT) + 1))[
+                :config.llm_ramble_tokens]
+        if max_tokens is not None and len(content) > max_tokens:
+            return content[:max_tokens], "length"
+        return content, "stop"
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        content, finish_reason = _generate(messages, body.get("max_tokens"))
+        stats["requests"] += 1
+        if config.llm_prefill_ms_per_token <= 0:
+            await _simulate(config.llm_latency_ms, llm_slots, config.llm_faults)
+            if body.get("stream"):
+                return _stream(body, content, finish_reason, {}, decode_ms=0)
+            return _completion_body(body, content, finish_reason, {})
+
+        slot, timings = await _prefill(_render_prompt(messages), body.get("cache_prompt", True))
+        timings.update(predicted_n=len(content), predicted_ms=len(content) * config.llm_decode_ms_per_token)
+        if body.get("stream"):
+            return _stream(body, content, finish_reason, timings, config.llm_decode_ms_per_token,
+                           release=partial(_release_slot, slot))
+        try:
+            await asyncio.sleep(timings["predicted_ms"] / 1000)
+        finally:
+            _release_slot(slot)
+        stats["decoded_tokens"] += len(content)
+        return _completion_body(body, content, finish_reason, timings)
+
+    @app.get("/stats")
+    async def get_stats():
+        """LLM 累計請求數與實際產生的 token 數（串流中斷後不再計入）"""
+        return dict(stats)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/faults")
+    async def get_faults():
+        return {"ocr": asdict(config.ocr_faults), "llm": asdict(config.llm_faults),
+                "slow_rate": config.slow_rate, "slow_factor": config.slow_factor, "hang_s": config.hang_s}
+
+    @app.post("/faults")
+    async def set_faults(request: Request):
+        body = await request.json()
+        for name, faults in (("ocr", config.ocr_faults), ("llm", config.llm_faults)):
+            for key, value in body.get(name, {}).items():
+                if not hasattr(faults, key):
+                    raise HTTPException(status_code=400, detail=f"未知的故障設定: {name}.{key}")
+                setattr(faults, key, type(getattr(faults, key))(value))
+        for key in ("slow_rate", "slow_factor", "hang_s"):
+            if key in body:
+                setattr(config, key, float(body[key]))
+        return await get_faults()
+
+    return app
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="本地 OCR / LLM 替身 server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--ocr-latency-ms", type=float, default=StubConfig.ocr_latency_ms)
+    parser.add_argument("--llm-latency-ms", type=float, default=StubConfig.llm_latency_ms)
+    parser.add_argument("--sigma", type=float, default=StubConfig.sigma)
+    parser.add_argument("--ocr-parallel", type=int, default=StubConfig.ocr_parallel)
+    parser.add_argument("--llm-parallel", type=int, default=StubConfig.llm_parallel)
+    parser.add_argument("--ocr-text", default=StubConfig.ocr_text)
+    parser.add_argument("--ocr-error-rate", type=float, default=0.0)
+    parser.add_argument("--ocr-hang-rate", type=float, default=0.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-hang-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=StubConfig.slow_rate)
+    parser.add_argument("--slow-factor", type=float, default=StubConfig.slow_factor)
+    parser.add_argument("--hang-s", type=float, default=StubConfig.hang_s)
+    parser.add_argument("--llm-prefill-ms-per-token", type=float, default=StubConfig.llm_prefill_ms_per_token)
+    parser.add_argument("--llm-decode-ms-per-token", type=float, default=StubConfig.llm_decode_ms_per_token)
+    parser.add_argument("--llm-ramble-tokens", type=int, default=StubConfig.llm_ramble_tokens)
+    args = parser.parse_args(argv)
+
+    config = StubConfig(
+        ocr_latency_ms=args.ocr_latency_ms,
+        llm_latency_ms=args.llm_latency_ms,
+        sigma=args.sigma,
+        ocr_parallel=args.ocr_parallel,
+        llm_parallel=args.llm_parallel,
+        ocr_text=args.ocr_text,
+        ocr_faults=Faults(error_rate=args.ocr_error_rate, hang_rate=args.ocr_hang_rate),
+        llm_faults=Faults(error_rate=args.llm_error_rate, hang_rate=args.llm_hang_rate),
+        slow_rate=args.slow_rate,
+        slow_factor=args.slow_factor,
+        hang_s=args.hang_s,
+        llm_prefill_ms_per_token=args.llm_prefill_ms_per_token,
+        llm_decode_ms_per_token=args.llm_decode_ms_per_token,
+        llm_ramble_tokens=args.llm_ramble_tokens,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
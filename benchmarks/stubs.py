@@ -0,0 +1,112 @@
+"""
+離線 benchmark 用的 OCR / LLM 替身。
+
+延遲以 lognormal 分布模擬，latency_ms 為中位數，sigma 控制長尾。
+"""
+
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from utils.ocr_backends import OCRBackend
+
+
+def message_text(message: dict) -> str:
+    """chat message 的文字內容；content 可為字串或 [{"type": "text", "text": ...}] 列表"""
+    content = message.get("content")
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if part.get("type") == "text")
+    return content if isinstance(content, str) else ""
+
+
+def scan_list_answer(messages: list) -> str:
+    """依 messages 中的掃描清單（"- 商品: N 瓶"）產生回答規則 1 格式的回答"""
+    lines = [line[2:].replace(": ", " 有 ") for message in messages
+             for line in message_text(message).splitlines() if line.startswith("- ")]
+    return "根據掃描結果清單，以下是各商品的數量統計：\n" + "\n".join(lines)
+
+
+def _sleep(latency_ms: float, sigma: float, rng: random.Random):
+    if latency_ms > 0:
+        time.sleep(latency_ms * rng.lognormvariate(0, sigma) / 1000)
+
+
+class StubOCRBackend(OCRBackend):
+    """OCR backend 替身：回傳預先指定的文字，並發 / 逾時 / 重試沿用 OCRBackend"""
+
+    name = "stub"
+    max_concurrency = 4
+
+    def __init__(self, latency_ms: float = 300.0, sigma: float = 0.25, texts=None, seed: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.texts = list(texts or [""])
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _recognize(self, image_base64: str, timeout: float) -> str:
+        with self._lock:
+            text = self.texts[self.calls % len(self.texts)]
+            self.calls += 1
+        _sleep(self.latency_ms, self.sigma, self._rng)
+        return text
+
+
+class StubLLMClient:
+    """模擬 OpenAI client 的 chat.completions.create，依 scan list 產生固定格式回答"""
+
+    def __init__(self, latency_ms: float = 800.0, sigma: float = 0.2, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model: str, messages: list, stream: bool = False, max_tokens: int = None, **kwargs):
+        self.calls += 1
+        _sleep(self.latency_ms, self.sigma, self._rng)
+        content, finish_reason = scan_list_answer(messages), "stop"
+        # token 數以字元數近似
+        if max_tokens is not None and len(content) > max_tokens:
+            content, finish_reason = content[:max_tokens], "length"
+        if stream:
+            return StubStream(content, finish_reason)
+        message = SimpleNamespace(content=content, role="assistant")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason=finish_reason)], usage=None,
+                               model_extra={})
+
+
+class StubStream:
+    """模擬 openai.Stream：逐字元產生 choices[0].delta.content 的 chunk，最後一個 chunk 帶 finish_reason"""
+
+    def __init__(self, content: str, finish_reason: str = "stop"):
+        self.content = content
+        self.finish_reason = finish_reason
+        self.consumed = 0
+        self.closed = False
+
+    def _chunk(self, content, finish_reason=None):
+        choice = SimpleNamespace(index=0, delta=SimpleNamespace(content=content, role=None),
+                                 finish_reason=finish_reason)
+        return SimpleNamespace(choices=[choice], model_extra={})
+
+    def __iter__(self):
+        for token in self.content:
+            if self.closed:
+                return
+            self.consumed += 1
+            yield self._chunk(token)
+        if not self.closed:
+            yield self._chunk(None, self.finish_reason)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.closed = True
@@ -0,0 +1,295 @@
+"""
+比對門檻掃描工具。
+
+對 my_crops/<sku>/ 的已標註 crop 只計算一次 CLIP 向量、GLM OCR 文字與 YOLO 信心值，
+結果快取在 --cache-dir，之後以 NumPy 向量化方式掃描門檻組合：
+
+- CONF_THRESHOLD       : YOLO 信心值低於門檻的 crop 視為未偵測（計入 unknown）
+- COSINE_THRESHOLD     : 最近鄰 CLIP 距離低於門檻時直接採用，不需 OCR
+                         （0 代表目前 service 的行為：每個 crop 都跑 OCR）
+- score_cutoff         : fuzzy 比對最低分；與 service 一樣經 FuzzyIndex.search
+                         （normalize_text 正規化與形近字表，比對 brand+flavor 文字）
+- FUZZY_CLIP_THRESHOLD : fuzzy 候選的 CLIP 距離需低於此門檻才確認
+
+輸出每組門檻的 precision / recall / unknown rate / 需 OCR 比例。
+
+用法：
+    python -m benchmarks.threshold_sweep                 # 首次執行會建立快取（需模型與 Ollama）
+    python -m benchmarks.threshold_sweep --cosine 0:0.4:0.02 --cutoff 40:90:5 --top 20
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.common import REPO_ROOT, git_commit, list_images, write_report
+from utils.fuzzy_index import FuzzyIndex, catalog_text
+
+
+def parse_range(text: str) -> np.ndarray:
+    """'start:stop:step'（含 stop）或逗號分隔的數值列表"""
+    if ":" in text:
+        start, stop, step = (float(v) for v in text.split(":"))
+        return np.round(np.arange(start, stop + step / 2, step), 6)
+    return np.array([float(v) for v in text.split(",")])
+
+
+# ========== 快取 ==========
+
+class EvalCache:
+    """crop 層級快取：以檔案內容 sha1 為 key，新增 crop 時只計算缺少的部分"""
+
+    def __init__(self, cache_dir: str):
+        self.dir = Path(cache_dir)
+        self.meta_path = self.dir / "crops.json"
+        self.emb_path = self.dir / "embeddings.npz"
+        self.catalog_path = self.dir / "catalog.npz"
+        self.records = {}
+        self.embeddings = {}
+        if self.meta_path.exists():
+            self.records = json.loads(self.meta_path.read_text(encoding="utf-8"))
+        if self.emb_path.exists():
+            with np.load(self.emb_path) as data:
+                self.embeddings = {key: data[key] for key in data.files}
+
+    def save(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.meta_path.write_text(json.dumps(self.records, ensure_ascii=False, indent=1), encoding="utf-8")
+        np.savez(self.emb_path, **self.embeddings)
+
+    def save_catalog(self, ids: list, texts: list, embeddings: np.ndarray):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        np.savez(self.catalog_path, ids=np.array(ids), texts=np.array(texts), embeddings=embeddings)
+
+    def load_catalog(self):
+        """回傳 (ids, fuzzy 比對文字, 向量)；舊快取沒有存文字時以 id（即 brand+flavor）代替"""
+        with np.load(self.catalog_path) as data:
+            ids = [str(i) for i in data["ids"]]
+            texts = [str(t) for t in data["texts"]] if "texts" in data.files else ids
+            return ids, texts, data["embeddings"]
+
+
+def build_cache(cache: EvalCache, crop_paths: list, refresh_catalog: bool):
+    """對尚未快取的 crop 執行 CLIP / OCR / YOLO；catalog 向量一併存下"""
+    os.environ.setdefault("TRACE_EXPORTER", "none")
+    os.environ.setdefault("DEBUG_SAVE", "0")
+    import service
+    from utils.clip_preprocess import select_class_boxes
+
+    pending = []
+    for path in crop_paths:
+        digest = hashlib.sha1(Path(path).read_bytes()).hexdigest()
+        if digest not in cache.records or digest not in cache.embeddings:
+            pending.append((path, digest))
+
+    if not pending and cache.catalog_path.exists() and not refresh_catalog:
+        return
+
+    service.load_models()
+    if refresh_catalog or not cache.catalog_path.exists():
+        catalog = service.collection.get(include=["embeddings", "metadatas"])
+        cache.save_catalog(catalog["ids"], [catalog_text(meta) for meta in catalog["metadatas"]],
+                           np.asarray(catalog["embeddings"], dtype=np.float32))
+
+    for n, (path, digest) in enumerate(pending, 1):
+        image = service.decode_image(Path(path).read_bytes())
+        started = time.perf_counter()
+        embedding = np.asarray(service.encode_image(image), dtype=np.float32)
+
+        try:
+            ocr_text = service.ocr_backend.recognize(service.ocr_backend.prepare_input(image))
+        except Exception as e:
+            print(f"[OCR] {path} 失敗: {e}")
+            ocr_text = ""
+
+        result = service.yolo_model(image, conf=0.01, verbose=False)[0]
+        confs = select_class_boxes(result.boxes.data, service.BOTTLE_CLASS_ID)[:, 4]
+
+        cache.embeddings[digest] = embedding
+        cache.records[digest] = {
+            "path": os.path.relpath(path, REPO_ROOT),
+            "label": Path(path).parent.name,
+            "ocr_text": ocr_text,
+            "yolo_conf": float(confs.max(initial=0.0)),
+        }
+        print(f"[{n}/{len(pending)}] {path} ({time.perf_counter() - started:.2f}s)")
+        cache.save()
+
+
+# ========== 向量化掃描 ==========
+
+def cosine_distance_matrix(queries: np.ndarray, catalog: np.ndarray) -> np.ndarray:
+    q = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    c = catalog / np.linalg.norm(catalog, axis=1, keepdims=True)
+    return 1.0 - q @ c.T
+
+
+def fuzzy_best(records: list, catalog_ids: list, catalog_texts: list):
+    """
+    每個 crop 的 fuzzy 最佳候選 index 與分數，與 service.fuzzy_match_ocr_to_db 走同一條
+    FuzzyIndex.search（正規化、形近字表、n-gram 候選、同分取前者）。
+    score_cutoff=0 取得最佳候選，門檻 c 下 service 的結果即「分數 >= c 時採用該候選」。
+    無候選（OCR 文字正規化後為空）時 index 為 -1、分數為 0。
+    """
+    fuzzy_index = FuzzyIndex(catalog_ids, catalog_texts)
+    position = {item_id: i for i, item_id in enumerate(catalog_ids)}
+    best = np.full(len(records), -1, dtype=np.int64)
+    scores = np.zeros(len(records), dtype=np.float32)
+    for row, record in enumerate(records):
+        matched_id, score, _ = fuzzy_index.search(record["ocr_text"], score_cutoff=0)
+        if matched_id is not None:
+            best[row] = position[matched_id]
+            scores[row] = score
+    return best, scores
+
+
+def prepare(records: list, embeddings: np.ndarray, catalog_ids: list, catalog_emb: np.ndarray,
+            catalog_texts: list = None) -> dict:
+    """計算與門檻無關的中間結果：最近鄰、fuzzy 最佳候選及其距離；catalog_texts 預設為 id"""
+    dist = cosine_distance_matrix(embeddings, catalog_emb)
+    fz, fz_score = fuzzy_best(records, catalog_ids, catalog_texts if catalog_texts is not None else catalog_ids)
+    index = {item_id: i for i, item_id in enumerate(catalog_ids)}
+    rows = np.arange(len(records))
+    nn = dist.argmin(axis=1)
+    return {
+        "label": np.array([index.get(r["label"], -1) for r in records]),
+        "conf": np.array([r["yolo_conf"] for r in records], dtype=np.float32),
+        "nn": nn,
+        "nn_dist": dist[rows, nn],
+        "fz": fz,
+        "fz_score": fz_score,
+        # 無候選時距離為 inf，任何 FUZZY_CLIP_THRESHOLD 都不會確認
+        "fz_dist": np.where(fz >= 0, dist[rows, np.maximum(fz, 0)], np.inf),
+    }
+
+
+def sweep(prep: dict, conf_grid, cosine_grid, cutoff_grid, fuzzy_clip_grid) -> dict:
+    """
+    回傳 shape 為 (conf, cosine, cutoff, fuzzy_clip) 的指標陣列。
+    每次只展開一個 conf 值，記憶體用量為 cosine*cutoff*fuzzy_clip*N。
+    """
+    label = prep["label"]
+    n = label.size
+    in_catalog = max(int((label >= 0).sum()), 1)
+    nn_correct = prep["nn"] == label
+    fz_correct = prep["fz"] == label
+
+    # (C, 1, 1, N) / (1, U, 1, N) / (1, 1, F, N)
+    clip_only = prep["nn_dist"][None, None, None, :] < np.asarray(cosine_grid)[:, None, None, None]
+    score_ok = prep["fz_score"][None, None, None, :] >= np.asarray(cutoff_grid)[None, :, None, None]
+    verify_ok = prep["fz_dist"][None, None, None, :] < np.asarray(fuzzy_clip_grid)[None, None, :, None]
+    fuzzy_ok = score_ok & verify_ok & ~clip_only
+
+    hit = (clip_only & nn_correct) | (fuzzy_ok & fz_correct)
+    predicted = clip_only | fuzzy_ok
+
+    shape = (len(conf_grid), len(cosine_grid), len(cutoff_grid), len(fuzzy_clip_grid))
+    correct = np.empty(shape, dtype=np.int64)
+    known = np.empty(shape, dtype=np.int64)
+    needs_ocr = np.empty(shape, dtype=np.int64)
+    for k, conf_thr in enumerate(conf_grid):
+        detected = prep["conf"] >= conf_thr
+        correct[k] = (hit & detected).sum(axis=-1)
+        known[k] = (predicted & detected).sum(axis=-1)
+        needs_ocr[k] = np.broadcast_to(~clip_only & detected, shape[1:] + (n,)).sum(axis=-1)
+
+    precision = np.divide(correct, known, out=np.zeros(shape), where=known > 0)
+    recall = correct / in_catalog
+    return {
+        "precision": precision,
+        "recall": recall,
+        "f1": np.divide(2 * precision * recall, precision + recall,
+                        out=np.zeros(shape), where=(precision + recall) > 0),
+        "unknown_rate": 1.0 - known / n,
+        "ocr_share": needs_ocr / n,
+    }
+
+
+def _row(metrics: dict, idx: tuple, grids: tuple) -> dict:
+    conf, cosine, cutoff, fuzzy_clip = (float(g[i]) for g, i in zip(grids, idx))
+    return {
+        "conf_threshold": conf,
+        "cosine_threshold": cosine,
+        "score_cutoff": cutoff,
+        "fuzzy_clip_threshold": fuzzy_clip,
+        **{name: round(float(values[idx]), 4) for name, values in metrics.items()},
+    }
+
+
+def _current_settings(metrics: dict, grids: tuple):
+    import service
+
+    targets = (service.CONF_THRESHOLD, 0.0, 50.0, service.FUZZY_CLIP_THRESHOLD)
+    idx = []
+    for grid, target in zip(grids, targets):
+        hits = np.flatnonzero(np.isclose(grid, target))
+        if hits.size == 0:
+            return None
+        idx.append(int(hits[0]))
+    return _row(metrics, tuple(idx), grids)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="比對門檻掃描")
+    parser.add_argument("--crops-dir", default="my_crops")
+    parser.add_argument("--cache-dir", default="bench_results/eval_cache")
+    parser.add_argument("--refresh-catalog", action="store_true", help="重新讀取 ChromaDB 的 catalog 向量")
+    parser.add_argument("--conf", default="0.5:0.95:0.05")
+    parser.add_argument("--cosine", default="0:0.4:0.02")
+    parser.add_argument("--cutoff", default="30:90:5")
+    parser.add_argument("--fuzzy-clip", default="0.05:0.4:0.01")
+    parser.add_argument("--min-precision", type=float, default=0.95)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    cache = EvalCache(args.cache_dir)
+    build_cache(cache, list_images(args.crops_dir, recursive=True), args.refresh_catalog)
+
+    digests = sorted(cache.records)
+    records = [cache.records[d] for d in digests]
+    embeddings = np.stack([cache.embeddings[d] for d in digests])
+    catalog_ids, catalog_texts, catalog_emb = cache.load_catalog()
+
+    grids = tuple(parse_range(g) for g in (args.conf, args.cosine, args.cutoff, args.fuzzy_clip))
+    started = time.perf_counter()
+    prep = prepare(records, embeddings, catalog_ids, catalog_emb, catalog_texts)
+    metrics = sweep(prep, *grids)
+    elapsed = time.perf_counter() - started
+    combos = int(np.prod([g.size for g in grids]))
+    print(f"{len(records)} 個 crop x {combos} 組門檻，耗時 {elapsed:.2f}s")
+
+    # 目前 service 的設定（每個 crop 都跑 OCR，等同 cosine 門檻 0）
+    current = _current_settings(metrics, grids)
+
+    eligible = metrics["precision"] >= args.min_precision
+    ranking = np.where(eligible, metrics["recall"] - 1e-3 * metrics["ocr_share"], -np.inf)
+    order = np.argsort(ranking, axis=None)[::-1][: args.top]
+    best = [_row(metrics, np.unravel_index(i, ranking.shape), grids) for i in order
+            if np.isfinite(ranking.flat[i])]
+
+    header = f"{'conf':>5} {'cos':>5} {'cut':>4} {'fclip':>5} | {'prec':>6} {'recall':>6} {'unk':>6} {'ocr%':>6}"
+    print(f"precision >= {args.min_precision} 中 recall 最高的組合：")
+    print(header)
+    for row in ([current] if current else []) + best:
+        print(f"{row['conf_threshold']:>5.2f} {row['cosine_threshold']:>5.2f} {row['score_cutoff']:>4.0f} "
+              f"{row['fuzzy_clip_threshold']:>5.2f} | {row['precision']:>6.3f} {row['recall']:>6.3f} "
+              f"{row['unknown_rate']:>6.3f} {row['ocr_share']:>6.3f}")
+    if current:
+        print("（第一列為目前 service 設定）")
+
+    write_report({
+        "config": {"crops": len(records), "catalog": len(catalog_ids), "combinations": combos,
+                   "sweep_seconds": round(elapsed, 3)},
+        "current": current,
+        "best": best,
+    }, args.output or f"bench_results/threshold-sweep-{git_commit()}.json")
+
+
+if __name__ == "__main__":
+    main()
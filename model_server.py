@@ -0,0 +1,88 @@
+"""
+共用模型 server（多 worker 部署）。
+
+單一 process 持有 YOLO、CLIP、ChromaDB catalog，並負責啟動 / 關閉 llama-server；
+uvicorn 的多個 API worker 只處理 HTTP，透過本機 IPC（utils/model_ipc.py）呼叫模型，
+圖片經 shared memory 傳遞。
+
+啟動方式（未指定 MODEL_SERVER_ADDRESS 時 socket 位於 $XDG_RUNTIME_DIR/good_backend-<uid>/model_server.sock，
+金鑰由 server 產生於同一目錄的 model_server.key，見 utils/model_ipc.py）：
+    python model_server.py
+    MODEL_SERVER_ADDRESS=$XDG_RUNTIME_DIR/good_backend-$(id -u)/model_server.sock \
+        uvicorn service:app --workers 4 --port 8888
+"""
+
+import os
+import threading
+
+# model server 本身一律在本地載入模型
+MODEL_SERVER_ADDRESS = os.environ.pop("MODEL_SERVER_ADDRESS", None)
+
+import numpy as np
+
+import service
+from utils.model_ipc import AttachedImage, default_address, ensure_authkey, serve
+from utils.tracing import enable_service_tracing
+
+# YOLO / CLIP 非 thread-safe，同一時間只允許一個推論
+_model_lock = threading.Lock()
+
+CATALOG_METHODS = {"count", "get", "query", "upsert", "delete"}
+
+
+def handle_ping():
+    return {"pid": os.getpid(), "catalog_size": service.collection.count()}
+
+
+def handle_detect(image: dict):
+    # 直接在 shared memory 上推論，回傳前不需複製整張圖
+    with AttachedImage(image) as array, _model_lock:
+        return service.detect_bottle_boxes(array)
+
+
+def handle_embed(image: dict, boxes: np.ndarray):
+    with AttachedImage(image) as array, _model_lock:
+        return service.encode_crops(array, np.asarray(boxes, dtype=np.float32))
+
+
+def handle_embed_text(texts: list):
+    with _model_lock:
+        return service.encode_texts(texts)
+
+
+def handle_catalog(method: str, kwargs: dict):
+    if method not in CATALOG_METHODS:
+        raise ValueError(f"不支援的 catalog 操作: {method}")
+    result = getattr(service.collection, method)(**kwargs)
+    if method in ("upsert", "delete"):
+        service.bump_catalog_version()
+    return result
+
+
+def handle_catalog_version():
+    return service.catalog_version
+
+
+def main():
+    address = MODEL_SERVER_ADDRESS or default_address()
+    # 金鑰檔有問題（權限過寬等）時在載入模型前就失敗
+    authkey = ensure_authkey()
+    enable_service_tracing()
+    service.load_models()
+    if service.LLAMA_SERVER_AUTOSTART:
+        service.start_llama_server()
+    try:
+        serve(address, {
+            "ping": handle_ping,
+            "detect": handle_detect,
+            "embed": handle_embed,
+            "embed_text": handle_embed_text,
+            "catalog": handle_catalog,
+            "catalog_version": handle_catalog_version,
+        }, authkey=authkey)
+    finally:
+        service.stop_llama_server()
+
+
+if __name__ == "__main__":
+    main()
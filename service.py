@@ -1,25 +1,61 @@
+from __future__ import annotations
+
 import os
-import base64
-import io
+import asyncio
+import hmac
+import random
 import time
 from collections import Counter
 from contextlib import asynccontextmanager
-from datetime import datetime
+from datetime import date, datetime
+from functools import partial
+from typing import List, Optional
 import signal
-import numpy as np
-import chromadb
-import ollama
-from PIL import ImageDraw, ImageFont
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import JSONResponse
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import APIRouter, FastAPI, File, UploadFile, HTTPException, Form, Header, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse
 from pydantic import BaseModel
-from PIL import Image
-from ultralytics import YOLO
-from sentence_transformers import SentenceTransformer
-from openai import OpenAI
-from rapidfuzz import process as fuzz_process, fuzz
 import subprocess
+from opentelemetry import trace
+from utils.body_limit import BodySizeLimitMiddleware
 from utils.date_validator import DateValidator
+from utils.deadline import Deadline, DeadlineExceeded, RequestCancelled
+from utils.ocr_backends import create_ocr_backend
+from utils.profiling import ProfileStore, parse_profile_modes, profile_request, valid_profile_id
+from utils.resilience import CircuitBreaker, CircuitOpenError, HedgeStats, LatencyTracker, hedge_delay, hedged_call
+from utils.tracing import enable_service_tracing, record_stage_timings, setup_tracing, shutdown_tracing
+
+# ========== Service Profile ==========
+# full：盤點 + 日期 OCR（預設）
+# date：只提供 /glm_ocr_inference_base64，不匯入 torch / chromadb / openai 與盤點用的
+#       cv2 / numpy / PIL / rapidfuzz 模組、不載入 YOLO / CLIP、不啟動 llama-server，適合只做效期辨識的節點
+SERVICE_PROFILE = os.getenv("SERVICE_PROFILE", "full")
+if SERVICE_PROFILE not in ("full", "date"):
+    raise ValueError(f"SERVICE_PROFILE 必須是 full 或 date，目前為 {SERVICE_PROFILE!r}")
+INVENTORY_ENABLED = SERVICE_PROFILE == "full"
+
+if INVENTORY_ENABLED:
+    import cv2
+    import numpy as np
+    from PIL import Image, ImageDraw, ImageFont
+    from utils.answer_grammar import AnswerGrammar, answer_token_budget
+    from utils.answer_prompt import build_messages, format_scan_list
+    from utils.catalog_search import CatalogSearchIndex, QueryEmbeddingCache
+    from utils.clip_preprocess import (build_clip_batch, clip_image_embeddings, crop_views, encode_pil_crops,
+                                       select_class_boxes)
+    from utils.detection_cascade import DetectionCascade
+    from utils.fuzzy_index import FuzzyIndex, catalog_text
+    from utils.ingest import (ImageTooLarge, MemoryBudget, MemoryBudgetExceeded, b64decode_bounded,
+                              decode_bounded)
+    from utils.job_store import JobStore, JobWorkerPool
+    from utils.model_ipc import MODEL_SERVER_ADDRESS, ModelServerClient, RemoteCollection
+    from utils.ocr_input import fit_to_max_side
+    from utils.pipeline import Pipeline, Stage
+    from utils.result_cache import ResultCache, result_key
+    from utils.text_verifier import TextVerifier
 
 # ========== Model & DB Config ==========
 BOTTLE_CLASS_ID = 39
@@ -36,53 +72,211 @@ COSINE_THRESHOLD = 0.35
 # 模糊比對找到候選後，用 CLIP cosine distance 做最終確認
 FUZZY_CLIP_THRESHOLD = 0.15
 
+# ========== Verification Config ==========
+# ocr       : 每個 crop 都以 GLM OCR 確認（預設）
+# clip_text : 影像最近鄰與 CLIP 文字向量的最佳候選一致時直接採用，不一致時才跑 OCR（見 utils/text_verifier.py）
+VERIFY_MODE = os.getenv("VERIFY_MODE", "ocr")
+if VERIFY_MODE not in ("ocr", "clip_text"):
+    raise ValueError(f"VERIFY_MODE 必須是 ocr 或 clip_text，目前為 {VERIFY_MODE!r}")
+# 文字最佳候選需領先第二名的 cosine similarity 差距
+TEXT_VERIFY_MARGIN = float(os.getenv("TEXT_VERIFY_MARGIN", "0"))
+# 文字向量的模型；空字串代表沿用 clip-ViT-B-32 的文字端。該模型以英文訓練，中文品名可改用
+# 與其影像空間對齊的 clip-ViT-B-32-multilingual-v1
+CLIP_TEXT_MODEL = os.getenv("CLIP_TEXT_MODEL", "")
+
+# ========== CLIP 前處理 Config ==========
+# pil   : crop 轉 PIL 後經 SentenceTransformer.encode（CLIPImageProcessor），與 catalog 建立方式相同（預設）
+# torch : 整批以 torch 縮放 / 正規化（utils/clip_preprocess.py），較快；
+#         需先以 test/test_clip_preprocess.py 的 parity 測試確認向量差距不影響 FUZZY_CLIP_THRESHOLD 判定
+CLIP_PREPROCESS = os.getenv("CLIP_PREPROCESS", "pil")
+if CLIP_PREPROCESS not in ("pil", "torch"):
+    raise ValueError(f"CLIP_PREPROCESS 必須是 pil 或 torch，目前為 {CLIP_PREPROCESS!r}")
+
+# ========== Detection Cascade Config ==========
+# 先以低解析度（或較小的模型）偵測，只對信心不足 / 過小的區域以完整模型放大再偵測（見 utils/detection_cascade.py）
+DETECT_CASCADE = os.getenv("DETECT_CASCADE", "0") == "1"
+# coarse pass 的模型；空字串代表沿用 yolo11m，只降低解析度
+CASCADE_COARSE_MODEL = os.getenv("CASCADE_COARSE_MODEL", "")
+CASCADE_COARSE_IMGSZ = int(os.getenv("CASCADE_COARSE_IMGSZ", "320"))
+CASCADE_FINE_IMGSZ = int(os.getenv("CASCADE_FINE_IMGSZ", "640"))
+# coarse pass 信心值介於此值與 CONF_THRESHOLD 之間的 box 交給 fine pass 確認
+CASCADE_LOW_CONF = float(os.getenv("CASCADE_LOW_CONF", "0.25"))
+# box 短邊在 coarse 輸入上小於此像素數時視為小物件
+CASCADE_SMALL_PX = int(os.getenv("CASCADE_SMALL_PX", "24"))
+
+# ========== Catalog 向量查詢 Config ==========
+# 0 代表每個 crop 都取回整個 catalog 的距離（debug 用）；> 0 只取 k 個最近鄰，
+# fuzzy 候選不在 top-k 內時另外取出其向量計算距離
+MATCH_TOP_K = int(os.getenv("MATCH_TOP_K", "0"))
+# drink_catalog 的 HNSW 參數：M / ef_construction 只在建立 collection 時生效，ef_search 啟動時套用
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "100"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "100"))
+
+# ========== Request Deadline Config ==========
+# 預設處理期限（秒），可由 X-Request-Timeout header 覆寫；0 代表不限制
+REQUEST_TIMEOUT_S = float(os.getenv("REQUEST_TIMEOUT_S", "60"))
+# llama-server 單次呼叫逾時（仍會被請求剩餘期限限制）
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "60"))
+# 期限到時回傳已完成部分的統計（未完成的 crop 標為 UNRESOLVED_LABEL），而非 504
+PARTIAL_RESULTS_ON_DEADLINE = os.getenv("PARTIAL_RESULTS_ON_DEADLINE", "0") == "1"
+UNRESOLVED_LABEL = "未解析"
+DISCONNECT_POLL_S = 0.2
+
+# ========== LLM Resilience Config ==========
+# llama-server 呼叫的重試、hedged request 與斷路器（OCR 的設定見 utils/ocr_backends.py 的 OCR_<NAME>_*）
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "1"))
+# 超過近期成功延遲的此分位數仍未完成時再送一次；llama-server 預設只有一個 slot，重複請求只會排在後面，預設關閉
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0"))
+# 連續失敗幾次後開啟斷路器，開啟期間直接以模板列出統計（format_counts_answer）
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+LLM_BREAKER_RESET_S = float(os.getenv("LLM_BREAKER_RESET_S", "30"))
+
+# ========== LLM Prompt Cache Config ==========
+# 要求 llama-server 保留 slot 的 KV cache，下一個請求只 prefill 與上次 prompt 不同的部分
+# （固定的 system prompt 在前、掃描清單與問題在後，見 utils/answer_prompt.py）
+LLM_CACHE_PROMPT = os.getenv("LLM_CACHE_PROMPT", "1") == "1"
+# llama-server --cache-reuse：以 KV shift 重用快取中至少此長度（tokens）的片段；0 代表關閉
+LLM_CACHE_REUSE = int(os.getenv("LLM_CACHE_REUSE", "256"))
+
+# ========== LLM Output Constraint Config ==========
+# 以 GBNF 文法限制回答只能是回答規則中的格式（見 utils/answer_grammar.py），回答完整即關閉串流
+LLM_GRAMMAR = os.getenv("LLM_GRAMMAR", "1") == "1"
+# max_tokens = LLM_BASE_TOKENS + LLM_TOKENS_PER_LINE × 掃描清單行數
+LLM_BASE_TOKENS = int(os.getenv("LLM_BASE_TOKENS", "32"))
+LLM_TOKENS_PER_LINE = int(os.getenv("LLM_TOKENS_PER_LINE", "24"))
+
+# ========== Batch Inventory Config ==========
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "64"))
+BATCH_REQUEST_TIMEOUT_S = float(os.getenv("BATCH_REQUEST_TIMEOUT_S", "600"))
+BATCH_DECODE_WORKERS = int(os.getenv("BATCH_DECODE_WORKERS", "2"))
+# 每次送進 YOLO / CLIP 的圖片數，湊批次時最多等 BATCH_WAIT_S 秒
+BATCH_DETECT_SIZE = int(os.getenv("BATCH_DETECT_SIZE", "4"))
+BATCH_EMBED_IMAGES = int(os.getenv("BATCH_EMBED_IMAGES", "4"))
+BATCH_WAIT_S = float(os.getenv("BATCH_WAIT_S", "0.02"))
+BATCH_MATCH_WORKERS = int(os.getenv("BATCH_MATCH_WORKERS", "8"))
+
+# ========== Ingestion Limits ==========
+# 請求 body 上限（MB），在讀取 body 前即以 413 拒絕；批次上傳另設上限
+MAX_REQUEST_MB = float(os.getenv("MAX_REQUEST_MB", "40"))
+BATCH_MAX_REQUEST_MB = float(os.getenv("BATCH_MAX_REQUEST_MB", "512"))
+# 單張圖片壓縮後大小與解碼後像素上限；超過像素上限的 JPEG 以 1/2、1/4、1/8 縮小解碼
+MAX_IMAGE_MB = float(os.getenv("MAX_IMAGE_MB", "25"))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", "16000000"))
+# 所有並發請求解碼後影像的記憶體總預算，超過時等待最多 DECODE_WAIT_S 秒後回 503
+DECODE_MEMORY_BUDGET_MB = int(os.getenv("DECODE_MEMORY_BUDGET_MB", "1024"))
+DECODE_WAIT_S = float(os.getenv("DECODE_WAIT_S", "30"))
+# debug overview 圖的長邊上限，避免為標註整張大圖再複製一份
+DEBUG_OVERVIEW_MAX_SIDE = 2048
+
+# ========== Async Job Config ==========
+# 提交後立即回傳 job id，由背景 worker 依序處理；結果保存在 SQLite，重啟後未完成的 job 會重新執行
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# 已完成 job 的保留時間（秒）
+JOB_TTL_S = float(os.getenv("JOB_TTL_S", "86400"))
+# 單一 job 的處理期限（秒），0 代表不限制
+JOB_TIMEOUT_S = float(os.getenv("JOB_TIMEOUT_S", "600"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# /jobs/inventory_batch 的請求 body 上限（MB）：payload 整個以 JSON 存在 SQLite 的一列，
+# 每次 lease / 重試都要整列讀出，因此遠低於同步批次的 BATCH_MAX_REQUEST_MB
+JOB_MAX_REQUEST_MB = float(os.getenv("JOB_MAX_REQUEST_MB", "64"))
+
+# ========== Scan History Config ==========
+# 每次盤點的各 SKU 數量、未知率與耗時寫入 Parquet（見 utils/scan_history.py）
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "1") == "1"
+HISTORY_DIR = os.getenv("HISTORY_DIR", "scan_history")
+HISTORY_FLUSH_ROWS = int(os.getenv("HISTORY_FLUSH_ROWS", "1000"))
+HISTORY_FLUSH_INTERVAL_S = float(os.getenv("HISTORY_FLUSH_INTERVAL_S", "30"))
+# 當天分區累積到這個檔案數即合併
+HISTORY_COMPACT_FILES = int(os.getenv("HISTORY_COMPACT_FILES", "16"))
+DEFAULT_STORE_ID = "default"
+
+# ========== Catalog Search Config ==========
+# /db/search：查詢句 CLIP 文字向量的 LRU 快取筆數
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "4096"))
+# 語意分數（CLIP）的權重，其餘為 rapidfuzz 文字分數
+SEARCH_SEMANTIC_WEIGHT = float(os.getenv("SEARCH_SEMANTIC_WEIGHT", "0.5"))
+SEARCH_MAX_QUERIES = 32
+
+# ========== Profiling Config ==========
+# /inventory_base64 的 CPU 取樣與 tracemalloc 記憶體 profiling（見 utils/profiling.py），結果以 request id 保存
+# 以 X-Profile: 1 / cpu / memory header 觸發，需同時帶相同的 X-Profile-Token；
+# 未設定 PROFILE_TOKEN 時忽略 X-Profile，/profiles 也不開放（profile 含程式路徑與 call stack）
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+# 隨機 profiling 的請求比例（0~1），不需 PROFILE_TOKEN；tracemalloc 會明顯拖慢請求，隨機取樣預設只收集 CPU
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SAMPLE_MODES = parse_profile_modes(os.getenv("PROFILE_SAMPLE_MODES", "cpu"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "100"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+
+# ========== Result Cache Config ==========
+# /inventory_base64 重送相同照片時直接回傳先前結果（見 utils/result_cache.py）；RESULT_CACHE_SIZE=0 代表關閉
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_TTL_S = float(os.getenv("RESULT_CACHE_TTL_S", "300"))
+
 class Base64ImageRequest(BaseModel):
     image_base64: str
     question: str = "請統計商品"
 
+# ========== Tracing ==========
+setup_tracing()
+tracer = trace.get_tracer(__name__)
+
 # ========== Global Objects ==========
 yolo_model = None
 clip_model = None
+text_model = None
+detection_cascade = None
 chroma_client = None
 collection = None
-
-SYSTEM_PROMPT_TEMPLATE = """你是一位專業的超商貨架分析員。請根據以下掃描結果清單回答用戶問題。
-
-【掃描結果清單】
-{scan_list}
-
-【回答規則與範例】
-1. 若用戶詢問「統計商品」或類似整體盤點的問題，嚴格遵守以下格式：
-   根據掃描結果清單，以下是各商品的數量統計：
-   [商品名稱] 有 [數量] 瓶
-   (以此類推，每行一個，不使用列點符號或顏色前綴)
-
-2. 若用戶詢問「有幾瓶 [特定商品]」，嚴格遵守以下格式：
-   [特定商品] 有 [數量] 瓶
-   (如果該商品完全不存在，請回：沒有找到您指定的商品)
-
-3. 輸出禁止包含額外的解釋或結尾客套話。
-4. 忽略顏色前綴（例如「灰色茶裏王」僅回答「茶裏王」），以掃描清單中的商品名稱為主。
-5. 必須使用繁體中文。
-6. 用戶輸入可能來自語音轉文字（STT），若遇到諧音詞，請自動對應到清單中最接近的商品
-
-【範例】
-用戶：統計商品
-回答：
-根據掃描結果清單，以下是各商品的數量統計：
-原萃台灣青茶 有 1 瓶
-茶裏王半熟金萱 有 1 瓶
-茶裏王白毫烏龍 有 1 瓶
-無加糖LP33機能優酪乳 有 2 瓶
-
-用戶：有幾瓶茶裏王白毫烏龍？
-回答：茶裏王白毫烏龍 有 1 瓶
-"""
-
-client = OpenAI(
-    base_url="http://127.0.0.1:8881/v1",
-    api_key="no-key-needed",  # 本地通常不驗證，填任意字串即可
-)
+# worker 模式（設定 MODEL_SERVER_ADDRESS）下，模型由 model_server.py 持有
+model_client = None
+# catalog 每次新增 / 刪除加 1，衍生的索引與快取據此判斷是否過期
+catalog_version = 0
+_fuzzy_index = None
+_fuzzy_index_version = None
+_fuzzy_index_lock = threading.Lock()
+_text_verifier = None
+_text_verifier_lock = threading.Lock()
+_search_index = None
+_search_index_lock = threading.Lock()
+_query_cache = None
+decode_budget = MemoryBudget(DECODE_MEMORY_BUDGET_MB << 20) if INVENTORY_ENABLED else None
+job_store = None
+job_pool = None
+scan_history = None
+profile_store = None
+result_cache = (ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL_S)
+                if INVENTORY_ENABLED and RESULT_CACHE_SIZE > 0 else None)
+llm_breaker = CircuitBreaker("llm", LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_S)
+llm_latency = LatencyTracker()
+llm_hedge_stats = HedgeStats()
+_llm_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="llm")
+
+# OCR backend 由 OCR_BACKEND 環境變數選擇（見 utils/ocr_backends.py）
+ocr_backend = create_ocr_backend()
+
+# llama-server 位址；設定 LLAMA_SERVER_AUTOSTART=0 時改連外部（或替身）server，不自行啟動
+LLAMA_SERVER_URL = os.getenv("LLAMA_SERVER_URL", "http://127.0.0.1:8881/v1")
+LLAMA_SERVER_AUTOSTART = os.getenv("LLAMA_SERVER_AUTOSTART", "1") == "1"
+
+# llama-server 的 OpenAI client，第一次呼叫 LLM 時才建立（date profile 不匯入 openai）
+client = None
+
+
+def get_llm_client():
+    global client
+    if client is None:
+        from openai import OpenAI
+
+        client = OpenAI(
+            base_url=LLAMA_SERVER_URL,
+            api_key="no-key-needed",  # 本地通常不驗證，填任意字串即可
+            max_retries=LLM_RETRIES,
+        )
+    return client
 
 
 # llama-server 進程
@@ -102,6 +296,8 @@ LLAMA_SERVER_CMD = [
     "4096",
     "-ngl",
     "-1",
+    "--cache-reuse",
+    str(LLM_CACHE_REUSE),
 ]
 
 
@@ -143,27 +339,125 @@ signal.signal(signal.SIGINT, _signal_handler)
 signal.signal(signal.SIGTERM, _signal_handler)
 
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    global yolo_model, clip_model, chroma_client, collection
+def connect_model_server():
+    """worker 模式：不載入模型，改連共用的 model server"""
+    global model_client, collection
+    print(f"🔌 連線 model server: {MODEL_SERVER_ADDRESS}")
+    model_client = ModelServerClient(MODEL_SERVER_ADDRESS)
+    info = model_client.wait_ready()
+    collection = RemoteCollection(model_client)
+    print(f"📦 model server 已就緒 (PID {info['pid']})，資料庫包含 {info['catalog_size']} 筆特徵資料。")
+    if VERIFY_MODE == "clip_text":
+        get_text_verifier()
+    get_search_index()
+
+
+def apply_hnsw_settings(collection) -> bool:
+    """
+    既有 collection 只能調整 ef_search（回傳是否有修改）；M / ef_construction 不同時提示需重建。
+    """
+    hnsw = collection.configuration_json.get("hnsw") or {}
+    if (hnsw.get("max_neighbors"), hnsw.get("ef_construction")) != (HNSW_M, HNSW_EF_CONSTRUCTION):
+        print(f"⚠️ [HNSW] drink_catalog 建立時使用 M={hnsw.get('max_neighbors')} "
+              f"ef_construction={hnsw.get('ef_construction')}，需重建 collection 才會套用 "
+              f"M={HNSW_M} ef_construction={HNSW_EF_CONSTRUCTION}")
+    if hnsw.get("ef_search") == HNSW_EF_SEARCH:
+        return False
+    collection.modify(configuration={"hnsw": {"ef_search": HNSW_EF_SEARCH}})
+    print(f"[HNSW] ef_search: {hnsw.get('ef_search')} -> {HNSW_EF_SEARCH}")
+    return True
+
+
+def open_catalog():
+    import chromadb
+    from chromadb.api.client import SharedSystemClient
+
+    client = chromadb.PersistentClient(path="./drink_vector_db")
+    catalog = client.get_or_create_collection(
+        name="drink_catalog",
+        metadata={"hnsw:space": "cosine"},
+        configuration={"hnsw": {
+            "space": "cosine",
+            "max_neighbors": HNSW_M,
+            "ef_construction": HNSW_EF_CONSTRUCTION,
+            "ef_search": HNSW_EF_SEARCH,
+        }},
+    )
+    if apply_hnsw_settings(catalog):
+        # 同一 process 內已開啟的 index 仍沿用舊的 ef_search，清掉 client 快取後重新開啟才會生效
+        SharedSystemClient.clear_system_cache()
+        client = chromadb.PersistentClient(path="./drink_vector_db")
+        catalog = client.get_collection(name="drink_catalog")
+    return client, catalog
+
+
+def load_models():
+    """載入 YOLO / CLIP 並連線 ChromaDB（不含 llama-server）"""
+    global yolo_model, clip_model, text_model, chroma_client, collection, detection_cascade
+    if MODEL_SERVER_ADDRESS:
+        connect_model_server()
+        return
     print("🚀 正在啟動系統並載入模型...")
-    
+    # torch 相關套件匯入即需數秒，只在需要盤點模型時才匯入
+    from sentence_transformers import SentenceTransformer
+    from ultralytics import YOLO
+
     # 1. 載入視覺模型
     yolo_model = YOLO("yolo11m.pt")
     clip_model = SentenceTransformer('clip-ViT-B-32')
+    if VERIFY_MODE == "clip_text" and CLIP_TEXT_MODEL:
+        text_model = SentenceTransformer(CLIP_TEXT_MODEL)
+    if DETECT_CASCADE:
+        coarse_model = YOLO(CASCADE_COARSE_MODEL) if CASCADE_COARSE_MODEL else yolo_model
+        detection_cascade = DetectionCascade(
+            lambda images, imgsz, conf: run_yolo(yolo_model, images, conf, imgsz, "fine"),
+            lambda images, imgsz, conf: run_yolo(coarse_model, images, conf, imgsz, "coarse"),
+            conf=CONF_THRESHOLD, low_conf=CASCADE_LOW_CONF, coarse_imgsz=CASCADE_COARSE_IMGSZ,
+            fine_imgsz=CASCADE_FINE_IMGSZ, small_px=CASCADE_SMALL_PX,
+        )
+        print(f"🔍 偵測 cascade 已啟用（coarse: {CASCADE_COARSE_MODEL or 'yolo11m.pt'} @ {CASCADE_COARSE_IMGSZ}，"
+              f"fine @ {CASCADE_FINE_IMGSZ}）")
     
     # 2. 初始化 ChromaDB (持久化儲存於本地資料夾)
-    chroma_client = chromadb.PersistentClient(path="./drink_vector_db")
-    collection = chroma_client.get_or_create_collection(name="drink_catalog", metadata={"hnsw:space": "cosine"})
+    chroma_client, collection = open_catalog()
     
     existing_count = collection.count()
     print(f"📦 ChromaDB 已就緒，目前資料庫包含 {existing_count} 筆特徵資料。")
+    if VERIFY_MODE == "clip_text":
+        get_text_verifier()
+    get_search_index()
+
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
     # 啟動時執行
-    start_llama_server()
+    enable_service_tracing()
+    if INVENTORY_ENABLED:
+        load_models()
+        # worker 模式下 llama-server 由 model server 負責啟動
+        if LLAMA_SERVER_AUTOSTART and not MODEL_SERVER_ADDRESS:
+            start_llama_server()
+        start_job_workers()
+        start_scan_history()
+    else:
+        print("📅 date profile：只提供效期 OCR，不載入盤點模型")
     yield
     # 關閉時執行
+    if job_pool is not None:
+        job_pool.stop()
+    if scan_history is not None:
+        scan_history.stop()
     stop_llama_server()
+    shutdown_tracing()
+
+
+class _UnmountedRouter:
+    """date profile 的盤點路由：decorator 原樣回傳函式，不建立 route（FastAPI 建立 route 時會分析參數、產生 pydantic 欄位）"""
+
+    def api_route(self, *args, **kwargs):
+        return lambda func: func
+
+    get = post = delete = api_route
 
 
 app = FastAPI(
@@ -172,140 +466,398 @@ app = FastAPI(
     version="1.0.0",
     lifespan=lifespan,
 )
+# 盤點相關路由（/db、/inventory、/history、/jobs）只在 full profile 建立並掛上，見檔案結尾
+inventory_router = APIRouter() if INVENTORY_ENABLED else _UnmountedRouter()
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    max_bytes=int(MAX_REQUEST_MB * (1 << 20)),
+    path_limits={"/inventory_batch_base64": int(BATCH_MAX_REQUEST_MB * (1 << 20)),
+                 "/jobs/inventory_batch": int(JOB_MAX_REQUEST_MB * (1 << 20))},
+)
 
 
 
 class Base64ImageRequest(BaseModel):
     image_base64: str
     question: str = "請統計圖中的商品"
+    # 掃描歷史以店代號分區，未提供時記為 DEFAULT_STORE_ID
+    store_id: Optional[str] = None
+
+
+class BatchInventoryRequest(BaseModel):
+    images_base64: List[str]
+    question: str = "請統計圖中的商品"
+    store_id: Optional[str] = None
+    # 是否在最後以整體統計呼叫一次 LLM
+    summarize: bool = True
+
+
+class CatalogSearchRequest(BaseModel):
+    queries: List[str]
+    k: int = 5
 
 
 # ========== Helper Functions ==========
 
+def decode_image(data: bytes) -> np.ndarray:
+    """
+    解碼為 HxWx3 BGR uint8（YOLO 的 ndarray 輸入格式，不需再轉換）。
+    與原本 PIL 解碼相同，不套用 EXIF 旋轉；超過 MAX_IMAGE_PIXELS 的 JPEG 縮小解碼。
+    """
+    return decode_bounded(data, MAX_IMAGE_PIXELS)
+
+
+def request_image_bytes(image_base64: str) -> bytes:
+    """請求中的 base64 圖片 → 壓縮的圖片 bytes（檢查大小上限）"""
+    return b64decode_bounded(image_base64, int(MAX_IMAGE_MB * (1 << 20)))
+
+
+def decode_request_image(image_base64: str, timeout: float = DECODE_WAIT_S) -> np.ndarray:
+    return decode_request_bytes(request_image_bytes(image_base64), timeout)
+
+
+def decode_request_bytes(data: bytes, timeout: float = DECODE_WAIT_S) -> np.ndarray:
+    """
+    解碼請求中的圖片並預約解碼記憶體。
+    預約在回傳的影像與其所有 crop view 都被回收後歸還，呼叫端不應保留多餘的參照。
+    """
+    return decode_bounded(data, MAX_IMAGE_PIXELS, decode_budget, timeout)
+
+
+def detect_bottle_boxes(image: np.ndarray) -> np.ndarray:
+    """YOLO 偵測瓶子，回傳 (N, 5) [x1, y1, x2, y2, conf]"""
+    return detect_bottle_boxes_batch([image])[0]
+
+
+def detect_bottle_boxes_batch(images: list) -> list:
+    """多張圖一次送進 YOLO，回傳每張圖的 (N, 5) boxes"""
+    if model_client is not None:
+        with tracer.start_as_current_span("model_server.detect"):
+            return [model_client.detect(image) for image in images]
+
+    if detection_cascade is not None:
+        with tracer.start_as_current_span("detect.cascade") as span:
+            stats = {}
+            boxes = detection_cascade.detect(images, stats)
+            span.set_attribute("cascade.full_images", stats["full"])
+            span.set_attribute("cascade.regions", stats["regions"])
+        return boxes
+    return run_yolo(yolo_model, images, CONF_THRESHOLD)
+
+
+def run_yolo(model, images: list, conf: float, imgsz: int = None, tag: str = None) -> list:
+    """執行一次 YOLO batch 推論，回傳每張圖的 (N, 5) 瓶子 boxes；imgsz 未指定時使用模型預設（640）"""
+    with tracer.start_as_current_span(f"yolo.predict.{tag}" if tag else "yolo.predict") as span:
+        span.set_attribute("yolo.batch_size", len(images))
+        kwargs = {"imgsz": imgsz} if imgsz else {}
+        results = model(images, conf=conf, verbose=False, **kwargs)
+    return [select_class_boxes(result.boxes.data, BOTTLE_CLASS_ID) for result in results]
+
+
+def encode_crops(image: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """CLIP 影像向量：所有 box 組成單一 batch 一次推論，回傳 (N, D)"""
+    return encode_crops_batch([(image, boxes)])[0]
+
+
+def encode_crops_batch(pairs: list) -> list:
+    """多張圖的 crop 合併成同一個 CLIP batch；pairs 為 [(image, boxes), ...]，回傳每張圖的 (N_i, D)"""
+    if model_client is not None:
+        return [model_client.embed(image, boxes) for image, boxes in pairs]
+    views = [view for image, boxes in pairs for view in crop_views(image, boxes)]
+    if not views:
+        return [np.empty((0, 0), dtype=np.float32) for _ in pairs]
+    if CLIP_PREPROCESS == "torch":
+        embeddings = clip_image_embeddings(clip_model, build_clip_batch(views, device=clip_model.device))
+    else:
+        embeddings = encode_pil_crops(clip_model, views)
+    return np.split(embeddings, np.cumsum([len(boxes) for _, boxes in pairs])[:-1])
+
+
+def encode_texts(texts: list) -> np.ndarray:
+    """CLIP 文字向量，回傳 (N, D)"""
+    if model_client is not None:
+        return model_client.call("embed_text", texts=list(texts))
+    with tracer.start_as_current_span("clip.encode_text") as span:
+        span.set_attribute("clip.batch_size", len(texts))
+        return np.asarray((text_model or clip_model).encode(list(texts), batch_size=64), dtype=np.float32)
+
+
+def encode_image(image: np.ndarray) -> np.ndarray:
+    """整張圖的 CLIP 影像向量"""
+    height, width = image.shape[:2]
+    return encode_crops(image, np.array([[0, 0, width, height]], dtype=np.float32))[0]
+
+
 DEBUG_DIR = "detected_bottle"
+# 設為 0 可關閉 debug 圖片輸出（benchmark / 正式環境減少磁碟 IO）
+DEBUG_SAVE = os.getenv("DEBUG_SAVE", "1") == "1"
 _FONT_PATH = "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc"
-_debug_font = ImageFont.truetype(_FONT_PATH, size=14)
-
-def detect_and_crop_bottles(pil_image: Image.Image):
-    results = yolo_model(pil_image, conf=CONF_THRESHOLD, verbose=False)
-    cropped_images = []
-    boxes_found = []
-
-    for result in results:
-        for box in result.boxes:
-            if int(box.cls[0]) == BOTTLE_CLASS_ID:
-                x1, y1, x2, y2 = (int(v) for v in box.xyxy[0].tolist())
-                conf = float(box.conf[0])
-                cropped_images.append(pil_image.crop((x1, y1, x2, y2)))
-                boxes_found.append((x1, y1, x2, y2, conf))
-
-    # Debug: 為每張輸入圖建立資料夾，存原圖 bbox 標註 + 各 crop
+_debug_font = ImageFont.truetype(_FONT_PATH, size=14) if INVENTORY_ENABLED and DEBUG_SAVE else None
+
+@tracer.start_as_current_span("detect_and_crop_bottles")
+def detect_and_crop_bottles(image: np.ndarray):
+    """回傳 (boxes, crops, debug_folder)；crops 為 image 的 view，不複製像素"""
+    span = trace.get_current_span()
+    span.set_attribute("image.width", image.shape[1])
+    span.set_attribute("image.height", image.shape[0])
+
+    boxes_found = detect_bottle_boxes(image)
+    crops = crop_views(image, boxes_found)
+    span.set_attribute("bottles.count", len(boxes_found))
+
+    if not DEBUG_SAVE:
+        return boxes_found, crops, None
+    return boxes_found, crops, save_detection_debug(image, boxes_found, crops)
+
+
+def save_detection_debug(image: np.ndarray, boxes_found: np.ndarray, crops: list, tag: str = "") -> str:
+    """Debug: 為每張輸入圖建立資料夾，存原圖 bbox 標註 + 各 crop"""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-    debug_folder = os.path.join(DEBUG_DIR, timestamp)
-    if boxes_found:
+    debug_folder = os.path.join(DEBUG_DIR, timestamp + tag)
+    if len(boxes_found):
         os.makedirs(debug_folder, exist_ok=True)
 
         # 儲存原始輸入圖
-        pil_image.save(os.path.join(debug_folder, "input.jpg"))
+        cv2.imwrite(os.path.join(debug_folder, "input.jpg"), image)
 
-        # 儲存原圖並標上 bbox
-        overview_img = pil_image.copy()
+        # 儲存原圖並標上 bbox（大圖先縮小，只複製縮小後的影像）
+        overview = fit_to_max_side(image, DEBUG_OVERVIEW_MAX_SIDE)
+        scale = overview.shape[1] / image.shape[1]
+        overview_img = Image.fromarray(overview[:, :, ::-1])
+        del overview
         draw = ImageDraw.Draw(overview_img)
         for i, (x1, y1, x2, y2, conf) in enumerate(boxes_found):
+            x1, y1, x2, y2 = int(x1 * scale), int(y1 * scale), int(x2 * scale), int(y2 * scale)
             draw.rectangle([x1, y1, x2, y2], outline="red", width=3)
             draw.text((x1, max(0, y1 - 15)), f"#{i} {conf:.2f}", fill="red", font=_debug_font)
         overview_img.save(os.path.join(debug_folder, "overview.jpg"))
 
         # 儲存所有 cropped bottle 原圖
-        for i, crop in enumerate(cropped_images):
-            crop.save(os.path.join(debug_folder, f"crop_{i:02d}_raw.jpg"))
+        for i, crop in enumerate(crops):
+            cv2.imwrite(os.path.join(debug_folder, f"crop_{i:02d}_raw.jpg"), crop)
 
         print(f"[DEBUG] 偵測到 {len(boxes_found)} 個瓶子，debug 資料夾: {debug_folder}")
 
-    return cropped_images, debug_folder
+    return debug_folder
+
+
+def bump_catalog_version():
+    global catalog_version
+    catalog_version += 1
+    # 舊版本的結果已不會被取用（key 含 catalog 版本），直接清空釋放記憶體
+    if result_cache is not None:
+        result_cache.invalidate()
+
+
+def current_catalog_version() -> int:
+    # worker 模式下 catalog 由 model server 持有，版本以 server 端為準
+    if model_client is not None:
+        return model_client.call("catalog_version")
+    return catalog_version
+
+
+def get_fuzzy_index() -> FuzzyIndex:
+    """catalog 版本改變後，下一次查詢時才重建 n-gram 索引"""
+    global _fuzzy_index, _fuzzy_index_version
+    version = current_catalog_version()
+    with _fuzzy_index_lock:
+        if _fuzzy_index is None or _fuzzy_index_version != version:
+            all_items = collection.get(include=["metadatas"])
+            _fuzzy_index = FuzzyIndex(all_items['ids'], [catalog_text(meta) for meta in all_items['metadatas']])
+            _fuzzy_index_version = version
+            print(f"[Fuzzy] 重建索引：{len(_fuzzy_index)} 筆 (catalog 版本 {version})")
+        return _fuzzy_index
 
 
 def fuzzy_match_ocr_to_db(ocr_text: str):
     """
-    從 DB 取出所有 brand+flavor，用 rapidfuzz 模糊比對 OCR 文字，
+    用 rapidfuzz 模糊比對 OCR 文字與 DB 的 brand+flavor，
     回傳最符合的 DB item ID（即 brand+flavor 字串）。
-    處理形近字錯誤，例如「線→綠」、「古→甘」。
+    形近字錯誤（例如「線→綠」、「古→甘」）先經正規化表對應，
+    大型 catalog 以 n-gram 索引篩出候選後才跑 partial_ratio（見 utils/fuzzy_index.py）。
     """
-    all_items = collection.get(include=["metadatas"])
-    if not all_items['ids']:
+    index = get_fuzzy_index()
+    if not len(index):
         return None
 
-    # 建立 {id: "brand+flavor"} 候選字典
-    candidates = {}
-    for item_id, meta in zip(all_items['ids'], all_items['metadatas']):
-        brand = meta.get('brand', '')
-        flavor = meta.get('flavor', '')
-        candidates[item_id] = f"{brand}{flavor}"
-
-    # partial_ratio 對形近字和部分匹配效果最好
-    result = fuzz_process.extractOne(
-        ocr_text,
-        candidates,
-        scorer=fuzz.partial_ratio,
-        score_cutoff=50,
-    )
+    matched_id, score, shortlisted = index.search(ocr_text, score_cutoff=50)
 
-    if result is None:
+    span = trace.get_current_span()
+    span.set_attribute("fuzzy.candidates", len(index))
+    span.set_attribute("fuzzy.shortlist", shortlisted)
+    if matched_id is None:
         print(f"[Fuzzy] 無法匹配 OCR 文字: {repr(ocr_text[:60])}")
         return None
 
-    _, score, matched_id = result
+    span.set_attribute("fuzzy.score", score)
     print(f"[Fuzzy] OCR 文字匹配 -> '{matched_id}' (score={score:.1f})")
     return matched_id
 
 
-def match_bottle(pil_image: Image.Image, debug_folder: str, crop_index: int):
+def get_text_verifier() -> TextVerifier:
+    """catalog 版本改變後，下一次比對時才補算新商品的文字向量"""
+    global _text_verifier
+    version = current_catalog_version()
+    with _text_verifier_lock:
+        if _text_verifier is None:
+            _text_verifier = TextVerifier(encode_texts, max_image_distance=COSINE_THRESHOLD,
+                                          min_margin=TEXT_VERIFY_MARGIN)
+        if _text_verifier.version != version:
+            all_items = collection.get(include=["metadatas"])
+            encoded = _text_verifier.refresh(all_items['ids'], all_items['metadatas'], version)
+            print(f"[Verify] 更新文字向量：{len(_text_verifier)} 筆商品，新計算 {encoded} 句 (catalog 版本 {version})")
+        return _text_verifier
+
+
+def query_catalog(embeddings) -> list:
+    """
+    多個 CLIP 向量一次查詢 catalog 的影像距離（top-k 或整個 catalog，供 debug 及後續驗證用），
+    回傳每個向量依距離排序的 (ids, metadatas, distances)。
+    """
+    with tracer.start_as_current_span("chroma.query") as query_span:
+        n_results = MATCH_TOP_K or max(collection.count(), 1)
+        results = collection.query(
+            query_embeddings=[np.asarray(e).tolist() for e in embeddings],
+            n_results=n_results,
+            include=["metadatas", "distances"]
+        )
+        query_span.set_attribute("chroma.n_results", n_results)
+        query_span.set_attribute("chroma.queries", len(embeddings))
+    return list(zip(results['ids'], results['metadatas'], results['distances']))
+
+
+def verify_crops(embeddings) -> list:
+    """
+    VERIFY_MODE=clip_text：所有 crop 一次查詢影像距離、一次與 catalog 文字矩陣相乘，
+    回傳每個 crop 的 (neighbours, TextEvidence)，交給 match_bottle。
+    """
+    if not len(embeddings):
+        return []
+    neighbours = query_catalog(embeddings)
+    verifier = get_text_verifier()
+    with tracer.start_as_current_span("clip.text_verify") as span:
+        evidence = verifier.verify(np.asarray(embeddings), [n[0] for n in neighbours], [n[2] for n in neighbours])
+        span.set_attribute("verify.crops", len(evidence))
+        span.set_attribute("verify.agreed", sum(e.agree for e in evidence))
+    return list(zip(neighbours, evidence))
+
+
+def catalog_distance(embedding: np.ndarray, item_id: str):
+    """不在 top-k 結果內的 catalog 項目：直接取出其向量計算 cosine distance"""
+    with tracer.start_as_current_span("chroma.get_embedding"):
+        item = collection.get(ids=[item_id], include=["embeddings"])
+    if not item['ids']:
+        return None
+    reference = np.asarray(item['embeddings'][0], dtype=np.float32)
+    query = np.asarray(embedding, dtype=np.float32)
+    return float(1.0 - query @ reference / (np.linalg.norm(query) * np.linalg.norm(reference)))
+
+
+def match_bottle(crop: np.ndarray, embedding: np.ndarray, debug_folder: str, crop_index: int,
+                 deadline: Deadline = None, verified: tuple = None, ocr_priority: str = "inventory"):
     """
-    新版比對流程：
-    1. CLIP encode crop 取得向量
+    新版比對流程（crop 為 BGR ndarray，embedding 為 encode_crops 批次算好的 CLIP 向量）：
+    1. 以 CLIP 向量查詢 DB 距離
     2. GLM OCR 辨識標籤文字
     3. rapidfuzz 模糊比對 DB 的 brand+flavor，找出候選商品
     4. 取 DB 該筆的 CLIP cosine distance，< FUZZY_CLIP_THRESHOLD 才確認命中
+
+    verified 為 verify_crops 預先算好的 (neighbours, TextEvidence)：影像與文字證據一致時直接採用
+    影像最近鄰，略過 2~4。
+
+    ocr_priority 為 OCR 排程的優先等級（見 utils/ocr_scheduler.py），同一請求的 crop 以 deadline 視為同一 flow。
+    OCR 因請求逾時或取消而失敗時，丟出 DeadlineExceeded / RequestCancelled。
+
+    回傳 (matched_name, ocr_failed)：ocr_failed 代表 OCR 失敗或斷路器開啟、以空白文字比對（結果可能因此是未知商品）。
     """
-    # Step 1: CLIP encode
-    img_emb = clip_model.encode(pil_image).tolist()
-
-    # Step 2: 查詢 DB 所有商品距離（供 debug 及後續驗證用）
-    total = collection.count()
-    all_results = collection.query(
-        query_embeddings=[img_emb],
-        n_results=max(total, 1),
-        include=["metadatas", "distances"]
-    )
-    id_dist_map = {
-        item_id: dist
-        for item_id, dist in zip(all_results['ids'][0], all_results['distances'][0])
-    }
-    distances = list(zip(all_results['metadatas'][0], all_results['distances'][0]))
+    with tracer.start_as_current_span("match_bottle") as span:
+        span.set_attribute("crop.index", crop_index)
+        matched_name, ocr_failed = _match_bottle(crop, embedding, debug_folder, crop_index, span,
+                                                 deadline or Deadline(), verified, ocr_priority)
+        span.set_attribute("matched.id", matched_name)
+        span.set_attribute("ocr.failed", ocr_failed)
+        return matched_name, ocr_failed
+
+
+def _match_bottle(crop: np.ndarray, img_emb: np.ndarray, debug_folder: str, crop_index: int, span,
+                  deadline: Deadline, verified: tuple = None, ocr_priority: str = "inventory"):
+    # Step 1: 查詢 DB 商品距離（clip_text 模式下已與同張圖的其他 crop 一起查過）
+    neighbours, evidence = verified if verified is not None else (query_catalog([img_emb])[0], None)
+    ids, metadatas, dists = neighbours
+    id_dist_map = dict(zip(ids, dists))
+    distances = list(zip(metadatas, dists))
 
     print(f"[DEBUG] crop #{crop_index} CLIP 距離:")
     for meta, dist in distances:
         label = f"{meta.get('brand','')}{meta.get('flavor','')}"
         print(f"  {label}: {dist:.4f}")
 
-    # Step 3: GLM OCR
-    buf = io.BytesIO()
-    pil_image.save(buf, format="JPEG")
-    crop_b64 = base64.b64encode(buf.getvalue()).decode()
-    try:
-        ocr_text = glm_ocr_ollama(crop_b64)
-        print(f"[OCR] crop #{crop_index}: {repr(ocr_text[:80])}")
-    except Exception as e:
-        print(f"[OCR] crop #{crop_index} 失敗: {e}")
-        ocr_text = ""
+    if evidence is not None:
+        span.set_attribute("verify.text_id", str(evidence.text_id))
+        span.set_attribute("verify.text_score", evidence.text_score)
+        span.set_attribute("verify.agree", evidence.agree)
+
+    if evidence is not None and evidence.agree:
+        print(f"[Verify] crop #{crop_index} 影像與文字一致 -> '{evidence.image_id}' "
+              f"(distance={evidence.image_distance:.4f}, text={evidence.text_score:.4f})，略過 OCR")
+        matched_name, ocr_text, ocr_failed = evidence.image_id, "", False
+    else:
+        if evidence is not None:
+            print(f"[Verify] crop #{crop_index} 影像 '{evidence.image_id}' (distance={evidence.image_distance:.4f}) "
+                  f"/ 文字 '{evidence.text_id}' 證據不足，改以 OCR 確認")
+        # Step 2~4: OCR + Fuzzy + CLIP 距離確認
+        matched_name, ocr_text, ocr_failed = _ocr_match(crop, img_emb, id_dist_map, debug_folder, crop_index, span,
+                                                        deadline, ocr_priority)
+
+    # Debug: 將 crop 圖片標註距離後儲存
+    if debug_folder:
+        save_match_debug(crop, distances, matched_name, ocr_text, debug_folder, crop_index)
 
-    # Step 4: Fuzzy match OCR 文字 -> 候選 DB ID
-    matched_id = fuzzy_match_ocr_to_db(ocr_text) if ocr_text else None
+    return matched_name, ocr_failed
 
-    # Step 5: CLIP 驗證 cosine distance < FUZZY_CLIP_THRESHOLD
+
+def _ocr_match(crop: np.ndarray, img_emb: np.ndarray, id_dist_map: dict, debug_folder: str, crop_index: int, span,
+               deadline: Deadline, ocr_priority: str = "inventory"):
+    """OCR + Fuzzy 找出候選，再以 CLIP 距離確認；回傳 (matched_name, ocr_text, ocr_failed)"""
+    # Step 2: GLM OCR
+    # 依 backend 的原生尺寸縮放並只編碼一次，OCR 與 debug 共用同一份 payload
+    with tracer.start_as_current_span("ocr.prepare_input") as prep_span:
+        payload = ocr_backend.prepare_input(crop)
+        prep_span.set_attribute("ocr.input_size", f"{payload.width}x{payload.height}")
+        prep_span.set_attribute("ocr.payload_bytes", len(payload.data))
+    if debug_folder:
+        payload.save(os.path.join(debug_folder, f"crop_{crop_index:02d}_ocr"))
+    with tracer.start_as_current_span("ocr") as ocr_span:
+        ocr_span.set_attribute("ocr.backend", ocr_backend.name)
+        ocr_span.set_attribute("ocr.payload_bytes", len(payload.data))
+        ocr_failed = True
+        try:
+            ocr_text = ocr_backend.recognize(payload, deadline, ocr_priority)
+            ocr_failed = False
+            print(f"[OCR] crop #{crop_index}: {repr(ocr_text[:80])}")
+        except CircuitOpenError as e:
+            print(f"[OCR] crop #{crop_index} 略過: {e}")
+            ocr_span.set_attribute("ocr.circuit_open", True)
+            ocr_text = ""
+        except Exception as e:
+            deadline.check()  # 因期限 / 取消而失敗時不當作 OCR 空白，直接中止
+            print(f"[OCR] crop #{crop_index} 失敗: {e}")
+            ocr_span.record_exception(e)
+            ocr_text = ""
+        ocr_span.set_attribute("ocr.text_length", len(ocr_text))
+
+    # Step 3: Fuzzy match OCR 文字 -> 候選 DB ID
+    with tracer.start_as_current_span("fuzzy_match"):
+        matched_id = fuzzy_match_ocr_to_db(ocr_text) if ocr_text else None
+
+    # Step 4: CLIP 驗證 cosine distance < FUZZY_CLIP_THRESHOLD
     if matched_id is not None:
         cosine_dist = id_dist_map.get(matched_id)
-        print(f"[Verify] '{matched_id}' CLIP distance = {cosine_dist:.4f} (threshold={FUZZY_CLIP_THRESHOLD})")
+        if cosine_dist is None and MATCH_TOP_K:
+            cosine_dist = catalog_distance(img_emb, matched_id)
+        if cosine_dist is not None:
+            span.set_attribute("clip.distance", cosine_dist)
+            print(f"[Verify] '{matched_id}' CLIP distance = {cosine_dist:.4f} (threshold={FUZZY_CLIP_THRESHOLD})")
         if cosine_dist is not None and cosine_dist < FUZZY_CLIP_THRESHOLD:
             matched_name = matched_id  # DB id == brand+flavor
         else:
@@ -313,32 +865,33 @@ def match_bottle(pil_image: Image.Image, debug_folder: str, crop_index: int):
             matched_name = "未知商品"
     else:
         matched_name = "未知商品"
+    return matched_name, ocr_text, ocr_failed
 
-    # Debug: 將 crop 圖片標註距離後儲存
-    if debug_folder:
-        crop_debug = pil_image.copy()
-        draw = ImageDraw.Draw(crop_debug)
-        line_height = 14
-        y_offset = 4
-        for meta, dist in distances:
-            name = f"{meta.get('brand','')}{meta.get('flavor','')}"
-            marker = " <--" if name == matched_name else ""
-            text = f"{name}: {dist:.4f}{marker}"
-            bbox = draw.textbbox((4, y_offset), text, font=_debug_font)
-            draw.rectangle(bbox, fill="white")
-            color = "green" if marker else "red"
-            draw.text((4, y_offset), text, fill=color, font=_debug_font)
-            y_offset += line_height
-        # 也標上 OCR 結果摘要
-        ocr_summary = ocr_text.replace("\n", " ")[:50]
-        draw.text((4, y_offset + 4), f"OCR: {ocr_summary}", fill="blue", font=_debug_font)
-        crop_debug.save(os.path.join(debug_folder, f"crop_{crop_index:02d}.jpg"))
-
-    return matched_name
+
+def save_match_debug(crop: np.ndarray, distances: list, matched_name: str, ocr_text: str, debug_folder: str,
+                     crop_index: int):
+    """crop 圖片標註各商品距離與 OCR 結果後儲存"""
+    crop_debug = Image.fromarray(crop[:, :, ::-1])
+    draw = ImageDraw.Draw(crop_debug)
+    line_height = 14
+    y_offset = 4
+    for meta, dist in distances:
+        name = f"{meta.get('brand','')}{meta.get('flavor','')}"
+        marker = " <--" if name == matched_name else ""
+        text = f"{name}: {dist:.4f}{marker}"
+        bbox = draw.textbbox((4, y_offset), text, font=_debug_font)
+        draw.rectangle(bbox, fill="white")
+        color = "green" if marker else "red"
+        draw.text((4, y_offset), text, fill=color, font=_debug_font)
+        y_offset += line_height
+    # 也標上 OCR 結果摘要
+    ocr_summary = ocr_text.replace("\n", " ")[:50]
+    draw.text((4, y_offset + 4), f"OCR: {ocr_summary}", fill="blue", font=_debug_font)
+    crop_debug.save(os.path.join(debug_folder, f"crop_{crop_index:02d}.jpg"))
 
 # ========== CRUD Endpoints (管理資料庫) ==========
 
-@app.post("/db/add", summary="[CRUD] 新增飲料特徵到資料庫")
+@inventory_router.post("/db/add", summary="[CRUD] 新增飲料特徵到資料庫")
 async def add_to_db(
     brand: str = Form(...),
     flavor: str = Form(...),
@@ -352,8 +905,11 @@ async def add_to_db(
     - color: 瓶身顏色，例如「黃色」
     """
     item_id = f"{brand}{flavor}"  # 以 brand+flavor 作為唯一 ID
-    image = Image.open(file.file).convert("RGB")
-    embedding = clip_model.encode(image).tolist()
+    try:
+        image = decode_image(await file.read())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="圖片解碼失敗")
+    embedding = encode_image(image).tolist()
 
     collection.upsert(
         ids=[item_id],
@@ -364,100 +920,728 @@ async def add_to_db(
             "color": color,
         }]
     )
+    bump_catalog_version()
     return {"status": "success", "message": f"已存入: {brand} {flavor} ({color})"}
 
-@app.get("/db/list", summary="[CRUD] 列出目前所有商品")
+@inventory_router.get("/db/list", summary="[CRUD] 列出目前所有商品")
 async def list_db():
     results = collection.get()
     return {"total": len(results['ids']), "items": results['metadatas']}
 
-@app.delete("/db/{name}", summary="[CRUD] 刪除特定商品")
+@inventory_router.delete("/db/{name}", summary="[CRUD] 刪除特定商品")
 async def delete_item(name: str):
     collection.delete(ids=[name])
+    bump_catalog_version()
     return {"status": "deleted", "item": name}
 
 
+def get_search_index() -> CatalogSearchIndex:
+    """catalog 版本改變後，下一次搜尋時才重新取出影像向量矩陣"""
+    global _search_index, _query_cache
+    version = current_catalog_version()
+    with _search_index_lock:
+        if _query_cache is None:
+            _query_cache = QueryEmbeddingCache(encode_texts, SEARCH_CACHE_SIZE)
+        if _search_index is None or _search_index.version != version:
+            all_items = collection.get(include=["metadatas", "embeddings"])
+            _search_index = CatalogSearchIndex(all_items['ids'], all_items['metadatas'], all_items['embeddings'], version)
+            print(f"[Search] 重建搜尋索引：{len(_search_index)} 筆 (catalog 版本 {version})")
+        return _search_index
+
+
+def search_catalog(queries: list, k: int) -> list:
+    """每個查詢句回傳前 k 名商品；查詢句向量取自 LRU 快取，未命中的一次編碼"""
+    with tracer.start_as_current_span("catalog_search") as span:
+        index = get_search_index()
+        span.set_attribute("search.queries", len(queries))
+        misses = _query_cache.misses
+        embeddings = _query_cache.get(queries)
+        span.set_attribute("search.cache_misses", _query_cache.misses - misses)
+        return index.search(queries, embeddings, k, SEARCH_SEMANTIC_WEIGHT)
+
+
+def validate_search_queries(queries: list, k: int):
+    if not queries or any(not q.strip() for q in queries):
+        raise HTTPException(status_code=400, detail="查詢文字不可為空")
+    if len(queries) > SEARCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"一次最多 {SEARCH_MAX_QUERIES} 個查詢")
+    if not 1 <= k <= 50:
+        raise HTTPException(status_code=400, detail="k 必須介於 1 與 50 之間")
+
+
+@inventory_router.get("/db/search", summary="[CRUD] 以文字搜尋商品（CLIP 語意 + 模糊比對）")
+async def search_db(q: str, k: int = 5):
+    """
+    例如「橘色飲料」、「無糖綠茶」。每個結果附上 score（加權總分）、semantic（CLIP 文字對商品影像的
+    softmax 機率）與 fuzzy（品牌 / 口味 / 顏色的 partial_ratio）。
+    """
+    validate_search_queries([q], k)
+    results = await run_in_threadpool(search_catalog, [q], k)
+    return {"query": q, "results": results[0]}
+
+
+@inventory_router.post("/db/search", summary="[CRUD] 批次文字搜尋")
+async def search_db_batch(request: CatalogSearchRequest):
+    validate_search_queries(request.queries, request.k)
+    results = await run_in_threadpool(search_catalog, request.queries, request.k)
+    return {"results": [{"query": q, "results": r} for q, r in zip(request.queries, results)]}
+
+
 @app.get("/")
 async def root():
     return {
         "message": "OCR API",
         "version": "1.0.0",
+        "profile": SERVICE_PROFILE,
     }
 
 
-@app.post("/inventory_base64")
-async def inventory_base64(request: Base64ImageRequest):
+async def _watch_disconnect(http_request: Request, deadline: Deadline):
+    while not deadline.done:
+        if await http_request.is_disconnected():
+            deadline.cancel("client disconnected")
+            return
+        await asyncio.sleep(DISCONNECT_POLL_S)
+
+
+async def run_with_deadline(http_request: Request, deadline: Deadline, func, *args):
+    """
+    在 threadpool 執行同步的 pipeline，同時監看客戶端是否斷線。
+    斷線時取消 deadline，讓尚未開始的 OCR / LLM 呼叫直接跳過。
+    """
+    watcher = asyncio.create_task(_watch_disconnect(http_request, deadline))
+    try:
+        return await run_in_threadpool(func, *args)
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"處理逾時: {e}")
+    except RequestCancelled as e:
+        print(f"[Deadline] 請求已取消 ({e})，停止剩餘工作")
+        raise HTTPException(status_code=499, detail="client closed request")
+    finally:
+        watcher.cancel()
+
+
+def request_deadline(x_request_timeout: Optional[float]) -> Deadline:
+    return Deadline(x_request_timeout if x_request_timeout is not None else REQUEST_TIMEOUT_S)
+
+
+def format_counts_answer(counts: dict) -> str:
+    """不經 LLM，直接以回答規則 1 的格式列出統計"""
+    lines = [f"{name} 有 {count} 瓶" for name, count in counts.items()]
+    return "根據掃描結果清單，以下是各商品的數量統計：\n" + "\n".join(lines)
+
+
+@inventory_router.post("/inventory_base64")
+async def inventory_base64(
+    request: Base64ImageRequest,
+    http_request: Request,
+    x_request_timeout: Optional[float] = Header(None, description="請求處理期限（秒），0 代表不限制"),
+    x_profile: Optional[str] = Header(None, description="profiling 這次請求：1 / cpu / memory"),
+    x_profile_token: Optional[str] = Header(None),
+    x_request_id: Optional[str] = Header(None, description="profile 的保存 id，未提供時自動產生"),
+):
+    deadline = request_deadline(x_request_timeout)
+    profile_modes = request_profile_modes(x_profile, x_profile_token)
+    if not profile_modes:
+        return await run_with_deadline(http_request, deadline, run_inventory, request, deadline)
+    profile_id = reserve_profile_id(x_request_id, explicit=bool(PROFILE_TOKEN) and x_profile is not None)
+    result = await run_with_deadline(http_request, deadline, run_inventory, request, deadline,
+                                     profile_id, profile_modes)
+    return {**result, "profile_id": profile_id}
+
+
+def run_inventory(request: Base64ImageRequest, deadline: Deadline = None, profile_id: str = None,
+                  profile_modes: tuple = (), ocr_priority: str = "inventory"):
+    """/inventory_base64 的同步主流程（benchmark 亦直接呼叫）；指定 profile_id 時 profiling 整個流程"""
+    with tracer.start_as_current_span("inventory_base64") as span:
+        if profile_id is None:
+            return _inventory_base64(request, span, deadline or Deadline(), ocr_priority)
+        span.set_attribute("profile.id", profile_id)
+        with profile_request(get_profile_store(), profile_id, profile_modes,
+                             interval_s=PROFILE_INTERVAL_MS / 1000) as attributes:
+            attributes.update(
+                trace_id=format(span.get_span_context().trace_id, "032x"),
+                image_base64_kb=len(request.image_base64) // 1024,
+                question=request.question,
+            )
+            # profiling 需要實際跑完整個流程，不取用結果快取
+            return _inventory_base64(request, span, deadline or Deadline(), ocr_priority, use_cache=False)
+
+
+def _partial_result(counts: dict, unresolved: int, span):
+    span.set_attribute("deadline.partial", True)
+    span.set_attribute("bottles.unresolved", unresolved)
+    print(f"[Deadline] 期限已到，回傳部分結果（{unresolved} 個 crop 未解析）")
+    return {"status": 1, "data": format_counts_answer(counts), "partial": True, "unresolved": unresolved}
+
+
+def _inventory_base64(request: Base64ImageRequest, span, deadline: Deadline, ocr_priority: str = "inventory",
+                      use_cache: bool = True):
     start_time = time.time()
-    
-    # 1. 解碼圖片
+    span.set_attribute("request.question", request.question)
+    if deadline.timeout_s:
+        span.set_attribute("deadline.timeout_s", deadline.timeout_s)
+
+    # 1. 解碼圖片（壓縮後的 bytes 在解碼完即釋放，影像記憶體計入 decode_budget）
+    #    相同照片 + 問題 + catalog 版本的結果已在快取中時，不解碼直接回傳
+    try:
+        data = request_image_bytes(request.image_base64)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="圖片解碼失敗")
+    if result_cache is None:
+        return _run_inventory_pipeline(request, data, span, deadline, ocr_priority, start_time)[0]
+
+    # 相同 key 的並發請求等待第一個請求的結果（single-flight），等到自己的期限為止
+    cache_key = result_key(data, request.question, current_catalog_version())
+    result, source = result_cache.get_or_compute(
+        cache_key, lambda: _run_inventory_pipeline(request, data, span, deadline, ocr_priority, start_time),
+        timeout=deadline.remaining(), abandoned=lambda: deadline.done, lookup=use_cache)
+    span.set_attribute("result_cache.source", source)
+    if source != "computed":
+        print(f"[Cache] 重複的請求，直接回傳先前結果 ({source}, {cache_key[:12]})")
+    return result
+
+
+def _run_inventory_pipeline(request: Base64ImageRequest, data: bytes, span, deadline: Deadline, ocr_priority: str,
+                            start_time: float):
+    """
+    回傳 (回應, 是否可保存)。OCR 失敗或 LLM 改以模板回答的降級結果、期限已到的部分結果不可保存：
+    保存後同一張照片重送只會一直拿到降級結果（例如 OCR 一次逾時就讓 crop 變成未知商品）。
+    """
+    deadline.check()
     try:
-        image_data = base64.b64decode(request.image_base64)
-        pil_image = Image.open(io.BytesIO(image_data)).convert("RGB")
+        with tracer.start_as_current_span("decode_image"):
+            image = decode_request_bytes(data, deadline.bound(DECODE_WAIT_S))
+        del data
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except MemoryBudgetExceeded as e:
+        deadline.check()
+        raise HTTPException(status_code=503, detail=str(e))
     except:
         raise HTTPException(status_code=400, detail="圖片解碼失敗")
 
     # 2. YOLO 偵測與裁切
-    crops, debug_folder = detect_and_crop_bottles(pil_image)
+    boxes, crops, debug_folder = detect_and_crop_bottles(image)
     if not crops:
-        return {"status": 1, "data": "貨架上看起來沒有瓶子。"}
-
-    # 3. OCR + Fuzzy + CLIP 比對
-    detected_names = [match_bottle(img, debug_folder, i) for i, img in enumerate(crops)]
+        record_scan(request.store_id, {}, time.time() - start_time, "inventory")
+        return {"status": 1, "data": "貨架上看起來沒有瓶子。"}, True
+
+    # 所有 crop 一次組成 CLIP batch
+    with tracer.start_as_current_span("clip.encode") as clip_span:
+        clip_span.set_attribute("clip.batch_size", len(crops))
+        embeddings = encode_crops(image, boxes)
+    verified = verify_crops(embeddings) if VERIFY_MODE == "clip_text" else [None] * len(crops)
+
+    # 3. OCR + Fuzzy + CLIP 比對（每個 crop 開始前檢查期限）
+    detected_names = []
+    ocr_failures = 0
+    for i, (crop, embedding) in enumerate(zip(crops, embeddings)):
+        try:
+            deadline.check()
+            matched_name, ocr_failed = match_bottle(crop, embedding, debug_folder, i, deadline, verified[i],
+                                                    ocr_priority)
+            detected_names.append(matched_name)
+            ocr_failures += ocr_failed
+        except DeadlineExceeded:
+            if not PARTIAL_RESULTS_ON_DEADLINE:
+                raise
+            detected_names += [UNRESOLVED_LABEL] * (len(crops) - i)
+            break
+    # LLM 只需要統計結果，先釋放影像與 crop，讓等待 LLM 的請求不佔解碼記憶體預算
+    del image, crops, embeddings, crop, embedding
     counts = dict(Counter(detected_names))
+    span.set_attribute("bottles.count", len(detected_names))
+    span.set_attribute("bottles.unknown", counts.get("未知商品", 0))
+    span.set_attribute("ocr.failures", ocr_failures)
+    record_scan(request.store_id, counts, time.time() - start_time, "inventory")
+    if UNRESOLVED_LABEL in counts:
+        return _partial_result(counts, counts[UNRESOLVED_LABEL], span), False
     
-    # 4. 組合成文字給 Ollama
-    scan_list_str = "\n".join([f"- {k}: {v} 瓶" for k, v in counts.items()])
+    # 4. llama.cpp 推理
+    try:
+        answer, llm_fallback = answer_question(counts, request.question, deadline)
+    except Exception:
+        try:
+            deadline.check()
+        except DeadlineExceeded:
+            if PARTIAL_RESULTS_ON_DEADLINE:
+                return _partial_result(counts, 0, span), False
+            raise
+        raise
+
+    print(f"⚡ 耗時: {round(time.time() - start_time, 2)}s")
+    print(f"=====回答======")
+    print(f"{answer}")
+    print(f"==============")
+    if ocr_failures:
+        print(f"[Cache] {ocr_failures} 個 crop 的 OCR 失敗，結果不保存")
+    return {"status": 1, "data": answer}, llm_fallback is None and not ocr_failures
+
+
+@inventory_router.get("/result_cache", summary="[Cache] /inventory_base64 結果快取的命中率與筆數")
+async def result_cache_stats():
+    if result_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **result_cache.stats()}
+
+
+def ask_llm(counts: dict, question: str, deadline: Deadline) -> str:
+    return answer_question(counts, question, deadline)[0]
+
+
+def answer_question(counts: dict, question: str, deadline: Deadline) -> tuple:
+    """
+    將統計結果組成掃描清單，交給 llama-server 回答問題，回傳 (回答, 改用模板的原因或 None)。
+    llama-server 斷路器開啟或呼叫失敗（連線 / 逾時 / 5xx）、回答超過 token 上限或不符回答格式時，改以模板列出統計。
+    """
+    scan_list_str = format_scan_list(counts)
     print(f"=====SYSTEM_PROMPT=====")
     print(f"{scan_list_str}")
     print(f"==========")
 
-    # 5. llama.cpp 推理
-    response = client.chat.completions.create(
-        model="ministral_3_3b",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT_TEMPLATE.format(scan_list=scan_list_str)},
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": request.question},
-                ],
-            },
-        ],
-        temperature=0,
-    )
+    grammar = AnswerGrammar(counts)
+    deadline.check()
+    with tracer.start_as_current_span("llm.completion") as llm_span:
+        if not llm_breaker.allow():
+            print("[LLM] 斷路器開啟中，改以模板回答")
+            llm_span.set_attribute("llm.fallback", "circuit_open")
+            return format_counts_answer(counts), "circuit_open"
+        try:
+            answer, finish_reason, timings = _llm_completion(scan_list_str, question, grammar, deadline)
+        except Exception as e:
+            if not is_llm_backend_error(e) or deadline.done:
+                llm_breaker.release_probe()
+                raise
+            llm_breaker.record_failure()
+            print(f"[LLM] 呼叫失敗 ({type(e).__name__})，改以模板回答")
+            llm_span.record_exception(e)
+            llm_span.set_attribute("llm.fallback", type(e).__name__)
+            return format_counts_answer(counts), type(e).__name__
+        llm_breaker.record_success()
+        llm_span.set_attribute("llm.finish_reason", str(finish_reason))
+        # llama-server 在最後一個 chunk 附上 timings；文法完成提早關閉串流時不會收到
+        for key, attribute in (("prompt_n", "llm.prompt_tokens"), ("predicted_n", "llm.completion_tokens"),
+                               ("cache_n", "llm.cached_tokens")):
+            if key in timings:
+                llm_span.set_attribute(attribute, timings[key])
+        if finish_reason == "length" or (LLM_GRAMMAR and not grammar.is_valid(answer)):
+            print(f"[LLM] 回答不完整或格式不符 (finish_reason={finish_reason})，改以模板回答")
+            llm_span.set_attribute("llm.fallback", "invalid_answer")
+            return format_counts_answer(counts), "invalid_answer"
+    return answer, None
+
+
+def _llm_completion(scan_list_str: str, question: str, grammar: AnswerGrammar, deadline: Deadline):
+    """
+    以串流取得回答，回傳 (回答, finish_reason, timings)。
+    max_tokens 依掃描清單行數決定；LLM_GRAMMAR 開啟時以 GBNF 限制輸出格式，
+    回答一完整（grammar.is_complete）就關閉串流，finish_reason 為 "grammar"。
+    """
+    max_tokens = answer_token_budget(len(grammar.names), LLM_BASE_TOKENS, LLM_TOKENS_PER_LINE)
+    extra_body = {"cache_prompt": LLM_CACHE_PROMPT}
+    if LLM_GRAMMAR:
+        extra_body["grammar"] = grammar.gbnf
+
+    def attempt():
+        started = time.perf_counter()
+        stream = get_llm_client().chat.completions.create(
+            model="ministral_3_3b",
+            messages=build_messages(scan_list_str, question),
+            temperature=0,
+            max_tokens=max_tokens,
+            stream=True,
+            extra_body=extra_body,
+            timeout=deadline.bound(LLM_TIMEOUT_S),
+        )
+        answer, finish_reason, timings = "", None, {}
+        # 關閉串流即中斷連線，llama-server 隨即停止產生並釋放 slot
+        with stream:
+            for chunk in stream:
+                deadline.check()
+                timings = (chunk.model_extra or {}).get("timings") or timings
+                if not chunk.choices:
+                    continue
+                answer += chunk.choices[0].delta.content or ""
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                if finish_reason is None and LLM_GRAMMAR and grammar.is_complete(answer):
+                    finish_reason = "grammar"
+                    break
+        llm_latency.record(time.perf_counter() - started)
+        return answer, finish_reason, timings
+
+    delay = hedge_delay(llm_latency, LLM_HEDGE_QUANTILE)
+    if delay is None:
+        return attempt()
+    return hedged_call(_llm_pool, attempt, delay, can_hedge=lambda: not deadline.done,
+                       retryable=is_llm_backend_error, stats=llm_hedge_stats)
+
+
+def is_llm_backend_error(exc: BaseException) -> bool:
+    import openai
+
+    # APITimeoutError 為 APIConnectionError 的子類別
+    return isinstance(exc, (openai.APIConnectionError, openai.InternalServerError))
+
+
+# ========== Batch Inventory ==========
+
+def _batch_decode(batch: list) -> list:
+    # 記憶體預算不足時在此等待，形成對整條 pipeline 的背壓
+    for item in batch:
+        try:
+            item["image"] = decode_request_image(item.pop("image_base64"))
+        except (ImageTooLarge, MemoryBudgetExceeded) as e:
+            item["error"] = str(e)
+        except Exception:
+            item["error"] = "圖片解碼失敗"
+    return batch
+
+
+def _batch_detect(batch: list) -> list:
+    valid = [item for item in batch if "error" not in item]
+    if valid:
+        for item, boxes in zip(valid, detect_bottle_boxes_batch([item["image"] for item in valid])):
+            item["boxes"] = boxes
+            item["crops"] = crop_views(item["image"], boxes)
+            item["debug_folder"] = (
+                save_detection_debug(item["image"], boxes, item["crops"], tag=f"_img{item['index']:02d}")
+                if DEBUG_SAVE else None
+            )
+    return batch
+
+
+def _batch_embed(batch: list) -> list:
+    """多張圖的 crop 合併成一個 CLIP batch，再展開成逐 crop 的 item 交給 OCR stage"""
+    valid = [item for item in batch if "error" not in item and len(item["boxes"])]
+    embeddings = encode_crops_batch([(item["image"], item["boxes"]) for item in valid]) if valid else []
+    for item, image_embeddings in zip(valid, embeddings):
+        item["embeddings"] = image_embeddings
+    if VERIFY_MODE == "clip_text" and valid:
+        # 整個 batch 的 crop 一次查詢 catalog 並與文字矩陣相乘
+        verified = iter(verify_crops(np.concatenate(embeddings)))
+        for item in valid:
+            item["verified"] = [next(verified) for _ in item["boxes"]]
+
+    outputs = []
+    for item in batch:
+        if "embeddings" not in item:
+            outputs.append({"index": item["index"], "error": item.get("error")})
+            continue
+        for i, (crop, embedding) in enumerate(zip(item["crops"], item["embeddings"])):
+            outputs.append({
+                "index": item["index"],
+                "crop_index": i,
+                "crop": crop,
+                "embedding": embedding,
+                "verified": item["verified"][i] if "verified" in item else None,
+                "debug_folder": item["debug_folder"],
+            })
+    return outputs
+
+
+def build_inventory_pipeline(deadline: Deadline, ocr_priority: str = "batch") -> Pipeline:
+    def match(batch):
+        for item in batch:
+            if "crop" not in item:
+                continue  # 解碼失敗或沒有瓶子的圖片
+            item["name"], _ = match_bottle(item.pop("crop"), item.pop("embedding"), item["debug_folder"],
+                                           item["crop_index"], deadline, item.pop("verified"), ocr_priority)
+        return batch
+
+    return Pipeline([
+        Stage("decode", _batch_decode, workers=BATCH_DECODE_WORKERS),
+        Stage("detect", _batch_detect, batch_size=BATCH_DETECT_SIZE, batch_timeout=BATCH_WAIT_S),
+        Stage("embed", _batch_embed, batch_size=BATCH_EMBED_IMAGES, batch_timeout=BATCH_WAIT_S),
+        # OCR 的實際並發仍受 OCR backend 的 max_concurrency 與排程器限制
+        Stage("match", match, workers=BATCH_MATCH_WORKERS),
+    ], queue_size=max(BATCH_MATCH_WORKERS * 2, 8))
+
+
+@inventory_router.post("/inventory_batch_base64")
+async def inventory_batch_base64(
+    request: BatchInventoryRequest,
+    http_request: Request,
+    x_request_timeout: Optional[float] = Header(None, description="請求處理期限（秒），0 代表不限制"),
+):
+    """一次上傳多張貨架照片：回傳每張圖的統計、整體統計，以及（可選）一次 LLM 總結"""
+    validate_batch_request(request)
+    deadline = Deadline(x_request_timeout if x_request_timeout is not None else BATCH_REQUEST_TIMEOUT_S)
+    return await run_with_deadline(http_request, deadline, run_inventory_batch, request, deadline)
 
-    
-    print(f"⚡ 耗時: {round(time.time() - start_time, 2)}s")
-    print(f"=====回答======")
-    print(f"{response.choices[0].message.content}")
-    print(f"==============")
-    return {"status": 1, "data": response.choices[0].message.content}
 
+def validate_batch_request(request: BatchInventoryRequest):
+    if not request.images_base64:
+        raise HTTPException(status_code=400, detail="images_base64 不可為空")
+    if len(request.images_base64) > BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=413, detail=f"一次最多 {BATCH_MAX_IMAGES} 張圖片")
 
 
-def glm_ocr_ollama(base64_image):
-    response = ollama.chat(
-        model="glm-ocr:q8_0",
-        messages=[
-            {
-                "role": "user",
-                "content": "Text Recognition:",
-                "images": [base64_image],
-            }
-        ],
-    )
+def run_inventory_batch(request: BatchInventoryRequest, deadline: Deadline = None, ocr_priority: str = "batch"):
+    """/inventory_batch_base64 的同步主流程"""
+    deadline = deadline or Deadline()
+    start_time = time.time()
+    with tracer.start_as_current_span("inventory_batch") as span:
+        span.set_attribute("batch.images", len(request.images_base64))
+        pipeline = build_inventory_pipeline(deadline, ocr_priority)
+        outputs = pipeline.run(
+            ({"index": i, "image_base64": b64} for i, b64 in enumerate(request.images_base64)),
+            deadline,
+        )
+
+        per_image = {i: {"index": i, "counts": Counter()} for i in range(len(request.images_base64))}
+        for output in outputs:
+            entry = per_image[output["index"]]
+            if output.get("error"):
+                entry["error"] = output["error"]
+            elif "name" in output:
+                entry["counts"][output["name"]] += 1
+        aggregate = sum((entry["counts"] for entry in per_image.values()), Counter())
+        images = []
+        for entry in per_image.values():
+            if "error" in entry:
+                images.append({"index": entry["index"], "error": entry["error"]})
+            else:
+                counts = dict(entry["counts"])
+                images.append({"index": entry["index"], "counts": counts, "bottles": sum(counts.values())})
+        span.set_attribute("bottles.count", sum(aggregate.values()))
+        span.set_attribute("batch.failed_images", sum("error" in image for image in images))
+        # 批次內各圖沒有個別耗時，以平均分攤
+        per_image_s = (time.time() - start_time) / len(images)
+        for image in images:
+            if "counts" in image:
+                record_scan(request.store_id, image["counts"], per_image_s, "batch")
+
+        summary = None
+        if request.summarize:
+            summary = ask_llm(dict(aggregate), request.question, deadline) if aggregate else "貨架上看起來沒有瓶子。"
+
+    print(f"⚡ 批次 {len(images)} 張耗時: {round(time.time() - start_time, 2)}s")
+    return {
+        "status": 1,
+        "data": summary,
+        "counts": dict(aggregate),
+        "images": images,
+        "stages": pipeline.stats,
+    }
 
-    return response["message"]["content"]
 
+# ========== Scan History ==========
+
+def start_scan_history():
+    global scan_history
+    if not HISTORY_ENABLED:
+        return
+    from utils.scan_history import ScanHistory
+
+    scan_history = ScanHistory(HISTORY_DIR, flush_rows=HISTORY_FLUSH_ROWS, flush_interval_s=HISTORY_FLUSH_INTERVAL_S,
+                               compact_files=HISTORY_COMPACT_FILES)
+    scan_history.start()
+    print(f"🗂️ 掃描歷史寫入 {HISTORY_DIR}/")
 
-@app.post("/glm_ocr_inference_base64")
-async def glm_ocr_inference_base64(request: Base64ImageRequest):
-    output = ""
 
+def record_scan(store_id: Optional[str], counts: dict, elapsed_s: float, source: str):
+    """記錄一次掃描；寫入失敗不影響盤點結果"""
+    if scan_history is None:
+        return
     try:
-        output = glm_ocr_ollama(request.image_base64)
+        unresolved = counts.get(UNRESOLVED_LABEL, 0)
+        scan_history.record(
+            store_id or DEFAULT_STORE_ID,
+            {name: n for name, n in counts.items() if name != UNRESOLVED_LABEL},
+            latency_ms=round(elapsed_s * 1000, 1),
+            source=source,
+            unknown=counts.get("未知商品", 0),
+            unresolved=unresolved,
+        )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        print(f"[History] 記錄失敗: {e}")
+
+
+def _history_query(method: str, **kwargs):
+    if scan_history is None:
+        raise HTTPException(status_code=503, detail="掃描歷史未啟用（HISTORY_ENABLED=0）")
+    try:
+        return {"rows": getattr(scan_history, method)(**kwargs)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@inventory_router.get("/history/counts", summary="[History] 依期間 / 店 / SKU 統計數量")
+async def history_counts(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    store: Optional[List[str]] = Query(None),
+    sku: Optional[List[str]] = Query(None),
+    group_by: str = Query("store,sku", description="以逗號分隔：store, sku"),
+    interval: Optional[str] = Query(None, description="時間粒度：1h, 1d, 1w, 1mo"),
+):
+    return await run_in_threadpool(
+        _history_query, "query_counts", start=start, end=end,
+        stores=store, skus=sku, group_by=tuple(k for k in group_by.split(",") if k), interval=interval,
+    )
+
+
+@inventory_router.get("/history/scans", summary="[History] 掃描次數、未知率與耗時")
+async def history_scans(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    store: Optional[List[str]] = Query(None),
+    group_by: str = Query("store", description="以逗號分隔：store, source"),
+    interval: Optional[str] = Query(None, description="時間粒度：1h, 1d, 1w, 1mo"),
+):
+    return await run_in_threadpool(
+        _history_query, "query_scans", start=start, end=end,
+        stores=store, group_by=tuple(k for k in group_by.split(",") if k), interval=interval,
+    )
+
+
+# ========== Profiling ==========
+
+def get_profile_store() -> ProfileStore:
+    global profile_store
+    if profile_store is None:
+        profile_store = ProfileStore(PROFILE_DIR, max_profiles=PROFILE_MAX_FILES)
+    return profile_store
+
+
+def check_profile_token(token: Optional[str]):
+    if not PROFILE_TOKEN:
+        raise HTTPException(status_code=404, detail="profiling 未開放（未設定 PROFILE_TOKEN）")
+    if not hmac.compare_digest((token or "").encode(), PROFILE_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="X-Profile-Token 不正確")
+
+
+def request_profile_modes(x_profile: Optional[str], x_profile_token: Optional[str]) -> tuple:
+    """
+    設定 PROFILE_TOKEN 且帶 X-Profile header 時依 header（需通過 token 檢查），否則依 PROFILE_SAMPLE_RATE 隨機取樣；
+    未設定 PROFILE_TOKEN 時 X-Profile 一律忽略
+    """
+    if x_profile is not None and PROFILE_TOKEN:
+        check_profile_token(x_profile_token)
+        return parse_profile_modes(x_profile)
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return PROFILE_SAMPLE_MODES
+    return ()
+
+
+def reserve_profile_id(x_request_id: Optional[str], explicit: bool) -> str:
+    """
+    X-Request-Id 合法且未被使用時作為 profile id，否則自動產生。
+    X-Profile 明確要求 profiling 而 id 已被使用時回 409，不覆寫既有的 profile（隨機取樣則改用新 id）
+    """
+    store = get_profile_store()
+    if valid_profile_id(x_request_id):
+        if store.reserve(x_request_id):
+            return x_request_id
+        if explicit:
+            raise HTTPException(status_code=409, detail=f"profile id 已被使用: {x_request_id}")
+    while True:
+        profile_id = uuid.uuid4().hex
+        if store.reserve(profile_id):
+            return profile_id
+
+
+@inventory_router.get("/profiles", summary="[Profile] 列出已保存的 profiling 結果")
+async def list_profiles(x_profile_token: Optional[str] = Header(None)):
+    check_profile_token(x_profile_token)
+    return {"profiles": await run_in_threadpool(get_profile_store().list)}
+
+
+@inventory_router.get("/profiles/{profile_id}", summary="[Profile] 下載 profiling 結果（json 摘要或 folded stacks）")
+async def download_profile(
+    profile_id: str,
+    format: str = Query("json", pattern="^(json|folded)$", description="folded 可直接給 flamegraph.pl / speedscope"),
+    x_profile_token: Optional[str] = Header(None),
+):
+    check_profile_token(x_profile_token)
+    path = get_profile_store().path(profile_id, format)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"找不到 profile: {profile_id}")
+    media_type = "application/json" if format == "json" else "text/plain; charset=utf-8"
+    return FileResponse(path, media_type=media_type, filename=f"{profile_id}.{format}")
+
+
+# ========== Async Jobs ==========
+
+def _run_job(name: str, func, request):
+    """在 job worker thread 執行（各自為新的 trace），回傳 (結果, 各 stage 的次數與總耗時)"""
+    with tracer.start_as_current_span(f"job.{name}") as span:
+        with record_stage_timings(span) as timings:
+            result = func(request, Deadline(JOB_TIMEOUT_S))
+        return result, dict(timings)
+
+
+# 背景 job 的 OCR 以最低優先等級排程，不影響線上請求
+JOB_HANDLERS = {
+    "inventory": lambda payload: _run_job("inventory", partial(run_inventory, ocr_priority="job"),
+                                          Base64ImageRequest(**payload)),
+    "inventory_batch": lambda payload: _run_job("inventory_batch", partial(run_inventory_batch, ocr_priority="job"),
+                                                BatchInventoryRequest(**payload)),
+}
+
+
+def start_job_workers():
+    global job_store, job_pool
+    job_store = JobStore(JOB_DB_PATH)
+    job_pool = JobWorkerPool(job_store, JOB_HANDLERS, workers=JOB_WORKERS, ttl_s=JOB_TTL_S,
+                             max_attempts=JOB_MAX_ATTEMPTS)
+    job_pool.start()
+    print(f"📋 Job worker 已啟動（{JOB_WORKERS} 個），佇列狀態: {job_store.counts()}")
+
+
+def submit_job(kind: str, request: BaseModel):
+    job_id = job_store.submit(kind, request.model_dump())
+    job_pool.notify()
+    return JSONResponse(status_code=202, content={"job_id": job_id, "status": "queued"})
+
+
+@inventory_router.post("/jobs/inventory", status_code=202, summary="[Job] 非同步提交 /inventory_base64")
+async def submit_inventory_job(request: Base64ImageRequest):
+    return await run_in_threadpool(submit_job, "inventory", request)
+
+
+@inventory_router.post("/jobs/inventory_batch", status_code=202, summary="[Job] 非同步提交 /inventory_batch_base64")
+async def submit_inventory_batch_job(request: BatchInventoryRequest):
+    validate_batch_request(request)
+    return await run_in_threadpool(submit_job, "inventory_batch", request)
+
+
+@inventory_router.get("/jobs/{job_id}", summary="[Job] 查詢 job 狀態與結果")
+async def get_job(job_id: str):
+    job = await run_in_threadpool(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job 不存在或已過期")
+    job.pop("payload", None)
+    job.pop("lease_until", None)
+    return job
+
+
+def _recognize_date_text(request: Base64ImageRequest, deadline: Deadline) -> str:
+    with tracer.start_as_current_span("glm_ocr_inference_base64") as span:
+        try:
+            with tracer.start_as_current_span("ocr"):
+                return ocr_backend.recognize(request.image_base64, deadline, "date")
+        except (DeadlineExceeded, RequestCancelled):
+            raise
+        except CircuitOpenError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except Exception as e:
+            span.record_exception(e)
+            deadline.check()
+            raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/glm_ocr_inference_base64")
+async def glm_ocr_inference_base64(
+    request: Base64ImageRequest,
+    http_request: Request,
+    x_request_timeout: Optional[float] = Header(None, description="請求處理期限（秒），0 代表不限制"),
+):
+    deadline = request_deadline(x_request_timeout)
+    output = await run_with_deadline(http_request, deadline, _recognize_date_text, request, deadline)
 
     print("OCR Result:", output)
 
@@ -475,6 +1659,29 @@ async def glm_ocr_inference_base64(request: Base64ImageRequest):
         return JSONResponse(content=result)
 
 
+@app.get("/ocr/scheduler", summary="[OCR] 排程器狀態與各優先等級的排隊等待時間")
+async def ocr_scheduler_stats():
+    return {**ocr_backend.describe(), "scheduler": ocr_backend.scheduler.stats()}
+
+
+@app.get("/backends", summary="[Health] OCR / LLM backend 的斷路器與 hedged request 狀態")
+async def backend_health():
+    ocr = ocr_backend.describe()
+    return {
+        "ocr": {key: ocr[key] for key in ("backend", "timeout", "hedge_quantile", "hedge", "breaker")},
+        "llm": {
+            "timeout": LLM_TIMEOUT_S,
+            "hedge_quantile": LLM_HEDGE_QUANTILE,
+            "hedge": llm_hedge_stats.describe(),
+            "breaker": llm_breaker.describe(),
+        },
+    }
+
+
+if INVENTORY_ENABLED:
+    app.include_router(inventory_router)
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,78 @@
+"""
+服務層測試共用的 fixture：以替身取代模型與 backend，直接執行 service 的盤點流程。
+
+- YOLO：每張圖固定偵測出左右兩半各一個瓶子
+- CLIP：第 i 個 crop 的向量等於 CATALOG 第 i 筆商品的向量（記憶體中的 ChromaDB）
+- OCR / LLM：benchmarks/stubs.py 的 StubOCRBackend / StubLLMClient
+"""
+
+import base64
+import os
+import sys
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("TRACE_EXPORTER", "none")
+os.environ.setdefault("DEBUG_SAVE", "0")
+os.environ.setdefault("LLAMA_SERVER_AUTOSTART", "0")
+
+import cv2
+import numpy as np
+import pytest
+
+CATALOG = [("茶裏王白毫烏龍", "茶裏王", "白毫烏龍"), ("光泉鮮乳", "光泉", "鮮乳")]
+DIM = 16
+
+
+def catalog_vector(index: int) -> np.ndarray:
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[index] = 1.0
+    return vector
+
+
+def shelf_image_base64(seed: int = 0) -> str:
+    image = np.random.default_rng(seed).integers(0, 255, size=(64, 96, 3), dtype=np.uint8)
+    ok, encoded = cv2.imencode(".png", image)
+    assert ok
+    return base64.b64encode(encoded.tobytes()).decode()
+
+
+@pytest.fixture
+def inventory_service(monkeypatch):
+    import chromadb
+
+    import service
+    from benchmarks.stubs import StubLLMClient, StubOCRBackend
+    from utils.resilience import CircuitBreaker, HedgeStats, LatencyTracker
+    from utils.result_cache import ResultCache
+
+    collection = chromadb.EphemeralClient().create_collection(
+        name=f"test_{uuid.uuid4().hex[:8]}", metadata={"hnsw:space": "cosine"})
+    collection.add(
+        ids=[item_id for item_id, _, _ in CATALOG],
+        embeddings=[catalog_vector(i).tolist() for i in range(len(CATALOG))],
+        metadatas=[{"brand": brand, "flavor": flavor, "color": ""} for _, brand, flavor in CATALOG],
+    )
+
+    def detect(images):
+        return [np.array([[0, 0, image.shape[1] // 2, image.shape[0], 0.9],
+                          [image.shape[1] // 2, 0, image.shape[1], image.shape[0], 0.9]], dtype=np.float32)
+                for image in images]
+
+    def embed(pairs):
+        return [np.stack([catalog_vector(i % len(CATALOG)) for i in range(len(boxes))]) for _, boxes in pairs]
+
+    monkeypatch.setattr(service, "collection", collection)
+    monkeypatch.setattr(service, "detect_bottle_boxes_batch", detect)
+    monkeypatch.setattr(service, "encode_crops_batch", embed)
+    monkeypatch.setattr(service, "ocr_backend",
+                        StubOCRBackend(latency_ms=0, texts=[item_id for item_id, _, _ in CATALOG]))
+    monkeypatch.setattr(service, "client", StubLLMClient(latency_ms=0))
+    monkeypatch.setattr(service, "llm_breaker", CircuitBreaker("llm", 3, 30))
+    monkeypatch.setattr(service, "llm_latency", LatencyTracker())
+    monkeypatch.setattr(service, "llm_hedge_stats", HedgeStats())
+    monkeypatch.setattr(service, "result_cache", ResultCache(16, 60))
+    monkeypatch.setattr(service, "catalog_version", 0)
+    monkeypatch.setattr(service, "_fuzzy_index", None)
+    return service
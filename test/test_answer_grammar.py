@@ -0,0 +1,76 @@
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fastapi.testclient import TestClient
+
+from benchmarks.stub_server import StubConfig, create_app
+from utils.answer_grammar import NOT_FOUND, SUMMARY_HEADER, AnswerGrammar, answer_token_budget
+
+
+class TestAnswerGrammar:
+    """盤點回答格式限制測試"""
+
+    names = ["茶裏王", "茶裏王白毫烏龍", "光泉鮮乳"]
+
+    def test_complete_answers(self):
+        grammar = AnswerGrammar(self.names)
+        assert grammar.is_complete("茶裏王白毫烏龍 有 12 瓶")
+        assert grammar.is_complete(NOT_FOUND)
+        summary = SUMMARY_HEADER + "\n茶裏王 有 1 瓶\n茶裏王白毫烏龍 有 2 瓶\n光泉鮮乳 有 3 瓶"
+        assert grammar.is_complete(summary)
+        # 串流中途：統計未列滿、數量後尚未出現「瓶」
+        assert not grammar.is_complete(SUMMARY_HEADER + "\n茶裏王 有 1 瓶")
+        assert not grammar.is_complete("茶裏王白毫烏龍 有 1")
+        assert not grammar.is_complete("沒有找到")
+
+    def test_valid_answers(self):
+        grammar = AnswerGrammar(self.names)
+        assert grammar.is_valid(SUMMARY_HEADER + "\n光泉鮮乳 有 3 瓶\n")
+        assert grammar.is_valid("光泉鮮乳 有 3 瓶")
+        assert not grammar.is_valid("光泉鮮乳 有 3 瓶\n以上是本次掃描的統計結果。")
+        assert not grammar.is_valid("麥香奶茶 有 3 瓶")  # 不在清單中
+        assert not grammar.is_valid("光泉鮮乳 有 0 瓶")
+        assert not grammar.is_valid(SUMMARY_HEADER)
+
+    def test_gbnf_lists_scan_names(self):
+        gbnf = AnswerGrammar(["茶裏王", 'A"B\\C']).gbnf
+        assert gbnf.startswith("root ::= summary | line | notfound\n")
+        assert 'name ::= "茶裏王" | "A\\"B\\\\C"' in gbnf
+        assert "{1,2}" in gbnf
+        assert f'"{NOT_FOUND}"' in gbnf
+
+    def test_empty_scan_list(self):
+        grammar = AnswerGrammar([])
+        assert grammar.gbnf.startswith("root ::= ")
+        assert grammar.is_complete(SUMMARY_HEADER) and grammar.is_valid(NOT_FOUND)
+
+    def test_token_budget_grows_with_lines(self):
+        assert answer_token_budget(0) == answer_token_budget(1) == 56
+        assert answer_token_budget(10, base_tokens=20, tokens_per_line=10) == 120
+
+
+class TestStubRambling:
+    """替身模擬停不下來的模型：串流到回答完整即可停止，max_tokens 截斷回答"""
+
+    def test_stream_completes_before_ramble(self):
+        client = TestClient(create_app(StubConfig(llm_latency_ms=0, llm_ramble_tokens=200)))
+        grammar = AnswerGrammar(["光泉鮮乳"])
+        body = {"messages": [{"role": "user", "content": "- 光泉鮮乳: 2 瓶"}], "stream": True}
+        answer = ""
+        with client.stream("POST", "/v1/chat/completions", json=body) as response:
+            for line in response.iter_lines():
+                if line.startswith("data: {"):
+                    answer += json.loads(line[6:])["choices"][0]["delta"].get("content", "")
+                    if grammar.is_complete(answer):
+                        break
+        assert answer == SUMMARY_HEADER + "\n光泉鮮乳 有 2 瓶"
+
+    def test_max_tokens_truncates(self):
+        client = TestClient(create_app(StubConfig(llm_latency_ms=0, llm_ramble_tokens=200)))
+        response = client.post("/v1/chat/completions", json={
+            "messages": [{"role": "user", "content": "- 光泉鮮乳: 2 瓶"}], "max_tokens": 56}).json()
+        assert response["choices"][0]["finish_reason"] == "length"
+        assert len(response["choices"][0]["message"]["content"]) == 56
@@ -0,0 +1,48 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fastapi.testclient import TestClient
+
+from benchmarks.stub_server import StubConfig, create_app
+from benchmarks.stubs import StubLLMClient
+from utils.answer_prompt import SYSTEM_PROMPT, build_messages, format_scan_list
+
+
+class TestAnswerPrompt:
+    """盤點回答 prompt 排列測試：固定前綴在前，掃描清單與問題在後"""
+
+    def test_system_prompt_is_static(self):
+        first = build_messages(format_scan_list({"茶裏王白毫烏龍": 1}), "統計商品")
+        second = build_messages(format_scan_list({"原萃台灣青茶": 3, "光泉鮮乳": 2}), "有幾瓶原萃？")
+        assert first[0] == second[0] == {"role": "system", "content": SYSTEM_PROMPT}
+        assert "{" not in SYSTEM_PROMPT
+
+    def test_scan_list_and_question_come_last(self):
+        messages = build_messages(format_scan_list({"原萃台灣青茶": 3, "光泉鮮乳": 2}), "有幾瓶原萃？")
+        text = messages[-1]["content"][0]["text"]
+        assert messages[-1]["role"] == "user"
+        assert "- 原萃台灣青茶: 3 瓶\n- 光泉鮮乳: 2 瓶" in text
+        assert text.endswith("有幾瓶原萃？")
+
+    def test_stub_client_reads_scan_list_from_user_parts(self):
+        client = StubLLMClient(latency_ms=0)
+        messages = build_messages(format_scan_list({"茶裏王白毫烏龍": 2, "光泉鮮乳": 1}), "統計商品")
+        content = client.chat.completions.create(model="stub", messages=messages).choices[0].message.content
+        assert content.endswith("茶裏王白毫烏龍 有 2 瓶\n光泉鮮乳 有 1 瓶")
+
+    def test_stub_reuses_cached_prefix(self):
+        client = TestClient(create_app(StubConfig(llm_prefill_ms_per_token=0.001, llm_decode_ms_per_token=0)))
+        timings = []
+        for counts, cache_prompt in (({"茶裏王白毫烏龍": 1}, True), ({"光泉鮮乳": 2}, True),
+                                     ({"麥香奶茶": 4}, False)):
+            response = client.post("/v1/chat/completions", json={
+                "messages": build_messages(format_scan_list(counts), "統計商品"), "cache_prompt": cache_prompt})
+            assert response.status_code == 200
+            timings.append(response.json()["timings"])
+        assert timings[0]["cache_n"] == 0
+        assert timings[1]["cache_n"] > len(SYSTEM_PROMPT)
+        assert timings[1]["prompt_n"] < 50
+        assert timings[2]["cache_n"] == 0
+        assert response.json()["choices"][0]["message"]["content"].endswith("麥香奶茶 有 4 瓶")
@@ -0,0 +1,132 @@
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+import pytest
+
+from utils.catalog_search import CatalogSearchIndex, QueryEmbeddingCache
+
+DIM = 32
+CATALOG = [
+    ("茶裏王日式無糖綠茶", {"brand": "茶裏王", "flavor": "日式無糖綠茶", "color": "綠色"}),
+    ("茶裏王白毫烏龍", {"brand": "茶裏王", "flavor": "白毫烏龍", "color": "褐色"}),
+    ("波蜜果菜汁", {"brand": "波蜜", "flavor": "果菜汁", "color": "橘色"}),
+    ("原萃紅茶", {"brand": "原萃", "flavor": "紅茶", "color": "紅色"}),
+]
+
+
+def _vectors(n, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32)
+
+
+@pytest.fixture
+def index():
+    return CatalogSearchIndex([i for i, _ in CATALOG], [m for _, m in CATALOG], _vectors(len(CATALOG)), version=1)
+
+
+class FakeEncoder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.stack([_vectors(1, seed=sum(map(ord, t)))[0] for t in texts])
+
+
+class TestQueryEmbeddingCache:
+    """查詢句向量 LRU 快取測試"""
+
+    def test_batch_encodes_only_misses_once(self):
+        encoder = FakeEncoder()
+        cache = QueryEmbeddingCache(encoder, max_size=10)
+        first = cache.get(["綠茶", "紅茶", "綠茶"])
+        assert encoder.calls == [["綠茶", "紅茶"]]
+        np.testing.assert_array_equal(first[0], first[2])
+        np.testing.assert_allclose(np.linalg.norm(first, axis=1), 1.0, rtol=1e-5)
+
+        second = cache.get(["紅茶", "奶茶"])
+        assert encoder.calls[-1] == ["奶茶"]
+        np.testing.assert_array_equal(second[0], first[1])
+        assert (cache.hits, cache.misses) == (1, 3)
+
+    def test_evicts_least_recently_used(self):
+        encoder = FakeEncoder()
+        cache = QueryEmbeddingCache(encoder, max_size=2)
+        cache.get(["a"])
+        cache.get(["b"])
+        cache.get(["a"])  # a 變成最近使用
+        cache.get(["c"])  # 淘汰 b
+        assert len(cache) == 2
+        cache.get(["a", "b"])
+        assert encoder.calls[-1] == ["b"]
+
+    def test_cached_vectors_are_read_only(self):
+        cache = QueryEmbeddingCache(FakeEncoder())
+        cache.get(["綠茶"])
+        with pytest.raises(ValueError):
+            cache._entries["綠茶"][0] = 0
+
+    def test_concurrent_gets(self):
+        cache = QueryEmbeddingCache(FakeEncoder(), max_size=8)
+        errors = []
+
+        def worker(seed):
+            try:
+                for i in range(200):
+                    texts = [f"q{(seed + i) % 12}", f"q{i % 5}"]
+                    assert cache.get(texts).shape == (2, DIM)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(s,)) for s in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors and len(cache) <= 8
+
+
+class TestCatalogSearchIndex:
+    """語意 + 模糊比對搜尋測試"""
+
+    def test_fuzzy_match_on_metadata(self, index):
+        # 語意分數對所有商品相同時，完全依文字分數排序；形近字「線」也能對上「綠」
+        query = np.zeros((1, DIM), dtype=np.float32)
+        results = index.search(["無糖線茶"], query, k=2)[0]
+        assert results[0]["id"] == "茶裏王日式無糖綠茶"
+        assert results[0]["fuzzy"] == 1.0
+        assert results[0]["semantic"] == pytest.approx(0.25)
+
+    def test_semantic_match_on_image_embeddings(self, index):
+        # 「橘色飲料」與各商品名稱都不像，由 CLIP 向量決定
+        query = index.matrix[2:3] * 3
+        results = index.search(["橘色飲料"], query, k=3)[0]
+        assert results[0]["id"] == "波蜜果菜汁"
+        assert results[0]["semantic"] > 0.99
+        assert [r["score"] for r in results] == sorted((r["score"] for r in results), reverse=True)
+
+    def test_weights_and_batch(self, index):
+        queries = ["紅茶", "烏龍"]
+        embeddings = np.stack([index.matrix[1], index.matrix[0]])
+        semantic_only = index.search(queries, embeddings, k=1, semantic_weight=1.0)
+        fuzzy_only = index.search(queries, embeddings, k=1, semantic_weight=0.0)
+        assert [r[0]["id"] for r in semantic_only] == ["茶裏王白毫烏龍", "茶裏王日式無糖綠茶"]
+        assert [r[0]["id"] for r in fuzzy_only] == ["原萃紅茶", "茶裏王白毫烏龍"]
+
+    def test_large_catalog_uses_ngram_shortlist(self):
+        # 超過 FuzzyIndex.full_scan_below 時只對有共同 bigram 的商品計算文字分數
+        ids = [f"品牌{i}口味{i}" for i in range(400)] + ["茶裏王日式無糖綠茶"]
+        metadatas = [{"brand": f"品牌{i}", "flavor": f"口味{i}"} for i in range(400)] + [CATALOG[0][1]]
+        index = CatalogSearchIndex(ids, metadatas, _vectors(len(ids)))
+        query = np.zeros((2, DIM), dtype=np.float32)
+        results = index.search(["無糖綠茶", "綠"], query, k=1)
+        assert [r[0]["id"] for r in results] == ["茶裏王日式無糖綠茶"] * 2
+        assert results[0][0]["fuzzy"] == 1.0
+
+    def test_k_and_empty_catalog(self, index):
+        assert len(index.search(["茶"], _vectors(1), k=10)[0]) == len(CATALOG)
+        empty = CatalogSearchIndex([], [], np.empty((0, DIM)))
+        assert empty.search(["茶", "水"], _vectors(2)) == [[], []]
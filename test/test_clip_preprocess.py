@@ -0,0 +1,194 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+import pytest
+
+from utils.clip_preprocess import (CLIP_MEAN, CLIP_STD, build_clip_batch, clip_image_embeddings, crop_views,
+                                   encode_pil_crops, select_class_boxes)
+
+
+class TestSelectClassBoxes:
+    """YOLO box 類別篩選測試"""
+
+    def test_filters_by_class(self):
+        data = np.array([
+            [10, 20, 50, 80, 0.9, 39],
+            [0, 0, 30, 30, 0.95, 0],
+            [60.7, 5.2, 90.9, 70.1, 0.85, 39],
+        ], dtype=np.float32)
+        boxes = select_class_boxes(data, 39)
+        assert boxes.shape == (2, 5)
+        np.testing.assert_allclose(boxes[:, 4], [0.9, 0.85])
+
+    def test_drops_degenerate_boxes(self):
+        data = np.array([[10.2, 20, 10.9, 80, 0.9, 39]], dtype=np.float32)
+        assert select_class_boxes(data, 39).shape == (0, 5)
+
+    def test_torch_input(self):
+        torch = pytest.importorskip("torch")
+        data = torch.tensor([[10, 20, 50, 80, 0.9, 39], [0, 0, 30, 30, 0.95, 0]])
+        boxes = select_class_boxes(data, 39)
+        assert isinstance(boxes, np.ndarray)
+        assert boxes.shape == (1, 5)
+
+
+class TestCropViews:
+    """crop 切片測試"""
+
+    def test_views_share_memory(self):
+        image = np.zeros((100, 80, 3), dtype=np.uint8)
+        crops = crop_views(image, np.array([[10.6, 20.2, 30.9, 60.0, 0.9]]))
+        assert crops[0].shape == (40, 20, 3)
+        assert np.shares_memory(crops[0], image)
+
+    def test_clips_to_image(self):
+        image = np.zeros((50, 40, 3), dtype=np.uint8)
+        crops = crop_views(image, np.array([[-5, -3, 45, 60, 0.9]]))
+        assert crops[0].shape == (50, 40, 3)
+
+
+class TestEncodePilCrops:
+    """PIL + SentenceTransformer.encode 路徑測試（與 catalog 建立方式相同）"""
+
+    def test_single_encode_call_with_rgb_images(self):
+        calls = []
+
+        class FakeModel:
+            def encode(self, images, batch_size):
+                calls.append((images, batch_size))
+                return [np.asarray(image, dtype=np.float32)[0, 0] for image in images]
+
+        image = np.zeros((60, 40, 3), dtype=np.uint8)
+        image[:, :, 2] = 255  # BGR 的紅色
+        crops = crop_views(image, np.array([[0, 0, 40, 60, 1.0], [5, 5, 20, 30, 1.0]]))
+        embeddings = encode_pil_crops(FakeModel(), crops)
+        assert len(calls) == 1 and calls[0][1] == 2
+        assert [im.size for im in calls[0][0]] == [(40, 60), (15, 25)]
+        assert embeddings.dtype == np.float32
+        np.testing.assert_array_equal(embeddings, [[255, 0, 0], [255, 0, 0]])
+
+
+class TestBuildClipBatch:
+    """CLIP batch tensor 測試"""
+
+    def test_shape_and_normalization(self):
+        pytest.importorskip("torch")
+        image = np.zeros((300, 200, 3), dtype=np.uint8)
+        image[:, :, 2] = 255  # BGR 的紅色
+        crops = crop_views(image, np.array([[0, 0, 200, 300, 1.0], [50, 50, 150, 100, 1.0]]))
+        batch = build_clip_batch(crops)
+        assert tuple(batch.shape) == (2, 3, 224, 224)
+        # 轉成 RGB 後紅色在第 0 個 channel
+        red = (1.0 - CLIP_MEAN[0]) / CLIP_STD[0]
+        blue = (0.0 - CLIP_MEAN[2]) / CLIP_STD[2]
+        assert batch[:, 0].mean().item() == pytest.approx(red, abs=1e-3)
+        assert batch[:, 2].mean().item() == pytest.approx(blue, abs=1e-3)
+
+    def test_matches_pil_center_crop(self):
+        pytest.importorskip("torch")
+        from PIL import Image
+
+        rng = np.random.default_rng(0)
+        image = rng.integers(0, 256, size=(320, 240, 3), dtype=np.uint8)
+        batch = build_clip_batch([image], bgr=False)
+
+        # PIL 參考實作：短邊縮放 + 中心裁切
+        pil = Image.fromarray(image).resize((224, 298), Image.BICUBIC)
+        top = (298 - 224) // 2
+        expected = np.asarray(pil, dtype=np.float32)[top:top + 224] / 255.0
+        expected = (expected - np.array(CLIP_MEAN)) / np.array(CLIP_STD)
+        actual = batch[0].permute(1, 2, 0).numpy()
+        assert np.abs(actual - expected).mean() < 0.05
+
+
+@pytest.fixture(scope="module")
+def clip_model():
+    sentence_transformers = pytest.importorskip("sentence_transformers")
+    try:
+        return sentence_transformers.SentenceTransformer("clip-ViT-B-32")
+    except Exception as e:  # 沒有快取且無法下載
+        pytest.skip(f"無法載入 clip-ViT-B-32: {e}")
+
+
+def _sample_crops(limit: int = 12, per_folder: int = 1) -> list:
+    """my_crops/ 下每個商品取 per_folder 張實際的瓶子 crop；limit=None 代表不限"""
+    import cv2
+
+    crops = []
+    for folder in sorted((Path(__file__).parent.parent / "my_crops").iterdir()):
+        paths = sorted(p for p in folder.glob("*") if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+        for path in paths[:per_folder]:
+            image = cv2.imread(str(path))
+            if image is not None:
+                crops.append(image)
+        if limit is not None and len(crops) >= limit:
+            return crops[:limit]
+    return crops
+
+
+def _catalog_embeddings(tmp_path) -> np.ndarray:
+    """drink_vector_db 的 catalog 向量；複製到 tmp_path 後才開啟，不改動 repo 內的 DB"""
+    import shutil
+
+    chromadb = pytest.importorskip("chromadb")
+    source = Path(__file__).parent.parent / "drink_vector_db"
+    if not source.exists():
+        pytest.skip("沒有 drink_vector_db")
+    shutil.copytree(source, tmp_path / "db")
+    collection = chromadb.PersistentClient(path=str(tmp_path / "db")).get_collection("drink_catalog")
+    embeddings = np.asarray(collection.get(include=["embeddings"])["embeddings"], dtype=np.float32)
+    if not len(embeddings):
+        pytest.skip("catalog 是空的")
+    return embeddings
+
+
+def _cosine_distance(queries: np.ndarray, catalog: np.ndarray) -> np.ndarray:
+    q = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    c = catalog / np.linalg.norm(catalog, axis=1, keepdims=True)
+    return 1.0 - q @ c.T
+
+
+class TestClipEmbeddingParity:
+    """batch 前處理的 embedding 與 SentenceTransformer.encode(PIL crop) 一致（catalog 以後者建立）"""
+
+    def test_cosine_agreement(self, clip_model):
+        from PIL import Image
+
+        crops = _sample_crops()
+        if not crops:
+            pytest.skip("my_crops/ 沒有可用的 crop")
+        actual = clip_image_embeddings(clip_model, build_clip_batch(crops))
+        expected = encode_pil_crops(clip_model, crops)
+        # 與逐張 encode(PIL)（catalog 的建立方式）相同
+        np.testing.assert_allclose(
+            expected[0], clip_model.encode(Image.fromarray(np.ascontiguousarray(crops[0][:, :, ::-1]))),
+            rtol=1e-4, atol=1e-4)
+        cosine = (actual * expected).sum(axis=1) / (np.linalg.norm(actual, axis=1) * np.linalg.norm(expected, axis=1))
+        print(f"\n[CLIP] {len(crops)} 個 crop 的 cosine：min={cosine.min():.5f} mean={cosine.mean():.5f}")
+        assert cosine.min() > 0.99
+
+    def test_threshold_flips_on_catalog(self, clip_model, tmp_path):
+        """
+        my_crops/ 全部 crop 對 catalog 的最近鄰與 COSINE_THRESHOLD / FUZZY_CLIP_THRESHOLD 判定，
+        torch 路徑與 PIL 路徑不可有任何不同（CLIP_PREPROCESS=torch 的前提）
+        """
+        crops = _sample_crops(limit=None, per_folder=1000)
+        if not crops:
+            pytest.skip("my_crops/ 沒有可用的 crop")
+        catalog = _catalog_embeddings(tmp_path)
+        actual = _cosine_distance(clip_image_embeddings(clip_model, build_clip_batch(crops)), catalog)
+        expected = _cosine_distance(encode_pil_crops(clip_model, crops), catalog)
+
+        # service.py 的門檻（不匯入 service，避免載入模型與 DB）
+        cosine_threshold, fuzzy_clip_threshold = 0.35, 0.15
+        nn_changed = int((actual.argmin(axis=1) != expected.argmin(axis=1)).sum())
+        flips = {name: int(((actual < thr) != (expected < thr)).sum())
+                 for name, thr in (("cosine", cosine_threshold), ("fuzzy_clip", fuzzy_clip_threshold))}
+        drift = np.abs(actual - expected).max()
+        print(f"\n[CLIP] {len(crops)} 個 crop x {catalog.shape[0]} 筆 catalog：最大距離差 {drift:.5f}，"
+              f"最近鄰改變 {nn_changed}，門檻翻轉 {flips}")
+        assert nn_changed == 0
+        assert flips == {"cosine": 0, "fuzzy_clip": 0}
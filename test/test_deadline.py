@@ -0,0 +1,52 @@
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+
+from utils.deadline import Deadline, DeadlineExceeded, RequestCancelled
+
+
+class TestDeadline:
+    """請求期限與取消測試"""
+
+    def test_no_deadline(self):
+        deadline = Deadline()
+        assert deadline.remaining() is None
+        assert deadline.bound(5.0) == 5.0
+        deadline.check()
+
+    def test_bound_uses_remaining(self):
+        deadline = Deadline(0.5)
+        assert deadline.bound(30.0) <= 0.5
+        assert deadline.bound(0.1) == 0.1
+
+    def test_expired(self):
+        deadline = Deadline(0.01)
+        time.sleep(0.02)
+        assert deadline.expired
+        assert deadline.bound(30.0) == 0.0
+        with pytest.raises(DeadlineExceeded):
+            deadline.check()
+
+    def test_cancel(self):
+        deadline = Deadline(10)
+        deadline.cancel("client disconnected")
+        assert deadline.done
+        with pytest.raises(RequestCancelled, match="client disconnected"):
+            deadline.check()
+
+    def test_on_cancel_callbacks(self):
+        deadline = Deadline()
+        calls = []
+        deadline.on_cancel(lambda: calls.append("a"))
+        unregister = deadline.on_cancel(lambda: calls.append("b"))
+        unregister()
+        deadline.cancel()
+        deadline.cancel()
+        assert calls == ["a"]
+        # 已取消時立即呼叫
+        deadline.on_cancel(lambda: calls.append("c"))
+        assert calls == ["a", "c"]
@@ -0,0 +1,112 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+import pytest
+
+from utils.detection_cascade import DetectionCascade, merge_regions, nms
+
+
+def _scene(height, width):
+    # 每個像素存 (y, x)，crop view 的 [0, 0] 即為其在原圖的偏移
+    ys, xs = np.mgrid[0:height, 0:width]
+    return np.stack([ys, xs], axis=2).astype(np.int32)
+
+
+class FakeDetector:
+    """
+    依 ground truth 回傳落在輸入範圍內的 box；box 在模型輸入上的短邊小於 min_px 時信心值減半，
+    模擬低解析度下小物件信心不足。
+    """
+
+    def __init__(self, truth, min_px=40):
+        self.truth = np.asarray(truth, dtype=np.float32).reshape(-1, 5)
+        self.min_px = min_px
+        self.calls = []
+
+    def __call__(self, images, imgsz, conf):
+        self.calls.append((imgsz, [image.shape[:2] for image in images]))
+        results = []
+        for image in images:
+            oy, ox = image[0, 0]
+            height, width = image.shape[:2]
+            boxes = self.truth.copy()
+            boxes[:, [0, 2]] = (boxes[:, [0, 2]] - ox).clip(0, width)
+            boxes[:, [1, 3]] = (boxes[:, [1, 3]] - oy).clip(0, height)
+            boxes = boxes[(boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])]
+            scale = imgsz / max(height, width)
+            sides = np.minimum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]) * scale
+            boxes[sides < self.min_px, 4] *= 0.5
+            results.append(boxes[boxes[:, 4] >= conf])
+        return results
+
+
+class TestBoxUtils:
+    """NMS 與區域合併測試"""
+
+    def test_nms(self):
+        boxes = np.array([[0, 0, 10, 10, 0.7], [1, 1, 10, 10, 0.9], [20, 20, 30, 30, 0.8]], dtype=np.float32)
+        kept = nms(boxes, 0.5)
+        assert kept[:, 4].tolist() == pytest.approx([0.9, 0.8])
+        assert nms(np.empty((0, 5), dtype=np.float32)).shape == (0, 5)
+
+    def test_merge_regions_chains(self):
+        # a 與 b 重疊、b 與 c 重疊 → 合併成一個；d 獨立
+        regions = merge_regions([[0, 0, 10, 10], [8, 0, 20, 10], [18, 5, 30, 15], [50, 50, 60, 60]])
+        assert sorted(map(tuple, regions.tolist())) == [(0, 0, 30, 15), (50, 50, 60, 60)]
+
+
+class TestDetectionCascade:
+    """coarse → fine 偵測 cascade 測試"""
+
+    def _cascade(self, detector, **kwargs):
+        return DetectionCascade(detector, conf=0.8, low_conf=0.3, coarse_imgsz=320, fine_imgsz=640,
+                                small_px=24, **kwargs)
+
+    def test_confident_boxes_skip_fine_pass(self):
+        # 近拍：兩個大瓶子在 320 下就夠清楚
+        detector = FakeDetector([[100, 100, 500, 900, 0.95], [600, 100, 1000, 900, 0.9]])
+        boxes = self._cascade(detector).detect([_scene(1000, 1200)])[0]
+        assert len(detector.calls) == 1 and detector.calls[0][0] == 320
+        assert boxes[:, 4].tolist() == pytest.approx([0.95, 0.9])
+
+    def test_small_boxes_refined_in_regions(self):
+        # 貨架遠景：小瓶子在 320 下信心不足，放大區域後才達門檻
+        truth = [[100, 100, 700, 1500, 0.95], [2000, 600, 2060, 760, 0.9], [3000, 1200, 3060, 1360, 0.85]]
+        detector = FakeDetector(truth)
+        stats = {}
+        boxes = self._cascade(detector).detect([_scene(2000, 4000)], stats)[0]
+        assert stats == {"images": 1, "full": 0, "regions": 2}
+        imgsz, shapes = detector.calls[1]
+        assert imgsz == 640 and all(h < 400 and w < 400 for h, w in shapes)
+        np.testing.assert_allclose(np.sort(boxes[:, 0]), [100, 2000, 3000])
+        np.testing.assert_allclose(boxes[np.argsort(boxes[:, 0])][:, :4], np.asarray(truth)[:, :4])
+
+    def test_no_coarse_boxes_falls_back_to_full_image(self):
+        # coarse pass 什麼都沒看到（信心值減半後低於 low_conf），改以整張圖再跑一次
+        detector = FakeDetector([[10, 10, 30, 60, 0.55]], min_px=1000)
+        stats = {}
+        self._cascade(detector).detect([_scene(500, 500)], stats)
+        assert stats["full"] == 1
+        assert detector.calls[1] == (640, [(500, 500)])
+
+    def test_large_uncertain_area_falls_back(self):
+        # 信心不足的 box 涵蓋大半張圖時，直接跑整張圖比切區域划算
+        detector = FakeDetector([[0, 0, 900, 900, 0.5]])
+        stats = {}
+        assert len(self._cascade(detector).detect([_scene(1000, 1000)], stats)[0]) == 0
+        assert stats["full"] == 1 and stats["regions"] == 0
+
+    def test_truncated_neighbours_dropped(self):
+        # 區域邊緣切到的鄰近瓶子只留下完整的那個；被截斷的副本不能變成額外的 box
+        truth = [[400, 400, 460, 560, 0.85], [470, 300, 800, 1300, 0.95]]
+        detector = FakeDetector(truth)
+        boxes = self._cascade(detector).detect([_scene(2000, 2000)])[0]
+        np.testing.assert_allclose(boxes[np.argsort(boxes[:, 0])][:, :4], np.asarray(truth)[:, :4])
+
+    def test_batch_keeps_image_order(self):
+        detector = FakeDetector([[100, 100, 500, 900, 0.95], [2000, 600, 2060, 760, 0.9]])
+        results = self._cascade(detector).detect([_scene(1000, 1000), _scene(2000, 4000), _scene(50, 50)])
+        assert [len(r) for r in results] == [1, 2, 0]
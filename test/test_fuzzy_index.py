@@ -0,0 +1,85 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import random
+
+from rapidfuzz import fuzz
+from rapidfuzz import process as fuzz_process
+
+from utils.fuzzy_index import FuzzyIndex, char_ngrams, normalize_text
+
+CATALOG = [
+    "茶裏王台式綠茶",
+    "茶裏王日式無糖綠茶",
+    "茶裏王白毫烏龍",
+    "原萃烏龍茶",
+    "御茶園特上檸檬茶",
+    "每朝健康双纖綠茶",
+]
+
+
+def _synthetic_catalog(size: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    pool = [chr(0x4E00 + i) for i in rng.sample(range(20000), 400)]
+    return [f"{i:05d}" + "".join(rng.choices(pool, k=rng.randint(5, 9))) for i in range(size)]
+
+
+class TestNormalize:
+    """形近字正規化測試"""
+
+    def test_glyph_confusions(self):
+        assert normalize_text("茶裡王台式線茶") == normalize_text("茶裏王台式綠茶")
+        assert normalize_text("原萃鳥龍荼") == "原萃烏龍茶"
+
+    def test_strips_punctuation_and_width(self):
+        assert normalize_text("ＬＰ３３ 機能-優酪乳！") == "lp33機能優酪乳"
+
+    def test_ngrams(self):
+        assert char_ngrams("綠茶王") == {"綠茶", "茶王"}
+        assert char_ngrams("茶") == {"茶"}
+        assert char_ngrams("") == set()
+
+
+class TestFuzzyIndex:
+    """n-gram 索引搜尋測試"""
+
+    def test_small_catalog_full_scan(self):
+        index = FuzzyIndex(CATALOG, CATALOG)
+        matched, score, shortlisted = index.search("未稅 茶裡王 台式線茶 600ml")
+        assert matched == "茶裏王台式綠茶"
+        assert score == 100
+        assert shortlisted == len(CATALOG)
+
+    def test_normalization_recovers_confused_glyph(self):
+        index = FuzzyIndex(CATALOG, CATALOG)
+        assert index.search("双纎線茶 每朝健康")[0] == "每朝健康双纖綠茶"
+
+    def test_no_match_below_cutoff(self):
+        index = FuzzyIndex(CATALOG, CATALOG)
+        assert index.search("ABCDEFG", score_cutoff=50)[0] is None
+        assert index.search("", score_cutoff=50) == (None, None, 0)
+
+    def test_shortlist_is_bounded_and_contains_target(self):
+        texts = _synthetic_catalog(5000)
+        index = FuzzyIndex(texts, texts, shortlist_size=32)
+        target = texts[1234]
+        query = f"保存期限 {target} 內容量"
+        shortlist = index.shortlist(normalize_text(query))
+        assert len(shortlist) <= 32
+        assert 1234 in shortlist
+        assert index.search(query)[0] == target
+
+    def test_agrees_with_full_scan(self):
+        texts = _synthetic_catalog(3000, seed=1)
+        index = FuzzyIndex(texts, texts)
+        rng = random.Random(2)
+        for target in rng.sample(texts, 20):
+            noisy = target[:3] + "某" + target[4:]
+            normalized = [normalize_text(t) for t in texts]
+            expected = fuzz_process.extractOne(normalize_text(noisy), normalized,
+                                               scorer=fuzz.partial_ratio, score_cutoff=50)
+            matched, score, _ = index.search(noisy)
+            assert score == expected[1]
+            assert normalize_text(matched) == expected[0]
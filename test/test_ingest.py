@@ -0,0 +1,178 @@
+import base64
+import gc
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import cv2
+import numpy as np
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from utils.body_limit import BodySizeLimitMiddleware
+from utils.ingest import (ImageTooLarge, MemoryBudget, MemoryBudgetExceeded, base64_decoded_size,
+                          decode_base64_bounded, decode_bounded, reduction_factor)
+
+MB = 1 << 20
+
+
+def _encode(width, height, ext=".jpg"):
+    # 漸層圖壓縮率高，編碼快
+    row = np.linspace(0, 255, width, dtype=np.uint8)
+    image = np.repeat(np.repeat(row[None, :, None], height, axis=0), 3, axis=2)
+    return cv2.imencode(ext, image)[1].tobytes()
+
+
+class TestDecodeLimits:
+    """圖片大小 / 像素上限測試"""
+
+    def test_reduction_factor(self):
+        assert reduction_factor("JPEG", 4000, 3000, 0) == 1
+        assert reduction_factor("JPEG", 4000, 3000, 12_000_000) == 1
+        assert reduction_factor("JPEG", 8000, 6000, 12_000_000) == 2
+        assert reduction_factor("JPEG", 8000, 6000, 1_000_000) == 8
+        with pytest.raises(ImageTooLarge):
+            reduction_factor("JPEG", 8000, 6000, 500_000)
+        with pytest.raises(ImageTooLarge):
+            reduction_factor("PNG", 8000, 6000, 12_000_000)
+
+    def test_large_jpeg_decoded_reduced(self):
+        image = decode_bounded(_encode(2000, 1500), max_pixels=1_000_000)
+        assert image.shape == (750, 1000, 3)
+        assert image.dtype == np.uint8
+
+    def test_small_image_full_size(self):
+        assert decode_bounded(_encode(640, 480, ".png"), max_pixels=1_000_000).shape == (480, 640, 3)
+
+    def test_large_png_rejected(self):
+        with pytest.raises(ImageTooLarge):
+            decode_bounded(_encode(2000, 1500, ".png"), max_pixels=1_000_000)
+
+    def test_base64_size_checked_before_decode(self):
+        data = base64.b64encode(_encode(640, 480)).decode()
+        assert base64_decoded_size(data) == len(base64.b64decode(data))
+        with pytest.raises(ImageTooLarge):
+            decode_base64_bounded(data, max_bytes=1000)
+        with pytest.raises(ValueError):
+            decode_base64_bounded("not base64!", max_bytes=1000)
+
+
+class TestMemoryBudget:
+    """解碼記憶體預算測試"""
+
+    def test_released_when_image_and_views_collected(self):
+        budget = MemoryBudget(10 * MB)
+        image = decode_bounded(_encode(640, 480), budget=budget)
+        assert budget.in_use == 640 * 480 * 3
+        view = image[10:100, 10:100]
+        del image
+        gc.collect()
+        assert budget.in_use > 0  # crop view 仍持有 base array
+        del view
+        gc.collect()
+        assert budget.in_use == 0
+
+    def test_waits_then_times_out(self):
+        budget = MemoryBudget(1 * MB)
+        budget.acquire(MB)
+        started = time.perf_counter()
+        with pytest.raises(MemoryBudgetExceeded):
+            budget.acquire(MB // 2, timeout=0.1)
+        assert time.perf_counter() - started >= 0.1
+
+        threading.Timer(0.05, budget.release, args=(MB,)).start()
+        assert budget.acquire(MB // 2, timeout=2) == MB // 2
+
+    def test_oversized_request_clamped(self):
+        budget = MemoryBudget(1 * MB)
+        assert budget.acquire(10 * MB, timeout=0) == MB
+
+    def test_failed_decode_releases(self):
+        budget = MemoryBudget(10 * MB)
+        data = _encode(640, 480)
+        with pytest.raises(ValueError):
+            decode_bounded(data[:200], budget=budget)
+        assert budget.in_use == 0
+
+    def test_peak_rss_for_concurrent_large_uploads(self):
+        psutil = pytest.importorskip("psutil")
+        process = psutil.Process()
+        # 8 個並發的 48 MP 上傳：全尺寸解碼每張 144 MB，共約 1.1 GB
+        payload = base64.b64encode(_encode(8000, 6000)).decode()
+        # 以 1/2 解碼，每張 36 MB（解碼期間峰值 72 MB），預算內最多一張解碼中、一至兩張處理中
+        budget = MemoryBudget(128 * MB)
+        max_pixels = 12_000_000
+        gc.collect()
+        baseline = process.memory_info().rss
+        peak = baseline
+        done = threading.Event()
+
+        def sample():
+            nonlocal peak
+            while not done.is_set():
+                peak = max(peak, process.memory_info().rss)
+                time.sleep(0.002)
+
+        errors = []
+
+        def upload():
+            try:
+                image = decode_base64_bounded(payload, 64 * MB, max_pixels, budget, timeout=60)
+                crops = [image[y:y + 500, x:x + 300] for y, x in ((0, 0), (1000, 1000), (2000, 3000))]
+                assert image.shape == (3000, 4000, 3)
+                time.sleep(0.05)  # 模擬偵測 / 比對期間持有影像
+                del image, crops
+            except Exception as e:
+                errors.append(e)
+
+        sampler = threading.Thread(target=sample)
+        sampler.start()
+        threads = [threading.Thread(target=upload) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        done.set()
+        sampler.join()
+
+        assert not errors
+        assert budget.in_use == 0
+        # 另留 32 MB 給壓縮後 bytes 與 thread stack；全尺寸並發解碼約需 2 GB
+        assert peak - baseline < budget.max_bytes + 32 * MB
+
+
+class TestBodySizeLimit:
+    """請求大小上限 middleware 測試"""
+
+    @pytest.fixture
+    def client(self):
+        app = FastAPI()
+
+        @app.post("/small")
+        async def small(request: Request):
+            return {"size": len(await request.body())}
+
+        @app.post("/batch")
+        async def batch(request: Request):
+            return {"size": len(await request.body())}
+
+        app.add_middleware(BodySizeLimitMiddleware, max_bytes=1 * MB, path_limits={"/batch": 4 * MB})
+        return TestClient(app)
+
+    def test_content_length_limit(self, client):
+        assert client.post("/small", content=b"x" * 1000).json() == {"size": 1000}
+        response = client.post("/small", content=b"x" * (2 * MB))
+        assert response.status_code == 413
+        assert client.post("/batch", content=b"x" * (2 * MB)).status_code == 200
+
+    def test_chunked_limit(self, client):
+        def chunks(n):
+            for _ in range(n):
+                yield b"x" * (256 * 1024)
+
+        assert client.post("/small", content=chunks(2)).json() == {"size": 512 * 1024}
+        assert client.post("/small", content=chunks(8)).status_code == 413
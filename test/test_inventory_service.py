@@ -0,0 +1,195 @@
+import base64
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+from conftest import catalog_vector, shelf_image_base64
+from fastapi.testclient import TestClient
+
+from utils.deadline import Deadline
+from utils.profiling import ProfileStore
+
+EXPECTED = "根據掃描結果清單，以下是各商品的數量統計：\n茶裏王白毫烏龍 有 1 瓶\n光泉鮮乳 有 1 瓶"
+
+
+class TestInventoryWithStubs:
+    """以替身模型 / OCR / LLM 執行完整的 /inventory_base64 流程"""
+
+    def test_run_inventory(self, inventory_service):
+        service = inventory_service
+        result = service.run_inventory(service.Base64ImageRequest(image_base64=shelf_image_base64()))
+        assert result == {"status": 1, "data": EXPECTED}
+        assert service.ocr_backend.calls == 2 and service.client.calls == 1
+
+    def test_stream_closed_when_answer_completes(self, inventory_service, monkeypatch):
+        service = inventory_service
+        streams = []
+        create = service.client.chat.completions.create
+
+        def rambling_create(**kwargs):
+            stream = create(**kwargs)
+            stream.content += "\n以上是本次掃描的統計結果。"
+            streams.append(stream)
+            return stream
+
+        monkeypatch.setattr(service.client.chat.completions, "create", rambling_create)
+        answer, fallback = service.answer_question({"茶裏王白毫烏龍": 2}, "統計商品", Deadline())
+        assert fallback is None and answer.endswith("茶裏王白毫烏龍 有 2 瓶")
+        assert streams[0].closed and streams[0].consumed == len(answer)
+
+    def test_truncated_answer_falls_back_to_template(self, inventory_service, monkeypatch):
+        service = inventory_service
+        monkeypatch.setattr(service, "LLM_BASE_TOKENS", 5)
+        monkeypatch.setattr(service, "LLM_TOKENS_PER_LINE", 5)
+        answer, fallback = service.answer_question({"茶裏王白毫烏龍": 2}, "統計商品", Deadline())
+        assert fallback == "invalid_answer"
+        assert answer == service.format_counts_answer({"茶裏王白毫烏龍": 2})
+
+
+class TestInventoryResultCache:
+    """/inventory_base64 結果快取：命中、失效、降級結果不保存、並發重送只執行一次"""
+
+    def post_inventory(self, client, seed=0):
+        response = client.post("/inventory_base64", json={"image_base64": shelf_image_base64(seed)})
+        assert response.status_code == 200
+        return response.json()
+
+    def test_hit_skips_decoding(self, inventory_service, monkeypatch):
+        service = inventory_service
+        decoded = []
+        decode = service.decode_request_bytes
+        monkeypatch.setattr(service, "decode_request_bytes", lambda *args: decoded.append(1) or decode(*args))
+        client = TestClient(service.app)
+        assert self.post_inventory(client) == {"status": 1, "data": EXPECTED}
+        assert self.post_inventory(client) == {"status": 1, "data": EXPECTED}
+        assert len(decoded) == 1 and service.client.calls == 1
+        assert client.get("/result_cache").json()["hits"] == 1
+
+    def test_db_add_and_delete_invalidate(self, inventory_service, monkeypatch):
+        service = inventory_service
+        monkeypatch.setattr(service, "encode_image", lambda image: catalog_vector(2))
+        client = TestClient(service.app)
+        self.post_inventory(client)
+        assert len(service.result_cache) == 1
+
+        image = base64.b64decode(shelf_image_base64(1))
+        response = client.post("/db/add", data={"brand": "麥香", "flavor": "奶茶"},
+                               files={"file": ("crop.png", image, "image/png")})
+        assert response.status_code == 200
+        assert len(service.result_cache) == 0
+        self.post_inventory(client)
+        assert service.client.calls == 2
+
+        assert client.delete("/db/麥香奶茶").status_code == 200
+        assert len(service.result_cache) == 0
+        self.post_inventory(client)
+        assert service.client.calls == 3
+        assert service.result_cache.stats()["invalidations"] == 2
+
+    def test_ocr_failure_not_cached(self, inventory_service, monkeypatch):
+        service = inventory_service
+        recognize = service.ocr_backend._recognize
+
+        def flaky(image_base64, timeout):
+            if service.ocr_backend.calls == 0:
+                service.ocr_backend.calls += 1
+                raise ValueError("OCR backend 500")
+            return recognize(image_base64, timeout)
+
+        monkeypatch.setattr(service.ocr_backend, "_recognize", flaky)
+        client = TestClient(service.app)
+        degraded = self.post_inventory(client)
+        assert "未知商品" in degraded["data"]
+        assert len(service.result_cache) == 0
+        # 重送時重新辨識，取得正確結果後才保存
+        assert self.post_inventory(client) == {"status": 1, "data": EXPECTED}
+        assert len(service.result_cache) == 1
+
+    def test_llm_fallback_not_cached(self, inventory_service, monkeypatch):
+        service = inventory_service
+        monkeypatch.setattr(service, "LLM_BASE_TOKENS", 5)
+        monkeypatch.setattr(service, "LLM_TOKENS_PER_LINE", 5)
+        client = TestClient(service.app)
+        self.post_inventory(client)
+        self.post_inventory(client)
+        assert len(service.result_cache) == 0 and service.client.calls == 2
+
+    def test_concurrent_duplicates_run_once(self, inventory_service):
+        service = inventory_service
+        service.ocr_backend.latency_ms, service.ocr_backend.sigma = 200, 0
+        request = service.Base64ImageRequest(image_base64=shelf_image_base64())
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(service.run_inventory(request)))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)
+        for thread in threads:
+            thread.join()
+        assert results == [{"status": 1, "data": EXPECTED}] * 3
+        assert service.client.calls == 1 and service.ocr_backend.calls == 2
+        assert service.result_cache.stats()["coalesced"] == 2
+
+
+class TestProfilingAccess:
+    """X-Profile 與 /profiles 只在設定 PROFILE_TOKEN 時開放；隨機取樣不需 token"""
+
+    @pytest.fixture
+    def client(self, inventory_service, monkeypatch, tmp_path):
+        monkeypatch.setattr(inventory_service, "profile_store", ProfileStore(str(tmp_path / "profiles")))
+        monkeypatch.setattr(inventory_service, "result_cache", None)
+        return TestClient(inventory_service.app)
+
+    def post_inventory(self, client, **headers):
+        return client.post("/inventory_base64", json={"image_base64": shelf_image_base64()}, headers=headers)
+
+    def test_disabled_without_token(self, client, inventory_service):
+        response = self.post_inventory(client, **{"X-Profile": "cpu", "X-Request-Id": "req-1"})
+        assert response.json() == {"status": 1, "data": EXPECTED}
+        assert inventory_service.get_profile_store().list() == []
+        assert client.get("/profiles").status_code == 404
+        assert client.get("/profiles/req-1").status_code == 404
+
+    def test_sampling_works_without_token(self, client, inventory_service, monkeypatch):
+        monkeypatch.setattr(inventory_service, "PROFILE_SAMPLE_RATE", 1.0)
+        profile_id = self.post_inventory(client).json()["profile_id"]
+        assert [p["id"] for p in inventory_service.get_profile_store().list()] == [profile_id]
+
+    def test_token_required(self, client, inventory_service, monkeypatch):
+        monkeypatch.setattr(inventory_service, "PROFILE_TOKEN", "admin")
+        assert self.post_inventory(client, **{"X-Profile": "cpu", "X-Profile-Token": "nope"}).status_code == 403
+        assert client.get("/profiles", headers={"X-Profile-Token": "nope"}).status_code == 403
+        headers = {"X-Profile": "cpu", "X-Profile-Token": "admin", "X-Request-Id": "req-1"}
+        assert self.post_inventory(client, **headers).json()["profile_id"] == "req-1"
+        profiles = client.get("/profiles", headers={"X-Profile-Token": "admin"}).json()["profiles"]
+        assert [p["id"] for p in profiles] == ["req-1"]
+
+    def test_existing_request_id_not_overwritten(self, client, inventory_service, monkeypatch):
+        monkeypatch.setattr(inventory_service, "PROFILE_TOKEN", "admin")
+        headers = {"X-Profile": "cpu", "X-Profile-Token": "admin", "X-Request-Id": "req-1"}
+        assert self.post_inventory(client, **headers).status_code == 200
+        created_at = inventory_service.get_profile_store().list()[0]["created_at"]
+        assert self.post_inventory(client, **headers).status_code == 409
+        assert inventory_service.get_profile_store().list()[0]["created_at"] == created_at
+        # 隨機取樣遇到重複的 id 時改用新 id
+        monkeypatch.setattr(inventory_service, "PROFILE_SAMPLE_RATE", 1.0)
+        response = self.post_inventory(client, **{"X-Request-Id": "req-1"})
+        assert response.status_code == 200 and response.json()["profile_id"] != "req-1"
+
+
+class TestJobRequestLimit:
+    """/jobs/inventory_batch 的 payload 存進 SQLite，body 上限遠低於同步批次"""
+
+    def test_job_batch_body_limit(self, inventory_service):
+        service = inventory_service
+        client = TestClient(service.app)
+        body = b"x" * (int(service.JOB_MAX_REQUEST_MB * (1 << 20)) + 1)
+        headers = {"Content-Type": "application/json"}
+        assert service.JOB_MAX_REQUEST_MB < service.BATCH_MAX_REQUEST_MB
+        assert client.post("/jobs/inventory_batch", content=body, headers=headers).status_code == 413
+        # 同樣大小的同步批次未超過上限（body 不是 JSON，由 FastAPI 回 422）
+        assert client.post("/inventory_batch_base64", content=body, headers=headers).status_code == 422
@@ -0,0 +1,153 @@
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+
+from utils.job_store import FAILED, QUEUED, RUNNING, SUCCEEDED, JobStore, JobWorkerPool
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"))
+
+
+def _wait_for(store, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = store.get(job_id)
+        if job["status"] in (SUCCEEDED, FAILED):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} 未完成: {store.get(job_id)['status']}")
+
+
+class TestJobStore:
+    """SQLite job 佇列測試"""
+
+    def test_submit_claim_complete(self, store):
+        job_id = store.submit("inventory", {"question": "幾瓶？"})
+        assert store.get(job_id)["status"] == QUEUED
+
+        job = store.claim("w1", lease_s=30)
+        assert job["id"] == job_id
+        assert job["status"] == RUNNING
+        assert job["attempts"] == 1
+        assert job["payload"] == {"question": "幾瓶？"}
+        assert store.claim("w1", lease_s=30) is None
+
+        assert store.complete(job_id, "w1", {"status": 1}, {"stages": {"yolo": {"count": 1}}})
+        done = store.get(job_id)
+        assert done["status"] == SUCCEEDED
+        assert done["result"] == {"status": 1}
+        assert done["timings"]["stages"]["yolo"]["count"] == 1
+        assert done["payload"] is None
+
+    def test_claim_in_submission_order(self, store):
+        ids = [store.submit("inventory", {"n": i}) for i in range(3)]
+        assert [store.claim("w", 30)["id"] for _ in ids] == ids
+
+    def test_complete_requires_owner(self, store):
+        job_id = store.submit("inventory", {})
+        store.claim("w1", lease_s=30)
+        assert not store.complete(job_id, "w2", {"status": 1})
+        assert store.get(job_id)["status"] == RUNNING
+
+    def test_expired_lease_requeued(self, store):
+        job_id = store.submit("inventory", {})
+        store.claim("w1", lease_s=-1)
+        assert store.requeue(max_attempts=3) == 1
+        assert store.get(job_id)["status"] == QUEUED
+        assert store.claim("w2", lease_s=30)["attempts"] == 2
+
+    def test_heartbeat_keeps_lease(self, store):
+        store.submit("inventory", {})
+        job = store.claim("w1", lease_s=-1)
+        store.heartbeat([job["id"]], "w1", lease_s=30)
+        assert store.requeue(max_attempts=3) == 0
+
+    def test_max_attempts_marks_failed(self, store):
+        job_id = store.submit("inventory", {})
+        for _ in range(2):
+            store.claim("w1", lease_s=-1)
+            store.requeue(max_attempts=2)
+        job = store.get(job_id)
+        assert job["status"] == FAILED
+        assert job["attempts"] == 2
+        assert job["error"]
+
+    def test_orphaned_worker_requeued(self, store):
+        job_id = store.submit("inventory", {})
+        store.claim("dead-worker", lease_s=30)
+        assert store.requeue(max_attempts=3, is_orphaned=lambda worker: worker == "dead-worker") == 1
+        assert store.get(job_id)["status"] == QUEUED
+
+    def test_cleanup_ttl(self, store):
+        old = store.submit("inventory", {})
+        store.claim("w", 30)
+        store.complete(old, "w", {"status": 1})
+        pending = store.submit("inventory", {})
+        assert store.cleanup(ttl_s=3600) == 0
+        assert store.cleanup(ttl_s=-1) == 1
+        assert store.get(old) is None
+        assert store.get(pending)["status"] == QUEUED
+
+    def test_persists_across_reopen(self, tmp_path):
+        path = str(tmp_path / "jobs.db")
+        job_id = JobStore(path).submit("inventory", {"question": "q"})
+        reopened = JobStore(path)
+        assert reopened.get(job_id)["payload"] == {"question": "q"}
+        assert reopened.counts() == {QUEUED: 1}
+
+
+class TestJobWorkerPool:
+    """背景 worker pool 測試"""
+
+    def test_runs_jobs_and_records_timings(self, store):
+        handlers = {"echo": lambda payload: ({"echo": payload["value"]}, {"stage": {"count": 1, "total_ms": 1.0}})}
+        pool = JobWorkerPool(store, handlers, workers=2, poll_s=0.05)
+        pool.start()
+        try:
+            ids = [store.submit("echo", {"value": i}) for i in range(5)]
+            pool.notify()
+            jobs = [_wait_for(store, job_id) for job_id in ids]
+        finally:
+            pool.stop()
+        assert [job["result"]["echo"] for job in jobs] == list(range(5))
+        assert all(job["status"] == SUCCEEDED for job in jobs)
+        assert "queued_s" in jobs[0]["timings"] and "run_s" in jobs[0]["timings"]
+        assert jobs[0]["timings"]["stages"]["stage"]["count"] == 1
+
+    def test_handler_error_marks_failed(self, store):
+        def explode(payload):
+            raise ValueError("bad image")
+
+        pool = JobWorkerPool(store, {"explode": explode}, workers=1, poll_s=0.05)
+        pool.start()
+        try:
+            job = _wait_for(store, store.submit("explode", {}))
+            unknown = _wait_for(store, store.submit("missing", {}))
+        finally:
+            pool.stop()
+        assert job["status"] == FAILED
+        assert "bad image" in job["error"]
+        assert unknown["status"] == FAILED
+
+    def test_resumes_jobs_after_restart(self, tmp_path):
+        path = str(tmp_path / "jobs.db")
+        before = JobStore(path)
+        job_id = before.submit("echo", {"value": 1})
+        # 模擬 process 在執行中被終止：job 停在 running，lease 已過期
+        before.claim("old-host:1", lease_s=-1)
+
+        store = JobStore(path)
+        pool = JobWorkerPool(store, {"echo": lambda payload: (payload, {})}, workers=1, poll_s=0.05)
+        pool.start()
+        try:
+            job = _wait_for(store, job_id)
+        finally:
+            pool.stop()
+        assert job["status"] == SUCCEEDED
+        assert job["attempts"] == 2
@@ -0,0 +1,124 @@
+import os
+import stat
+import sys
+import threading
+from multiprocessing import AuthenticationError
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+import pytest
+
+from utils.model_ipc import (AttachedImage, ModelServerClient, ModelServerError, SharedImage, ensure_authkey,
+                             load_authkey, private_dir, serve)
+
+AUTHKEY = b"test-authkey"
+
+
+def _handle_detect(image: dict):
+    with AttachedImage(image) as array:
+        return [(0, 0, int(array.shape[1]), int(array.shape[0]), float(array.mean()))]
+
+
+def _handle_embed(image: dict, boxes: list = None):
+    with AttachedImage(image) as array:
+        return np.full((len(boxes or [None]), 4), array.sum(), dtype=np.float32)
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    address = str(tmp_path_factory.mktemp("ipc") / "models.sock")
+    ready = threading.Event()
+    handlers = {"ping": lambda: {"pid": 0}, "detect": _handle_detect, "embed": _handle_embed}
+    threading.Thread(target=serve, args=(address, handlers), kwargs={"authkey": AUTHKEY, "ready": ready},
+                     daemon=True).start()
+    ready.wait(5)
+    client = ModelServerClient(address, AUTHKEY)
+    yield client
+    client.close()
+
+
+class TestSharedImage:
+    """shared memory 圖片傳遞測試"""
+
+    def test_roundtrip(self):
+        image = np.arange(2 * 3 * 3, dtype=np.uint8).reshape(2, 3, 3)
+        with SharedImage(image) as shared:
+            with AttachedImage(shared.descriptor) as attached:
+                assert np.array_equal(attached, image)
+
+
+class TestModelServerClient:
+    """model server 協定測試"""
+
+    def test_detect(self, client):
+        image = np.full((4, 6, 3), 7, dtype=np.uint8)
+        assert client.detect(image) == [(0, 0, 6, 4, 7.0)]
+
+    def test_embed_per_box(self, client):
+        image = np.ones((2, 2, 3), dtype=np.uint8)
+        result = client.embed(image, boxes=[(0, 0, 1, 1, 0.9), (1, 1, 2, 2, 0.8)])
+        assert result.shape == (2, 4)
+        assert result[0, 0] == 12
+
+    def test_concurrent_calls(self, client):
+        results = []
+        threads = [
+            threading.Thread(target=lambda v=v: results.append(client.detect(np.full((2, 2, 3), v, np.uint8))))
+            for v in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert sorted(r[0][4] for r in results) == [float(v) for v in range(8)]
+
+    def test_unknown_op(self, client):
+        with pytest.raises(ModelServerError):
+            client.call("train")
+
+
+class TestModelServerSecurity:
+    """socket 與金鑰權限測試"""
+
+    def test_socket_is_owner_only(self, client):
+        assert stat.S_IMODE(os.stat(client.address).st_mode) == 0o600
+
+    def test_wrong_authkey_rejected(self, client):
+        with pytest.raises(AuthenticationError):
+            ModelServerClient(client.address, b"good-backend").call("ping")
+        # server 仍繼續接受其他連線
+        assert ModelServerClient(client.address, AUTHKEY).call("ping") == {"pid": 0}
+
+    def test_generated_authkey_file(self, tmp_path, monkeypatch):
+        monkeypatch.delenv("MODEL_SERVER_AUTHKEY", raising=False)
+        path = str(tmp_path / "run" / "model_server.key")
+        key = ensure_authkey(path)
+        assert len(key) == 64 and ensure_authkey(path) == key == load_authkey(path)
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+        assert stat.S_IMODE(os.stat(tmp_path / "run").st_mode) == 0o700
+        assert os.listdir(tmp_path / "run") == ["model_server.key"]
+
+    def test_explicit_authkey_wins(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("MODEL_SERVER_AUTHKEY", "from-env")
+        assert ensure_authkey(str(tmp_path / "model_server.key")) == b"from-env"
+        assert not (tmp_path / "model_server.key").exists()
+
+    def test_permissive_key_or_dir_refused(self, tmp_path, monkeypatch):
+        monkeypatch.delenv("MODEL_SERVER_AUTHKEY", raising=False)
+        path = tmp_path / "model_server.key"
+        path.write_text("secret")
+        path.chmod(0o644)
+        with pytest.raises(PermissionError):
+            load_authkey(str(path))
+        shared = tmp_path / "shared"
+        shared.mkdir(mode=0o755)
+        shared.chmod(0o755)
+        with pytest.raises(PermissionError):
+            private_dir(str(shared))
+
+    def test_missing_key_file(self, tmp_path, monkeypatch):
+        monkeypatch.delenv("MODEL_SERVER_AUTHKEY", raising=False)
+        with pytest.raises(FileNotFoundError):
+            load_authkey(str(tmp_path / "model_server.key"))
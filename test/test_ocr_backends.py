@@ -0,0 +1,102 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+
+from utils.deadline import Deadline, RequestCancelled
+from utils.ocr_backends import OCRBackend, OCRTimeoutError, create_ocr_backend
+
+
+class FlakyBackend(OCRBackend):
+    name = "flaky"
+    retry_backoff = 0
+
+    def __init__(self, failures: int = 0, delay: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def _recognize(self, image_base64: str, timeout: float) -> str:
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.delay)
+            if self.calls <= self.failures:
+                raise ConnectionError("backend down")
+            return f"text:{image_base64}"
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class TestOCRBackend:
+    """OCR backend 並發 / 重試 / 逾時測試"""
+
+    def test_retries_transient_errors(self):
+        backend = FlakyBackend(failures=1, retries=1)
+        assert backend.recognize("a") == "text:a"
+        assert backend.calls == 2
+
+    def test_gives_up_after_retries(self):
+        backend = FlakyBackend(failures=5, retries=1)
+        with pytest.raises(ConnectionError):
+            backend.recognize("a")
+        assert backend.calls == 2
+
+    def test_concurrency_limit(self):
+        backend = FlakyBackend(delay=0.05, max_concurrency=2)
+        threads = [threading.Thread(target=backend.recognize, args=("a",)) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert backend.peak == 2
+
+    def test_slot_wait_timeout(self):
+        backend = FlakyBackend(delay=0.3, max_concurrency=1, timeout=0.05)
+        worker = threading.Thread(target=backend.recognize, args=("a",))
+        worker.start()
+        time.sleep(0.02)
+        with pytest.raises(OCRTimeoutError):
+            backend.recognize("b")
+        worker.join()
+
+    def test_cancelled_request_leaves_queue(self):
+        backend = FlakyBackend(delay=0.5, max_concurrency=1, timeout=5)
+        worker = threading.Thread(target=backend.recognize, args=("a",), kwargs={"priority": "job"})
+        worker.start()
+        time.sleep(0.02)
+        deadline = Deadline()
+        threading.Timer(0.05, deadline.cancel).start()
+        started = time.monotonic()
+        with pytest.raises(RequestCancelled):
+            backend.recognize("b", deadline, priority="date")
+        assert time.monotonic() - started < 0.4
+        assert backend.scheduler.stats()["classes"]["date"]["queued"] == 0
+        worker.join()
+
+
+class TestCreateOCRBackend:
+    """backend 建立與環境變數設定測試"""
+
+    def test_env_overrides(self, monkeypatch):
+        monkeypatch.setenv("OCR_OLLAMA_GLM_MAX_CONCURRENCY", "6")
+        monkeypatch.setenv("OCR_OLLAMA_GLM_RETRIES", "3")
+        backend = create_ocr_backend("ollama_glm")
+        assert backend.describe()["max_concurrency"] == 6
+        assert backend.scheduler.capacity == 6
+        assert backend.retries == 3
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            create_ocr_backend("tesseract")
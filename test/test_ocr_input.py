@@ -0,0 +1,89 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import base64
+
+import cv2
+import numpy as np
+import pytest
+
+from utils.ocr_backends import create_ocr_backend
+from utils.ocr_input import OCRInputSpec, fit_to_max_side, prepare_ocr_input, spec_from_env
+
+
+def _image(height, width):
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+
+
+class TestFitToMaxSide:
+    """OCR 輸入縮放測試"""
+
+    def test_downscale_keeps_aspect(self):
+        resized = fit_to_max_side(_image(3000, 1000), 1024)
+        assert resized.shape == (1024, 341, 3)
+
+    def test_small_image_untouched(self):
+        image = _image(200, 100)
+        assert fit_to_max_side(image, 1024) is image
+
+    def test_zero_disables_resize(self):
+        image = _image(3000, 1000)
+        assert fit_to_max_side(image, 0) is image
+
+
+class TestPrepareOCRInput:
+    """OCR payload 編碼測試"""
+
+    def test_jpeg_payload(self):
+        payload = prepare_ocr_input(_image(2000, 800), OCRInputSpec(max_side=512, format="jpeg", quality=80))
+        assert (payload.width, payload.height) == (205, 512)
+        assert payload.data[:2] == b"\xff\xd8"
+        assert base64.b64decode(payload.b64) == payload.data
+        assert payload.mime_type == "image/jpeg"
+
+    def test_png_lossless(self):
+        image = _image(40, 30)
+        payload = prepare_ocr_input(image, OCRInputSpec(format="png"))
+        decoded = cv2.imdecode(np.frombuffer(payload.data, np.uint8), cv2.IMREAD_COLOR)
+        assert np.array_equal(decoded, image)
+
+    def test_accepts_view(self):
+        image = _image(100, 100)
+        payload = prepare_ocr_input(image[10:60, 20:50], OCRInputSpec())
+        assert (payload.width, payload.height) == (30, 50)
+
+    def test_sha256_stable(self):
+        image = _image(50, 50)
+        spec = OCRInputSpec()
+        assert prepare_ocr_input(image, spec).sha256 == prepare_ocr_input(image, spec).sha256
+
+    def test_save_writes_encoded_bytes(self, tmp_path):
+        payload = prepare_ocr_input(_image(50, 50), OCRInputSpec(format="png"))
+        path = payload.save(str(tmp_path / "crop_00_ocr"))
+        assert path.endswith(".png")
+        assert Path(path).read_bytes() == payload.data
+
+    def test_unknown_format(self):
+        with pytest.raises(ValueError):
+            OCRInputSpec(format="gif")
+
+
+class TestInputSpecConfig:
+    """backend input_spec 設定測試"""
+
+    def test_env_overrides(self, monkeypatch):
+        monkeypatch.setenv("OCR_OLLAMA_GLM_INPUT_MAX_SIDE", "768")
+        monkeypatch.setenv("OCR_OLLAMA_GLM_INPUT_QUALITY", "70")
+        spec = spec_from_env("ollama_glm", OCRInputSpec(max_side=1024, quality=90))
+        assert spec == OCRInputSpec(max_side=768, format="jpeg", quality=70)
+
+    def test_backend_uses_own_spec(self, monkeypatch):
+        monkeypatch.setenv("OCR_OLLAMA_GLM_INPUT_FORMAT", "png")
+        backend = create_ocr_backend("ollama_glm")
+        assert backend.input_spec.format == "png"
+        payload = backend.prepare_input(_image(2048, 512))
+        assert payload.format == "png"
+        assert max(payload.width, payload.height) == backend.input_spec.max_side
@@ -0,0 +1,117 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+
+from utils.ocr_scheduler import OCRScheduler, parse_class_weights
+
+
+def queue_behind_blocker(scheduler, requests):
+    """
+    先佔住唯一的 slot，依序排入 requests（(priority, flow) 列表），再逐一放行；
+    回傳實際取得 slot 的順序（requests 的 index）。
+    """
+    assert scheduler.acquire("inventory", flow="blocker") is not None
+    order, lock = [], threading.Lock()
+
+    def worker(index, priority, flow):
+        assert scheduler.acquire(priority, flow=flow, timeout=5) is not None
+        with lock:
+            order.append(index)
+        scheduler.release(priority)
+
+    threads = []
+    for index, (priority, flow) in enumerate(requests):
+        thread = threading.Thread(target=worker, args=(index, priority, flow))
+        thread.start()
+        threads.append(thread)
+        # 確保依序排入佇列
+        while sum(s["queued"] for s in scheduler.stats()["classes"].values()) < index + 1:
+            time.sleep(0.001)
+    scheduler.release("inventory")
+    for thread in threads:
+        thread.join()
+    return order
+
+
+class TestOCRScheduler:
+    """OCR 優先等級 / 公平分配 / 等待統計測試"""
+
+    def test_global_concurrency_limit(self):
+        scheduler = OCRScheduler(capacity=2)
+        active, peak, lock = [0], [0], threading.Lock()
+
+        def worker(priority):
+            assert scheduler.acquire(priority, timeout=5) is not None
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+            scheduler.release(priority)
+
+        threads = [threading.Thread(target=worker, args=(p,)) for p in ["date", "inventory", "batch", "job"] * 3]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert peak[0] == 2
+        assert scheduler.stats()["running"] == 0
+
+    def test_high_weight_class_goes_first(self):
+        # 一張貨架照片的 6 個 crop 已在排隊，之後才到的效期 OCR 仍先取得 slot
+        scheduler = OCRScheduler(capacity=1)
+        order = queue_behind_blocker(scheduler, [("inventory", "shelf")] * 6 + [("date", "expiry")])
+        assert order.index(6) <= 1
+
+    def test_low_weight_class_is_not_starved(self):
+        scheduler = OCRScheduler(capacity=1, weights={"inventory": 1.0, "date": 4.0, "job": 1.0})
+        order = queue_behind_blocker(scheduler, [("job", "bg")] * 3 + [("date", "d")] * 12)
+        # 權重 4:1，job 約每 5 個 slot 取得 1 個
+        first_ten = order[:10]
+        assert sum(i < 3 for i in first_ten) == 2
+
+    def test_flows_share_fairly_within_class(self):
+        # 大貨架（8 個 crop）先排隊，小貨架（2 個 crop）後到，仍與大貨架輪流
+        scheduler = OCRScheduler(capacity=1)
+        order = queue_behind_blocker(scheduler, [("inventory", "big")] * 8 + [("inventory", "small")] * 2)
+        assert max(order.index(8), order.index(9)) <= 3
+
+    def test_timeout_and_abandon_leave_queue(self):
+        scheduler = OCRScheduler(capacity=1)
+        assert scheduler.acquire("inventory") is not None
+        assert scheduler.acquire("date", timeout=0.05) is None
+        started = time.monotonic()
+        cancelled = threading.Event()
+        threading.Timer(0.05, cancelled.set).start()
+        assert scheduler.acquire("batch", timeout=5, abandoned=cancelled.is_set) is None
+        assert time.monotonic() - started < 1
+        stats = scheduler.stats()["classes"]
+        assert stats["date"]["timeouts"] == 1 and stats["batch"]["timeouts"] == 1
+        assert stats["date"]["queued"] == 0 and stats["date"]["queued_flows"] == 0
+        scheduler.release("inventory")
+        assert scheduler.acquire("date", timeout=0.05) is not None
+
+    def test_wait_metrics_per_class(self):
+        scheduler = OCRScheduler(capacity=1)
+        assert scheduler.acquire("inventory") == pytest.approx(0, abs=0.01)
+        threading.Timer(0.1, scheduler.release, args=("inventory",)).start()
+        wait_s = scheduler.acquire("date", timeout=5)
+        assert wait_s >= 0.09
+        stats = scheduler.stats()
+        assert stats["classes"]["date"]["wait_ms"]["max"] >= 90
+        assert stats["classes"]["date"]["granted"] == 1 and stats["classes"]["date"]["running"] == 1
+        assert stats["classes"]["job"]["wait_ms"] is None
+
+    def test_weights_from_env_string(self):
+        weights = parse_class_weights("date=10, job=0.5")
+        assert weights["date"] == 10 and weights["job"] == 0.5 and weights["inventory"] == 4
+        with pytest.raises(ValueError):
+            parse_class_weights("date=0")
+        with pytest.raises(ValueError):
+            OCRScheduler(capacity=1).acquire("unknown")
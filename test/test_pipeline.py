@@ -0,0 +1,79 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+
+from utils.deadline import Deadline, DeadlineExceeded, RequestCancelled
+from utils.pipeline import Pipeline, Stage
+
+
+def _sleepy(delay, func=lambda x: x):
+    def run(batch):
+        time.sleep(delay)
+        return [func(item) for item in batch]
+    return run
+
+
+class TestPipeline:
+    """多階段 pipeline 測試"""
+
+    def test_results_and_fan_out(self):
+        pipeline = Pipeline([
+            Stage("double", lambda batch: [x * 2 for x in batch], workers=2),
+            Stage("fan_out", lambda batch: [y for x in batch for y in (x, x + 1)], workers=3),
+            Stage("square", lambda batch: [x * x for x in batch]),
+        ])
+        results = pipeline.run(range(10))
+        expected = [y * y for x in range(10) for y in (2 * x, 2 * x + 1)]
+        assert sorted(results) == sorted(expected)
+        assert pipeline.stats["fan_out"]["items_out"] == 20
+
+    def test_empty_input(self):
+        assert Pipeline([Stage("noop", lambda batch: batch)]).run([]) == []
+
+    def test_batching(self):
+        sizes = []
+
+        def record(batch):
+            sizes.append(len(batch))
+            return batch
+
+        pipeline = Pipeline([Stage("batch", record, batch_size=4, batch_timeout=0.2)], queue_size=16)
+        assert sorted(pipeline.run(range(10))) == list(range(10))
+        assert max(sizes) <= 4
+        assert pipeline.stats["batch"]["batches"] < 10
+
+    def test_stages_overlap(self):
+        pipeline = Pipeline([Stage("a", _sleepy(0.05)), Stage("b", _sleepy(0.05))])
+        started = time.perf_counter()
+        pipeline.run(range(10))
+        # 循序執行需 1.0s，兩個 stage 重疊約 0.55s
+        assert time.perf_counter() - started < 0.85
+
+    def test_stage_error_propagates(self):
+        def explode(batch):
+            if 3 in batch:
+                raise ValueError("bad item")
+            return batch
+
+        pipeline = Pipeline([Stage("first", _sleepy(0.01)), Stage("explode", explode, workers=2)], queue_size=2)
+        with pytest.raises(ValueError):
+            pipeline.run(range(100))
+        assert not [t for t in threading.enumerate() if t.name.startswith("pipeline-explode")]
+
+    def test_deadline_exceeded(self):
+        pipeline = Pipeline([Stage("slow", _sleepy(0.05))])
+        started = time.perf_counter()
+        with pytest.raises(DeadlineExceeded):
+            pipeline.run(range(50), Deadline(0.1))
+        assert time.perf_counter() - started < 1.0
+
+    def test_cancelled(self):
+        deadline = Deadline()
+        deadline.cancel("client disconnected")
+        with pytest.raises(RequestCancelled):
+            Pipeline([Stage("any", lambda batch: batch)]).run(range(5), deadline)
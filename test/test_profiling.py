@@ -0,0 +1,98 @@
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+import pytest
+
+from utils.profiling import ProfileStore, parse_profile_modes, profile_request, valid_profile_id
+
+
+def busy_loop(seconds):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += sum(range(200))
+    return total
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ProfileStore(str(tmp_path / "profiles"), max_profiles=3)
+
+
+class TestProfileOptions:
+    """X-Profile header 與 request id 檢查"""
+
+    def test_parse_modes(self):
+        assert parse_profile_modes("1") == ("cpu", "memory")
+        assert parse_profile_modes("all") == ("cpu", "memory")
+        assert parse_profile_modes("memory") == ("memory",)
+        assert parse_profile_modes("memory, cpu") == ("cpu", "memory")
+        assert parse_profile_modes("0") == ()
+        assert parse_profile_modes(None) == ()
+
+    def test_profile_id_is_safe_filename(self):
+        assert valid_profile_id("3f2a-req_01.b")
+        for bad in (None, "", "..", "../etc/passwd", "a/b", "x" * 65):
+            assert not valid_profile_id(bad)
+
+
+class TestProfileRequest:
+    """請求 profiling 與保存測試"""
+
+    def test_cpu_samples_current_thread(self, store):
+        with profile_request(store, "req-cpu", ("cpu",), interval_s=0.002) as attributes:
+            attributes["image_kb"] = 12
+            busy_loop(0.2)
+
+        profile = json.loads(Path(store.path("req-cpu")).read_text(encoding="utf-8"))
+        assert profile["samples"] > 10
+        assert profile["attributes"] == {"image_kb": 12}
+        assert profile["cpu_s"] > 0.1 and profile["error"] is None
+        assert any("busy_loop" in f["function"] and f["total_pct"] > 50 for f in profile["top_functions"][:3])
+        folded = Path(store.path("req-cpu", "folded")).read_text(encoding="utf-8").splitlines()
+        # collapsed 格式：root;...;leaf 次數
+        assert sum(int(line.rsplit(" ", 1)[1]) for line in folded) == profile["samples"]
+        assert any("test_cpu_samples_current_thread" in line and "busy_loop" in line for line in folded)
+
+    def test_memory_snapshot_diff(self, store):
+        kept = []
+        was_tracing = tracemalloc.is_tracing()
+        with profile_request(store, "req-mem", ("memory",)):
+            kept.append(np.ones(4 << 20, dtype=np.uint8))
+        assert tracemalloc.is_tracing() == was_tracing
+
+        profile = json.loads(Path(store.path("req-mem")).read_text(encoding="utf-8"))
+        assert store.path("req-mem", "folded") is None
+        top = profile["memory"]["top_allocations"][0]
+        assert top["size_diff_kb"] >= 4096
+        assert any("test_profiling.py" in frame for frame in [top["location"], *top["callers"]])
+
+    def test_saved_on_error(self, store):
+        with pytest.raises(RuntimeError):
+            with profile_request(store, "req-err", ("cpu",)):
+                raise RuntimeError("boom")
+        assert store.list()[0]["error"] == "RuntimeError"
+
+    def test_store_prunes_oldest(self, store):
+        for i in range(5):
+            store.save({"id": f"p{i}", "created_at": f"2026-01-01T00:00:0{i}"}, folded="main 1")
+            time.sleep(0.01)
+        assert [p["id"] for p in store.list()] == ["p4", "p3", "p2"]
+        assert store.path("p0") is None and store.path("p0", "folded") is None
+        assert store.path("../p4") is None and store.path("p4", "txt") is None
+        with pytest.raises(ValueError):
+            store.save({"id": "../escape"})
+
+    def test_reserve_refuses_existing_and_in_flight_ids(self, store):
+        assert store.reserve("req-1")
+        assert not store.reserve("req-1")  # 執行中
+        store.save({"id": "req-1", "created_at": "2026-01-01T00:00:00"})
+        assert not store.reserve("req-1")  # 已保存
+        assert not store.reserve("../escape")
+        assert store.reserve("req-2")
@@ -0,0 +1,244 @@
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import httpx
+import pytest
+import uvicorn
+
+from benchmarks.stub_server import StubConfig, create_app
+from conftest import shelf_image_base64
+from utils.deadline import Deadline, RequestCancelled
+from utils.ocr_backends import OllamaGLMBackend
+from utils.resilience import (CircuitBreaker, CircuitOpenError, HedgeStats, LatencyTracker, hedge_delay,
+                              hedged_call)
+
+
+class TestCircuitBreaker:
+    """斷路器狀態轉換測試"""
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout_s=60)
+        for _ in range(2):
+            breaker.record_failure()
+        breaker.record_success()  # 成功會重新計算
+        for _ in range(3):
+            assert breaker.allow()
+            breaker.record_failure()
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            breaker.check()
+        assert breaker.describe()["rejected"] == 1
+
+    def test_half_open_allows_single_probe(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout_s=0.05)
+        breaker.record_failure()
+        assert not breaker.allow()
+        time.sleep(0.06)
+        assert breaker.state == "half_open"
+        assert breaker.allow()
+        assert not breaker.allow()  # 試探請求進行中
+        breaker.record_failure()  # 試探失敗，重新開啟
+        assert breaker.state == "open" and not breaker.allow()
+        time.sleep(0.06)
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.state == "closed" and breaker.allow()
+
+    def test_released_probe_can_be_retried(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout_s=0)
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.release_probe()  # 例如請求期限已到
+        assert breaker.allow()
+
+
+class TestHedgedCall:
+    """hedged request 測試"""
+
+    @pytest.fixture
+    def pool(self):
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            yield pool
+
+    def test_slow_primary_is_hedged(self, pool):
+        delays = iter([1.0, 0.01])
+        stats = HedgeStats()
+
+        def call():
+            delay = next(delays)
+            time.sleep(delay)
+            return delay
+
+        started = time.perf_counter()
+        assert hedged_call(pool, call, delay_s=0.05, stats=stats) == 0.01
+        assert time.perf_counter() - started < 0.5
+        assert stats.describe() == {"hedged": 1, "hedge_won": 1}
+
+    def test_fast_primary_is_not_hedged(self, pool):
+        stats = HedgeStats()
+        assert hedged_call(pool, lambda: "ok", delay_s=0.5, stats=stats) == "ok"
+        assert stats.hedged == 0
+
+    def test_failed_primary_retries_immediately(self, pool):
+        calls = []
+
+        def call():
+            calls.append(time.perf_counter())
+            if len(calls) == 1:
+                raise ConnectionError("down")
+            return "ok"
+
+        started = time.perf_counter()
+        assert hedged_call(pool, call, delay_s=5, retryable=lambda e: isinstance(e, ConnectionError)) == "ok"
+        assert time.perf_counter() - started < 1
+
+        with pytest.raises(ValueError):
+            hedged_call(pool, lambda: (_ for _ in ()).throw(ValueError("bad input")), delay_s=5,
+                        retryable=lambda e: isinstance(e, ConnectionError))
+
+    def test_no_hedge_without_capacity(self, pool):
+        stats = HedgeStats()
+        assert hedged_call(pool, lambda: time.sleep(0.1) or "slow", delay_s=0.01, can_hedge=lambda: False,
+                           stats=stats) == "slow"
+        assert stats.hedged == 0
+
+    def test_hedge_delay_needs_samples(self):
+        tracker = LatencyTracker(min_samples=5)
+        for latency in (0.1, 0.1, 0.1, 0.1):
+            tracker.record(latency)
+        assert hedge_delay(tracker, 0.95) is None
+        tracker.record(1.0)
+        assert 0.1 < hedge_delay(tracker, 0.95) <= 1.0
+        assert hedge_delay(tracker, 0) is None
+        assert hedge_delay(LatencyTracker(min_samples=1), 0.5) is None
+
+
+@pytest.fixture(scope="module")
+def stub():
+    """故障注入的 OCR / LLM 替身 server（benchmarks/stub_server.py）"""
+    config = StubConfig(ocr_latency_ms=20, llm_latency_ms=20, sigma=0.1, ocr_parallel=4, llm_parallel=2, hang_s=2.0)
+    server = uvicorn.Server(uvicorn.Config(create_app(config), host="127.0.0.1", port=0, log_level="warning",
+                                           timeout_graceful_shutdown=1))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    yield f"127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+def set_faults(host, kind="ocr", **faults):
+    httpx.post(f"http://{host}/faults", json={kind: {"error_rate": 0, "hang_rate": 0, "hang_next": 0,
+                                                     "fail_next": 0, **faults}}).raise_for_status()
+
+
+class TestOllamaBackendAgainstStub:
+    """以故障注入替身測試 OCR backend 的逾時、hedged request 與斷路器"""
+
+    def test_hung_call_is_hedged(self, stub):
+        set_faults(stub)
+        backend = OllamaGLMBackend(host=stub, max_concurrency=2, timeout=5, retries=0)
+        for _ in range(backend.latency.min_samples):
+            backend.recognize("img")
+        set_faults(stub, hang_next=1)
+        started = time.perf_counter()
+        assert backend.recognize("img") == StubConfig.ocr_text
+        assert time.perf_counter() - started < 1
+        assert backend.hedge_stats.describe() == {"hedged": 1, "hedge_won": 1}
+        # 卡住的請求在背景跑完才釋放 slot
+        assert backend.scheduler.stats()["running"] == 1
+
+    def test_per_call_timeout(self, stub):
+        set_faults(stub, hang_next=1)
+        backend = OllamaGLMBackend(host=stub, timeout=0.3, retries=0, hedge_quantile=0)
+        started = time.perf_counter()
+        with pytest.raises(httpx.TimeoutException):
+            backend.recognize("img")
+        assert time.perf_counter() - started < 1
+        assert backend.breaker.describe()["consecutive_failures"] == 1
+
+    def test_cancel_aborts_in_flight_call(self, stub):
+        set_faults(stub, hang_next=1)
+        backend = OllamaGLMBackend(host=stub, timeout=5, retries=0, hedge_quantile=0)
+        deadline = Deadline(10)
+        threading.Timer(0.2, deadline.cancel, args=("client disconnected",)).start()
+        started = time.perf_counter()
+        with pytest.raises(RequestCancelled):
+            backend.recognize("img", deadline)
+        assert time.perf_counter() - started < 1
+        # slot 立即釋放，取消也不計入斷路器
+        assert backend.scheduler.stats()["running"] == 0
+        assert backend.breaker.describe()["consecutive_failures"] == 0
+
+    def test_breaker_fails_fast_and_recovers(self, stub):
+        set_faults(stub, error_rate=1.0)
+        backend = OllamaGLMBackend(host=stub, retries=0, hedge_quantile=0, breaker_failures=3, breaker_reset_s=0.2)
+        for _ in range(3):
+            with pytest.raises(httpx.HTTPStatusError):
+                backend.recognize("img")
+        started = time.perf_counter()
+        with pytest.raises(CircuitOpenError):
+            backend.recognize("img")
+        assert time.perf_counter() - started < 0.05
+        assert backend.breaker.state == "open"
+
+        set_faults(stub)
+        time.sleep(0.25)
+        assert backend.recognize("img") == StubConfig.ocr_text
+        assert backend.breaker.state == "closed"
+
+
+class TestLLMAgainstStub:
+    """以故障注入替身測試 answer_question 的斷路器、模板回答與 hedged request"""
+
+    COUNTS = {"茶裏王白毫烏龍": 1, "光泉鮮乳": 1}
+
+    @pytest.fixture
+    def service(self, inventory_service, stub, monkeypatch):
+        from openai import OpenAI
+
+        set_faults(stub, "llm")
+        monkeypatch.setattr(inventory_service, "client",
+                            OpenAI(base_url=f"http://{stub}/v1", api_key="no-key-needed", max_retries=0))
+        yield inventory_service
+        set_faults(stub, "llm")
+
+    def test_breaker_opens_after_failures(self, service, stub):
+        set_faults(stub, "llm", error_rate=1.0)
+        template = service.format_counts_answer(self.COUNTS)
+        for _ in range(3):
+            assert service.answer_question(self.COUNTS, "統計商品", Deadline()) == (template, "InternalServerError")
+        assert service.llm_breaker.state == "open"
+        requests = httpx.get(f"http://{stub}/stats").json()["requests"]
+        started = time.perf_counter()
+        assert service.answer_question(self.COUNTS, "統計商品", Deadline()) == (template, "circuit_open")
+        assert time.perf_counter() - started < 0.05
+        assert httpx.get(f"http://{stub}/stats").json()["requests"] == requests
+
+    def test_inventory_falls_back_to_template_when_open(self, service, stub):
+        for _ in range(3):
+            service.llm_breaker.record_failure()
+        request = service.Base64ImageRequest(image_base64=shelf_image_base64())
+        result = service.run_inventory(request)
+        assert result == {"status": 1, "data": service.format_counts_answer(self.COUNTS)}
+        assert service.llm_breaker.describe()["rejected"] == 1
+        # 模板回答不保存，斷路器恢復後重新詢問 LLM
+        assert len(service.result_cache) == 0
+
+    def test_hung_call_is_hedged(self, service, stub, monkeypatch):
+        monkeypatch.setattr(service, "LLM_HEDGE_QUANTILE", 0.95)
+        for _ in range(service.llm_latency.min_samples):
+            assert service.answer_question(self.COUNTS, "統計商品", Deadline())[1] is None
+        set_faults(stub, "llm", hang_next=1)
+        started = time.perf_counter()
+        answer, fallback = service.answer_question(self.COUNTS, "統計商品", Deadline())
+        assert fallback is None and answer.endswith("光泉鮮乳 有 1 瓶")
+        assert time.perf_counter() - started < 1
+        assert service.llm_hedge_stats.describe() == {"hedged": 1, "hedge_won": 1}
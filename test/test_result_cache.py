@@ -0,0 +1,121 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.result_cache import ResultCache, result_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResultCache:
+    """整個請求結果快取測試"""
+
+    def test_key_covers_image_question_and_catalog(self):
+        key = result_key(b"jpeg-bytes", "請統計商品", 3)
+        assert key == result_key(b"jpeg-bytes", "請統計商品", 3)
+        assert key != result_key(b"jpeg-bytez", "請統計商品", 3)
+        assert key != result_key(b"jpeg-bytes", "有幾瓶茶裏王？", 3)
+        assert key != result_key(b"jpeg-bytes", "請統計商品", 4)
+
+    def test_ttl_expires_entries(self):
+        clock = FakeClock()
+        cache = ResultCache(max_entries=4, ttl_s=10, clock=clock)
+        cache.put("a", {"status": 1, "data": "茶裏王 有 1 瓶"})
+        clock.now = 9.9
+        assert cache.get("a") == {"status": 1, "data": "茶裏王 有 1 瓶"}
+        clock.now = 10.0
+        assert cache.get("a") is None
+        stats = cache.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1 and stats["expired"] == 1 and stats["entries"] == 0
+
+    def test_lru_bound(self):
+        cache = ResultCache(max_entries=2, ttl_s=60)
+        cache.put("a", {"data": "a"})
+        cache.put("b", {"data": "b"})
+        assert cache.get("a") is not None  # a 最近使用，淘汰 b
+        cache.put("c", {"data": "c"})
+        assert len(cache) == 2 and cache.get("b") is None
+        assert cache.stats()["evictions"] == 1
+
+    def test_invalidate_clears_everything(self):
+        cache = ResultCache()
+        cache.put("a", {"data": "a"})
+        cache.put("b", {"data": "b"})
+        assert cache.invalidate() == 2
+        assert cache.get("a") is None and len(cache) == 0
+
+    def test_returned_result_is_a_copy(self):
+        cache = ResultCache()
+        result = {"status": 1, "data": "a"}
+        cache.put("a", result)
+        result["data"] = "changed"
+        cache.get("a")["profile_id"] = "x"
+        assert cache.get("a") == {"status": 1, "data": "a"}
+
+    def test_get_or_compute_coalesces_concurrent_calls(self):
+        cache = ResultCache()
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {"data": "a"}, True
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+        follower.start()
+        time.sleep(0.05)
+        release.set()
+        leader.join()
+        follower.join()
+        assert len(calls) == 1
+        assert sorted(source for _, source in results) == ["coalesced", "computed"]
+        assert all(result == {"data": "a"} for result, _ in results)
+        assert cache.get_or_compute("k", compute) == ({"data": "a"}, "hit")
+        assert cache.stats()["in_flight"] == 0
+
+    def test_uncacheable_or_failed_result_is_recomputed(self):
+        cache = ResultCache()
+        outcomes = [RuntimeError("boom"), ({"data": "degraded"}, False), ({"data": "a"}, True)]
+
+        def compute():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        with pytest.raises(RuntimeError):
+            cache.get_or_compute("k", compute)
+        assert cache.get_or_compute("k", compute) == ({"data": "degraded"}, "computed")
+        assert cache.get_or_compute("k", compute) == ({"data": "a"}, "computed")
+        assert cache.get("k") == {"data": "a"} and cache.stats()["in_flight"] == 0
+
+    def test_waiter_gives_up_when_abandoned(self):
+        cache = ResultCache()
+        release = threading.Event()
+        leader = threading.Thread(target=cache.get_or_compute,
+                                  args=("k", lambda: (release.wait(5), ({"data": "a"}, True))[1]))
+        leader.start()
+        while not cache.stats()["in_flight"]:
+            time.sleep(0.01)
+        started = time.monotonic()
+        result = cache.get_or_compute("k", lambda: ({"data": "own"}, False), timeout=0.1)
+        assert result == ({"data": "own"}, "computed") and time.monotonic() - started < 1
+        release.set()
+        leader.join()
@@ -0,0 +1,192 @@
+import sys
+import threading
+from datetime import date, datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+
+from utils.scan_history import ScanHistory
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = ScanHistory(str(tmp_path / "history"), flush_rows=1000)
+    history.record("A01", {"茶裏王白毫烏龍": 3, "未知商品": 1}, 120.0, "inventory", unknown=1,
+                   ts=datetime(2026, 10, 1, 9, 0))
+    history.record("A01", {"茶裏王白毫烏龍": 2}, 80.0, "inventory", ts=datetime(2026, 10, 1, 15, 0))
+    history.record("B02", {"茶裏王白毫烏龍": 5, "原萃綠茶": 4}, 200.0, "batch", ts=datetime(2026, 10, 2, 10, 0))
+    history.record("A01", {"原萃綠茶": 1}, 100.0, "inventory", ts=datetime(2026, 11, 1, 10, 0))
+    return history
+
+
+def _by(rows, *keys):
+    return {tuple(row[k] for k in keys): row for row in rows}
+
+
+class TestScanHistory:
+    """Parquet 掃描歷史測試"""
+
+    def test_counts_per_day_for_store_and_sku(self, history):
+        history.flush()
+        rows = history.query_counts(date(2026, 10, 1), date(2026, 10, 31), stores=["A01"],
+                                    skus=["茶裏王白毫烏龍"], group_by=("sku",), interval="1d")
+        assert len(rows) == 1
+        assert rows[0]["period"] == datetime(2026, 10, 1)
+        assert rows[0]["count"] == 5
+        assert rows[0]["scans"] == 2
+
+    def test_buffered_rows_are_queryable(self, history):
+        # 尚未 flush 的資料也要查得到，flush 後結果不變
+        before = history.query_counts(group_by=("sku",))
+        history.flush()
+        assert history.query_counts(group_by=("sku",)) == before
+        assert _by(before, "sku")[("茶裏王白毫烏龍",)]["count"] == 10
+
+    def test_hive_partition_layout(self, history, tmp_path):
+        history.record("台北 信義/店", {"原萃綠茶": 1}, 50.0, "inventory", ts=datetime(2026, 10, 3))
+        history.flush()
+        root = tmp_path / "history" / "counts"
+        assert sorted(p.name for p in root.iterdir()) == [
+            "date=2026-10-01", "date=2026-10-02", "date=2026-10-03", "date=2026-11-01"]
+        rows = history.query_counts(stores=["台北 信義/店"], group_by=("store",))
+        assert rows == [{"store": "台北 信義/店", "count": 1, "scans": 1}]
+
+    def test_scan_metrics(self, history):
+        history.flush()
+        rows = _by(history.query_scans(end=date(2026, 10, 31), group_by=("store",)), "store")
+        assert rows[("A01",)]["scans"] == 2
+        assert rows[("A01",)]["bottles"] == 6
+        assert rows[("A01",)]["unknown_rate"] == pytest.approx(1 / 6, abs=1e-4)
+        assert rows[("A01",)]["latency_mean_ms"] == 100.0
+        assert rows[("B02",)]["unknown_rate"] == 0.0
+
+    def test_totals_without_grouping(self, history):
+        assert history.query_scans(group_by=())[0]["scans"] == 4
+
+    def test_compact_merges_closed_partitions(self, history, tmp_path):
+        history.flush()
+        history.record("A01", {"原萃綠茶": 2}, 90.0, "inventory", ts=datetime(2026, 10, 1, 18, 0))
+        history.flush()
+        partition = tmp_path / "history" / "counts" / "date=2026-10-01"
+        assert len(list(partition.glob("*.parquet"))) == 2
+        before = history.query_counts(group_by=("store", "sku"))
+
+        # 只有 10/01 分區（scans / counts 各一）有多個檔案
+        assert history.compact() == 2
+        assert len(list(partition.glob("*.parquet"))) == 1
+        assert history.query_counts(group_by=("store", "sku")) == before
+
+    def test_compact_day_threshold(self, history, tmp_path):
+        day = date(2026, 10, 2)
+        for hour in range(3):
+            history.record("B02", {"原萃綠茶": 1}, 90.0, "batch", ts=datetime(2026, 10, 2, hour))
+            history.flush()
+        partition = tmp_path / "history" / "scans" / "date=2026-10-02"
+        assert history.compact(day, min_files=5) == 0
+        assert history.compact(day, min_files=3) == 2
+        assert len(list(partition.glob("*.parquet"))) == 1
+        assert history.query_scans(start=day, end=day)[0]["scans"] == 4
+
+    def test_query_does_not_block_writers(self, history, monkeypatch):
+        history.flush()
+        collecting, release = threading.Event(), threading.Event()
+        aggregate = ScanHistory._aggregate
+
+        def slow_aggregate(frame, keys, aggs):
+            collecting.set()
+            release.wait(5)
+            return aggregate(frame, keys, aggs)
+
+        monkeypatch.setattr(ScanHistory, "_aggregate", staticmethod(slow_aggregate))
+        rows = []
+        query = threading.Thread(target=lambda: rows.extend(history.query_scans(group_by=())))
+        query.start()
+        collecting.wait(5)
+        # 查詢 collect 期間仍可寫入與 flush
+        flushed = []
+        writer = threading.Thread(target=lambda: (
+            history.record("C03", {"原萃綠茶": 1}, 50.0, "inventory", ts=datetime(2026, 10, 3, 9, 0)),
+            flushed.append(history.flush())))
+        writer.start()
+        writer.join(1)
+        assert flushed == [1]
+        release.set()
+        query.join()
+        assert rows[0]["scans"] == 4
+        monkeypatch.undo()
+        assert history.query_scans(group_by=())[0]["scans"] == 5
+
+    def test_full_buffer_flushes_on_background_thread(self, tmp_path, monkeypatch):
+        history = ScanHistory(str(tmp_path / "history"), flush_rows=2, flush_interval_s=60)
+        writing, release = threading.Event(), threading.Event()
+        write_partition = ScanHistory._write_partition
+
+        def slow_write(self, table, day, frame):
+            writing.set()
+            release.wait(5)
+            return write_partition(self, table, day, frame)
+
+        monkeypatch.setattr(ScanHistory, "_write_partition", slow_write)
+        history.start()
+        try:
+            ts = datetime(2026, 10, 1, 9, 0)
+            history.record("A01", {"原萃綠茶": 1}, 50.0, "inventory", ts=ts)
+            # 填滿暫存區的請求只喚醒背景 thread，不等待寫檔
+            recorder = threading.Thread(target=lambda: history.record("A01", {"原萃綠茶": 2}, 50.0, "inventory", ts=ts))
+            recorder.start()
+            recorder.join(1)
+            assert not recorder.is_alive()
+            assert writing.wait(5)
+            # 寫檔期間仍可寫入與查詢，寫到一半的資料只算一次
+            other = threading.Thread(target=lambda: history.record("B02", {"原萃綠茶": 3}, 50.0, "inventory", ts=ts))
+            other.start()
+            other.join(1)
+            assert not other.is_alive()
+            rows = []
+            query = threading.Thread(target=lambda: rows.extend(history.query_counts(group_by=())))
+            query.start()
+            query.join(1)
+            assert not query.is_alive()
+            assert rows[0]["count"] == 6
+        finally:
+            release.set()
+            history.stop()
+        monkeypatch.undo()
+        assert history.query_counts(group_by=())[0]["count"] == 6
+        assert len(list((tmp_path / "history" / "counts" / "date=2026-10-01").glob("*.parquet"))) == 2
+
+    def test_failed_flush_keeps_rows(self, history, monkeypatch):
+        def failing_write(self, table, day, frame):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(ScanHistory, "_write_partition", failing_write)
+        with pytest.raises(OSError):
+            history.flush()
+        assert history.query_scans(group_by=())[0]["scans"] == 4
+        monkeypatch.undo()
+        assert history.flush() == 4
+        assert history.query_scans(group_by=())[0]["scans"] == 4
+
+    def test_compaction_waits_for_queries(self, history, tmp_path):
+        history.flush()
+        history.record("A01", {"原萃綠茶": 2}, 90.0, "inventory", ts=datetime(2026, 10, 1, 18, 0))
+        history.flush()
+        with history._read_lock():
+            # 查詢中：不等待的合併直接略過，檔案不被刪除
+            assert history.compact() == 0
+            merged = []
+            waiting = threading.Thread(target=lambda: merged.append(history.compact(wait=True)))
+            waiting.start()
+            waiting.join(0.2)
+            assert waiting.is_alive()
+        waiting.join(5)
+        assert merged == [2]
+        assert len(list((tmp_path / "history" / "counts" / "date=2026-10-01").glob("*.parquet"))) == 1
+
+    def test_invalid_grouping(self, history):
+        with pytest.raises(ValueError):
+            history.query_counts(group_by=("source",))
+        with pytest.raises(ValueError):
+            history.query_scans(interval="1s")
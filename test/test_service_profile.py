@@ -0,0 +1,61 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).parent.parent
+
+_CHECK = """
+import json, sys
+import service
+from fastapi.testclient import TestClient
+with TestClient(service.app) as client:
+    root = client.get("/").json()
+    db = client.get("/db/list").status_code
+    routes = sorted(client.get("/openapi.json").json()["paths"])
+heavy = [m for m in ("torch", "ultralytics", "sentence_transformers", "chromadb", "openai", "polars",
+                   "cv2", "numpy", "PIL", "rapidfuzz") if m in sys.modules]
+print("@@" + json.dumps({"root": root, "db": db, "heavy": heavy, "routes": routes}))
+"""
+
+
+def _run(profile: str, code: str = _CHECK):
+    env = {**os.environ, "SERVICE_PROFILE": profile, "TRACE_EXPORTER": "none", "DEBUG_SAVE": "0",
+           "LLAMA_SERVER_AUTOSTART": "0"}
+    return subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, env=env, capture_output=True,
+                          text=True, timeout=120)
+
+
+class TestServiceProfile:
+    """SERVICE_PROFILE=date 輕量啟動測試"""
+
+    def test_date_profile_skips_inventory(self):
+        proc = _run("date")
+        lines = [line for line in proc.stdout.splitlines() if line.startswith("@@")]
+        assert lines, proc.stderr
+        result = json.loads(lines[0][2:])
+        assert result["heavy"] == []
+        assert result["root"]["profile"] == "date"
+        assert result["db"] == 404
+        assert "/glm_ocr_inference_base64" in result["routes"]
+        assert not any(path.startswith(("/inventory", "/db", "/jobs", "/history")) for path in result["routes"])
+
+    def test_invalid_profile(self):
+        proc = _run("inventory-only", "import service")
+        assert proc.returncode != 0
+        assert "SERVICE_PROFILE" in proc.stderr
+
+    def test_full_profile_registers_inventory_routes(self):
+        # 不進入 lifespan（不載入模型），只檢查 OpenAPI 中的路由
+        code = ("import json, service\n"
+                "from fastapi.testclient import TestClient\n"
+                "paths = TestClient(service.app).get('/openapi.json').json()['paths']\n"
+                "print('@@' + json.dumps(sorted(paths)))")
+        proc = _run("full", code)
+        lines = [line for line in proc.stdout.splitlines() if line.startswith("@@")]
+        assert lines, proc.stderr
+        paths = json.loads(lines[0][2:])
+        for path in ("/inventory_base64", "/inventory_batch_base64", "/db/add", "/jobs/inventory",
+                     "/glm_ocr_inference_base64"):
+            assert path in paths
@@ -0,0 +1,96 @@
+import hashlib
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+import pytest
+
+from utils.text_verifier import TextVerifier, item_prompts
+
+CATALOG = {
+    "茶裏王白毫烏龍": {"brand": "茶裏王", "flavor": "白毫烏龍", "color": "褐色"},
+    "原萃綠茶": {"brand": "原萃", "flavor": "綠茶", "color": "綠色"},
+    "御茶園特上紅茶": {"brand": "御茶園", "flavor": "特上紅茶", "color": ""},
+}
+
+
+class FakeTextEncoder:
+    """每句描述對應一個固定的隨機向量，記錄被要求編碼的句子"""
+
+    def __init__(self, dim=64):
+        self.dim = dim
+        self.encoded = []
+
+    def __call__(self, texts):
+        self.encoded.extend(texts)
+        return np.stack([self.vector(text) for text in texts])
+
+    def vector(self, text):
+        seed = int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
+        return np.random.default_rng(seed).normal(size=self.dim).astype(np.float32)
+
+
+@pytest.fixture
+def encoder():
+    return FakeTextEncoder()
+
+
+@pytest.fixture
+def verifier(encoder):
+    verifier = TextVerifier(encoder, max_image_distance=0.35)
+    verifier.refresh(list(CATALOG), list(CATALOG.values()), version=1)
+    return verifier
+
+
+def _image_like(verifier, item_id, noise=0.05, seed=0):
+    """與某商品文字向量相近的影像向量"""
+    base = verifier.matrix[verifier.ids.index(item_id)]
+    return base + np.random.default_rng(seed).normal(scale=noise, size=base.shape).astype(np.float32)
+
+
+class TestTextVerifier:
+    """CLIP 文字向量驗證測試"""
+
+    def test_prompts_use_brand_flavor_color(self):
+        assert item_prompts(CATALOG["原萃綠茶"]) == ["原萃綠茶", "一瓶原萃綠茶飲料", "綠色瓶身的原萃綠茶"]
+        assert len(item_prompts(CATALOG["御茶園特上紅茶"])) == 2
+
+    def test_refresh_encodes_only_new_prompts(self, verifier, encoder):
+        assert len(encoder.encoded) == 8
+        assert verifier.matrix.shape == (3, encoder.dim)
+        np.testing.assert_allclose(np.linalg.norm(verifier.matrix, axis=1), 1.0, rtol=1e-5)
+
+        catalog = {**CATALOG, "麥香奶茶": {"brand": "麥香", "flavor": "奶茶", "color": "黃色"}}
+        assert verifier.refresh(list(catalog), list(catalog.values()), version=2) == 3
+        assert verifier.ids[-1] == "麥香奶茶" and verifier.version == 2
+        # 刪除商品不需重新計算
+        assert verifier.refresh(list(CATALOG), list(CATALOG.values()), version=3) == 0
+        assert len(verifier) == 3
+
+    def test_agreement_skips_ocr(self, verifier):
+        embeddings = np.stack([_image_like(verifier, "原萃綠茶"), _image_like(verifier, "茶裏王白毫烏龍", seed=1)])
+        evidence = verifier.verify(embeddings, [["原萃綠茶", "御茶園特上紅茶"], ["茶裏王白毫烏龍"]], [[0.1, 0.4], [0.2]])
+        assert [e.agree for e in evidence] == [True, True]
+        assert evidence[0].text_id == "原萃綠茶" and evidence[0].text_margin > 0
+
+    def test_disagreement_needs_ocr(self, verifier):
+        embedding = _image_like(verifier, "原萃綠茶")[None]
+        # 影像最近鄰是另一個商品
+        evidence = verifier.verify(embedding, [["茶裏王白毫烏龍", "原萃綠茶"]], [[0.1, 0.12]])[0]
+        assert not evidence.agree and evidence.text_id == "原萃綠茶"
+        # 文字一致但影像距離太遠
+        assert not verifier.verify(embedding, [["原萃綠茶"]], [[0.5]])[0].agree
+
+    def test_margin_threshold(self, verifier):
+        embedding = _image_like(verifier, "原萃綠茶")[None]
+        margin = verifier.verify(embedding, [["原萃綠茶"]], [[0.1]])[0].text_margin
+        verifier.min_margin = margin + 0.01
+        assert not verifier.verify(embedding, [["原萃綠茶"]], [[0.1]])[0].agree
+
+    def test_empty_catalog(self, encoder):
+        verifier = TextVerifier(encoder)
+        verifier.refresh([], [], version=0)
+        evidence = verifier.verify(np.ones((1, encoder.dim)), [[]], [[]])
+        assert len(evidence) == 1 and not evidence[0].agree
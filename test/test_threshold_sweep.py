@@ -0,0 +1,94 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+
+from benchmarks.threshold_sweep import parse_range, prepare, sweep
+
+CATALOG_IDS = ["茶裏王白毫烏龍", "原萃台灣青茶", "冷山茶王"]
+CATALOG_EMB = np.eye(3, 4, dtype=np.float32)
+
+
+def _records_and_embeddings():
+    records = [
+        # CLIP 很近、OCR 正確
+        {"label": "茶裏王白毫烏龍", "ocr_text": "茶裏王 白毫烏龍", "yolo_conf": 0.9},
+        # CLIP 較遠、OCR 正確
+        {"label": "原萃台灣青茶", "ocr_text": "原萃 台灣青茶", "yolo_conf": 0.85},
+        # YOLO 信心值低
+        {"label": "冷山茶王", "ocr_text": "冷山茶王", "yolo_conf": 0.5},
+    ]
+    embeddings = np.array([
+        [1.0, 0.05, 0.0, 0.0],
+        [0.8, 1.0, 0.0, 0.0],
+        [0.0, 0.0, 1.0, 0.0],
+    ], dtype=np.float32)
+    return records, embeddings
+
+
+class TestParseRange:
+    """門檻範圍解析測試"""
+
+    def test_inclusive_range(self):
+        assert parse_range("0.1:0.3:0.1").tolist() == [0.1, 0.2, 0.3]
+
+    def test_list(self):
+        assert parse_range("50,60").tolist() == [50.0, 60.0]
+
+
+class TestSweep:
+    """向量化門檻掃描測試"""
+
+    def setup_method(self):
+        records, embeddings = _records_and_embeddings()
+        self.prep = prepare(records, embeddings, CATALOG_IDS, CATALOG_EMB)
+
+    def test_prepare_picks_nearest_and_fuzzy(self):
+        assert self.prep["nn"].tolist() == [0, 1, 2]
+        assert self.prep["fz"].tolist() == [0, 1, 2]
+        assert self.prep["label"].tolist() == [0, 1, 2]
+
+    def test_ocr_only_matches_current_service(self):
+        # cosine 門檻 0：每個 crop 都跑 OCR；fuzzy_clip 0.15 只放行第一個
+        m = sweep(self.prep, [0.8], [0.0], [50], [0.15])
+        assert m["ocr_share"][0, 0, 0, 0] == 2 / 3
+        assert m["recall"][0, 0, 0, 0] == 1 / 3
+        assert m["precision"][0, 0, 0, 0] == 1.0
+
+    def test_clip_shortcut_reduces_ocr(self):
+        m = sweep(self.prep, [0.4], [0.0, 0.5], [50], [0.15])
+        assert m["ocr_share"][0, 0, 0, 0] == 1.0
+        assert m["ocr_share"][0, 1, 0, 0] == 0.0
+        assert m["recall"][0, 1, 0, 0] == 1.0
+
+    def test_output_shape(self):
+        m = sweep(self.prep, [0.5, 0.8], [0.0, 0.1, 0.2], [40, 60], [0.1, 0.2, 0.3, 0.4])
+        assert m["precision"].shape == (2, 3, 2, 4)
+        assert np.all(m["unknown_rate"] >= 0)
+
+    def test_fuzzy_scores_match_service_index(self):
+        # 與 service 一樣經 FuzzyIndex：形近字「線→綠」「古→甘」正規化後完全相符
+        records = [{"label": "甘味綠茶", "ocr_text": "古味 線茶", "yolo_conf": 0.9}]
+        ids = CATALOG_IDS + ["甘味綠茶"]
+        emb = np.eye(4, 4, dtype=np.float32)
+        prep = prepare(records, np.eye(1, 4, 3, dtype=np.float32), ids, emb)
+        assert prep["fz"].tolist() == [3]
+        assert prep["fz_score"].tolist() == [100.0]
+
+    def test_fuzzy_uses_catalog_texts(self):
+        # 比對的是 brand+flavor 文字，回報的是對應的 id
+        records = [{"label": "item-b", "ocr_text": "原萃台灣青茶", "yolo_conf": 0.9}]
+        prep = prepare(records, np.eye(1, 4, 1, dtype=np.float32), ["item-a", "item-b", "item-c"],
+                       CATALOG_EMB, catalog_texts=CATALOG_IDS)
+        assert prep["fz"].tolist() == [1]
+        assert prep["label"].tolist() == [1]
+
+    def test_empty_ocr_text_never_confirms(self):
+        records = [{"label": "冷山茶王", "ocr_text": "  ", "yolo_conf": 0.9}]
+        prep = prepare(records, np.eye(1, 4, 2, dtype=np.float32), CATALOG_IDS, CATALOG_EMB)
+        assert prep["fz"].tolist() == [-1]
+        m = sweep(prep, [0.5], [0.0], [0], [1.0])
+        assert m["recall"][0, 0, 0, 0] == 0.0
+        assert m["unknown_rate"][0, 0, 0, 0] == 1.0
@@ -0,0 +1,92 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+
+from utils.tracing import JsonLinesFileSpanExporter, format_trace, load_spans, record_stage_timings, stage_timings
+
+
+def _make_tracer(tmp_path):
+    exporter = JsonLinesFileSpanExporter(str(tmp_path))
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    return provider.get_tracer("test"), exporter
+
+
+class TestJsonLinesFileSpanExporter:
+    """本地 JSON Lines exporter 測試"""
+
+    def test_writes_one_line_per_span(self, tmp_path):
+        tracer, exporter = _make_tracer(tmp_path)
+        with tracer.start_as_current_span("inventory_base64"):
+            with tracer.start_as_current_span("match_bottle") as span:
+                span.set_attribute("crop.index", 0)
+
+        spans = load_spans(exporter._current_path())
+        assert [s["name"] for s in spans] == ["match_bottle", "inventory_base64"]
+        assert spans[0]["attributes"]["crop.index"] == 0
+
+    def test_format_trace_nests_children(self, tmp_path):
+        tracer, exporter = _make_tracer(tmp_path)
+        with tracer.start_as_current_span("inventory_base64"):
+            with tracer.start_as_current_span("match_bottle"):
+                with tracer.start_as_current_span("ocr"):
+                    pass
+
+        lines = format_trace(load_spans(exporter._current_path())).splitlines()
+        assert lines[0].startswith("inventory_base64")
+        assert lines[1].startswith("  match_bottle")
+        assert lines[2].startswith("    ocr")
+
+
+class TestStageTimings:
+    """stage timings 累計測試"""
+
+    def test_collects_only_registered_trace(self):
+        provider = TracerProvider()
+        provider.add_span_processor(stage_timings)
+        tracer = provider.get_tracer("test")
+
+        with tracer.start_as_current_span("job") as span, record_stage_timings(span) as timings:
+            for _ in range(3):
+                with tracer.start_as_current_span("match_bottle"):
+                    pass
+            with tracer.start_as_current_span("llm.completion"):
+                pass
+        with tracer.start_as_current_span("other_request"):
+            with tracer.start_as_current_span("match_bottle"):
+                pass
+
+        assert set(timings) == {"match_bottle", "llm.completion"}
+        assert timings["match_bottle"]["count"] == 3
+        assert timings["llm.completion"]["total_ms"] >= 0
+
+
+class TestDefaultExporter:
+    """未設定 TRACE_EXPORTER 時只有啟動服務才寫 trace 檔"""
+
+    def test_file_exporter_only_when_service_starts(self, tmp_path):
+        code = (
+            "import os, service\n"
+            "from fastapi.testclient import TestClient\n"
+            "with service.tracer.start_as_current_span('import_only'):\n"
+            "    pass\n"
+            "print('@@', os.path.exists(os.environ['TRACE_DIR']))\n"
+            "with TestClient(service.app):\n"
+            "    with service.tracer.start_as_current_span('served'):\n"
+            "        pass\n"
+            "print('@@', os.path.exists(os.environ['TRACE_DIR']))\n"
+        )
+        env = {k: v for k, v in os.environ.items() if k != "TRACE_EXPORTER"}
+        env.update(TRACE_DIR=str(tmp_path / "traces"), SERVICE_PROFILE="date", LLAMA_SERVER_AUTOSTART="0")
+        proc = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).parent.parent, env=env,
+                              capture_output=True, text=True, timeout=120)
+        assert [line for line in proc.stdout.splitlines() if line.startswith("@@")] == ["@@ False", "@@ True"], \
+            proc.stderr
+        spans = load_spans(next((tmp_path / "traces").glob("spans-*.jsonl")))
+        assert [span["name"] for span in spans] == ["served"]
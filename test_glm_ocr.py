@@ -1,21 +1,9 @@
 import base64
 import glob
 import os
-import ollama
+from utils.ocr_backends import create_ocr_backend
 
-
-def glm_ocr_ollama(base64_image):
-    response = ollama.chat(
-        model="glm-ocr:q8_0",
-        messages=[
-            {
-                "role": "user",
-                "content": "Text Recognition:",
-                "images": [base64_image],
-            }
-        ],
-    )
-    return response["message"]["content"]
+ocr_backend = create_ocr_backend()
 
 
 def image_to_base64(image_path: str) -> str:
@@ -35,7 +23,7 @@ def main():
         label = os.path.basename(os.path.dirname(image_path))
         print(f"[{label}] {image_path}")
         b64 = image_to_base64(image_path)
-        result = glm_ocr_ollama(b64)
+        result = ocr_backend.recognize(b64)
         print(f"  OCR 結果: {result.strip()}")
         print()
 
@@ -1,7 +1,7 @@
 
 import base64
 import os
-import ollama
+from utils.ocr_backends import OllamaGLMBackend
 
 def encode_image(image_path):
     with open(image_path, "rb") as image_file:
@@ -11,24 +11,12 @@ def encode_image(image_path):
 
 
 
-def glm_ocr_ollama(base64_image):
-    response = ollama.chat(
-        model="glm-ocr:q8_0",
-        messages=[
-            {
-                "role": "user",
-                "content": "Text Recognition:",
-                "images": [base64_image],
-            }
-        ],
-    )
-
-    return response["message"]["content"]
+ocr_backend = OllamaGLMBackend()
 
 
 
 if __name__ == "__main__":
     image_path = "images/img_00001.jpg"
     base64_image = encode_image(image_path)
-    ocr_result = glm_ocr_ollama(base64_image)
+    ocr_result = ocr_backend.recognize(base64_image)
     print(f"OCR Result for {image_path}:\n{ocr_result}")
\ No newline at end of file
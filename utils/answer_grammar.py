@@ -0,0 +1,71 @@
+"""
+盤點回答的輸出限制。
+
+llama-server 的回答沒有長度與格式限制時，3B 模型偶爾會一路產生到 context 上限，成為最大的延遲離群值。
+AnswerGrammar 依掃描清單的商品名稱產生 GBNF 文法，只允許回答規則中的三種格式：
+
+- 統計：「根據掃描結果清單，以下是各商品的數量統計：」後接 1～N 行「[商品名稱] 有 [數量] 瓶」
+- 單一商品：「[商品名稱] 有 [數量] 瓶」
+- 找不到：「沒有找到您指定的商品」
+
+商品名稱只能是清單中的名稱。串流時以 is_complete() 判斷回答是否已完整（文法已無法再延伸成更長的合法回答），
+完整即關閉串流，不等模型自行結束；answer_token_budget() 依清單行數決定 max_tokens 上限。
+"""
+
+import re
+
+SUMMARY_HEADER = "根據掃描結果清單，以下是各商品的數量統計："
+NOT_FOUND = "沒有找到您指定的商品"
+COUNT_PATTERN = "[1-9][0-9]{0,3}"
+
+
+def _gbnf_literal(text: str) -> str:
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+
+
+def answer_token_budget(line_count: int, base_tokens: int = 32, tokens_per_line: int = 24) -> int:
+    """max_tokens：標題 base_tokens，加上每行「[商品名稱] 有 [數量] 瓶」tokens_per_line"""
+    return base_tokens + tokens_per_line * max(line_count, 1)
+
+
+class AnswerGrammar:
+    """names : 掃描清單中的商品名稱"""
+
+    def __init__(self, names):
+        self.names = list(dict.fromkeys(names))
+        name = "|".join(re.escape(n) for n in sorted(self.names, key=len, reverse=True))
+        line = f"(?:{name}) 有 {COUNT_PATTERN} 瓶" if self.names else None
+        n = len(self.names)
+        self._complete = [re.escape(NOT_FOUND)]
+        self._valid = [re.escape(NOT_FOUND)]
+        if line:
+            self._complete += [line, re.escape(SUMMARY_HEADER) + f"(?:\n{line}){{{n}}}"]
+            self._valid += [line, re.escape(SUMMARY_HEADER) + f"(?:\n{line}){{1,{n}}}"]
+        else:
+            self._complete.append(re.escape(SUMMARY_HEADER))
+            self._valid.append(re.escape(SUMMARY_HEADER))
+        self._complete = re.compile("|".join(self._complete))
+        self._valid = re.compile("|".join(self._valid))
+
+    @property
+    def gbnf(self) -> str:
+        """llama-server 的 grammar 參數"""
+        if not self.names:
+            return f"root ::= {_gbnf_literal(SUMMARY_HEADER)} | {_gbnf_literal(NOT_FOUND)}\n"
+        names = " | ".join(_gbnf_literal(n) for n in self.names)
+        return (
+            "root ::= summary | line | notfound\n"
+            f"summary ::= {_gbnf_literal(SUMMARY_HEADER)} (\"\\n\" line){{1,{len(self.names)}}}\n"
+            f"line ::= name {_gbnf_literal(' 有 ')} count {_gbnf_literal(' 瓶')}\n"
+            f"name ::= {names}\n"
+            "count ::= [1-9] [0-9]{0,3}\n"
+            f"notfound ::= {_gbnf_literal(NOT_FOUND)}\n"
+        )
+
+    def is_complete(self, text: str) -> bool:
+        """text 已是完整回答，再產生任何內容都不會更完整（單一商品一行、找不到、或統計列滿 N 行）"""
+        return self._complete.fullmatch(text) is not None
+
+    def is_valid(self, text: str) -> bool:
+        """text 符合任一回答格式"""
+        return self._valid.fullmatch(text.strip()) is not None
@@ -0,0 +1,61 @@
+"""
+請求 body 大小上限（ASGI middleware）。
+
+只依賴標準函式庫，date profile 不需為此匯入 utils/ingest.py 的 cv2 / numpy / PIL。
+"""
+
+import json
+
+
+class BodySizeLimitMiddleware:
+    """
+    ASGI middleware：Content-Length 超過上限直接回 413，不讀取 body；沒有 Content-Length（chunked）時
+    邊讀邊計算，超過即中止。path_limits 可針對個別路徑（例如批次上傳）設定不同上限。
+    """
+
+    def __init__(self, app, max_bytes: int, path_limits: dict = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        limit = self.path_limits.get(scope["path"], self.max_bytes)
+        if not limit:
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            return await self._reject(send, limit)
+
+        if content_length is not None:
+            # 伺服器保證 body 不會超過 Content-Length
+            return await self.app(scope, receive, send)
+
+        # chunked：先讀完並計量，再原樣重播給 app（FastAPI 本來就會讀進整個 body，不增加峰值）
+        messages = []
+        received = 0
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                messages.append(message)
+                break
+            received += len(message.get("body", b""))
+            if received > limit:
+                return await self._reject(send, limit)
+            messages.append(message)
+            if not message.get("more_body", False):
+                break
+
+        async def replay():
+            return messages.pop(0) if messages else await receive()
+
+        await self.app(scope, replay, send)
+
+    @staticmethod
+    async def _reject(send, limit: int):
+        body = json.dumps({"detail": f"請求超過 {limit >> 20} MB 上限"}, ensure_ascii=False).encode("utf-8")
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
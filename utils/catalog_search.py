@@ -0,0 +1,129 @@
+"""
+catalog 文字搜尋（/db/search）。
+
+- 語意分數：查詢句的 CLIP 文字向量與各商品影像向量的 cosine similarity（與 test_clip_text_to_image.py
+            相同的 text → image 比對），以 CLIP 的 logit scale 在 catalog 上做 softmax，轉成 0~1 的機率
+- 文字分數：normalize_text 後的查詢句與 brand+flavor+color 的 rapidfuzz partial_ratio（0~1）；
+            大型 catalog 以 FuzzyIndex 的 n-gram 倒排索引挑出候選，其餘商品文字分數記為 0
+- 兩者加權後排序；catalog 影像向量預先取出成正規化矩陣，查詢只需一次矩陣乘法，不經 Chroma
+
+查詢句向量以 LRU 快取（QueryEmbeddingCache）；一次多個查詢時只對未命中的句子做一次 batch 編碼。
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from rapidfuzz import fuzz
+from rapidfuzz import process as fuzz_process
+
+from utils.fuzzy_index import FuzzyIndex, normalize_text
+
+# CLIP 訓練時的 logit scale（exp(4.6052)）
+CLIP_LOGIT_SCALE = 100.0
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+class QueryEmbeddingCache:
+    """查詢句 → 正規化文字向量的 LRU 快取；encode_text(list[str]) -> (N, D)"""
+
+    def __init__(self, encode_text, max_size: int = 4096):
+        self._encode_text = encode_text
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, texts: list) -> np.ndarray:
+        """回傳 (len(texts), D)；未命中的句子（去重後）一次編碼"""
+        found = {}
+        with self._lock:
+            for text in texts:
+                vector = self._entries.get(text)
+                if vector is not None:
+                    self._entries.move_to_end(text)
+                    found[text] = vector
+            missing = list(dict.fromkeys(t for t in texts if t not in found))
+            self.hits += sum(1 for t in texts if t in found)
+            self.misses += len(missing)
+        if missing:
+            # 編碼不持鎖，其他命中快取的查詢不需等待
+            vectors = _normalize(self._encode_text(missing))
+            vectors.flags.writeable = False
+            with self._lock:
+                for text, vector in zip(missing, vectors):
+                    found[text] = vector
+                    self._entries[text] = vector
+                    self._entries.move_to_end(text)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return np.stack([found[text] for text in texts])
+
+
+def item_search_text(meta: dict) -> str:
+    return f"{meta.get('brand', '')}{meta.get('flavor', '')}{meta.get('color', '')}"
+
+
+class CatalogSearchIndex:
+    """catalog 影像向量矩陣與正規化的 metadata 文字；catalog 變更時整個重建"""
+
+    def __init__(self, ids: list, metadatas: list, embeddings, version=None, shortlist_size: int = 512):
+        self.ids = list(ids)
+        self.metadatas = [meta or {} for meta in metadatas]
+        self.matrix = (_normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(self.ids), -1))
+                       if self.ids else np.empty((0, 0), dtype=np.float32))
+        self.fuzzy_index = FuzzyIndex(self.ids, [item_search_text(meta) for meta in self.metadatas],
+                                      shortlist_size=shortlist_size)
+        self.texts = self.fuzzy_index.texts
+        self.version = version
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores(self, queries: list, query_embeddings: np.ndarray):
+        """回傳 (semantic, fuzzy)，皆為 (Q, M)、0~1"""
+        logits = CLIP_LOGIT_SCALE * (_normalize(query_embeddings) @ self.matrix.T)
+        logits -= logits.max(axis=1, keepdims=True)
+        semantic = np.exp(logits)
+        semantic /= semantic.sum(axis=1, keepdims=True)
+        fuzzy = np.zeros_like(semantic)
+        for row, query in enumerate(queries):
+            query = normalize_text(query)
+            # 單一字元沒有 bigram 可查，直接全量比對
+            candidates = (self.fuzzy_index.shortlist(query) if len(query) >= self.fuzzy_index.n
+                          else np.arange(len(self.ids)))
+            if len(candidates):
+                fuzzy[row, candidates] = fuzz_process.cdist(
+                    [query], [self.texts[i] for i in candidates], scorer=fuzz.partial_ratio, dtype=np.float32,
+                )[0] / 100.0
+        return semantic, fuzzy
+
+    def search(self, queries: list, query_embeddings: np.ndarray, k: int = 5, semantic_weight: float = 0.5) -> list:
+        """每個查詢回傳前 k 名 [{id, brand, flavor, color, score, semantic, fuzzy}, ...]"""
+        if not self.ids:
+            return [[] for _ in queries]
+        semantic, fuzzy = self.scores(queries, query_embeddings)
+        combined = semantic_weight * semantic + (1.0 - semantic_weight) * fuzzy
+        k = min(k, len(self.ids))
+        top = np.argpartition(-combined, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in enumerate(top):
+            candidates = candidates[np.argsort(-combined[row, candidates], kind="stable")]
+            results.append([{
+                "id": self.ids[i],
+                "brand": self.metadatas[i].get("brand", ""),
+                "flavor": self.metadatas[i].get("flavor", ""),
+                "color": self.metadatas[i].get("color", ""),
+                "score": round(float(combined[row, i]), 4),
+                "semantic": round(float(semantic[row, i]), 4),
+                "fuzzy": round(float(fuzzy[row, i]), 4),
+            } for i in candidates])
+        return results
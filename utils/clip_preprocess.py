@@ -0,0 +1,96 @@
+"""
+CLIP 影像前處理。
+
+- select_class_boxes : 以陣列 mask 一次篩出指定類別的 YOLO box
+- crop_views         : 從同一張解碼後的 ndarray 切出各 box 的 view（不複製像素）
+- encode_pil_crops   : 所有 crop 轉成 PIL 後以一次 SentenceTransformer.encode 推論，
+                       前處理與建立 catalog 時相同（CLIPImageProcessor）
+- build_clip_batch   : 各 crop 以 torch 縮放 / 中心裁切後寫入同一個 batch，
+                       BGR→RGB 與 normalize 對整個 batch 只做一次
+- clip_image_embeddings : 直接呼叫 HF CLIP vision model + projection
+
+torch 路徑對齊 CLIPImageProcessor：短邊縮放至 224（bicubic）、中心裁切 224、
+除以 255 後以 CLIP mean / std 正規化；但縮放演算法與 PIL 不完全相同，
+與 catalog 向量的差距未確認前 service 預設仍走 encode_pil_crops（CLIP_PREPROCESS）。
+"""
+
+import numpy as np
+
+CLIP_IMAGE_SIZE = 224
+CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)
+CLIP_STD = (0.26862954, 0.26130258, 0.27577711)
+
+
+def select_class_boxes(data, class_id: int) -> np.ndarray:
+    """
+    data 為 ultralytics Boxes.data（torch.Tensor 或 ndarray，每列 [x1, y1, x2, y2, conf, cls]），
+    回傳 (N, 5) float32 [x1, y1, x2, y2, conf]；取整後寬或高為 0 的 box 一併濾掉。
+    """
+    selected = data[data[:, 5] == class_id, :5]
+    if not isinstance(selected, np.ndarray):
+        selected = selected.cpu().numpy()
+    selected = selected.astype(np.float32, copy=False)
+    coords = selected[:, :4].astype(np.int64)
+    valid = (coords[:, 2] > coords[:, 0]) & (coords[:, 3] > coords[:, 1])
+    return selected[valid]
+
+
+def crop_views(image: np.ndarray, boxes: np.ndarray) -> list:
+    """依 box 切出 image 的 view；座標先 clip 到圖片範圍內"""
+    height, width = image.shape[:2]
+    coords = np.asarray(boxes)[:, :4].astype(np.int64)
+    coords[:, [0, 2]] = coords[:, [0, 2]].clip(0, width)
+    coords[:, [1, 3]] = coords[:, [1, 3]].clip(0, height)
+    return [image[y1:y2, x1:x2] for x1, y1, x2, y2 in coords]
+
+
+def encode_pil_crops(clip_model, crops: list, bgr: bool = True) -> np.ndarray:
+    """HxWx3 uint8 crop（可為 view）轉成 RGB PIL 後一次 encode，回傳 (N, D) float32"""
+    from PIL import Image
+
+    images = [Image.fromarray(np.ascontiguousarray(crop[:, :, ::-1] if bgr else crop)) for crop in crops]
+    return np.asarray(clip_model.encode(images, batch_size=max(len(images), 1)), dtype=np.float32)
+
+
+def _resize_center_crop(crop, size: int):
+    """crop: (1, 3, H, W) float tensor；短邊縮放至 size 後中心裁切"""
+    import torch.nn.functional as F
+
+    height, width = crop.shape[-2:]
+    scale = size / min(height, width)
+    new_h, new_w = max(size, int(height * scale)), max(size, int(width * scale))
+    resized = F.interpolate(crop, size=(new_h, new_w), mode="bicubic", align_corners=False, antialias=True)
+    top, left = (new_h - size) // 2, (new_w - size) // 2
+    return resized[0, :, top:top + size, left:left + size]
+
+
+def build_clip_batch(crops: list, device="cpu", size: int = CLIP_IMAGE_SIZE, bgr: bool = True):
+    """
+    將多個 HxWx3 uint8 crop（可為非連續的 view）組成 (N, 3, size, size) 的 CLIP 輸入 tensor。
+    每個 crop 以 uint8 送上 device 後才轉 float，減少傳輸量。
+    """
+    import torch
+
+    batch = torch.empty((len(crops), 3, size, size), dtype=torch.float32, device=device)
+    for i, crop in enumerate(crops):
+        pixels = torch.from_numpy(crop).to(device, non_blocking=True)
+        batch[i] = _resize_center_crop(pixels.permute(2, 0, 1).unsqueeze(0).float(), size)
+    if bgr:
+        batch = batch.flip(1)
+    # bicubic 會有 overshoot，與 PIL 一樣先 clamp 回 0~255
+    mean = torch.tensor(CLIP_MEAN, device=device).view(1, 3, 1, 1) * 255
+    std = torch.tensor(CLIP_STD, device=device).view(1, 3, 1, 1) * 255
+    return batch.clamp_(0, 255).sub_(mean).div_(std)
+
+
+def clip_image_embeddings(clip_model, batch) -> np.ndarray:
+    """
+    clip_model 為 SentenceTransformer('clip-ViT-B-32')，其第一個模組包著 HF CLIPModel。
+    與 SentenceTransformer.encode 相同：vision_model 的 pooler_output 經 visual_projection，不做 normalize。
+    """
+    import torch
+
+    hf_model = clip_model[0].model
+    with torch.inference_mode():
+        pooled = hf_model.vision_model(pixel_values=batch).pooler_output
+        return hf_model.visual_projection(pooled).float().cpu().numpy()
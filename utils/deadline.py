@@ -0,0 +1,90 @@
+"""
+單一請求的處理期限與取消狀態。
+
+Deadline 由 endpoint 建立（X-Request-Timeout header 或預設值），
+一路傳進 OCR backend 與 llama-server 呼叫，用來決定每次呼叫的逾時，
+並在客戶端斷線或期限已過時中止尚未開始的工作；進行中的呼叫可以 on_cancel 註冊取消動作。
+"""
+
+import threading
+import time
+
+
+class DeadlineExceeded(TimeoutError):
+    """請求處理超過期限"""
+
+
+class RequestCancelled(Exception):
+    """請求已被取消（例如客戶端斷線）"""
+
+
+class Deadline:
+    def __init__(self, timeout_s: float = None):
+        self.timeout_s = timeout_s
+        self.expires_at = time.monotonic() + timeout_s if timeout_s else None
+        self.cancel_reason = None
+        self._cancelled = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        """剩餘秒數；沒有期限時回傳 None"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def done(self) -> bool:
+        return self.cancelled or self.expired
+
+    def cancel(self, reason: str = "cancelled"):
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self.cancel_reason = reason
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback):
+        """
+        cancel() 時呼叫 callback（已取消則立即呼叫），用來中止進行中的 I/O。
+        回傳解除註冊的函式，呼叫結束後應呼叫以免累積。
+        """
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove_callback(callback)
+        callback()
+        return lambda: None
+
+    def _remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def check(self):
+        """已取消或逾時則丟出例外，供每個 stage 開始前呼叫"""
+        if self.cancelled:
+            raise RequestCancelled(self.cancel_reason)
+        if self.expired:
+            raise DeadlineExceeded(f"超過請求期限 {self.timeout_s}s")
+
+    def bound(self, timeout: float):
+        """將單次呼叫的逾時限制在剩餘期限內"""
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if timeout is None:
+            return remaining
+        return min(timeout, remaining)
+
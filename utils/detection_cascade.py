@@ -0,0 +1,178 @@
+"""
+由粗到細的瓶子偵測 cascade。
+
+單一路徑對每張圖都以完整模型跑一次；近拍只有兩三瓶的圖其實低解析度就足夠。此模組：
+
+1. coarse pass : 以低解析度（或較小的模型）、較低信心門檻偵測整張圖
+2. 信心值達門檻且不小的 box 直接採用；信心不足或過小的 box 外擴成區域並合併重疊區域
+3. fine pass   : 只對這些區域以完整模型、較高解析度再偵測（區域被放大到 fine_imgsz）
+4. 區域內的結果轉回原圖座標，與直接採用的 box 以 NMS 合併
+
+coarse pass 沒有任何 box、或待確認區域佔整張圖比例過高時，直接對整張圖跑 fine pass
+（即原本的單一路徑），最差情況只多付一次低解析度推論。
+
+detect 介面與模型無關：detect(images, imgsz, conf) 回傳每張圖的 (N, 5) [x1, y1, x2, y2, conf]，
+座標為輸入圖片的像素座標。回傳格式與 service.detect_bottle_boxes_batch 相同。
+"""
+
+import numpy as np
+
+from utils.clip_preprocess import crop_views
+
+_EMPTY = np.empty((0, 5), dtype=np.float32)
+
+
+def box_iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """單一 box 與 (N, 4+) boxes 的 IoU"""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def nms(boxes: np.ndarray, iou_threshold: float = 0.5) -> np.ndarray:
+    """依信心值由高到低保留 box，與已保留 box 的 IoU 超過門檻者捨棄；輸出依信心值排序"""
+    if len(boxes) == 0:
+        return _EMPTY
+    boxes = boxes[np.argsort(-boxes[:, 4], kind="stable")]
+    keep = []
+    remaining = np.arange(len(boxes))
+    while remaining.size:
+        best = remaining[0]
+        keep.append(best)
+        rest = remaining[1:]
+        remaining = rest[box_iou(boxes[best], boxes[rest]) <= iou_threshold]
+    return boxes[keep].astype(np.float32, copy=False)
+
+
+def merge_regions(regions: np.ndarray) -> np.ndarray:
+    """將互相重疊的矩形反覆合併成外接矩形，直到兩兩不重疊"""
+    regions = [list(r) for r in np.asarray(regions, dtype=np.int64)]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                a, b = regions[i], regions[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    regions[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return np.array(regions, dtype=np.int64).reshape(-1, 4)
+
+
+class DetectionCascade:
+    """
+    fine_detect   : 完整模型；對待確認區域或整張圖執行
+    coarse_detect : 低成本模型；未指定時沿用 fine_detect，只降低解析度
+    conf          : 最終信心門檻（與單一路徑相同）
+    low_conf      : coarse pass 的門檻；介於 low_conf 與 conf 之間的 box 交給 fine pass 確認
+    small_px      : box 短邊在 coarse 輸入上小於此像素數時視為小物件，交給 fine pass
+    pad           : 區域向外擴張的比例（相對 box 長邊），讓 fine pass 看到完整瓶身與周邊
+    min_region_px : 區域最小邊長（原圖像素）
+    max_region_frac : 待確認區域總面積超過整張圖的此比例時改跑整張圖
+    """
+
+    def __init__(self, fine_detect, coarse_detect=None, conf: float = 0.8, low_conf: float = 0.25,
+                 coarse_imgsz: int = 320, fine_imgsz: int = 640, small_px: int = 24, pad: float = 0.25,
+                 min_region_px: int = 64, max_region_frac: float = 0.5, iou: float = 0.5, edge_px: int = 2):
+        self.fine_detect = fine_detect
+        self.coarse_detect = coarse_detect or fine_detect
+        self.conf = conf
+        self.low_conf = low_conf
+        self.coarse_imgsz = coarse_imgsz
+        self.fine_imgsz = fine_imgsz
+        self.small_px = small_px
+        self.pad = pad
+        self.min_region_px = min_region_px
+        self.max_region_frac = max_region_frac
+        self.iou = iou
+        self.edge_px = edge_px
+
+    def split(self, boxes: np.ndarray, shape: tuple):
+        """將 coarse box 分成 (直接採用的 box, 待確認區域)"""
+        height, width = shape[:2]
+        scale = self.coarse_imgsz / max(height, width)
+        sides = np.minimum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]) * scale
+        certain = (boxes[:, 4] >= self.conf) & (sides >= self.small_px)
+        return boxes[certain], self.regions(boxes[~certain], shape)
+
+    def regions(self, boxes: np.ndarray, shape: tuple) -> np.ndarray:
+        """待確認 box 外擴、補足最小邊長、clip 到圖內後合併重疊"""
+        if len(boxes) == 0:
+            return np.empty((0, 4), dtype=np.int64)
+        height, width = shape[:2]
+        cx = (boxes[:, 0] + boxes[:, 2]) / 2
+        cy = (boxes[:, 1] + boxes[:, 3]) / 2
+        long_side = np.maximum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])
+        half_w = np.maximum((boxes[:, 2] - boxes[:, 0]) / 2 + long_side * self.pad, self.min_region_px / 2)
+        half_h = np.maximum((boxes[:, 3] - boxes[:, 1]) / 2 + long_side * self.pad, self.min_region_px / 2)
+        regions = np.stack([
+            np.floor(cx - half_w).clip(0, width), np.floor(cy - half_h).clip(0, height),
+            np.ceil(cx + half_w).clip(0, width), np.ceil(cy + half_h).clip(0, height),
+        ], axis=1)
+        return merge_regions(regions)
+
+    def _drop_truncated(self, boxes: np.ndarray, region: np.ndarray, shape: tuple) -> np.ndarray:
+        """
+        捨棄貼齊區域邊界的 box（被區域截斷的鄰近瓶子）；區域邊界與原圖邊界重合時不算截斷。
+        boxes 為區域內座標。
+        """
+        height, width = shape[:2]
+        x1, y1, x2, y2 = region
+        w, h = x2 - x1, y2 - y1
+        e = self.edge_px
+        truncated = np.zeros(len(boxes), dtype=bool)
+        if x1 > 0:
+            truncated |= boxes[:, 0] <= e
+        if y1 > 0:
+            truncated |= boxes[:, 1] <= e
+        if x2 < width:
+            truncated |= boxes[:, 2] >= w - e
+        if y2 < height:
+            truncated |= boxes[:, 3] >= h - e
+        return boxes[~truncated]
+
+    def detect(self, images: list, stats: dict = None) -> list:
+        """回傳每張圖最終的 (N, 5) boxes；stats 有傳入時累計各階段執行次數"""
+        stats = stats if stats is not None else {}
+        coarse = self.coarse_detect(images, self.coarse_imgsz, self.low_conf)
+        results = [None] * len(images)
+        full_indices, region_jobs = [], []
+        for index, (image, boxes) in enumerate(zip(images, coarse)):
+            accepted, regions = self.split(boxes, image.shape)
+            area = image.shape[0] * image.shape[1]
+            region_area = float(((regions[:, 2] - regions[:, 0]) * (regions[:, 3] - regions[:, 1])).sum())
+            if len(boxes) == 0 or region_area > self.max_region_frac * area:
+                full_indices.append(index)
+                continue
+            results[index] = [accepted]
+            region_jobs.extend((index, region) for region in regions)
+
+        stats["images"] = stats.get("images", 0) + len(images)
+        stats["full"] = stats.get("full", 0) + len(full_indices)
+        stats["regions"] = stats.get("regions", 0) + len(region_jobs)
+
+        # 整張圖與各區域各自合成一個 batch 推論
+        if full_indices:
+            for index, boxes in zip(full_indices, self.fine_detect([images[i] for i in full_indices],
+                                                                  self.fine_imgsz, self.conf)):
+                results[index] = boxes
+        if region_jobs:
+            views = [crop_views(images[index], region[None])[0] for index, region in region_jobs]
+            for (index, region), boxes in zip(region_jobs, self.fine_detect(views, self.fine_imgsz, self.conf)):
+                boxes = self._drop_truncated(boxes, region, images[index].shape).copy()
+                boxes[:, [0, 2]] += region[0]
+                boxes[:, [1, 3]] += region[1]
+                results[index].append(boxes)
+
+        return [merged if isinstance(merged, np.ndarray) else
+                nms(np.concatenate(merged).astype(np.float32, copy=False), self.iou)
+                for merged in results]
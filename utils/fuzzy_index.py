@@ -0,0 +1,106 @@
+"""
+catalog 模糊搜尋索引（OCR 文字 → brand+flavor）。
+
+- normalize_text : NFKC、去除空白與標點，並以 GLYPH_CONFUSIONS 將形近字 / 簡體字
+                   對應到同一個字，catalog 與 OCR 文字兩邊都先正規化
+- FuzzyIndex     : 字元 n-gram 倒排索引，先以共同 n-gram 比例挑出候選，
+                   只對候選跑 rapidfuzz partial_ratio
+
+catalog 小於 full_scan_below 筆時直接全量比對，結果與原本的 extractOne 相同。
+"""
+
+import unicodedata
+
+import numpy as np
+from rapidfuzz import fuzz
+from rapidfuzz import process as fuzz_process
+
+# OCR 常見誤讀（形近字）與簡繁異體：左側一律轉成右側
+GLYPH_CONFUSIONS = {
+    "線": "綠", "緑": "綠", "绿": "綠",
+    "古": "甘",
+    "鳥": "烏", "乌": "烏",
+    "荼": "茶",
+    "裡": "裏", "里": "裏",
+    "龙": "龍", "红": "紅", "麦": "麥", "柠": "檸",
+    "観": "觀", "鉄": "鐵", "铁": "鐵",
+    "双": "雙", "纎": "纖", "纤": "纖",
+    "园": "園", "优": "優", "臺": "台",
+}
+_GLYPH_TABLE = str.maketrans(GLYPH_CONFUSIONS)
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).lower().translate(_GLYPH_TABLE)
+    return "".join(ch for ch in text if ch.isalnum())
+
+
+def catalog_text(meta: dict) -> str:
+    """fuzzy 比對用的商品文字：brand+flavor（即 catalog 的 item ID）"""
+    meta = meta or {}
+    return f"{meta.get('brand', '')}{meta.get('flavor', '')}"
+
+
+def char_ngrams(text: str, n: int = 2) -> set:
+    """字元 n-gram；長度不足 n 時以整個字串作為唯一 gram"""
+    if len(text) < n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class FuzzyIndex:
+    def __init__(self, ids: list, texts: list, n: int = 2, shortlist_size: int = 64, full_scan_below: int = 256):
+        self.ids = list(ids)
+        self.texts = [normalize_text(t) for t in texts]
+        self.n = n
+        self.shortlist_size = shortlist_size
+        self.full_scan_below = full_scan_below
+
+        postings = {}
+        gram_counts = np.zeros(len(self.texts), dtype=np.float32)
+        for i, text in enumerate(self.texts):
+            grams = char_ngrams(text, n)
+            gram_counts[i] = max(len(grams), 1)
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        self._postings = {gram: np.asarray(idx, dtype=np.int32) for gram, idx in postings.items()}
+        self._gram_counts = gram_counts
+
+    def __len__(self):
+        return len(self.ids)
+
+    def shortlist(self, query: str) -> np.ndarray:
+        """回傳候選 index（依 catalog 原順序），以候選本身的 n-gram 有多少比例出現在 query 排序"""
+        if len(self.ids) < self.full_scan_below:
+            return np.arange(len(self.ids))
+        hits = np.zeros(len(self.ids), dtype=np.float32)
+        for gram in char_ngrams(query, self.n):
+            postings = self._postings.get(gram)
+            if postings is not None:
+                hits[postings] += 1
+        candidates = np.flatnonzero(hits)
+        if len(candidates) > self.shortlist_size:
+            coverage = hits[candidates] / self._gram_counts[candidates]
+            top = np.argpartition(-coverage, self.shortlist_size - 1)[: self.shortlist_size]
+            candidates = np.sort(candidates[top])
+        return candidates
+
+    def search(self, query: str, score_cutoff: float = 50):
+        """
+        回傳 (id, score, 候選數)；無符合者回傳 (None, None, 候選數)。
+        候選依 catalog 原順序比對，同分時與原本 extractOne 一樣取較前面的項目。
+        """
+        query = normalize_text(query)
+        candidates = self.shortlist(query) if query else np.arange(0)
+        if not len(candidates):
+            return None, None, 0
+        result = fuzz_process.extractOne(
+            query,
+            [self.texts[i] for i in candidates],
+            scorer=fuzz.partial_ratio,
+            score_cutoff=score_cutoff,
+        )
+        if result is None:
+            return None, None, len(candidates)
+        _, score, position = result
+        return self.ids[candidates[position]], score, len(candidates)
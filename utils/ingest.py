@@ -0,0 +1,138 @@
+"""
+記憶體受限的圖片讀入流程。
+
+大圖（例如 50 MP）解碼後每張就佔 150 MB，數個並發上傳即可讓節點 OOM。此模組：
+
+- BodySizeLimitMiddleware : 在讀取 body 之前依 Content-Length / 實際串流量拒絕過大的請求（413），
+                            見 utils/body_limit.py（不需 cv2 / numpy，date profile 也使用）
+- decode_base64_bounded   : 先檢查 base64 長度，只讀檔頭取得尺寸；超過 max_pixels 的 JPEG
+                            直接以 1/2、1/4、1/8 縮小解碼（DCT 階段縮小，不會先產生全尺寸影像），
+                            其他格式超過上限則拒絕。壓縮後的 bytes 在解碼完立即釋放。
+- MemoryBudget            : 解碼前先預約解碼所需的記憶體，總量超過預算時等待；解碼完歸還暫存的部分，
+                            其餘在影像 ndarray（連同所有 crop view）被回收時自動歸還。
+"""
+
+import base64
+import binascii
+import io
+import threading
+import weakref
+
+import cv2
+import numpy as np
+from PIL import Image
+
+_JPEG_REDUCE_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                      4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+class ImageTooLarge(ValueError):
+    """圖片或請求超過設定的大小上限"""
+
+
+class MemoryBudgetExceeded(RuntimeError):
+    """等待解碼記憶體預約逾時"""
+
+
+class MemoryBudget:
+    """
+    以 bytes 計量的加權 semaphore。
+    單次預約超過總預算時以總預算計，確保仍可在沒有其他預約時執行。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.in_use = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes: int, timeout: float = None) -> int:
+        """回傳實際預約的 bytes；timeout 內無法預約時丟出 MemoryBudgetExceeded"""
+        nbytes = min(nbytes, self.max_bytes)
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.in_use + nbytes <= self.max_bytes, timeout):
+                raise MemoryBudgetExceeded(
+                    f"解碼記憶體不足（需要 {nbytes >> 20} MB，使用中 {self.in_use >> 20}/{self.max_bytes >> 20} MB）")
+            self.in_use += nbytes
+        return nbytes
+
+    def release(self, nbytes: int):
+        with self._cond:
+            self.in_use -= nbytes
+            self._cond.notify_all()
+
+    def attach(self, array: np.ndarray, nbytes: int):
+        """array 被回收時歸還預約（crop view 會持有 base array，全部釋放後才歸還）"""
+        weakref.finalize(array, self.release, nbytes)
+
+
+def base64_decoded_size(data: str) -> int:
+    """不解碼即可算出 base64 解碼後的 bytes 數"""
+    padding = data[-2:].count("=") if data else 0
+    return len(data) * 3 // 4 - padding
+
+
+def probe_image(data: bytes):
+    """只讀檔頭，回傳 (format, width, height)"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return image.format, image.width, image.height
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+    except Exception:
+        raise ValueError("無法解碼的圖片格式")
+
+
+def reduction_factor(image_format: str, width: int, height: int, max_pixels: int) -> int:
+    """能讓像素數不超過 max_pixels 的最小縮小倍率（僅 JPEG 可縮小解碼）"""
+    if not max_pixels or width * height <= max_pixels:
+        return 1
+    if image_format == "JPEG":
+        for factor in (2, 4, 8):
+            if -(-width // factor) * -(-height // factor) <= max_pixels:
+                return factor
+    raise ImageTooLarge(f"圖片 {width}x{height} 超過 {max_pixels} 像素上限")
+
+
+def decode_bounded(data: bytes, max_pixels: int = 0, budget: MemoryBudget = None,
+                   timeout: float = None) -> np.ndarray:
+    """
+    解碼為 HxWx3 BGR uint8（不套用 EXIF 旋轉），必要時縮小解碼。
+    有 budget 時先預約解碼後的記憶體，並在回傳的 array 被回收時歸還。
+    """
+    image_format, width, height = probe_image(data)
+    factor = reduction_factor(image_format, width, height, max_pixels)
+    nbytes = -(-width // factor) * -(-height // factor) * 3
+    # cv2.imdecode 先解碼到內部緩衝再複製成 ndarray，解碼期間峰值約為結果的兩倍
+    reserved = budget.acquire(2 * nbytes, timeout) if budget is not None else 0
+    try:
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8),
+                             _JPEG_REDUCE_FLAGS[factor] | cv2.IMREAD_IGNORE_ORIENTATION)
+        if image is None:
+            raise ValueError("無法解碼的圖片格式")
+    except BaseException:
+        if budget is not None:
+            budget.release(reserved)
+        raise
+    if factor > 1:
+        print(f"[Ingest] {width}x{height} 超過像素上限，以 1/{factor} 解碼為 {image.shape[1]}x{image.shape[0]}")
+    if budget is not None:
+        kept = min(nbytes, reserved)
+        budget.release(reserved - kept)
+        budget.attach(image, kept)
+    return image
+
+
+def b64decode_bounded(data: str, max_bytes: int = 0) -> bytes:
+    """base64 → 壓縮的圖片 bytes；解碼前先以長度檢查 max_bytes"""
+    if max_bytes and base64_decoded_size(data) > max_bytes:
+        raise ImageTooLarge(f"圖片超過 {max_bytes >> 20} MB 上限")
+    try:
+        return base64.b64decode(data)
+    except (binascii.Error, ValueError):
+        raise ValueError("base64 格式錯誤")
+
+
+def decode_base64_bounded(data: str, max_bytes: int = 0, max_pixels: int = 0, budget: MemoryBudget = None,
+                          timeout: float = None) -> np.ndarray:
+    """base64 版本：解碼前先以長度檢查 max_bytes"""
+    return decode_bounded(b64decode_bounded(data, max_bytes), max_pixels, budget, timeout)
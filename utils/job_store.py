@@ -0,0 +1,286 @@
+"""
+非同步 job 佇列與結果儲存（SQLite）。
+
+- 提交後立即回傳 job id，由 JobWorkerPool 從佇列取出執行
+- 執行中的 job 帶有 lease，worker 定期延長；process 重啟（或 lease 過期）時重新排回佇列，
+  超過 max_attempts 次則標記為失敗，避免每次重啟都被同一個 job 拖垮
+- 已完成的 job 保留 ttl 秒後清除；完成時一併清掉 payload 以節省空間
+
+SQLite 以 WAL 模式開啟，多個 uvicorn worker 可共用同一個資料庫檔。
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT,
+    result TEXT,
+    error TEXT,
+    timings TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_until REAL,
+    worker TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+_JSON_COLUMNS = ("payload", "result", "timings")
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+class JobStore:
+    def __init__(self, path: str = "jobs.db"):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 連線不可跨 thread 共用，每個 thread 各自開一條
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        for column in _JSON_COLUMNS:
+            if job.get(column) is not None:
+                job[column] = json.loads(job[column])
+        return job
+
+    def submit(self, kind: str, payload: dict) -> str:
+        job_id = uuid.uuid4().hex
+        self._conn().execute(
+            "INSERT INTO jobs (id, kind, status, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, kind, QUEUED, _dumps(payload), time.time()),
+        )
+        return job_id
+
+    def get(self, job_id: str):
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def claim(self, worker: str, lease_s: float):
+        """取出最早排入的 job 並標記為 running；佇列為空時回傳 None"""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, lease_until = ?, worker = ?, attempts = attempts + 1 "
+                "WHERE id = ?",
+                (RUNNING, now, now + lease_s, worker, row["id"]),
+            )
+            return self._to_dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+
+    def _finish(self, job_id: str, worker: str, status: str, result=None, error: str = None, timings=None) -> bool:
+        # lease 已被其他 worker 接手時不覆寫
+        cursor = self._conn().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, timings = ?, finished_at = ?, payload = NULL, "
+            "lease_until = NULL WHERE id = ? AND worker = ? AND status = ?",
+            (status, _dumps(result) if result is not None else None, error,
+             _dumps(timings) if timings is not None else None, time.time(), job_id, worker, RUNNING),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker: str, result, timings: dict = None) -> bool:
+        return self._finish(job_id, worker, SUCCEEDED, result=result, timings=timings)
+
+    def fail(self, job_id: str, worker: str, error: str, timings: dict = None) -> bool:
+        return self._finish(job_id, worker, FAILED, error=error, timings=timings)
+
+    def heartbeat(self, job_ids: list, worker: str, lease_s: float):
+        if not job_ids:
+            return
+        placeholders = ",".join("?" * len(job_ids))
+        self._conn().execute(
+            f"UPDATE jobs SET lease_until = ? WHERE worker = ? AND status = ? AND id IN ({placeholders})",
+            (time.time() + lease_s, worker, RUNNING, *job_ids),
+        )
+
+    def requeue(self, max_attempts: int, is_orphaned=None) -> int:
+        """
+        lease 已過期、或 is_orphaned(worker) 為 True（執行它的 process 已不存在）的 running job
+        重新排回佇列；已嘗試 max_attempts 次的標記為失敗。回傳處理筆數。
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, attempts, lease_until, worker FROM jobs WHERE status = ?", (RUNNING,)
+            ).fetchall()
+            stale = [r for r in rows
+                     if (r["lease_until"] or 0) < now or (is_orphaned is not None and is_orphaned(r["worker"]))]
+            for row in stale:
+                if row["attempts"] >= max_attempts:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, error = ?, finished_at = ?, payload = NULL WHERE id = ?",
+                        (FAILED, f"執行中斷超過 {max_attempts} 次", now, row["id"]),
+                    )
+                else:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, lease_until = NULL, worker = NULL WHERE id = ?",
+                        (QUEUED, row["id"]),
+                    )
+        return len(stale)
+
+    def cleanup(self, ttl_s: float) -> int:
+        cursor = self._conn().execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+            (SUCCEEDED, FAILED, time.time() - ttl_s),
+        )
+        return cursor.rowcount
+
+    def counts(self) -> dict:
+        rows = self._conn().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+def _local_worker_dead(worker: str) -> bool:
+    """worker 格式為 host:pid；同一台主機上 pid 已不存在即視為中斷"""
+    if not worker:
+        return False
+    host, _, pid = worker.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
+
+
+class JobWorkerPool:
+    """
+    handlers: {kind: func(payload) -> (result, stage_timings)}
+    例外會被記錄為 job 失敗（HTTPException 取其 detail）。
+    """
+
+    def __init__(self, store: JobStore, handlers: dict, workers: int = 2, lease_s: float = 30.0,
+                 ttl_s: float = 86400.0, max_attempts: int = 3, poll_s: float = 0.5,
+                 cleanup_interval_s: float = 60.0):
+        self.store = store
+        self.handlers = handlers
+        self.workers = workers
+        self.lease_s = lease_s
+        self.ttl_s = ttl_s
+        self.max_attempts = max_attempts
+        self.poll_s = poll_s
+        self.cleanup_interval_s = cleanup_interval_s
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._running = set()
+        self._running_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        requeued = self.store.requeue(self.max_attempts, is_orphaned=_local_worker_dead)
+        if requeued:
+            print(f"[Jobs] 重新排入 {requeued} 個中斷的 job")
+        self._threads = [threading.Thread(target=self._work_loop, name=f"job-worker-{i}", daemon=True)
+                         for i in range(self.workers)]
+        self._threads.append(threading.Thread(target=self._maintenance_loop, name="job-maintenance", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def notify(self):
+        """有新 job 時喚醒等待中的 worker"""
+        self._wake.set()
+
+    def _work_loop(self):
+        while not self._stop.is_set():
+            try:
+                job = self.store.claim(self.worker_id, self.lease_s)
+            except sqlite3.Error as e:
+                print(f"[Jobs] 取出 job 失敗: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_s)
+                self._wake.clear()
+                continue
+            self._execute(job)
+
+    def _execute(self, job: dict):
+        with self._running_lock:
+            self._running.add(job["id"])
+        started = time.time()
+        timings = {"queued_s": round(started - job["created_at"], 3)}
+        try:
+            handler = self.handlers.get(job["kind"])
+            if handler is None:
+                raise ValueError(f"未知的 job 類型: {job['kind']}")
+            result, stage_timings = handler(job["payload"])
+            timings.update(run_s=round(time.time() - started, 3), stages=stage_timings)
+            self.store.complete(job["id"], self.worker_id, result, timings)
+        except Exception as e:
+            timings["run_s"] = round(time.time() - started, 3)
+            error = getattr(e, "detail", None) or f"{type(e).__name__}: {e}"
+            print(f"[Jobs] job {job['id']} 失敗: {error}")
+            self.store.fail(job["id"], self.worker_id, str(error), timings)
+        finally:
+            with self._running_lock:
+                self._running.discard(job["id"])
+
+    def _maintenance_loop(self):
+        last_cleanup = 0.0
+        while not self._stop.wait(self.lease_s / 3):
+            try:
+                with self._running_lock:
+                    running = list(self._running)
+                self.store.heartbeat(running, self.worker_id, self.lease_s)
+                self.store.requeue(self.max_attempts)
+                if time.monotonic() - last_cleanup >= self.cleanup_interval_s:
+                    removed = self.store.cleanup(self.ttl_s)
+                    if removed:
+                        print(f"[Jobs] 清除 {removed} 個過期 job")
+                    last_cleanup = time.monotonic()
+            except sqlite3.Error as e:
+                print(f"[Jobs] 維護作業失敗: {e}")
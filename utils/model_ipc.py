@@ -0,0 +1,270 @@
+"""
+API worker 與共用模型 server（model_server.py）之間的本機 IPC。
+
+- 控制訊息走 Unix socket（multiprocessing.connection），只含小型 dict
+- 圖片以 shared memory 傳遞：worker 寫入一次，server 直接 attach 讀取，不經 pickle
+
+server 會 unpickle 收到的請求，能連上 socket 且通過驗證就等於能在 server process 執行任意程式碼：
+- 預設 socket 放在只有目前使用者可進入的目錄（$XDG_RUNTIME_DIR/good_backend-<uid>，權限 0700），socket 本身 0600
+- 沒有內建的預設金鑰：未設定 MODEL_SERVER_AUTHKEY 時，server 產生隨機金鑰寫入權限 0600 的金鑰檔，worker 讀取同一檔案
+
+環境變數：
+- MODEL_SERVER_ADDRESS      : Unix socket 路徑；有設定時 service.py 以 worker 模式運作
+- MODEL_SERVER_RUNTIME_DIR  : 預設 socket 與金鑰檔所在的私有目錄
+- MODEL_SERVER_AUTHKEY      : 連線驗證金鑰（明確指定時不使用金鑰檔）
+- MODEL_SERVER_AUTHKEY_FILE : 金鑰檔路徑，預設為 MODEL_SERVER_RUNTIME_DIR/model_server.key
+"""
+
+import os
+import secrets
+import tempfile
+import threading
+import time
+import traceback
+from multiprocessing import AuthenticationError, resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+MODEL_SERVER_ADDRESS = os.getenv("MODEL_SERVER_ADDRESS")
+MODEL_SERVER_RUNTIME_DIR = os.getenv("MODEL_SERVER_RUNTIME_DIR") or os.path.join(
+    os.getenv("XDG_RUNTIME_DIR") or tempfile.gettempdir(), f"good_backend-{os.getuid()}")
+MODEL_SERVER_AUTHKEY_FILE = os.getenv("MODEL_SERVER_AUTHKEY_FILE") or os.path.join(MODEL_SERVER_RUNTIME_DIR,
+                                                                                     "model_server.key")
+
+
+class ModelServerError(RuntimeError):
+    """model server 端執行失敗"""
+
+
+# ========== Socket 與金鑰 ==========
+
+def _check_private(path: str, mode_mask: int = 0o077):
+    """path 必須屬於目前使用者，且群組 / 其他人沒有任何權限"""
+    st = os.stat(path)
+    if st.st_uid != os.getuid() or st.st_mode & mode_mask:
+        raise PermissionError(f"{path} 必須屬於目前使用者且權限為 {'0700' if os.path.isdir(path) else '0600'}"
+                              f"（目前 {oct(st.st_mode & 0o777)}）")
+
+
+def private_dir(path: str = None) -> str:
+    """建立（或檢查）只有目前使用者可進入的目錄"""
+    path = path or MODEL_SERVER_RUNTIME_DIR
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    _check_private(path)
+    return path
+
+
+def default_address() -> str:
+    return os.path.join(private_dir(), "model_server.sock")
+
+
+def ensure_authkey(path: str = None) -> bytes:
+    """server 端：未設定 MODEL_SERVER_AUTHKEY 時使用金鑰檔，不存在則產生隨機金鑰（權限 0600）"""
+    if os.getenv("MODEL_SERVER_AUTHKEY"):
+        return os.getenv("MODEL_SERVER_AUTHKEY").encode()
+    path = path or MODEL_SERVER_AUTHKEY_FILE
+    private_dir(os.path.dirname(path))
+    # 先寫入暫存檔再 link：已有其他 server 產生金鑰時沿用，worker 也不會讀到寫到一半的檔案
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".model_server.key.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+        os.link(tmp_path, path)
+        print(f"🔑 已產生 model server 金鑰: {path}")
+    except FileExistsError:
+        pass
+    finally:
+        os.unlink(tmp_path)
+    return load_authkey(path)
+
+
+def load_authkey(path: str = None) -> bytes:
+    """worker 端：MODEL_SERVER_AUTHKEY 或 server 產生的金鑰檔；server 尚未啟動時丟出 FileNotFoundError"""
+    if os.getenv("MODEL_SERVER_AUTHKEY"):
+        return os.getenv("MODEL_SERVER_AUTHKEY").encode()
+    path = path or MODEL_SERVER_AUTHKEY_FILE
+    _check_private(path)
+    with open(path) as f:
+        key = f.read().strip()
+    if not key:
+        raise ModelServerError(f"model server 金鑰檔是空的: {path}")
+    return key.encode()
+
+
+# ========== Shared Memory 圖片 ==========
+
+class SharedImage:
+    """將 ndarray 複製進一塊 shared memory，離開 context 時釋放"""
+
+    def __init__(self, array: np.ndarray):
+        array = np.ascontiguousarray(array)
+        self._shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=self._shm.buf)[...] = array
+        self.descriptor = {
+            "shm": self._shm.name,
+            "shape": array.shape,
+            "dtype": array.dtype.str,
+            "pid": os.getpid(),
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._shm.close()
+        self._shm.unlink()
+
+
+class AttachedImage:
+    """server 端 attach worker 建立的 shared memory；array 只在 context 內有效"""
+
+    def __init__(self, descriptor: dict):
+        self._shm = SharedMemory(name=descriptor["shm"])
+        # 由建立者負責 unlink，避免本 process 的 resource tracker 在結束時誤刪
+        if descriptor.get("pid") != os.getpid():
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+        self.array = np.ndarray(descriptor["shape"], dtype=np.dtype(descriptor["dtype"]), buffer=self._shm.buf)
+
+    def __enter__(self):
+        return self.array
+
+    def __exit__(self, *exc):
+        self.array = None
+        self._shm.close()
+
+
+# ========== Server ==========
+
+def serve(address: str, handlers: dict, authkey: bytes = None, ready: threading.Event = None):
+    """
+    接受連線並以 thread 處理每條連線；authkey 未指定時使用 ensure_authkey()。
+    訊息格式 {"op": 名稱, **參數}，回覆 {"ok": True, "result": ...} 或 {"ok": False, "error": ...}。
+    """
+    authkey = authkey or ensure_authkey()
+    if os.path.exists(address):
+        os.unlink(address)
+    # socket 建立時即為 0600，不留其他使用者可連線的空檔
+    umask = os.umask(0o177)
+    try:
+        listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    finally:
+        os.umask(umask)
+    with listener:
+        os.chmod(address, 0o600)
+        print(f"🔌 model server 監聽 {address}")
+        if ready is not None:
+            ready.set()
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, AuthenticationError) as e:
+                print(f"[IPC] 接受連線失敗: {e}")
+                continue
+            threading.Thread(target=_serve_connection, args=(conn, handlers), daemon=True).start()
+
+
+def _serve_connection(conn, handlers: dict):
+    with conn:
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                return
+            op = request.pop("op", None)
+            handler = handlers.get(op)
+            if handler is None:
+                conn.send({"ok": False, "error": f"未知的操作: {op}"})
+                continue
+            try:
+                conn.send({"ok": True, "result": handler(**request)})
+            except Exception as e:
+                traceback.print_exc()
+                conn.send({"ok": False, "error": f"{type(e).__name__}: {e}"})
+
+
+# ========== Client ==========
+
+class ModelServerClient:
+    """執行緒安全的 client：每個呼叫從連線池借一條連線；authkey 未指定時於第一次連線讀取 load_authkey()"""
+
+    def __init__(self, address: str = MODEL_SERVER_ADDRESS, authkey: bytes = None):
+        self.address = address
+        self.authkey = authkey
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        if self.authkey is None:
+            self.authkey = load_authkey()
+        return Client(self.address, family="AF_UNIX", authkey=self.authkey)
+
+    def _release(self, conn):
+        with self._lock:
+            self._idle.append(conn)
+
+    def call(self, op: str, **kwargs):
+        conn = self._acquire()
+        try:
+            conn.send({"op": op, **kwargs})
+            reply = conn.recv()
+        except Exception:
+            conn.close()
+            raise
+        self._release(conn)
+        if not reply["ok"]:
+            raise ModelServerError(reply["error"])
+        return reply["result"]
+
+    def wait_ready(self, timeout: float = 300.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self.call("ping")
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.5)
+
+    def detect(self, image: np.ndarray) -> np.ndarray:
+        with SharedImage(image) as shared:
+            return self.call("detect", image=shared.descriptor)
+
+    def embed(self, image: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+        with SharedImage(image) as shared:
+            return self.call("embed", image=shared.descriptor, boxes=boxes)
+
+    def close(self):
+        with self._lock:
+            for conn in self._idle:
+                conn.close()
+            self._idle.clear()
+
+
+class RemoteCollection:
+    """在 worker 端模擬 chromadb Collection 介面，實際操作在 model server 執行"""
+
+    def __init__(self, client: ModelServerClient):
+        self._client = client
+
+    def _call(self, method: str, **kwargs):
+        return self._client.call("catalog", method=method, kwargs=kwargs)
+
+    def count(self):
+        return self._call("count")
+
+    def get(self, **kwargs):
+        return self._call("get", **kwargs)
+
+    def query(self, **kwargs):
+        return self._call("query", **kwargs)
+
+    def upsert(self, **kwargs):
+        return self._call("upsert", **kwargs)
+
+    def delete(self, **kwargs):
+        return self._call("delete", **kwargs)
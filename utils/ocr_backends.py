@@ -0,0 +1,376 @@
+"""
+OCR backend 抽象層。
+
+每個 backend 各自有並發上限、逾時與重試策略，部署時以環境變數選擇：
+- OCR_BACKEND                  : ollama_glm (預設) / paddle / llama_vision
+- OCR_<NAME>_MAX_CONCURRENCY   : 同時送出的請求數上限，例如 OCR_OLLAMA_GLM_MAX_CONCURRENCY=4（需與 OLLAMA_NUM_PARALLEL 一致）
+- OCR_CLASS_WEIGHTS            : 各優先等級的權重，例如 "date=8,inventory=4,batch=2,job=1"（見 utils/ocr_scheduler.py）
+- OCR_<NAME>_TIMEOUT           : 單次呼叫逾時秒數（含等待 slot）
+- OCR_<NAME>_RETRIES           : 失敗後重試次數（未 hedge 時）
+- OCR_<NAME>_HEDGE_QUANTILE    : 呼叫超過近期成功延遲的此分位數仍未完成時，以閒置 slot 再送一次相同請求（0 代表關閉）
+- OCR_<NAME>_BREAKER_FAILURES / _BREAKER_RESET_S : 連續失敗幾次後開啟斷路器、開啟幾秒後再試（見 utils/resilience.py）
+- OCR_<NAME>_INPUT_MAX_SIDE / _INPUT_FORMAT / _INPUT_QUALITY : 送進 OCR 前的縮放與編碼（見 utils/ocr_input.py）
+
+呼叫時可傳入 utils.deadline.Deadline，單次逾時會被限制在請求剩餘期限內，
+期限已過則不再重試；HTTP backend 在背景 event loop 以 async client 呼叫，deadline.cancel()（客戶端斷線）
+會取消進行中的請求並立即釋放 slot。超過並發上限時依 priority class 與 flow（預設為同一個 Deadline）排隊。
+斷路器開啟時 recognize 直接丟出 utils.resilience.CircuitOpenError，不送出請求也不排隊。
+"""
+
+import asyncio
+import base64
+import io
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+from opentelemetry import trace
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, stop_any, wait_exponential
+
+from utils.deadline import Deadline
+from utils.ocr_input import OCRInputSpec, OCRPayload, prepare_ocr_input, spec_from_env
+from utils.ocr_scheduler import DEFAULT_CLASS, OCRScheduler, parse_class_weights
+from utils.resilience import CircuitBreaker, HedgeStats, LatencyTracker, hedge_delay, hedged_call
+
+OCR_PROMPT = "Text Recognition:"
+
+
+class OCRTimeoutError(TimeoutError):
+    """等待 backend slot 或呼叫逾時"""
+
+
+class EventLoopThread:
+    """背景 thread 上的 event loop：同步呼叫端以 run() 等待 coroutine，deadline 取消時一併取消該 task"""
+
+    def __init__(self, name: str):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name=name, daemon=True).start()
+
+    def run(self, coro, deadline: Deadline):
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        unregister = deadline.on_cancel(future.cancel)
+        try:
+            return future.result()
+        except CancelledError:
+            deadline.check()
+            raise
+        finally:
+            unregister()
+
+
+class OCRBackend:
+    """OCR backend 基底類別：子類別只需實作 _recognize"""
+
+    name = "base"
+    # 各 backend 的預設值，可由環境變數覆寫
+    max_concurrency = 2
+    timeout = 30.0
+    retries = 1
+    retry_backoff = 0.5
+    # hedge 延遲取近期成功延遲的分位數，0 代表不 hedge
+    hedge_quantile = 0.95
+    hedge_min_delay = 0.05
+    breaker_failures = 5
+    breaker_reset_s = 30.0
+    # 可重試的例外類型，子類別依 client 套件覆寫
+    retryable_errors = (ConnectionError, TimeoutError)
+    # 模型原生輸入尺寸與編碼格式
+    input_spec = OCRInputSpec()
+
+    def __init__(self, max_concurrency: int = None, timeout: float = None, retries: int = None,
+                 input_spec: OCRInputSpec = None, class_weights: dict = None, hedge_quantile: float = None,
+                 breaker_failures: int = None, breaker_reset_s: float = None):
+        if input_spec is not None:
+            self.input_spec = input_spec
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+        if timeout is not None:
+            self.timeout = timeout
+        if retries is not None:
+            self.retries = retries
+        if hedge_quantile is not None:
+            self.hedge_quantile = hedge_quantile
+        if breaker_failures is not None:
+            self.breaker_failures = breaker_failures
+        if breaker_reset_s is not None:
+            self.breaker_reset_s = breaker_reset_s
+        self.scheduler = OCRScheduler(self.max_concurrency, class_weights)
+        self.breaker = CircuitBreaker(f"ocr.{self.name}", self.breaker_failures, self.breaker_reset_s)
+        self.latency = LatencyTracker()
+        self.hedge_stats = HedgeStats()
+        # hedge 時主要請求與重複請求都在此執行；每個請求各自持有一個 slot，數量不超過 max_concurrency
+        self._hedge_pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix=f"ocr-{self.name}")
+
+    def prepare_input(self, image) -> OCRPayload:
+        """將 BGR ndarray 依本 backend 的 input_spec 縮放並編碼一次"""
+        return prepare_ocr_input(image, self.input_spec)
+
+    def recognize(self, image, deadline: Deadline = None, priority: str = DEFAULT_CLASS, flow=None) -> str:
+        """
+        辨識圖片中的文字；image 為 prepare_input 產生的 OCRPayload 或 base64 字串。
+        超過並發上限時依 priority 排隊等待，最多等 timeout 秒；flow 未指定時以 deadline 區分請求。
+        """
+        image_base64 = image.b64 if isinstance(image, OCRPayload) else image
+        deadline = deadline or Deadline()
+        deadline.check()
+        self.breaker.check()
+        wait_timeout = deadline.bound(self.timeout)
+        wait_s = self.scheduler.acquire(priority, flow if flow is not None else deadline, wait_timeout,
+                                        abandoned=lambda: deadline.done)
+        if wait_s is None:
+            self.breaker.release_probe()
+            deadline.check()
+            raise OCRTimeoutError(f"[{self.name}] 等待 OCR slot 逾時 ({wait_timeout:.1f}s)")
+        span = trace.get_current_span()
+        span.set_attribute("ocr.priority", priority)
+        span.set_attribute("ocr.queue_wait_ms", round(wait_s * 1000, 1))
+        try:
+            text = self._call(image_base64, deadline, priority)
+        except Exception as e:
+            # 期限 / 取消造成的失敗與 backend 健康無關
+            if self.is_retryable(e) and not deadline.done:
+                self.breaker.record_failure()
+            else:
+                self.breaker.release_probe()
+            raise
+        self.breaker.record_success()
+        return text
+
+    def _call(self, image_base64: str, deadline: Deadline, priority: str) -> str:
+        """在已取得的 slot 上呼叫 backend（結束時釋放）；近期延遲樣本足夠時改為 hedged request"""
+        delay = hedge_delay(self.latency, self.hedge_quantile, self.hedge_min_delay)
+        if delay is None:
+            try:
+                retrying = Retrying(
+                    stop=stop_any(stop_after_attempt(self.retries + 1), lambda _: deadline.done),
+                    wait=wait_exponential(multiplier=self.retry_backoff, max=5),
+                    retry=retry_if_exception(self.is_retryable),
+                    reraise=True,
+                )
+                return retrying(lambda: self._timed_recognize(image_base64, deadline))
+            finally:
+                self.scheduler.release(priority)
+
+        def attempt():
+            # 主要請求沿用排隊取得的 slot，重複請求以 try_acquire 取得閒置 slot；各自跑完才釋放
+            try:
+                return self._timed_recognize(image_base64, deadline)
+            finally:
+                self.scheduler.release(priority)
+
+        return hedged_call(
+            self._hedge_pool, attempt, delay,
+            can_hedge=lambda: not deadline.done and self.scheduler.try_acquire(priority),
+            retryable=self.is_retryable,
+            stats=self.hedge_stats,
+        )
+
+    def _timed_recognize(self, image_base64: str, deadline: Deadline) -> str:
+        started = time.perf_counter()
+        text = self._recognize_until(image_base64, deadline)
+        self.latency.record(time.perf_counter() - started)
+        return text
+
+    def _recognize_until(self, image_base64: str, deadline: Deadline) -> str:
+        """單次呼叫；可中止進行中請求的 backend 覆寫此方法，deadline 取消時丟出 RequestCancelled"""
+        return self._recognize(image_base64, deadline.bound(self.timeout))
+
+    def _recognize(self, image_base64: str, timeout: float) -> str:
+        raise NotImplementedError
+
+    def is_retryable(self, exc: BaseException) -> bool:
+        return isinstance(exc, self.retryable_errors)
+
+    def describe(self) -> dict:
+        return {
+            "backend": self.name,
+            "max_concurrency": self.max_concurrency,
+            "timeout": self.timeout,
+            "retries": self.retries,
+            "hedge_quantile": self.hedge_quantile,
+            "hedge": self.hedge_stats.describe(),
+            "breaker": self.breaker.describe(),
+            "class_weights": self.scheduler.weights,
+            "input_spec": vars(self.input_spec),
+        }
+
+
+def _ollama_base_url(host: str = None) -> str:
+    host = host or os.getenv("OLLAMA_HOST", "127.0.0.1:11434")
+    if "://" not in host:
+        host = f"http://{host}"
+    return host.replace("://0.0.0.0", "://127.0.0.1")
+
+
+class OllamaGLMBackend(OCRBackend):
+    """
+    Ollama 上的 GLM-OCR（OLLAMA_HOST 決定 server 位址）。
+    直接呼叫 /api/chat 以便每次請求帶入各自的逾時；以 httpx.AsyncClient 在背景 event loop 送出，
+    請求取消時關閉連線，Ollama 隨即停止該次生成。
+    """
+
+    name = "ollama_glm"
+    max_concurrency = 2
+    timeout = 60.0
+    retries = 1
+    input_spec = OCRInputSpec(max_side=1024, format="jpeg", quality=90)
+
+    def __init__(self, model: str = "glm-ocr:q8_0", host: str = None, **kwargs):
+        super().__init__(**kwargs)
+        import httpx
+
+        self.model = model
+        self._httpx = httpx
+        self._io = EventLoopThread(f"ocr-{self.name}-io")
+        self._client = httpx.AsyncClient(base_url=_ollama_base_url(host), timeout=self.timeout)
+
+    def is_retryable(self, exc: BaseException) -> bool:
+        if isinstance(exc, self._httpx.HTTPStatusError):
+            return exc.response.status_code >= 500
+        return isinstance(exc, (self._httpx.TransportError, ConnectionError))
+
+    def _recognize_until(self, image_base64: str, deadline: Deadline) -> str:
+        return self._io.run(self._arecognize(image_base64, deadline.bound(self.timeout)), deadline)
+
+    def _recognize(self, image_base64: str, timeout: float) -> str:
+        return self._io.run(self._arecognize(image_base64, timeout), Deadline())
+
+    async def _arecognize(self, image_base64: str, timeout: float) -> str:
+        response = await self._client.post(
+            "/api/chat",
+            json={
+                "model": self.model,
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": OCR_PROMPT,
+                        "images": [image_base64],
+                    }
+                ],
+                "stream": False,
+            },
+            timeout=timeout,
+        )
+        response.raise_for_status()
+        return response.json()["message"]["content"]
+
+
+class LlamaServerVisionBackend(OCRBackend):
+    """llama-server 的 OpenAI 相容 vision endpoint（需以 --mmproj 啟動）；與 Ollama 相同，請求取消時中止進行中的呼叫"""
+
+    name = "llama_vision"
+    max_concurrency = 1
+    timeout = 60.0
+    retries = 1
+    # llama.cpp 以 stb_image 解碼，不支援 webp
+    input_spec = OCRInputSpec(max_side=1024, format="jpeg", quality=90)
+
+    def __init__(self, base_url: str = None, model: str = "ministral_3_3b", **kwargs):
+        super().__init__(**kwargs)
+        import openai
+
+        self.model = model
+        self.retryable_errors = (openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+        self._io = EventLoopThread(f"ocr-{self.name}-io")
+        self._client = openai.AsyncOpenAI(
+            base_url=base_url or os.getenv("LLAMA_SERVER_URL", "http://127.0.0.1:8881/v1"),
+            api_key="no-key-needed",
+            timeout=self.timeout,
+            max_retries=0,  # 重試由 OCRBackend 統一處理
+        )
+
+    def _recognize_until(self, image_base64: str, deadline: Deadline) -> str:
+        return self._io.run(self._arecognize(image_base64, deadline.bound(self.timeout)), deadline)
+
+    def _recognize(self, image_base64: str, timeout: float) -> str:
+        return self._io.run(self._arecognize(image_base64, timeout), Deadline())
+
+    async def _arecognize(self, image_base64: str, timeout: float) -> str:
+        response = await self._client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "image_url", "image_url": {"url": f"data:image/{self.input_spec.format};base64,{image_base64}"}},
+                        {"type": "text", "text": OCR_PROMPT},
+                    ],
+                }
+            ],
+            temperature=0,
+            timeout=timeout,
+        )
+        return response.choices[0].message.content or ""
+
+
+class PaddleOCRBackend(OCRBackend):
+    """本機 PaddleOCR（首次呼叫時才載入模型）；逾時只限制等待 slot 的時間"""
+
+    name = "paddle"
+    max_concurrency = 1  # PaddleOCR predictor 非 thread-safe
+    timeout = 30.0
+    retries = 0
+    retryable_errors = ()
+    # 本機模型且只有一個 predictor，重複請求沒有意義
+    hedge_quantile = 0.0
+    # 同 process 內解碼，品質較高以免壓縮雜訊影響文字偵測
+    input_spec = OCRInputSpec(max_side=1280, format="jpeg", quality=95)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._ocr = None
+        self._init_lock = threading.Lock()
+
+    def _load(self):
+        with self._init_lock:
+            if self._ocr is None:
+                from paddleocr import PaddleOCR
+
+                self._ocr = PaddleOCR(
+                    use_doc_orientation_classify=False,
+                    use_doc_unwarping=False,
+                    use_textline_orientation=False,
+                )
+        return self._ocr
+
+    def _recognize(self, image_base64: str, timeout: float) -> str:
+        import numpy as np
+        from PIL import Image
+
+        image = Image.open(io.BytesIO(base64.b64decode(image_base64))).convert("RGB")
+        # PaddleOCR 的 ndarray 輸入為 BGR
+        array = np.asarray(image)[:, :, ::-1]
+        texts = []
+        for result in self._load().predict(np.ascontiguousarray(array)):
+            texts.extend(result["rec_texts"])
+        return "\n".join(texts)
+
+
+OCR_BACKENDS = {
+    OllamaGLMBackend.name: OllamaGLMBackend,
+    LlamaServerVisionBackend.name: LlamaServerVisionBackend,
+    PaddleOCRBackend.name: PaddleOCRBackend,
+}
+
+
+def _env_settings(name: str) -> dict:
+    prefix = f"OCR_{name.upper()}_"
+    settings = {}
+    for key, cast in (("max_concurrency", int), ("timeout", float), ("retries", int), ("hedge_quantile", float),
+                      ("breaker_failures", int), ("breaker_reset_s", float)):
+        value = os.getenv(prefix + key.upper())
+        if value is not None:
+            settings[key] = cast(value)
+    return settings
+
+
+def create_ocr_backend(name: str = None, **kwargs) -> OCRBackend:
+    """依名稱（或 OCR_BACKEND 環境變數）建立 backend，環境變數設定會被 kwargs 覆寫"""
+    name = name or os.getenv("OCR_BACKEND", OllamaGLMBackend.name)
+    if name not in OCR_BACKENDS:
+        raise ValueError(f"未知的 OCR backend: {name}（可用: {', '.join(OCR_BACKENDS)}）")
+    backend_cls = OCR_BACKENDS[name]
+    settings = {**_env_settings(name), "input_spec": spec_from_env(name, backend_cls.input_spec),
+                "class_weights": parse_class_weights(os.getenv("OCR_CLASS_WEIGHTS", ""))}
+    return backend_cls(**{**settings, **kwargs})
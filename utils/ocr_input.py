@@ -0,0 +1,108 @@
+"""
+OCR 輸入準備：將 crop 縮放到 OCR 模型的原生輸入尺寸，依 backend 選擇格式 / 品質後只編碼一次。
+
+送進 vision model 的圖片超過其原生尺寸時，模型端仍會再縮小一次，
+原尺寸傳輸只會增加 base64 / JSON 序列化與 prefill 成本。
+編碼結果（OCRPayload）可重複使用：OCR 呼叫、debug 輸出與快取 key 都取自同一份 bytes。
+
+cv2 在第一次縮放 / 編碼時才匯入：效期 OCR（date profile）直接轉送 base64，不需要 cv2 / numpy。
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import os
+from dataclasses import dataclass, replace
+from functools import cached_property
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+_ENCODE_PARAMS = {
+    "jpeg": lambda cv2, quality: [cv2.IMWRITE_JPEG_QUALITY, quality],
+    "png": lambda cv2, quality: [cv2.IMWRITE_PNG_COMPRESSION, 1],
+    "webp": lambda cv2, quality: [cv2.IMWRITE_WEBP_QUALITY, quality],
+}
+_EXTENSIONS = {"jpeg": ".jpg", "png": ".png", "webp": ".webp"}
+
+
+@dataclass(frozen=True)
+class OCRInputSpec:
+    """max_side：長邊上限（只縮小不放大，0 代表不縮放）；quality 只對有損格式有效"""
+
+    max_side: int = 1024
+    format: str = "jpeg"
+    quality: int = 90
+
+    def __post_init__(self):
+        if self.format not in _ENCODE_PARAMS:
+            raise ValueError(f"不支援的 OCR 輸入格式: {self.format}")
+
+    def with_overrides(self, **overrides) -> "OCRInputSpec":
+        return replace(self, **{k: v for k, v in overrides.items() if v is not None})
+
+
+@dataclass(frozen=True)
+class OCRPayload:
+    data: bytes
+    format: str
+    width: int
+    height: int
+
+    @cached_property
+    def b64(self) -> str:
+        return base64.b64encode(self.data).decode()
+
+    @cached_property
+    def sha256(self) -> str:
+        return hashlib.sha256(self.data).hexdigest()
+
+    @property
+    def mime_type(self) -> str:
+        return f"image/{self.format}"
+
+    def save(self, path_without_ext: str) -> str:
+        """直接寫出已編碼的 bytes（不重新編碼），回傳實際檔名"""
+        path = path_without_ext + _EXTENSIONS[self.format]
+        with open(path, "wb") as f:
+            f.write(self.data)
+        return path
+
+
+def fit_to_max_side(image: np.ndarray, max_side: int) -> np.ndarray:
+    """長邊超過 max_side 時以 INTER_AREA 等比縮小；否則原樣回傳（不複製）"""
+    import cv2
+
+    height, width = image.shape[:2]
+    longest = max(height, width)
+    if not max_side or longest <= max_side:
+        return image
+    scale = max_side / longest
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def prepare_ocr_input(image: np.ndarray, spec: OCRInputSpec) -> OCRPayload:
+    """image 為 BGR ndarray（可為 view），依 spec 縮放並編碼一次"""
+    import cv2
+
+    resized = fit_to_max_side(image, spec.max_side)
+    ok, encoded = cv2.imencode(_EXTENSIONS[spec.format], resized, _ENCODE_PARAMS[spec.format](cv2, spec.quality))
+    if not ok:
+        raise ValueError(f"OCR 輸入編碼失敗 ({spec.format})")
+    height, width = resized.shape[:2]
+    return OCRPayload(encoded.tobytes(), spec.format, width, height)
+
+
+def spec_from_env(name: str, default: OCRInputSpec) -> OCRInputSpec:
+    """OCR_<NAME>_INPUT_MAX_SIDE / _INPUT_FORMAT / _INPUT_QUALITY 覆寫 backend 預設值"""
+    prefix = f"OCR_{name.upper()}_INPUT_"
+    max_side = os.getenv(prefix + "MAX_SIDE")
+    quality = os.getenv(prefix + "QUALITY")
+    return default.with_overrides(
+        max_side=int(max_side) if max_side is not None else None,
+        format=os.getenv(prefix + "FORMAT"),
+        quality=int(quality) if quality is not None else None,
+    )
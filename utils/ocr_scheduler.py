@@ -0,0 +1,191 @@
+"""
+共用 OCR backend 的排程器。
+
+OCR backend（例如 Ollama glm-ocr）同時能處理的請求數有限（OLLAMA_NUM_PARALLEL），
+所有 endpoint 的 OCR 呼叫都經由 OCRScheduler 取得 slot：
+
+- 全域並發上限 capacity：與 backend 的平行處理能力一致（OCR_<NAME>_MAX_CONCURRENCY）
+- 優先等級（priority class）：各 class 有權重，slot 空出時以 stride scheduling 依權重分配，
+  權重高的 class（例如效期 OCR）多數時間優先，但權重低的 class 不會被餓死
+- 同一 class 內以 flow（通常為單一請求）輪流取得 slot：一張擠滿瓶子的貨架照片不會一次佔滿佇列，
+  同時進來的其他請求仍能穿插執行
+- 每個 class 記錄排隊人數、執行中數量與最近的排隊等待時間分布（stats()）
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+# 預設優先等級與權重：效期 OCR（單次、使用者在等）> 單張盤點 > 批次盤點 > 背景 job
+DEFAULT_CLASS_WEIGHTS = {"date": 8.0, "inventory": 4.0, "batch": 2.0, "job": 1.0}
+DEFAULT_CLASS = "inventory"
+WAIT_WINDOW = 1024
+# 等待期間檢查 abandoned() 的間隔
+ABANDON_POLL_S = 0.1
+
+
+def parse_class_weights(value: str) -> dict:
+    """"date=8,inventory=4" → {"date": 8.0, "inventory": 4.0}；未指定的 class 沿用預設權重"""
+    weights = dict(DEFAULT_CLASS_WEIGHTS)
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        name, _, weight = item.partition("=")
+        weight = float(weight)
+        if weight <= 0:
+            raise ValueError(f"OCR class 權重需大於 0: {item}")
+        weights[name.strip()] = weight
+    return weights
+
+
+class _Waiter:
+    __slots__ = ("priority", "flow", "enqueued_at", "event", "granted", "wait_s")
+
+    def __init__(self, priority: str, flow):
+        self.priority = priority
+        self.flow = flow
+        self.enqueued_at = time.monotonic()
+        self.event = threading.Event()
+        self.granted = False
+        self.wait_s = None
+
+
+class _ClassState:
+    def __init__(self, weight: float):
+        self.weight = weight
+        # stride scheduling 的 pass 值：每取得一個 slot 增加 1 / weight，值最小的 class 先執行
+        self.pass_value = 0.0
+        # flow → 該 flow 排隊中的 waiter；依序輪流
+        self.flows = OrderedDict()
+        self.waiting = 0
+        self.running = 0
+        self.granted = 0
+        self.timeouts = 0
+        self.waits = deque(maxlen=WAIT_WINDOW)
+
+
+class OCRScheduler:
+    """
+    capacity : 同時執行的 OCR 呼叫上限
+    weights  : priority class → 權重
+    """
+
+    def __init__(self, capacity: int, weights: dict = None):
+        if capacity < 1:
+            raise ValueError("capacity 需至少為 1")
+        self.capacity = capacity
+        self.weights = dict(weights or DEFAULT_CLASS_WEIGHTS)
+        self._classes = {name: _ClassState(weight) for name, weight in self.weights.items()}
+        self._lock = threading.Lock()
+        self._running = 0
+        self._virtual_time = 0.0
+
+    def acquire(self, priority: str = DEFAULT_CLASS, flow=None, timeout: float = None, abandoned=None):
+        """
+        排隊等待 slot，取得時回傳等待秒數；逾時或 abandoned() 為真時回傳 None。
+        flow 相同的呼叫視為同一個請求，同 class 內各 flow 輪流；未指定時每次呼叫各自一個 flow。
+        """
+        state = self._classes.get(priority)
+        if state is None:
+            raise ValueError(f"未知的 OCR priority class: {priority}（可用: {', '.join(self._classes)}）")
+        waiter = _Waiter(priority, flow if flow is not None else object())
+        with self._lock:
+            if not state.waiting and not state.running:
+                # 閒置的 class 不累積額度，從目前的虛擬時間開始計算
+                state.pass_value = max(state.pass_value, self._virtual_time)
+            state.flows.setdefault(waiter.flow, deque()).append(waiter)
+            state.waiting += 1
+            self._dispatch()
+
+        expires_at = time.monotonic() + timeout if timeout is not None else None
+        while not waiter.event.is_set():
+            wait_s = ABANDON_POLL_S if abandoned is not None else None
+            if expires_at is not None:
+                remaining = expires_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                wait_s = min(wait_s, remaining) if wait_s is not None else remaining
+            waiter.event.wait(wait_s)
+            if abandoned is not None and abandoned():
+                break
+
+        with self._lock:
+            # 逾時與取得 slot 同時發生時仍視為取得
+            if waiter.granted:
+                return waiter.wait_s
+            queue = state.flows[waiter.flow]
+            queue.remove(waiter)
+            if not queue:
+                del state.flows[waiter.flow]
+            state.waiting -= 1
+            state.timeouts += 1
+            return None
+
+    def try_acquire(self, priority: str = DEFAULT_CLASS) -> bool:
+        """
+        只在有閒置 slot 且沒有任何請求排隊時立即取得（hedged request 用：不與排隊中的請求搶 slot），
+        不計入排隊等待統計。
+        """
+        with self._lock:
+            if self._running >= self.capacity or any(state.waiting for state in self._classes.values()):
+                return False
+            self._running += 1
+            self._classes[priority].running += 1
+            return True
+
+    def release(self, priority: str = DEFAULT_CLASS):
+        with self._lock:
+            self._running -= 1
+            self._classes[priority].running -= 1
+            self._dispatch()
+
+    def _dispatch(self):
+        """持有 self._lock 時呼叫：依 pass 值與 flow 輪替把空出的 slot 交給排隊中的 waiter"""
+        while self._running < self.capacity:
+            active = [(state.pass_value, -state.weight, name) for name, state in self._classes.items() if state.waiting]
+            if not active:
+                return
+            _, _, name = min(active)
+            state = self._classes[name]
+            flow, queue = next(iter(state.flows.items()))
+            waiter = queue.popleft()
+            if queue:
+                state.flows.move_to_end(flow)
+            else:
+                del state.flows[flow]
+            self._virtual_time = state.pass_value
+            state.pass_value += 1.0 / state.weight
+            state.waiting -= 1
+            state.running += 1
+            state.granted += 1
+            self._running += 1
+            waiter.granted = True
+            waiter.wait_s = time.monotonic() - waiter.enqueued_at
+            state.waits.append(waiter.wait_s)
+            waiter.event.set()
+
+    def stats(self) -> dict:
+        """各 class 的權重、排隊 / 執行中數量、累計次數與最近 WAIT_WINDOW 次的排隊等待（ms）"""
+        import numpy as np
+
+        with self._lock:
+            snapshot = {name: (state.weight, state.waiting, state.running, state.granted, state.timeouts,
+                               list(state.waits), len(state.flows))
+                        for name, state in self._classes.items()}
+            running = self._running
+        classes = {}
+        for name, (weight, waiting, running_n, granted, timeouts, waits, flows) in snapshot.items():
+            waits_ms = np.asarray(waits) * 1000
+            classes[name] = {
+                "weight": weight,
+                "queued": waiting,
+                "queued_flows": flows,
+                "running": running_n,
+                "granted": granted,
+                "timeouts": timeouts,
+                "wait_ms": {
+                    "p50": round(float(np.percentile(waits_ms, 50)), 1),
+                    "p95": round(float(np.percentile(waits_ms, 95)), 1),
+                    "max": round(float(waits_ms.max()), 1),
+                    "mean": round(float(waits_ms.mean()), 1),
+                } if len(waits) else None,
+            }
+        return {"capacity": self.capacity, "running": running, "classes": classes}
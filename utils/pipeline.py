@@ -0,0 +1,165 @@
+"""
+多階段 pipeline：每個 stage 由各自的 thread 執行，stage 之間以有界 queue 串接，
+讓不同圖片的 decode / YOLO / CLIP / OCR 可以同時進行。
+
+- Stage(name, func, workers, batch_size, batch_timeout)
+  func 接收一批 item（list），回傳任意數量的輸出（可 fan-out 成多個 item）
+- 任一 stage 丟出例外或 deadline 已到 / 取消時，整條 pipeline 停止並在 run() 重新丟出
+- run() 回傳最後一個 stage 的所有輸出（順序不保證），stats 記錄各 stage 的批次數與忙碌時間
+"""
+
+import queue
+import threading
+import time
+
+from opentelemetry import context as otel_context
+from opentelemetry import trace
+
+from utils.deadline import Deadline
+
+tracer = trace.get_tracer(__name__)
+
+_DONE = object()
+_POLL_S = 0.05
+
+
+class Stage:
+    def __init__(self, name: str, func, workers: int = 1, batch_size: int = 1, batch_timeout: float = 0.0):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        # 湊批次時，拿到第一個 item 後最多再等多久
+        self.batch_timeout = batch_timeout
+
+
+class PipelineAborted(Exception):
+    """pipeline 因其他 stage 失敗而停止"""
+
+
+class Pipeline:
+    def __init__(self, stages: list, queue_size: int = 8):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stats = {}
+
+    def run(self, items, deadline: Deadline = None) -> list:
+        deadline = deadline or Deadline()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results = []
+        results_lock = threading.Lock()
+        stop = threading.Event()
+        errors = []
+        remaining = [stage.workers for stage in self.stages]
+        remaining_lock = threading.Lock()
+        self.stats = {stage.name: {"workers": stage.workers, "batches": 0, "items_in": 0, "items_out": 0,
+                                   "busy_s": 0.0} for stage in self.stages}
+        parent_context = otel_context.get_current()
+
+        def fail(exc):
+            errors.append(exc)
+            stop.set()
+
+        def put(q, item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=_POLL_S)
+                    return
+                except queue.Full:
+                    pass
+            raise PipelineAborted()
+
+        def get(q, timeout=None):
+            """timeout=None 代表一直等到有 item 或 pipeline 停止"""
+            waited_until = None if timeout is None else time.monotonic() + timeout
+            while not stop.is_set():
+                wait = _POLL_S if waited_until is None else min(_POLL_S, waited_until - time.monotonic())
+                if wait <= 0:
+                    raise queue.Empty
+                try:
+                    return q.get(timeout=wait)
+                except queue.Empty:
+                    pass
+            raise PipelineAborted()
+
+        def emit(position, outputs):
+            if position + 1 == len(self.stages):
+                with results_lock:
+                    results.extend(outputs)
+                return
+            for output in outputs:
+                put(queues[position + 1], output)
+
+        def worker(position: int):
+            stage = self.stages[position]
+            stats = self.stats[stage.name]
+            token = otel_context.attach(parent_context)
+            try:
+                finished = False
+                while not finished:
+                    first = get(queues[position])
+                    if first is _DONE:
+                        break
+                    batch = [first]
+                    batch_deadline = time.monotonic() + stage.batch_timeout
+                    while len(batch) < stage.batch_size:
+                        try:
+                            item = get(queues[position], max(0.0, batch_deadline - time.monotonic()))
+                        except queue.Empty:
+                            break
+                        if item is _DONE:
+                            finished = True
+                            break
+                        batch.append(item)
+
+                    deadline.check()
+                    started = time.perf_counter()
+                    with tracer.start_as_current_span(f"pipeline.{stage.name}") as span:
+                        span.set_attribute("pipeline.batch_size", len(batch))
+                        outputs = list(stage.func(batch))
+                    with results_lock:
+                        stats["batches"] += 1
+                        stats["items_in"] += len(batch)
+                        stats["items_out"] += len(outputs)
+                        stats["busy_s"] += time.perf_counter() - started
+                    emit(position, outputs)
+            except PipelineAborted:
+                return
+            except BaseException as e:
+                fail(e)
+                return
+            finally:
+                otel_context.detach(token)
+            # 同 stage 最後一個結束的 worker 通知下一個 stage 的所有 worker
+            with remaining_lock:
+                remaining[position] -= 1
+                last = remaining[position] == 0
+            if last and position + 1 < len(self.stages):
+                try:
+                    for _ in range(self.stages[position + 1].workers):
+                        put(queues[position + 1], _DONE)
+                except PipelineAborted:
+                    pass
+
+        threads = [
+            threading.Thread(target=worker, args=(position,), name=f"pipeline-{stage.name}-{i}", daemon=True)
+            for position, stage in enumerate(self.stages)
+            for i in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for item in items:
+                put(queues[0], item)
+            for _ in range(self.stages[0].workers):
+                put(queues[0], _DONE)
+        except PipelineAborted:
+            pass
+        for thread in threads:
+            thread.join()
+
+        for stats in self.stats.values():
+            stats["busy_s"] = round(stats["busy_s"], 4)
+        if errors:
+            raise errors[0]
+        return results
@@ -0,0 +1,297 @@
+"""
+單一請求的 CPU / 記憶體 profiling（/inventory_base64 的 X-Profile header 或 PROFILE_SAMPLE_RATE 觸發）。
+
+- CPU   : 背景 thread 每 interval_s 取樣一次處理請求的 thread 的 call stack（sys._current_frames），
+          累計成 collapsed stack（flamegraph.pl / speedscope 可直接讀取），不需額外套件，也不需 attach 外部 profiler
+- 記憶體: 請求開始與結束各取一次 tracemalloc snapshot，依配置位置（含呼叫端）列出仍存活的配置；tracemalloc 為全域設定，
+          同時有多個 profiling 請求時共用，最後一個結束時才停止。numpy 的配置會被追蹤，OpenCV 的不會
+
+結果以 request id 為 key 存在 ProfileStore（<id>.json 摘要 + <id>.folded collapsed stacks），超過上限時刪除最舊的。
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILE_MODES = ("cpu", "memory")
+# request id 會成為檔名，只接受安全字元
+_PROFILE_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+
+def parse_profile_modes(value) -> tuple:
+    """X-Profile header → 要收集的項目；"1" / "all" 代表全部，"cpu" / "memory" 可逗號組合，其他值視為關閉"""
+    if not value:
+        return ()
+    value = value.strip().lower()
+    if value in ("1", "true", "all"):
+        return PROFILE_MODES
+    return tuple(mode for mode in PROFILE_MODES if mode in {v.strip() for v in value.split(",")})
+
+
+def valid_profile_id(profile_id) -> bool:
+    return bool(profile_id) and bool(_PROFILE_ID_RE.match(profile_id)) and profile_id not in (".", "..")
+
+
+_frame_labels = {}
+
+
+def _frame_label(code) -> str:
+    label = _frame_labels.get(code)
+    if label is None:
+        label = _frame_labels[code] = _format_frame(code)
+    return label
+
+
+def _format_frame(code) -> str:
+    filename = code.co_filename
+    try:
+        relative = os.path.relpath(filename)
+        if not relative.startswith(".."):
+            filename = relative
+        else:
+            filename = os.path.join(*filename.replace("\\", "/").split("/")[-2:])
+    except ValueError:
+        pass
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """以固定間隔取樣指定 thread 的 call stack，累計 collapsed stack 次數"""
+
+    def __init__(self, thread_id: int, interval_s: float = 0.005, max_depth: int = 128):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            del frame
+
+    def folded(self) -> str:
+        """flamegraph.pl / speedscope 的 collapsed 格式：每行「root;...;leaf 次數」"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit: int = 30) -> list:
+        """各函式出現在 stack 頂端（self）與任一層（total）的取樣比例，依 self 排序"""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for label in set(frames):
+                total[label] += count
+        samples = max(self.samples, 1)
+        return [{
+            "function": label,
+            "self_pct": round(100 * own[label] / samples, 1),
+            "total_pct": round(100 * total[label] / samples, 1),
+        } for label, count in own.most_common(limit)]
+
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+
+
+def _acquire_tracemalloc(frames: int):
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0:
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start(frames)
+                _tracemalloc_owned = True
+        _tracemalloc_users += 1
+
+
+def _release_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        # 只停止自己啟動的 tracemalloc（例如以 PYTHONTRACEMALLOC 啟動時保留）
+        if _tracemalloc_users == 0 and _tracemalloc_owned:
+            tracemalloc.stop()
+            _tracemalloc_owned = False
+
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, "<frozen *>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+
+
+def memory_diff(before, after, limit: int = 30, depth: int = 6) -> list:
+    """
+    兩個 snapshot 之間依配置位置的差異（KB），依增加量排序。
+    以完整 traceback 分組，callers 保留外層的呼叫位置（numpy 等套件內的配置才看得出是哪段程式造成）。
+    """
+    return [{
+        "location": f"{stat.traceback[-1].filename}:{stat.traceback[-1].lineno}",
+        "callers": [f"{frame.filename}:{frame.lineno}" for frame in list(stat.traceback)[-2:-depth - 1:-1]],
+        "size_kb": round(stat.size / 1024, 1),
+        "size_diff_kb": round(stat.size_diff / 1024, 1),
+        "count_diff": stat.count_diff,
+    } for stat in after.compare_to(before, "traceback")[:limit] if stat.size_diff]
+
+
+class ProfileStore:
+    """以 request id 保存 profile；<id>.json 為摘要、<id>.folded 為 collapsed stacks"""
+
+    def __init__(self, directory: str, max_profiles: int = 100):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+        # 已保留、尚未保存的 id（profiling 執行中）
+        self._reserved = set()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, profile_id: str, kind: str = "json"):
+        """檔案存在時回傳路徑，否則 None（不合法的 id 亦回傳 None）"""
+        if kind not in ("json", "folded") or not valid_profile_id(profile_id):
+            return None
+        path = os.path.join(self.directory, f"{profile_id}.{kind}")
+        return path if os.path.exists(path) else None
+
+    def reserve(self, profile_id: str) -> bool:
+        """保留尚未使用的 id；已有同名 profile 或執行中時回傳 False，避免覆寫。save 後釋放"""
+        if not valid_profile_id(profile_id):
+            return False
+        with self._lock:
+            if profile_id in self._reserved or os.path.exists(os.path.join(self.directory, f"{profile_id}.json")):
+                return False
+            self._reserved.add(profile_id)
+            return True
+
+    def save(self, profile: dict, folded: str = None):
+        profile_id = profile["id"]
+        if not valid_profile_id(profile_id):
+            raise ValueError(f"不合法的 profile id: {profile_id!r}")
+        base = os.path.join(self.directory, profile_id)
+        with self._lock:
+            if folded is not None:
+                with open(f"{base}.folded", "w", encoding="utf-8") as f:
+                    f.write(folded + "\n")
+            tmp = f"{base}.json.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(profile, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, f"{base}.json")
+            self._reserved.discard(profile_id)
+            self._prune()
+
+    def _prune(self):
+        entries = sorted(
+            (e for e in os.scandir(self.directory) if e.name.endswith(".json")),
+            key=lambda e: e.stat().st_mtime,
+        )
+        for entry in entries[:max(len(entries) - self.max_profiles, 0)]:
+            profile_id = entry.name[:-len(".json")]
+            for kind in ("json", "folded"):
+                try:
+                    os.remove(os.path.join(self.directory, f"{profile_id}.{kind}"))
+                except FileNotFoundError:
+                    pass
+
+    def list(self) -> list:
+        """所有 profile 的摘要（不含 stacks 與記憶體明細），新的在前"""
+        summaries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path, encoding="utf-8") as f:
+                    profile = json.load(f)
+            except (OSError, ValueError):
+                continue
+            summaries.append({k: profile.get(k) for k in
+                              ("id", "created_at", "modes", "wall_s", "cpu_s", "samples", "error", "attributes")})
+        return sorted(summaries, key=lambda p: p["created_at"] or "", reverse=True)
+
+
+@contextmanager
+def profile_request(store: ProfileStore, profile_id: str, modes=PROFILE_MODES, interval_s: float = 0.005,
+                    memory_frames: int = 16, top: int = 30):
+    """
+    profiling 目前 thread 的 with 區塊，結束（含例外）時存入 store。
+    yield 的 dict 可加入額外屬性（例如圖片大小），會存在 profile 的 attributes。
+    """
+    attributes = {}
+    sampler = StackSampler(threading.get_ident(), interval_s) if "cpu" in modes else None
+    if "memory" in modes:
+        _acquire_tracemalloc(memory_frames)
+        before = _snapshot()
+    started, cpu_started = time.perf_counter(), time.thread_time()
+    if sampler is not None:
+        sampler.start()
+    error = None
+    try:
+        yield attributes
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        wall_s, cpu_s = time.perf_counter() - started, time.thread_time() - cpu_started
+        profile = {
+            "id": profile_id,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "modes": list(modes),
+            "wall_s": round(wall_s, 4),
+            # 處理請求的 thread 實際使用的 CPU 時間；遠小於 wall_s 代表多在等待 OCR / LLM
+            "cpu_s": round(cpu_s, 4),
+            "error": error,
+            "attributes": attributes,
+        }
+        folded = None
+        if sampler is not None:
+            sampler.stop()
+            profile.update(samples=sampler.samples, interval_ms=interval_s * 1000,
+                           top_functions=sampler.top_functions(top))
+            folded = sampler.folded()
+        if "memory" in modes:
+            try:
+                after = _snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                profile["memory"] = {
+                    # 與同時間的其他請求共用，僅供參考
+                    "traced_current_mb": round(current / (1 << 20), 2),
+                    "traced_peak_mb": round(peak / (1 << 20), 2),
+                    "top_allocations": memory_diff(before, after, top),
+                }
+            finally:
+                _release_tracemalloc()
+        try:
+            store.save(profile, folded)
+            print(f"[Profile] 已保存 {profile_id}（{profile['wall_s']}s, {profile.get('samples', 0)} 個取樣）")
+        except (OSError, ValueError) as e:
+            print(f"[Profile] 保存 {profile_id} 失敗: {e}")
@@ -0,0 +1,176 @@
+"""
+OCR / LLM backend 的 hedged request 與 circuit breaker。
+
+- hedged_call   : 送出請求後等待 hedge 延遲（近期成功呼叫延遲的 p95），仍未完成就再送一次相同請求，
+                  取先成功者；第一個請求在延遲前就失敗時立即送出第二個（等同重試）。
+                  被取代的請求無法中途取消，會在背景跑完（受各自的逾時限制）
+- LatencyTracker: 保存最近的成功呼叫延遲，樣本不足時不 hedge
+- CircuitBreaker: 連續失敗達門檻即開啟，開啟期間直接丟出 CircuitOpenError（呼叫端改用「未知商品」或
+                  模板回答），reset_timeout_s 後放行一個試探請求，成功才關閉
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """backend 的斷路器開啟中，未送出請求"""
+
+
+class CircuitBreaker:
+    """
+    failure_threshold : 連續失敗幾次後開啟
+    reset_timeout_s   : 開啟多久後放行試探請求（half-open）
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout_s: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout_s:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """是否可送出請求；half-open 時只放行一個試探請求"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout_s and not self._probe_in_flight:
+                self._state = HALF_OPEN
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def check(self):
+        if not self.allow():
+            raise CircuitOpenError(f"[{self.name}] 斷路器開啟中，暫停呼叫 backend")
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                print(f"[Breaker] {self.name} 恢復正常，關閉斷路器")
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                print(f"[Breaker] {self.name} 連續失敗 {self._failures} 次，開啟斷路器 {self.reset_timeout_s}s")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """試探請求因與 backend 無關的原因（期限、取消）結束時，讓下一個請求再試"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def describe(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout_s": self.reset_timeout_s,
+            "rejected": self.rejected,
+        }
+
+
+class LatencyTracker:
+    """最近 window 次成功呼叫的延遲（秒）"""
+
+    def __init__(self, window: int = 256, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float):
+        """樣本不足 min_samples 時回傳 None"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            samples = list(self._samples)
+        import numpy as np
+
+        return float(np.quantile(samples, q))
+
+
+class HedgeStats:
+    """hedged_call 的累計次數：hedged 為送出第二個請求的次數，hedge_won 為第二個請求先完成的次數"""
+
+    def __init__(self):
+        self.hedged = 0
+        self.hedge_won = 0
+        self._lock = threading.Lock()
+
+    def add(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def describe(self) -> dict:
+        return {"hedged": self.hedged, "hedge_won": self.hedge_won}
+
+
+def hedge_delay(tracker: LatencyTracker, quantile: float, min_delay_s: float = 0.05):
+    """依近期延遲決定 hedge 延遲；quantile <= 0 或樣本不足時回傳 None（不 hedge）"""
+    if quantile <= 0:
+        return None
+    delay = tracker.quantile(quantile)
+    return None if delay is None else max(delay, min_delay_s)
+
+
+def hedged_call(executor, fn, delay_s: float, can_hedge=None, retryable=None, stats: HedgeStats = None):
+    """
+    在 executor 執行 fn()，delay_s 秒後仍未完成、或已失敗且 retryable(例外) 為真時，若 can_hedge() 為真
+    再執行一次 fn()，回傳先成功者的結果；全部失敗時丟出最後一個例外。
+    """
+    primary = executor.submit(fn)
+    done, _ = wait([primary], timeout=delay_s)
+    if done and primary.exception() is None:
+        return primary.result()
+    if done and retryable is not None and not retryable(primary.exception()):
+        raise primary.exception()
+
+    pending = {primary}
+    hedged = None
+    if can_hedge is None or can_hedge():
+        hedged = executor.submit(fn)
+        pending.add(hedged)
+        if stats is not None:
+            stats.add("hedged")
+    last_error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is hedged and stats is not None:
+                    stats.add("hedge_won")
+                return future.result()
+            last_error = future.exception()
+    raise last_error
@@ -0,0 +1,167 @@
+"""
+/inventory_base64 的整個請求結果快取。
+
+網路不穩時 client 常重送同一張貨架照片，每次都要重跑 YOLO、CLIP、所有 OCR 與 LLM。
+以「圖片 bytes 的 sha256 + 問題 + catalog 版本」為 key 保存回應：
+
+- 只需 base64 解碼與一次 sha256，命中時不解碼圖片，也不呼叫任何模型或 backend
+- catalog 版本在 key 中：/db/add、/db/{name} 之後舊結果不會再被取用；invalidate() 另外清空以釋放記憶體
+- 筆數上限（LRU 淘汰）與 TTL 限制記憶體與結果的新舊；回應只有統計文字，每筆約數 KB
+- single-flight：重送的請求常在第一個請求仍在處理時就到達，get_or_compute 讓相同 key 的並發請求
+  等待正在執行的那一個，而不是各自重跑；執行者的結果不可保存（降級、部分結果）或執行失敗時，
+  等待者改由其中一個重新執行
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# 等待其他請求的結果時檢查 abandoned() 的間隔
+ABANDON_POLL_S = 0.1
+
+
+def result_key(image_bytes: bytes, question: str, catalog_version) -> str:
+    image_digest = hashlib.sha256(image_bytes).hexdigest()
+    return hashlib.sha256(json.dumps([image_digest, question, catalog_version]).encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    __slots__ = ("done", "result")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class ResultCache:
+    """
+    max_entries : 保存筆數上限，超過時淘汰最久未使用者
+    ttl_s       : 每筆結果的有效秒數
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_s: float = 300.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._clock = clock
+        # key → (到期時間, 回應)
+        self._entries = OrderedDict()
+        # key → 執行中的 _Flight
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str):
+        """回傳保存的回應（複本），未命中或已過期時回傳 None"""
+        with self._lock:
+            return self._lookup(key)
+
+    def _lookup(self, key: str):
+        """持有 self._lock 時呼叫"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= self._clock():
+            del self._entries[key]
+            self.expired += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(entry[1])
+
+    def get_or_compute(self, key: str, compute, timeout: float = None, abandoned=None, lookup: bool = True):
+        """
+        回傳 (回應, 來源)：來源為 "hit"（已保存）、"coalesced"（等到並發的相同請求的結果）或 "computed"。
+        compute() 回傳 (回應, 是否可保存)；可保存的回應才會存入並交給等待中的請求。
+        等待超過 timeout 秒或 abandoned() 為真時不再等待，自行 compute()。lookup=False 時一律自行執行。
+        """
+        if not lookup:
+            result, cacheable = compute()
+            if cacheable:
+                self.put(key, result)
+            return result, "computed"
+        while True:
+            with self._lock:
+                cached = self._lookup(key)
+                if cached is not None:
+                    return cached, "hit"
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = self._flights[key] = _Flight()
+                    break
+            if not self._wait(flight, timeout, abandoned):
+                result, _ = compute()
+                return result, "computed"
+            if flight.result is not None:
+                with self._lock:
+                    self.coalesced += 1
+                return dict(flight.result), "coalesced"
+            # 執行者失敗或結果不可保存：由等待者之一重新執行
+
+        try:
+            result, cacheable = compute()
+            if cacheable:
+                self.put(key, result)
+                flight.result = dict(result)
+            return result, "computed"
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    @staticmethod
+    def _wait(flight: _Flight, timeout: float, abandoned) -> bool:
+        """等待 flight 完成；逾時或 abandoned() 為真時回傳 False"""
+        expires_at = time.monotonic() + timeout if timeout is not None else None
+        while not flight.done.is_set():
+            wait_s = ABANDON_POLL_S if abandoned is not None else None
+            if expires_at is not None:
+                remaining = expires_at - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait_s = min(wait_s, remaining) if wait_s is not None else remaining
+            flight.done.wait(wait_s)
+            if abandoned is not None and abandoned() and not flight.done.is_set():
+                return False
+        return True
+
+    def put(self, key: str, result: dict):
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl_s, dict(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self) -> int:
+        """清空所有結果（catalog 變更時），回傳清除的筆數"""
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            self.invalidations += 1
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._flights),
+            }
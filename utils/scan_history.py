@@ -0,0 +1,303 @@
+"""
+掃描歷史（Parquet 欄式儲存，polars 查詢）。
+
+每次盤點記錄兩張表，皆以 hive 分區 date=YYYY-MM-DD 存放：
+- scans  : 每次掃描一列（scan_id, ts, store, source, bottles, unknown, unresolved, latency_ms）
+- counts : 每次掃描 × SKU 一列（scan_id, ts, store, sku, count）
+
+寫入先暫存在記憶體，累積 flush_rows 列（喚醒背景 thread）或每 flush_interval_s 秒寫成一個新檔，
+record() 本身不做磁碟 IO；查詢時一併納入尚未寫出的資料。當天分區的檔案數達 compact_files 時即合併，
+過了當天的分區則合併成單一檔案。日期條件以分區裁剪略過整個目錄；檔案內依 store, sku, ts
+排序，店 / SKU 條件再透過 row group 統計略過不相符的區段。
+不以店再細分目錄：店多、單店單日掃描少時會產生大量小檔案，反而拖慢查詢。
+
+flush 只在交換暫存資料與改名已寫好的檔案時持有 process 內的 lock，Parquet 寫入期間不阻擋 record() 與查詢；
+查詢只在取暫存資料與檔案清單時持有該 lock，掃描與 collect 期間改持有 .compact.lock 的共享檔案鎖；
+合併持有獨佔檔案鎖，因此不會刪除查詢中正在讀的檔案（跨 process 亦然），寫入與其他查詢也不必等待查詢完成。
+"""
+
+import fcntl
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime
+from pathlib import Path
+
+import polars as pl
+
+SCANS = "scans"
+COUNTS = "counts"
+
+_SCHEMAS = {
+    SCANS: {
+        "scan_id": pl.String, "ts": pl.Datetime("us"), "date": pl.Date, "store": pl.String,
+        "source": pl.String, "bottles": pl.Int32, "unknown": pl.Int32, "unresolved": pl.Int32,
+        "latency_ms": pl.Float64,
+    },
+    COUNTS: {
+        "scan_id": pl.String, "ts": pl.Datetime("us"), "date": pl.Date, "store": pl.String,
+        "sku": pl.String, "count": pl.Int32,
+    },
+}
+_HIVE_SCHEMA = {"date": pl.Date}
+_SORT_COLUMNS = {SCANS: ["store", "ts"], COUNTS: ["store", "sku", "ts"]}
+_ROW_GROUP_SIZE = 16384
+# 可用於查詢 interval 參數的時間粒度（polars duration 字串）
+INTERVALS = ("1h", "1d", "1w", "1mo")
+
+
+class ScanHistory:
+    def __init__(self, root: str, flush_rows: int = 1000, flush_interval_s: float = 30.0, compact_files: int = 16):
+        self.root = Path(root)
+        self.flush_rows = flush_rows
+        self.flush_interval_s = flush_interval_s
+        self.compact_files = compact_files
+        self._buffers = {SCANS: [], COUNTS: []}
+        # 已從暫存區取出、檔案尚未改名就位的資料；查詢仍將其視為暫存資料
+        self._pending = []
+        # 保護暫存資料、_pending 與檔案改名；查詢取得的暫存資料與檔案清單才不會重複或遺漏
+        self._lock = threading.Lock()
+        # 同一時間只有一個 flush 在寫檔
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        # 暫存達 flush_rows 或 stop() 時喚醒背景 thread
+        self._wake = threading.Event()
+        self._thread = None
+        self._compacted_before = None
+
+    # ---------- 寫入 ----------
+
+    def record(self, store: str, counts: dict, latency_ms: float, source: str, unknown: int = 0,
+               unresolved: int = 0, ts: datetime = None) -> str:
+        ts = ts or datetime.now()
+        scan_id = uuid.uuid4().hex
+        base = {"scan_id": scan_id, "ts": ts, "date": ts.date(), "store": store}
+        with self._lock:
+            self._buffers[SCANS].append({
+                **base, "source": source, "bottles": sum(counts.values()), "unknown": unknown,
+                "unresolved": unresolved, "latency_ms": latency_ms,
+            })
+            self._buffers[COUNTS].extend({**base, "sku": sku, "count": n} for sku, n in counts.items())
+            full = len(self._buffers[SCANS]) >= self.flush_rows
+        if full:
+            # 背景 thread 執行中時交給它寫檔，請求不等待磁碟 IO
+            if self._thread is not None and self._thread.is_alive():
+                self._wake.set()
+            else:
+                self.flush()
+        return scan_id
+
+    def _buffer_frame(self, table: str) -> pl.DataFrame:
+        """持有 self._lock 時呼叫；包含寫檔中、尚未就位的資料"""
+        rows = [row for batch in self._pending for row in batch[table]] + self._buffers[table]
+        return pl.DataFrame(rows, schema=_SCHEMAS[table])
+
+    def flush(self) -> int:
+        """
+        將暫存資料寫成 Parquet，回傳寫出的掃描數。
+        lock 內只交換暫存區；寫完暫存檔後再於 lock 內一次改名就位並移出 _pending，
+        查詢在任何時間點都只會從暫存資料或檔案其中之一看到這批資料。
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch = self._buffers
+                self._buffers = {table: [] for table in batch}
+                self._pending.append(batch)
+            written = []
+            try:
+                for table, rows in batch.items():
+                    frame = pl.DataFrame(rows, schema=_SCHEMAS[table])
+                    for (day,), part in frame.group_by("date"):
+                        written.append(self._write_partition(table, day, part))
+            except BaseException:
+                # 尚未有檔案就位：清掉暫存檔，資料放回暫存區等下次 flush
+                for tmp, _ in written:
+                    tmp.unlink(missing_ok=True)
+                with self._lock:
+                    self._pending.remove(batch)
+                    for table, rows in batch.items():
+                        self._buffers[table][:0] = rows
+                raise
+            with self._lock:
+                for tmp, path in written:
+                    os.replace(tmp, path)
+                self._pending.remove(batch)
+        return len(batch[SCANS])
+
+    def _partition_dir(self, table: str, day: date) -> Path:
+        return self.root / table / f"date={day.isoformat()}"
+
+    @staticmethod
+    def _write_tmp(table: str, frame: pl.DataFrame, directory: Path, name: str) -> tuple:
+        """寫成暫存檔，回傳 (暫存檔, 正式路徑)；改名後讀取端才看得到，不會讀到寫到一半的檔案"""
+        tmp = directory / f".{name}.tmp"
+        frame.sort(_SORT_COLUMNS[table]).write_parquet(tmp, statistics=True, row_group_size=_ROW_GROUP_SIZE)
+        return tmp, directory / name
+
+    def _write_partition(self, table: str, day: date, frame: pl.DataFrame) -> tuple:
+        directory = self._partition_dir(table, day)
+        directory.mkdir(parents=True, exist_ok=True)
+        name = f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet"
+        return self._write_tmp(table, frame.drop("date"), directory, name)
+
+    def compact(self, day: date = None, min_files: int = 2, wait: bool = False) -> int:
+        """
+        合併檔案數達 min_files 的分區，回傳合併的分區數。
+        day 指定時只處理該日；未指定時處理今天以前的所有分區。
+        以獨佔檔案鎖與其他 process 的合併、進行中的查詢互斥；鎖被佔用時 wait=False 直接略過（回傳 0），
+        wait=True 則等待。
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        merged = 0
+        with open(self.root / ".compact.lock", "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+            except BlockingIOError:
+                return 0
+            for table in _SCHEMAS:
+                if day is not None:
+                    day_dirs = [self._partition_dir(table, day)]
+                else:
+                    today = date.today()
+                    day_dirs = [d for d in (self.root / table).glob("date=*")
+                                if date.fromisoformat(d.name.split("=", 1)[1]) < today]
+                for directory in day_dirs:
+                    files = sorted(directory.glob("*.parquet"))
+                    if len(files) >= max(min_files, 2):
+                        self._merge_files(table, directory, files)
+                        merged += 1
+        return merged
+
+    def _merge_files(self, table: str, directory: Path, files: list):
+        frame = pl.read_parquet(files, hive_partitioning=False)
+        os.replace(*self._write_tmp(table, frame, directory,
+                                    f"compacted-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet"))
+        # 只刪除讀進來的檔案，合併期間其他 process 新寫入的檔案保留
+        for path in files:
+            path.unlink()
+
+    def start(self):
+        """啟動背景 thread：定時 flush 與合併分區"""
+        self._thread = threading.Thread(target=self._flush_loop, name="scan-history", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_interval_s)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.flush()
+                today = date.today()
+                self.compact(today, self.compact_files)
+                if self._compacted_before != today:
+                    merged = self.compact(wait=True)
+                    if merged:
+                        print(f"[History] 合併 {merged} 個分區")
+                    self._compacted_before = today
+            except Exception as e:
+                print(f"[History] 寫入失敗: {e}")
+
+    # ---------- 查詢 ----------
+
+    @contextmanager
+    def _read_lock(self):
+        """查詢期間持有共享檔案鎖，合併不會刪除正在讀的檔案"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / ".compact.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            yield
+
+    def _snapshot(self, table: str, start: date = None, end: date = None) -> tuple:
+        """同一時間點的暫存資料與檔案清單；日期範圍外的分區目錄直接略過"""
+        with self._lock:
+            buffered = self._buffer_frame(table)
+            files = []
+            for directory in (self.root / table).glob("date=*"):
+                day = date.fromisoformat(directory.name.split("=", 1)[1])
+                if (start is None or day >= start) and (end is None or day <= end):
+                    files.extend(directory.glob("*.parquet"))
+        return buffered, sorted(files)
+
+    def _scan(self, table: str, start: date = None, end: date = None) -> pl.LazyFrame:
+        """呼叫端需持有 _read_lock"""
+        buffered, files = self._snapshot(table, start, end)
+        if not files:
+            return buffered.lazy()
+        stored = pl.scan_parquet(
+            files, hive_partitioning=True, hive_schema=_HIVE_SCHEMA,
+        ).select(list(_SCHEMAS[table]))
+        return pl.concat([stored, buffered.lazy()], how="vertical_relaxed")
+
+    @staticmethod
+    def _filter(frame: pl.LazyFrame, start: date = None, end: date = None, stores: list = None) -> pl.LazyFrame:
+        # date 為分區欄位，polars 會直接略過不相符的目錄
+        if start is not None:
+            frame = frame.filter(pl.col("date") >= start)
+        if end is not None:
+            frame = frame.filter(pl.col("date") <= end)
+        if stores:
+            frame = frame.filter(pl.col("store").is_in(stores))
+        return frame
+
+    @staticmethod
+    def _group_keys(group_by: list, interval: str = None) -> list:
+        keys = []
+        if interval:
+            if interval not in INTERVALS:
+                raise ValueError(f"interval 必須是 {', '.join(INTERVALS)} 之一")
+            keys.append(pl.col("ts").dt.truncate(interval).alias("period"))
+        return keys + [pl.col(name) for name in group_by]
+
+    @staticmethod
+    def _aggregate(frame: pl.LazyFrame, keys: list, aggs: list) -> list:
+        if not keys:
+            return frame.select(aggs).collect().to_dicts()
+        result = frame.group_by(keys).agg(aggs).collect()
+        return result.sort([key.meta.output_name() for key in keys]).to_dicts()
+
+    def query_counts(self, start: date = None, end: date = None, stores: list = None, skus: list = None,
+                     group_by: tuple = ("store", "sku"), interval: str = None) -> list:
+        """各 SKU 的數量加總與出現的掃描次數；group_by 可選 store / sku"""
+        for name in group_by:
+            if name not in ("store", "sku"):
+                raise ValueError(f"counts 不支援依 {name} 分組")
+        keys = self._group_keys(list(group_by), interval)
+        with self._read_lock():
+            frame = self._filter(self._scan(COUNTS, start, end), start, end, stores)
+            if skus:
+                frame = frame.filter(pl.col("sku").is_in(skus))
+            return self._aggregate(frame, keys, [
+                pl.col("count").sum().alias("count"),
+                pl.col("scan_id").n_unique().alias("scans"),
+            ])
+
+    def query_scans(self, start: date = None, end: date = None, stores: list = None,
+                    group_by: tuple = ("store",), interval: str = None) -> list:
+        """掃描次數、瓶數、未知率與延遲分布；group_by 可選 store / source"""
+        for name in group_by:
+            if name not in ("store", "source"):
+                raise ValueError(f"scans 不支援依 {name} 分組")
+        keys = self._group_keys(list(group_by), interval)
+        with self._read_lock():
+            frame = self._filter(self._scan(SCANS, start, end), start, end, stores)
+            return self._aggregate(frame, keys, [
+                pl.len().alias("scans"),
+                pl.col("bottles").sum().alias("bottles"),
+                pl.col("unknown").sum().alias("unknown"),
+                pl.col("unresolved").sum().alias("unresolved"),
+                (pl.col("unknown").sum() / pl.col("bottles").sum()).fill_nan(None).round(4).alias("unknown_rate"),
+                pl.col("latency_ms").mean().round(1).alias("latency_mean_ms"),
+                pl.col("latency_ms").quantile(0.5).round(1).alias("latency_p50_ms"),
+                pl.col("latency_ms").quantile(0.95).round(1).alias("latency_p95_ms"),
+            ])
@@ -0,0 +1,105 @@
+"""
+CLIP 文字向量驗證（VERIFY_MODE=clip_text）。
+
+CLIP 的影像與文字向量在同一個空間，catalog 每個商品的 brand / flavor / color 組成幾句描述，
+文字向量預先算好並快取（以描述文字為 key，catalog 新增商品時只需計算新的描述）。
+比對時所有 crop 的影像向量一次與整個文字矩陣相乘，得到每個 crop 對每個商品的文字相似度；
+影像最近鄰與文字最佳候選一致、且影像距離夠近時直接採用，不一致時才交給 OCR 確認。
+"""
+
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+
+
+def item_prompts(meta: dict) -> list:
+    """商品的描述句；多句的文字向量平均後作為該商品的文字向量"""
+    name = f"{meta.get('brand', '')}{meta.get('flavor', '')}"
+    prompts = [name, f"一瓶{name}飲料"]
+    if meta.get("color"):
+        prompts.append(f"{meta['color']}瓶身的{name}")
+    return prompts
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+@dataclass(frozen=True)
+class TextEvidence:
+    image_id: str
+    image_distance: float
+    text_id: str
+    text_score: float
+    # 文字最佳候選與第二名的相似度差
+    text_margin: float
+    agree: bool
+
+
+class TextVerifier:
+    """
+    encode_text(list[str]) -> (N, D) 文字向量。
+    max_image_distance : 影像最近鄰的 cosine distance 需低於此值才可略過 OCR
+    min_margin         : 文字最佳候選需領先第二名至少此相似度
+    """
+
+    def __init__(self, encode_text, max_image_distance: float = 0.35, min_margin: float = 0.0):
+        self._encode_text = encode_text
+        self.max_image_distance = max_image_distance
+        self.min_margin = min_margin
+        self._prompt_cache = {}
+        self._lock = threading.Lock()
+        self.ids = []
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.version = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def refresh(self, ids: list, metadatas: list, version=None) -> int:
+        """依目前的 catalog 重建文字矩陣，回傳這次實際計算的描述句數"""
+        with self._lock:
+            prompts = [item_prompts(meta or {}) for meta in metadatas]
+            missing = sorted({p for item in prompts for p in item} - self._prompt_cache.keys())
+            if missing:
+                for prompt, vector in zip(missing, _normalize(self._encode_text(missing))):
+                    self._prompt_cache[prompt] = vector
+            if prompts:
+                self.matrix = _normalize(np.stack([
+                    np.mean([self._prompt_cache[p] for p in item], axis=0) for item in prompts
+                ]))
+            else:
+                self.matrix = np.empty((0, 0), dtype=np.float32)
+            self.ids = list(ids)
+            self.version = version
+            return len(missing)
+
+    def scores(self, embeddings: np.ndarray) -> np.ndarray:
+        """(N, D) 影像向量對每個商品的文字 cosine similarity，回傳 (N, M)"""
+        return _normalize(embeddings) @ self.matrix.T
+
+    def verify(self, embeddings: np.ndarray, neighbour_ids: list, neighbour_distances: list) -> list:
+        """
+        neighbour_ids / neighbour_distances 為各 crop 依影像距離排序的 catalog 查詢結果，
+        回傳每個 crop 的 TextEvidence。
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(neighbour_ids), -1)
+        if not self.ids or not len(embeddings):
+            return [TextEvidence(ids[0] if ids else None, float(dists[0]) if dists else float("inf"),
+                                 None, 0.0, 0.0, False)
+                    for ids, dists in zip(neighbour_ids, neighbour_distances)]
+        scores = self.scores(embeddings)
+        order = np.argsort(-scores, axis=1)[:, :2]
+        evidence = []
+        for row, (ids, dists) in enumerate(zip(neighbour_ids, neighbour_distances)):
+            best = order[row, 0]
+            margin = float(scores[row, best] - scores[row, order[row, 1]]) if order.shape[1] > 1 else 1.0
+            image_id = ids[0] if ids else None
+            image_distance = float(dists[0]) if dists else float("inf")
+            text_id = self.ids[best]
+            agree = (image_id == text_id and image_distance < self.max_image_distance
+                     and margin >= self.min_margin)
+            evidence.append(TextEvidence(image_id, image_distance, text_id, float(scores[row, best]), margin, agree))
+        return evidence
@@ -0,0 +1,225 @@
+"""
+OpenTelemetry tracing 設定。
+
+支援離線可用的 exporter，方便在無對外網路的門市主機上檢視 trace：
+- file: 每個 span 一行 JSON，寫入 TRACE_DIR/spans-YYYYMMDD.jsonl
+- console: 直接印到 stdout
+- otlp: 送往 OTEL_EXPORTER_OTLP_ENDPOINT（需有 collector）
+- none: 關閉
+
+以環境變數 TRACE_EXPORTER 設定，可用逗號同時啟用多個，例如 "file,console"。
+未設定時不掛 exporter（測試、benchmark 匯入 service 不會產生 traces/），
+實際啟動服務時（service 的 lifespan、model_server.py）才預設為 SERVICE_TRACE_EXPORTER（file）。
+
+檢視 trace 檔：
+    python -m utils.tracing traces/spans-20260312.jsonl [--slowest 5]
+"""
+
+import json
+import os
+import sys
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Sequence
+
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    ConsoleSpanExporter,
+    SimpleSpanProcessor,
+    SpanExporter,
+    SpanExportResult,
+)
+
+# None 代表未設定
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER")
+SERVICE_TRACE_EXPORTER = "file"
+TRACE_DIR = os.getenv("TRACE_DIR", "traces")
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "good-backend")
+
+
+class JsonLinesFileSpanExporter(SpanExporter):
+    """將 span 以 JSON Lines 格式寫入本地檔案（依日期分檔）"""
+
+    def __init__(self, directory: str = TRACE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _current_path(self) -> str:
+        return os.path.join(self.directory, f"spans-{datetime.now():%Y%m%d}.jsonl")
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = [span.to_json(indent=None) for span in spans]
+        try:
+            with self._lock, open(self._current_path(), "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            print(f"[Trace] 寫入 span 失敗: {e}")
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+
+class StageTimingProcessor(SpanProcessor):
+    """
+    依 trace id 累計各 span 名稱的次數與總耗時（例如 job 的 stage timings）。
+    只有透過 record_stage_timings 註冊的 trace 才會被記錄。
+    """
+
+    def __init__(self):
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def on_end(self, span: ReadableSpan) -> None:
+        collector = self._collectors.get(span.context.trace_id)
+        if collector is None or span.end_time is None:
+            return
+        with self._lock:
+            entry = collector.setdefault(span.name, {"count": 0, "total_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] = round(entry["total_ms"] + (span.end_time - span.start_time) / 1e6, 3)
+
+    def register(self, trace_id: int) -> dict:
+        with self._lock:
+            return self._collectors.setdefault(trace_id, {})
+
+    def release(self, trace_id: int):
+        with self._lock:
+            self._collectors.pop(trace_id, None)
+
+
+stage_timings = StageTimingProcessor()
+
+
+@contextmanager
+def record_stage_timings(span):
+    """在 context 內結束、且與 span 同一個 trace 的所有 span 都累計到回傳的 dict"""
+    trace_id = span.get_span_context().trace_id
+    timings = stage_timings.register(trace_id)
+    try:
+        yield timings
+    finally:
+        stage_timings.release(trace_id)
+
+
+def _build_exporters(names: str):
+    exporters = []
+    for name in (n.strip().lower() for n in names.split(",")):
+        if not name or name == "none":
+            continue
+        if name == "file":
+            exporters.append((JsonLinesFileSpanExporter(), True))
+        elif name == "console":
+            exporters.append((ConsoleSpanExporter(), False))
+        elif name == "otlp":
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+
+            exporters.append((OTLPSpanExporter(), True))
+        else:
+            raise ValueError(f"未知的 TRACE_EXPORTER: {name}")
+    return exporters
+
+
+def setup_tracing(exporter_names: str = None) -> TracerProvider:
+    """建立全域 TracerProvider 並掛上指定的 exporter（預設依 TRACE_EXPORTER，未設定時不掛）"""
+    provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+    provider.add_span_processor(stage_timings)
+    add_exporters(exporter_names or TRACE_EXPORTER or "none", provider)
+    trace.set_tracer_provider(provider)
+    return provider
+
+
+def add_exporters(exporter_names: str, provider: TracerProvider = None):
+    provider = provider or trace.get_tracer_provider()
+    for exporter, batched in _build_exporters(exporter_names):
+        processor = BatchSpanProcessor(exporter) if batched else SimpleSpanProcessor(exporter)
+        provider.add_span_processor(processor)
+
+
+_service_tracing_enabled = False
+
+
+def enable_service_tracing():
+    """服務啟動時呼叫：未設定 TRACE_EXPORTER 時掛上 SERVICE_TRACE_EXPORTER（同一 process 只掛一次）"""
+    global _service_tracing_enabled
+    if TRACE_EXPORTER is None and not _service_tracing_enabled:
+        _service_tracing_enabled = True
+        add_exporters(SERVICE_TRACE_EXPORTER)
+
+
+def shutdown_tracing():
+    provider = trace.get_tracer_provider()
+    if isinstance(provider, TracerProvider):
+        provider.shutdown()
+
+
+# ========== Trace 檔檢視工具 ==========
+
+def load_spans(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _duration_ms(span: dict) -> float:
+    start = datetime.fromisoformat(span["start_time"].replace("Z", "+00:00"))
+    end = datetime.fromisoformat(span["end_time"].replace("Z", "+00:00"))
+    return (end - start).total_seconds() * 1000
+
+
+def format_trace(spans: list) -> str:
+    """將同一個 trace 的 span 排成樹狀文字，附上耗時與屬性"""
+    children = defaultdict(list)
+    ids = {s["context"]["span_id"] for s in spans}
+    roots = []
+    for s in sorted(spans, key=lambda s: s["start_time"]):
+        parent = s.get("parent_id")
+        if parent and parent in ids:
+            children[parent].append(s)
+        else:
+            roots.append(s)
+
+    lines = []
+
+    def walk(span, depth):
+        attrs = " ".join(f"{k}={v}" for k, v in (span.get("attributes") or {}).items())
+        lines.append(f"{'  ' * depth}{span['name']}  {_duration_ms(span):.1f}ms  {attrs}".rstrip())
+        for child in children[span["context"]["span_id"]]:
+            walk(child, depth + 1)
+
+    for root in roots:
+        walk(root, 0)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="檢視本地 trace 檔")
+    parser.add_argument("path")
+    parser.add_argument("--slowest", type=int, default=5, help="只顯示最慢的 N 個 trace")
+    args = parser.parse_args(argv)
+
+    traces = defaultdict(list)
+    for span in load_spans(args.path):
+        traces[span["context"]["trace_id"]].append(span)
+
+    def total(spans):
+        roots = [s for s in spans if not s.get("parent_id")]
+        return max(_duration_ms(s) for s in roots) if roots else 0.0
+
+    ranked = sorted(traces.items(), key=lambda kv: total(kv[1]), reverse=True)
+    for trace_id, spans in ranked[: args.slowest]:
+        print(f"===== trace {trace_id} ({total(spans):.1f}ms) =====")
+        print(format_trace(spans))
+        print()
+
+
+if __name__ == "__main__":
+    sys.exit(main())